@@ -0,0 +1,170 @@
+# batch_render.py - 无界面 (Headless) 批量渲染入口
+#
+# 用法示例:
+#   python batch_render.py a.json b.json -o thumbs --size 256x256 --no-ssaa -j 8
+#   python batch_render.py projects/ -o out --algorithm Bresenham
+
+import os
+import sys
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# 🟢 必须在导入任何 Qt 模块之前指定 offscreen 平台，否则没有显示器的服务器上会直接崩溃
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtGui import QGuiApplication, QColor, QImage
+from PyQt6.QtCore import Qt, QSize, QRect, QPointF
+
+from file_handler import ProjectHandler
+from renderer import CanvasRenderer
+
+RASTER_ALGORITHMS = ["Bresenham", "DDA", "PyQt原生"]
+
+
+class HeadlessCanvas:
+    """CanvasWidget 的最小替身，只包含渲染时读取的属性，不创建 QWidget。"""
+    def __init__(self, layers, width, height, ssaa_enabled=True, raster_algorithm="PyQt原生",
+                 pixel_ratio=1.0, background_color=None, ssaa_factor=CanvasRenderer.SSAA_BASE_FACTOR):
+        self.layers = layers
+        self._size = QSize(width, height)
+        self._pixel_ratio = pixel_ratio
+        self.ssaa_enabled = ssaa_enabled
+        self.ssaa_factor = max(1, int(ssaa_factor))
+        self.current_raster_algorithm = raster_algorithm
+        self.background_color = background_color if background_color is not None else QColor(Qt.GlobalColor.white)
+        self.grid_enabled = False
+        self.grid_size = 50
+        self.view_scale = 1.0
+        self.view_offset = QPointF(0, 0)
+        self.editing_shape = None
+        self.current_tool_obj = None
+
+    def size(self): return QSize(self._size)
+    def width(self): return self._size.width()
+    def height(self): return self._size.height()
+    def rect(self): return QRect(0, 0, self._size.width(), self._size.height())
+    def devicePixelRatioF(self): return self._pixel_ratio
+
+
+def ensure_gui_application():
+    """QPainter 绘制文字需要 QGuiApplication (字体数据库)，每个进程只创建一次。"""
+    app = QGuiApplication.instance()
+    if app is None:
+        app = QGuiApplication([sys.argv[0]])
+    return app
+
+
+def render_layers(layers, width, height, ssaa_enabled=True, raster_algorithm="PyQt原生",
+                  pixel_ratio=1.0, background_color=None, ssaa_factor=CanvasRenderer.SSAA_BASE_FACTOR) -> QImage:
+    """把图层列表渲染成一张 QImage，像素尺寸为 (width * pixel_ratio, height * pixel_ratio)。"""
+    canvas = HeadlessCanvas(layers, width, height, ssaa_enabled, raster_algorithm, pixel_ratio, background_color, ssaa_factor)
+    image = CanvasRenderer.render_layers_to_image(canvas)
+
+    # 与 draw_layers 里 drawImage(canvas.rect(), ...) 的平滑缩放等价：把 SSAA 缓冲降采样到目标尺寸
+    target_size = QSize(int(width * pixel_ratio), int(height * pixel_ratio))
+    if image.size() != target_size:
+        image = image.scaled(target_size, Qt.AspectRatioMode.IgnoreAspectRatio, Qt.TransformationMode.SmoothTransformation)
+    image.setDevicePixelRatio(pixel_ratio)
+    return image
+
+
+def render_project(file_path, width, height, ssaa_enabled=True, raster_algorithm="PyQt原生",
+                   pixel_ratio=1.0, background_color=None, ssaa_factor=CanvasRenderer.SSAA_BASE_FACTOR) -> QImage:
+    """加载一个项目文件并渲染。"""
+    ensure_gui_application()
+    layers = ProjectHandler.load(file_path)
+    return render_layers(layers, width, height, ssaa_enabled, raster_algorithm, pixel_ratio, background_color, ssaa_factor)
+
+
+def _render_job(job):
+    """工作进程入口：job 是纯数据元组，便于跨进程传递。返回 (输入, 输出, 错误信息)。"""
+    in_path, out_path, width, height, ssaa_enabled, ssaa_factor, algorithm, pixel_ratio, background = job
+    try:
+        background_color = QColor(background) if background else None
+        image = render_project(in_path, width, height, ssaa_enabled, algorithm, pixel_ratio, background_color, ssaa_factor)
+        if not image.save(out_path, "PNG"):
+            return in_path, out_path, "无法写入输出文件"
+        return in_path, out_path, None
+    except Exception as e:
+        return in_path, out_path, f"{type(e).__name__}: {e}"
+
+
+def render_batch(jobs, processes=None):
+    """并行渲染一批任务，逐个产出 (输入, 输出, 错误信息)。"""
+    # processes == 1 时直接在当前进程渲染；否则用 spawn 进程池，避免 fork 已初始化的 Qt 状态
+    if processes == 1 or len(jobs) <= 1:
+        for job in jobs:
+            yield _render_job(job)
+        return
+
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+        futures = [executor.submit(_render_job, job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def _collect_inputs(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(".json"):
+                    files.append(os.path.join(path, name))
+        else:
+            files.append(path)
+    return files
+
+
+def _parse_size(text):
+    try:
+        w, h = text.lower().split("x")
+        width, height = int(w), int(h)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"尺寸格式应为 宽x高，例如 1280x720，而不是 '{text}'")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError("宽和高必须为正数")
+    return width, height
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ShapePainter 无界面批量渲染：把项目文件 (.json) 渲染为 PNG。")
+    parser.add_argument("inputs", nargs="+", help="项目文件或包含项目文件的目录")
+    parser.add_argument("-o", "--output-dir", default=".", help="PNG 输出目录 (默认当前目录)")
+    parser.add_argument("--size", type=_parse_size, default=(1280, 720), help="逻辑画布尺寸，格式 宽x高 (默认 1280x720)")
+    parser.add_argument("--pixel-ratio", type=float, default=1.0, help="设备像素比，输出像素尺寸 = 画布尺寸 × 像素比")
+    parser.add_argument("--ssaa", dest="ssaa", action="store_true", default=True, help="启用 SSAA 抗锯齿 (默认)")
+    parser.add_argument("--no-ssaa", dest="ssaa", action="store_false", help="关闭 SSAA 抗锯齿")
+    parser.add_argument("--ssaa-factor", type=int, default=CanvasRenderer.SSAA_BASE_FACTOR, help="SSAA 超采样倍数")
+    parser.add_argument("--algorithm", choices=RASTER_ALGORITHMS, default="PyQt原生", help="光栅化算法")
+    parser.add_argument("--background", default=None, help="背景色，例如 #ffffff")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="并行进程数")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    width, height = args.size
+    jobs = []
+    for in_path in _collect_inputs(args.inputs):
+        stem = os.path.splitext(os.path.basename(in_path))[0]
+        out_path = os.path.join(args.output_dir, stem + ".png")
+        jobs.append((in_path, out_path, width, height, args.ssaa, max(1, args.ssaa_factor), args.algorithm, args.pixel_ratio, args.background))
+
+    if not jobs:
+        print("没有找到可渲染的项目文件。", file=sys.stderr)
+        return 1
+
+    failures = 0
+    for in_path, out_path, error in render_batch(jobs, max(1, args.jobs)):
+        if error:
+            failures += 1
+            print(f"[失败] {in_path}: {error}", file=sys.stderr)
+        else:
+            print(f"[完成] {in_path} -> {out_path}")
+
+    print(f"共 {len(jobs)} 个文件，成功 {len(jobs) - failures} 个，失败 {failures} 个。")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
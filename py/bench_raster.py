@@ -0,0 +1,166 @@
+# bench_raster.py - raster_algorithms 各基础算法的微基准与金标准校验
+#
+# 每个算法按输入规模 (半径、顶点数、控制点数、细分步数……) 扫一遍，报告每个输出单位 (像素 / 线段 / 点 / 三角形) 的耗时，
+# 同时把输出规范化后取摘要，与 raster_goldens.json 中的金标准比较：优化算法时既能看到速度变化，也能发现结果被改动。
+#
+# 用法示例:
+#   python bench_raster.py                                   # 全部算法，校验金标准
+#   python bench_raster.py -k circle -k polygon              # 只测名字含 circle 或 polygon 的算法
+#   python bench_raster.py --update-golden                   # 有意修改算法输出后，重新生成金标准
+
+import os
+import sys
+import json
+import math
+import time
+import timeit
+import hashlib
+import argparse
+import platform
+
+from PyQt6.QtCore import QPoint, QPointF, QT_VERSION_STR
+from PyQt6.QtGui import QColor
+
+import raster_algorithms as ra
+
+GOLDEN_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "raster_goldens.json")
+MIN_RUN_TIME = 0.05 # 每个样本至少运行这么久 (自动决定循环次数)
+
+
+# --- 输入生成 ---
+def _star_polygon(vertex_count, radius=300.0):
+    """内外半径交替的星形，边既有左斜也有右斜，每条扫描线上有多对交点。"""
+    points = []
+    for i in range(vertex_count):
+        angle = 2 * math.pi * i / vertex_count
+        r = radius if i % 2 == 0 else radius * 0.45
+        points.append(QPointF(400 + r * math.cos(angle), 400 + r * math.sin(angle)))
+    return points
+
+def _bezier_controls(size):
+    return (QPointF(0, 0), QPointF(size * 0.2, -size * 0.9), QPointF(size * 0.9, size * 1.1), QPointF(size, 0))
+
+def _zigzag(count):
+    return [QPointF(i * 20.0, 80.0 if i % 2 else 0.0) for i in range(count)]
+
+def _surface_controls(size=300.0):
+    """4x4 控制点网格，中间四个点向外鼓起，让曲面真正弯曲。"""
+    step = size / 3
+    return [QPointF(c * step + (step * 0.4 if 0 < c < 3 and 0 < r < 3 else 0), r * step) for r in range(4) for c in range(4)]
+
+def _gouraud_triangle(size):
+    return (QPointF(0, 0), QColor(255, 0, 0), QPointF(size, size * 0.3), QColor(0, 255, 0), QPointF(size * 0.4, size), QColor(0, 0, 255))
+
+# 名称 -> (规模名, 规模列表, 由规模生成参数的函数, 输出单位)
+CASES = {
+    "scanline_fill_circle":       ("r", (8, 64, 256, 1024), lambda r: (0, 0, r), "span"),
+    "scanline_fill_ellipse":      ("rx", (8, 64, 256, 1024), lambda r: (0, 0, r, max(1, r // 2)), "span"),
+    "scanline_fill_rounded_rect": ("w", (16, 128, 512, 2048), lambda w: (0, 0, w, w, w // 8), "span"),
+    "scanline_fill_polygon":      ("vertices", (8, 64, 512, 4096), lambda n: (_star_polygon(n),), "span"),
+    "midpoint_circle":            ("r", (8, 64, 256, 1024), lambda r: (0, 0, r), "pixel"),
+    "midpoint_ellipse":           ("rx", (8, 64, 256, 1024), lambda r: (0, 0, r, max(1, r // 2)), "pixel"),
+    "rasterize_quarter_circle":   ("r", (8, 64, 256, 1024), lambda r: (0, 0, r, 1), "pixel"),
+    "flatten_bezier":             ("extent", (16, 128, 1024, 8192), lambda s: _bezier_controls(s), "point"),
+    "compute_bspline_points":     ("control_points", (4, 16, 64, 256), lambda n: (_zigzag(n), 3), "point"),
+    "tessellate_bezier_surface":  ("steps", (5, 10, 20, 40), lambda n: (_surface_controls(), n), "triangle"),
+    "rasterize_triangle_gouraud": ("extent", (16, 128, 512, 2048), lambda s: _gouraud_triangle(s), "span"),
+}
+
+
+# --- 输出规范化与摘要 ---
+def _canonical(value):
+    """把算法输出转成只含数字的嵌套列表；浮点保留 4 位小数，避免平台间末位差异。"""
+    if isinstance(value, QPoint): return [value.x(), value.y()]
+    if isinstance(value, QPointF): return [round(value.x(), 4), round(value.y(), 4)]
+    if isinstance(value, QColor): return [value.red(), value.green(), value.blue(), value.alpha()]
+    if isinstance(value, (list, tuple)): return [_canonical(v) for v in value]
+    if isinstance(value, float): return round(value, 4)
+    return value
+
+def output_digest(output):
+    data = json.dumps(_canonical(output), separators=(",", ":")).encode("utf-8")
+    return {"count": len(output), "sha256": hashlib.sha256(data).hexdigest()}
+
+def case_key(name, size):
+    return f"{name}[{size}]"
+
+
+# --- 计时 ---
+def bench_case(name, size, repeat):
+    size_name, _, make_args, unit = CASES[name]
+    func = getattr(ra, name)
+    args = make_args(size)
+    start = time.perf_counter()
+    output = func(*args) # 第一次调用同时用来估算循环次数
+    loops = max(1, math.ceil(MIN_RUN_TIME / max(time.perf_counter() - start, 1e-9)))
+
+    per_call = min(timeit.Timer(lambda: func(*args)).repeat(repeat=repeat, number=loops)) / loops
+    return dict(name=name, size=size, size_name=size_name, unit=unit, seconds_per_call=round(per_call, 9),
+                ns_per_unit=round(per_call / max(1, len(output)) * 1e9, 2), **output_digest(output))
+
+
+def run(names, repeat):
+    return [bench_case(name, size, repeat) for name in names for size in CASES[name][1]]
+
+def check_goldens(results, goldens):
+    """返回 [(键, 说明)]：与金标准不一致或缺少金标准的项目。"""
+    problems = []
+    for result in results:
+        key = case_key(result["name"], result["size"])
+        expected = goldens.get(key)
+        if expected is None:
+            problems.append((key, "没有金标准 (用 --update-golden 生成)"))
+        elif expected["sha256"] != result["sha256"]:
+            problems.append((key, f"输出不一致：数量 {expected['count']} -> {result['count']}"))
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="raster_algorithms 微基准：按输入规模计时，并与金标准比较输出。")
+    parser.add_argument("-k", dest="patterns", action="append", help="只运行名字包含该子串的算法，可重复指定")
+    parser.add_argument("-r", "--repeat", type=int, default=5, help="每个规模的采样次数 (默认 5)，报告最小值")
+    parser.add_argument("-o", "--output", help="把结果写成 JSON")
+    parser.add_argument("--golden", default=GOLDEN_FILE, help="金标准文件 (默认 raster_goldens.json)")
+    parser.add_argument("--update-golden", action="store_true", help="用本次输出覆盖金标准中对应的项目")
+    args = parser.parse_args(argv)
+
+    names = [n for n in CASES if not args.patterns or any(p in n for p in args.patterns)]
+    if not names:
+        parser.error("没有匹配的算法")
+    results = run(names, max(1, args.repeat))
+
+    print(f"{'算法':<28}{'规模':>18}{'输出':>14}{'单次':>13}{'每单位':>12}")
+    for r in results:
+        print(f"{r['name']:<30}{r['size_name'] + '=' + str(r['size']):>20}{str(r['count']) + ' ' + r['unit']:>16}"
+              f"{r['seconds_per_call'] * 1e3:>13.3f}ms{r['ns_per_unit']:>13.1f}ns")
+
+    goldens = {}
+    if os.path.exists(args.golden):
+        with open(args.golden, encoding="utf-8") as f:
+            goldens = json.load(f)
+
+    if args.output:
+        meta = dict(timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"), python=platform.python_version(), qt=QT_VERSION_STR,
+                    platform=platform.platform(), repeat=args.repeat)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(dict(meta=meta, results=results), f, ensure_ascii=False, indent=2)
+        print(f"结果已写入 {args.output}")
+
+    if args.update_golden:
+        for r in results:
+            goldens[case_key(r["name"], r["size"])] = {"count": r["count"], "sha256": r["sha256"]}
+        with open(args.golden, "w", encoding="utf-8") as f:
+            json.dump(dict(sorted(goldens.items())), f, indent=2)
+        print(f"金标准已更新: {args.golden}")
+        return 0
+
+    problems = check_goldens(results, goldens)
+    for key, message in problems:
+        print(f"[不一致] {key}: {message}", file=sys.stderr)
+    if problems: return 1
+    print("所有输出与金标准一致。")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,238 @@
+# bench_render.py - 渲染性能基准 (无界面)
+#
+# 按固定随机种子生成合成文档，分别计时：
+#   full_redraw        所有图层变脏后的整帧重绘 (相当于切换算法 / SSAA 之后的第一帧)
+#   incremental_redraw 移动一个图形之后的重绘
+#   hit_test           在视口内随机点做命中测试
+#   save / load        项目文件的保存与加载
+# 渲染目标是 QImage (offscreen 平台)，结果写成 JSON，便于在不同提交之间比较。
+#
+# 用法示例:
+#   python bench_render.py                                   # 默认规模，所有算法 × SSAA 开/关
+#   python bench_render.py --shapes 5000 -o before.json
+#   python bench_render.py --shapes 5000 -o after.json --compare before.json
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+# 🟢 必须在导入任何 Qt 模块之前指定 offscreen 平台
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+
+from PyQt6.QtGui import QColor
+from PyQt6.QtCore import Qt, QPointF, QRectF, QT_VERSION_STR, PYQT_VERSION_STR
+
+from shapes import *
+from file_handler import ProjectHandler
+from renderer import CanvasRenderer
+from batch_render import HeadlessCanvas, ensure_gui_application, RASTER_ALGORITHMS, _parse_size
+
+SHAPE_KINDS = ("rect", "circle", "polyline", "path", "bspline", "surface", "group")
+REGRESSION_THRESHOLD = 1.10 # 中位数比基线慢 10% 以上视为退化
+
+
+# --- 合成文档 ---
+def generate_document(shape_count, width, height, seed=0, layer_count=2):
+    """各类图形轮流出现，随机分布在比画布大一圈的范围内 (有一部分落在视口之外)。"""
+    rng = random.Random(seed)
+    layers = [Layer(f"图层 {i + 1}") for i in range(layer_count)]
+    for i in range(shape_count):
+        shape = _make_shape(SHAPE_KINDS[i % len(SHAPE_KINDS)], rng, width, height)
+        layers[i % layer_count].shapes.append(shape)
+    return layers
+
+def _random_color(rng):
+    return QColor(rng.randrange(256), rng.randrange(256), rng.randrange(256))
+
+def _random_point(rng, width, height):
+    return QPointF(rng.uniform(-width * 0.25, width * 1.25), rng.uniform(-height * 0.25, height * 1.25))
+
+def _make_shape(kind, rng, width, height, depth=0):
+    origin = _random_point(rng, width, height)
+    color, pen_width = _random_color(rng), rng.choice((1, 2, 3, 5))
+    fill = _random_color(rng) if rng.random() < 0.5 else None
+    fill_style = Qt.BrushStyle.SolidPattern if fill else Qt.BrushStyle.NoBrush
+    if kind == "rect":
+        size = QPointF(rng.uniform(5, 200), rng.uniform(5, 200))
+        return Rectangle(origin, origin + size, color, pen_width, fill, fill_style)
+    if kind == "circle":
+        return Circle(origin, rng.uniform(2, 120), color, pen_width, fill, fill_style)
+    if kind == "polyline":
+        # 长折线：200 个点的随机游走
+        points, p = [], QPointF(origin)
+        for _ in range(200):
+            p = p + QPointF(rng.uniform(-15, 15), rng.uniform(-15, 15)); points.append(QPointF(p))
+        return Polyline(points, color, pen_width)
+    if kind == "path":
+        # 深层贝塞尔路径：40 段三次曲线，控制柄较长，平坦化时需要多级细分
+        segments, p = [], QPointF(origin)
+        for _ in range(41):
+            handle = QPointF(rng.uniform(-80, 80), rng.uniform(-80, 80))
+            segments.append(PathSegment(QPointF(p), p - handle, p + handle, PathSegment.SMOOTH))
+            p = p + QPointF(rng.uniform(-60, 60), rng.uniform(-60, 60))
+        return Path([segments], color, pen_width)
+    if kind == "bspline":
+        points = [origin + QPointF(rng.uniform(-150, 150), rng.uniform(-150, 150)) for _ in range(rng.randint(4, 12))]
+        return BSpline(points, 3, color, pen_width)
+    if kind == "surface":
+        size = rng.uniform(40, 250)
+        return BezierSurface(QRectF(origin.x(), origin.y(), size, size * rng.uniform(0.5, 1.5)), color, 1)
+    if kind == "group":
+        # 嵌套编组：最多三层
+        kinds = ("rect", "circle", "polyline", "bspline") + (("group",) if depth < 2 else ())
+        anchor = _random_point(rng, width, height)
+        members = []
+        for _ in range(rng.randint(3, 6)):
+            member = _make_shape(rng.choice(kinds), rng, 300, 300, depth + 1)
+            member.move(anchor.x(), anchor.y())
+            members.append(member)
+        return ShapeGroup(members)
+    raise ValueError(f"未知的图形种类: {kind}")
+
+
+# --- 计时 ---
+def _measure(action, repeat, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup: setup()
+        start = time.perf_counter()
+        action()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+def _summary(name, samples, **config):
+    return dict(name=name, **config, samples=[round(s, 6) for s in samples],
+                median=round(statistics.median(samples), 6), min=round(min(samples), 6), mean=round(statistics.fmean(samples), 6))
+
+def _hit_test(layers, point):
+    """与 CanvasWidget._get_shape_at 相同的查找：空间索引给出候选，从最上层往下找。"""
+    for layer in layers:
+        if not layer.is_visible: continue
+        for shape in reversed(layer.shapes_in(QRectF(point, point))):
+            if shape.get_transformed_bounding_box().contains(point): return shape
+    return None
+
+def bench_rendering(layers, width, height, algorithm, ssaa, repeat):
+    canvas = HeadlessCanvas(layers, width, height, ssaa, algorithm)
+    def mark_all_dirty():
+        for layer in layers: layer.is_dirty = True
+    def render(): CanvasRenderer.render_layers_to_image(canvas)
+
+    render() # 预热：字体、瓦片分箱等一次性开销不计入
+    results = [_summary("full_redraw", _measure(render, repeat, mark_all_dirty), algorithm=algorithm, ssaa=ssaa)]
+
+    # 增量重绘：每次把同一个视口内的图形来回移动一个像素
+    target = next((s for s in layers[0].shapes if QRectF(0, 0, width, height).intersects(s.get_transformed_bounding_box())), None)
+    if target is not None:
+        step = [1]
+        def move():
+            target.move(step[0], 0); step[0] = -step[0]
+        results.append(_summary("incremental_redraw", _measure(render, repeat, move), algorithm=algorithm, ssaa=ssaa))
+    return results
+
+def bench_hit_test(layers, width, height, repeat, count=1000, seed=0):
+    rng = random.Random(seed)
+    points = [QPointF(rng.uniform(0, width), rng.uniform(0, height)) for _ in range(count)]
+    def run():
+        for point in points: _hit_test(layers, point)
+    return [_summary("hit_test", _measure(run, repeat), points=count)]
+
+def bench_save_load(layers, repeat):
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "bench.json")
+        save = _summary("save", _measure(lambda: ProjectHandler.save(layers, path), repeat))
+        load = _summary("load", _measure(lambda: ProjectHandler.load(path), repeat), bytes=os.path.getsize(path))
+    return [save, load]
+
+
+# --- 结果 ---
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+def _result_key(result):
+    return (result["name"], result.get("algorithm"), result.get("ssaa"))
+
+def _describe(result):
+    parts = [result["name"]]
+    if "algorithm" in result: parts.append(result["algorithm"])
+    if "ssaa" in result: parts.append("SSAA" if result["ssaa"] else "无SSAA")
+    return " / ".join(parts)
+
+def compare_results(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """返回 [(描述, 基线中位数, 当前中位数, 比值, 是否退化)]，只比较两边都有的项目。"""
+    previous = {_result_key(r): r for r in baseline["results"]}
+    rows = []
+    for result in current["results"]:
+        old = previous.get(_result_key(result))
+        if old is None or old["median"] <= 0: continue
+        ratio = result["median"] / old["median"]
+        rows.append((_describe(result), old["median"], result["median"], ratio, ratio > threshold))
+    return rows
+
+def run(shape_count, width, height, algorithms, ssaa_modes, repeat, seed):
+    ensure_gui_application()
+    layers = generate_document(shape_count, width, height, seed)
+    results = []
+    for algorithm in algorithms:
+        for ssaa in ssaa_modes:
+            results.extend(bench_rendering(layers, width, height, algorithm, ssaa, repeat))
+    results.extend(bench_hit_test(layers, width, height, repeat, seed=seed))
+    results.extend(bench_save_load(layers, repeat))
+    meta = dict(timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"), commit=_git_commit(), python=platform.python_version(),
+                qt=QT_VERSION_STR, pyqt=PYQT_VERSION_STR, platform=platform.platform(),
+                shapes=shape_count, size=[width, height], seed=seed, repeat=repeat)
+    return dict(meta=meta, results=results)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ShapePainter 渲染性能基准：合成文档的重绘、命中测试与保存/加载计时。")
+    parser.add_argument("--shapes", type=int, default=500, help="合成文档中的图形数量 (默认 500；逐像素算法是纯 Python，规模大时很慢)")
+    parser.add_argument("--size", type=_parse_size, default=(1280, 720), help="画布尺寸，格式 宽x高 (默认 1280x720)")
+    parser.add_argument("--algorithm", dest="algorithms", action="append", choices=RASTER_ALGORITHMS,
+                        help="只测指定算法，可重复指定 (默认全部)")
+    parser.add_argument("--ssaa-only", dest="ssaa_modes", action="store_const", const=[True], help="只测 SSAA 开启")
+    parser.add_argument("--no-ssaa-only", dest="ssaa_modes", action="store_const", const=[False], help="只测 SSAA 关闭")
+    parser.add_argument("-r", "--repeat", type=int, default=3, help="每项重复次数 (默认 3)，报告中位数")
+    parser.add_argument("--seed", type=int, default=0, help="合成文档的随机种子")
+    parser.add_argument("-o", "--output", default="bench_render_results.json", help="JSON 结果文件")
+    parser.add_argument("--compare", help="与之前的 JSON 结果比较，列出变化")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="判定退化的中位数比值 (默认 1.10)")
+    args = parser.parse_args(argv)
+
+    width, height = args.size
+    report = run(args.shapes, width, height, args.algorithms or RASTER_ALGORITHMS,
+                 args.ssaa_modes or [True, False], max(1, args.repeat), args.seed)
+
+    for result in report["results"]:
+        print(f"{_describe(result):<40} 中位数 {result['median'] * 1000:9.2f} ms   最小 {result['min'] * 1000:9.2f} ms")
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"结果已写入 {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare_results(report, baseline, args.threshold)
+        regressions = [row for row in rows if row[4]]
+        print(f"\n与 {args.compare} (提交 {baseline['meta'].get('commit')}) 比较:")
+        for name, old, new, ratio, regressed in rows:
+            print(f"{name:<40} {old * 1000:9.2f} -> {new * 1000:9.2f} ms  x{ratio:.2f}{'  [退化]' if regressed else ''}")
+        if regressions:
+            print(f"共 {len(regressions)} 项退化 (阈值 x{args.threshold:.2f})。", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -2,16 +2,20 @@
 
 from PyQt6.QtWidgets import (QWidget, QFileDialog, QMenu, QColorDialog, QTextEdit, 
                              QFontDialog, QApplication, QMessageBox)
-from PyQt6.QtGui import QPainter, QColor, QPixmap, QAction, QFont, QBrush, QKeySequence, QPalette
-from PyQt6.QtCore import Qt, QPoint, QRect, pyqtSignal, QPointF
+from PyQt6.QtGui import QPainter, QColor, QPixmap, QAction, QFont, QBrush, QKeySequence, QPalette, QMouseEvent
+from PyQt6.QtCore import Qt, QPoint, QRect, pyqtSignal, QPointF, QRectF, QLineF, QTimer
 from PyQt6.QtSvg import QSvgGenerator
 
 from shapes import *
 from commands import *
 from file_handler import ProjectHandler
 from renderer import CanvasRenderer
+from frame_profiler import profiler
+from profiling_hooks import hooks
 from tools import *
 from aligner import Aligner
+from undo_history import UndoHistory, DEFAULT_MEMORY_BUDGET_MB
+from curve_fitting import DEFAULT_FREEHAND_MODE, DEFAULT_TOLERANCE
 
 class CanvasWidget(QWidget):
     undo_stack_changed = pyqtSignal(bool)
@@ -21,6 +25,12 @@ class CanvasWidget(QWidget):
     selection_changed_signal = pyqtSignal(bool)
     clipboard_changed_signal = pyqtSignal(bool)
     tool_changed_signal = pyqtSignal(str)
+    viewport_changed = pyqtSignal()
+
+    MIN_ZOOM, MAX_ZOOM = 1 / 16, 64
+    WHEEL_ZOOM_STEP = 2 ** 0.25 # 滚轮每格缩放四分之一倍频程
+    RESIZE_SETTLE_MS = 200      # 窗口停止缩放这么久之后才收缩合成缓冲
+    DEFAULT_REFRESH_RATE = 60   # 取不到屏幕刷新率时渲染时钟使用的频率 (Hz)
 
     def __init__(self, parent=None, settings=None):
         super().__init__(parent)
@@ -30,18 +40,21 @@ class CanvasWidget(QWidget):
         if settings is None: settings = {}
 
         self.layers, self.current_layer_index = [], -1
-        self.undo_stack, self.redo_stack = [], []
+        # 🟢 撤销历史带内存预算，长时间编辑也不会无限增长
+        self.history = UndoHistory(settings.get("undo_memory_budget_mb", DEFAULT_MEMORY_BUDGET_MB))
         self.clipboard = []
+        self.symbol_counter = 0 # 只用于给新符号起默认名字
         self.selected_shapes = []
-        self.last_mouse_pos = QPoint(0, 0)
-        
-        self._saved_stack_len = 0
+        self.last_mouse_pos = QPointF(0, 0) # 世界坐标
         
         self.current_pen_color = settings.get("default_pen_color", QColor(0, 0, 0))
         self.current_width = settings.get("default_pen_width", 2)
         self.current_font = settings.get("default_font", QFont("Arial", 24))
         self.current_alignment = Qt.AlignmentFlag.AlignLeft
         self.background_color = settings.get("canvas_background_color", QColor(Qt.GlobalColor.white))
+        # 手绘笔划的保存方式与容差 (屏幕像素)，见 FreehandTool
+        self.freehand_mode = settings.get("freehand_mode", DEFAULT_FREEHAND_MODE)
+        self.freehand_tolerance = settings.get("freehand_tolerance", DEFAULT_TOLERANCE)
         
         self.current_fill_color = None; self.current_fill_style = Qt.BrushStyle.NoBrush
         self.editing_shape = None; self.text_editor = None
@@ -49,6 +62,10 @@ class CanvasWidget(QWidget):
         self.grid_size = 50; self.snap_threshold = 8
         self.horizontal_guides = []; self.vertical_guides = []
         self.guides_enabled = True 
+        # 🟢 视口：控件坐标 = 世界坐标 * view_scale + view_offset；图形、参考线和工具都使用世界坐标
+        self.view_scale = 1.0
+        self.view_offset = QPointF(0, 0)
+        self._pan_anchor = None # 中键拖动平移时上一次的鼠标位置
         self.tools = {
             "select": SelectTool(self), "point": PointTool(self), "line": LineTool(self), "arrow": ArrowTool(self),
             "rect": RectangleTool(self), "square": SquareTool(self), "circle": CircleTool(self), "ellipse": EllipseTool(self),
@@ -59,10 +76,21 @@ class CanvasWidget(QWidget):
         self.current_tool_obj = self.tools["select"]
         self.current_raster_algorithm = "PyQt原生"
         self.ssaa_enabled = True # 🔴 新增SSAA状态属性，默认为开启
+        self.ssaa_factor = CanvasRenderer.SSAA_BASE_FACTOR # SSAA 开启时的超采样倍数
+        self.partial_erase = False # 🟢 局部擦除：橡皮只擦掉扫过的部分，折线/多边形/路径被切成几段
+        self.composite = None # 持久合成缓冲，由 CanvasRenderer 维护
+        self._resize_timer = QTimer(self); self._resize_timer.setSingleShot(True)
+        self._resize_timer.timeout.connect(lambda: CanvasRenderer.trim_composite(self))
+        # 🟢 渲染时钟：鼠标移动先排队，每个刷新周期把攒下的事件一次交给工具；重绘请求也按这个节拍合并
+        self._render_clock = QTimer(self); self._render_clock.setTimerType(Qt.TimerType.PreciseTimer)
+        self._render_clock.timeout.connect(self._on_frame_tick)
+        self._pending_moves = []        # 尚未交给工具的鼠标移动 (世界坐标)
+        self._pending_screen_pos = None # 最后一次移动的屏幕坐标，给标尺和状态栏
+        self._frame_requested = False
 
     @property
     def is_dirty(self):
-        return len(self.undo_stack) != self._saved_stack_len
+        return self.history.is_dirty
     
     def set_raster_algorithm(self, algo_name: str):
         if self.current_raster_algorithm != algo_name:
@@ -72,13 +100,14 @@ class CanvasWidget(QWidget):
                 layer.is_dirty = True
             self.update()
 
-    def execute_command(self, command):
+    @hooks.hooked("execute_command", lambda self, command, merge=False: type(command).__name__)
+    def execute_command(self, command, merge=False):
         # 🔴 性能优化：在执行命令前，为涉及的图形添加对图层的引用
-        # 这是为了让Move/ChangeProperty等命令能找到它们需要“弄脏”的图层
+        # 图形因此能把自己的变化通知给所在图层
         layer_to_set = None
         shapes_to_set = []
 
-        if isinstance(command, (AddShapeCommand, AddShapesCommand, GroupCommand)):
+        if isinstance(command, (AddShapeCommand, AddShapesCommand, GroupCommand, CreateSymbolCommand)):
             if hasattr(command, 'layer'):
                 layer_to_set = command.layer
             
@@ -88,38 +117,80 @@ class CanvasWidget(QWidget):
                 shapes_to_set.extend(command.shapes)
             elif isinstance(command, GroupCommand):
                 shapes_to_set.append(command.group)
+            elif isinstance(command, CreateSymbolCommand):
+                shapes_to_set.append(command.instance)
 
         if layer_to_set:
             for shape in shapes_to_set:
                 shape.layer = layer_to_set # 建立反向引用
 
         command.redo()
-        self.undo_stack.append(command)
-        self.redo_stack.clear()
-        self.update_stacks_and_canvas()
+        self.history.push(command, merge)
+        if self.history.in_transaction:
+            self.update() # 🟢 事务进行中只重绘画布，撤销按钮和图层面板等到提交时再刷新一次
+        else:
+            self.update_stacks_and_canvas()
+
+    def begin_transaction(self):
+        """在 begin/commit 之间执行的所有命令合并为一个撤销步骤。"""
+        self.history.begin_transaction()
+
+    def commit_transaction(self):
+        if self.history.commit_transaction():
+            self.update_stacks_and_canvas()
+        else:
+            self.update()
 
+    @hooks.hooked("undo", lambda self: self.history.undo_stack and type(self.history.undo_stack[-1][0]).__name__)
     def undo(self):
-        if self.undo_stack:
-            command = self.undo_stack.pop()
-            command.undo()
-            self.redo_stack.append(command)
+        if self.history.undo():
             self.update_stacks_and_canvas()
 
+    @hooks.hooked("redo", lambda self: self.history.redo_stack and type(self.history.redo_stack[-1][0]).__name__)
     def redo(self):
-        if self.redo_stack:
-            command = self.redo_stack.pop()
-            command.redo()
-            self.undo_stack.append(command)
+        if self.history.redo():
             self.update_stacks_and_canvas()
 
+    def update(self, *args):
+        """不带参数的 update() 不再立即排队重绘，而是由渲染时钟每个刷新周期最多重绘一次。"""
+        if args: return super().update(*args)
+        self._frame_requested = True
+        self._schedule_tick()
+
+    def _schedule_tick(self):
+        if self._render_clock.isActive(): return
+        # 时钟空闲时立即处理这一次 (不增加延迟)，之后同一周期内的请求都等下一拍
+        screen = self.screen()
+        rate = screen.refreshRate() if screen is not None and screen.refreshRate() > 0 else self.DEFAULT_REFRESH_RATE
+        self._render_clock.start(max(1, round(1000 / min(max(rate, 30), 240))))
+        self._on_frame_tick()
+
+    def _on_frame_tick(self):
+        worked = self._flush_input()
+        if self._frame_requested:
+            self._frame_requested = False
+            super().update()
+            worked = True
+        if not worked: self._render_clock.stop() # 一整拍无事可做时停钟，空闲时不占 CPU
+
+    def _flush_input(self):
+        """把排队的鼠标移动一次交给当前工具；按键、按下、松开之前也会先调用，保证事件顺序。"""
+        if not self._pending_moves: return False
+        events, self._pending_moves = self._pending_moves, []
+        self.mouse_moved_signal.emit(self._pending_screen_pos) # 标尺使用屏幕坐标
+        self.last_mouse_pos = events[-1].position()
+        if self.current_tool_obj: self._dispatch_tool_event("mouseMoveEvents", events)
+        return True
+
     def update_stacks_and_canvas(self):
-        self.undo_stack_changed.emit(bool(self.undo_stack))
-        self.redo_stack_changed.emit(bool(self.redo_stack))
+        self.undo_stack_changed.emit(self.history.can_undo())
+        self.redo_stack_changed.emit(self.history.can_redo())
         self.layers_changed.emit(self.layers, self.current_layer_index)
         self.update()
 
     def set_tool(self, tool_name):
         self._finish_text_editing()
+        self._flush_input()
         if self.current_tool_obj:
             self.current_tool_obj.deactivate()
         if tool_name in self.tools:
@@ -148,7 +219,7 @@ class CanvasWidget(QWidget):
         if self.text_editor and self.editing_shape in text_shapes: self.text_editor.setCurrentFont(new_font)
     def set_font_size(self, size):
         self.current_font.setPointSize(size); text_shapes = [s for s in self.selected_shapes if isinstance(s, Text)]
-        if text_shapes: new_font = QFont(text_shapes[0].font); new_font.setPointSize(size); self.execute_command(ChangePropertiesCommand(text_shapes, {'font': new_font}))
+        if text_shapes: new_font = QFont(text_shapes[0].font); new_font.setPointSize(size); self.execute_command(ChangePropertiesCommand(text_shapes, {'font': new_font}), merge=True)
         if self.text_editor and self.editing_shape in text_shapes: self.text_editor.setCurrentFont(new_font)
     def set_selected_text_style(self, style_type, is_checked):
         text_shapes = [s for s in self.selected_shapes if isinstance(s, Text)];
@@ -168,13 +239,13 @@ class CanvasWidget(QWidget):
         elif style_type == 'italic': self.current_font.setItalic(is_checked)
     def set_text_alignment(self, alignment): self.current_alignment = alignment
     def initialize_layers(self):
-        self.add_layer("背景"); self._saved_stack_len = len(self.undo_stack)
+        self.add_layer("背景"); self.history.mark_saved()
     def get_current_layer(self):
         if 0 <= self.current_layer_index < len(self.layers): return self.layers[self.current_layer_index]
         return None
     def set_layer_opacity(self, index, value):
         if 0 <= index < len(self.layers): layer = self.layers[index]; new_opacity = max(0.0, min(1.0, value / 100.0));
-        if abs(layer.opacity - new_opacity) > 0.001: self.execute_command(ChangePropertiesCommand([layer], {'opacity': new_opacity}))
+        if abs(layer.opacity - new_opacity) > 0.001: self.execute_command(ChangePropertiesCommand([layer], {'opacity': new_opacity}), merge=True)
     def set_layer_blend_mode(self, index, mode):
         if 0 <= index < len(self.layers): layer = self.layers[index]
         if layer.blend_mode != mode: self.execute_command(ChangePropertiesCommand([layer], {'blend_mode': mode}))
@@ -201,13 +272,13 @@ class CanvasWidget(QWidget):
         if new_name != layer_to_rename.name: self.execute_command(ChangePropertiesCommand([layer_to_rename], {'name': new_name})); self.layers_changed.emit(self.layers, self.current_layer_index)
     def save_shapes(self):
         file_path, _ = QFileDialog.getSaveFileName(self, "保存项目", "", "JSON Files (*.json)");
-        if file_path: ProjectHandler.save(self.layers, file_path); self._saved_stack_len = len(self.undo_stack); return True
+        if file_path: ProjectHandler.save(self.layers, file_path); self.history.mark_saved(); return True
         return False
     def load_shapes(self):
         if self.is_dirty: reply = QMessageBox.question(self, '确认加载', "您有未保存的更改，如果加载新项目，这些更改将丢失。是否继续？", QMessageBox.StandardButton.Yes | QMessageBox.StandardButton.No);
         if reply == QMessageBox.StandardButton.No: return
         file_path, _ = QFileDialog.getOpenFileName(self, "加载项目", "", "JSON Files (*.json)");
-        if file_path: self.layers = ProjectHandler.load(file_path); self.set_current_layer(0); self.undo_stack.clear(); self.redo_stack.clear(); self.selected_shapes.clear(); self._saved_stack_len = len(self.undo_stack); self.update_stacks_and_canvas()
+        if file_path: self.layers = ProjectHandler.load(file_path); self.set_current_layer(0); self.history.clear(); self.selected_shapes.clear(); self.update_stacks_and_canvas()
     def export_as_png(self):
         file_path, _ = QFileDialog.getSaveFileName(self, "导出为PNG", "", "PNG Files (*.png)");
         if file_path: pixmap = QPixmap(self.size()); pixmap.fill(self.background_color); original_tool = self.current_tool_obj; self.current_tool_obj = Tool(self); painter = QPainter(pixmap); CanvasRenderer.paint(painter, self); painter.end(); self.current_tool_obj = original_tool; pixmap.save(file_path, "PNG")
@@ -222,6 +293,14 @@ class CanvasWidget(QWidget):
     def group_selected(self):
         current_layer = self.get_current_layer()
         if current_layer and not current_layer.is_locked and len(self.selected_shapes) > 1: command = GroupCommand(current_layer, self.selected_shapes); self.execute_command(command); self.selected_shapes = [command.group]; self.selection_changed_signal.emit(True); self.update()
+    def create_symbol_from_selection(self):
+        """把选中的图形转换为符号，原位置替换为一个实例；之后复制粘贴出的都是共享母版的轻量实例。"""
+        current_layer = self.get_current_layer()
+        shapes = [s for s in self.selected_shapes if s in current_layer.shapes] if current_layer else []
+        if not shapes or current_layer.is_locked: return
+        self.symbol_counter += 1
+        command = CreateSymbolCommand(current_layer, shapes, f"符号 {self.symbol_counter}")
+        self.execute_command(command); self.selected_shapes = [command.instance]; self.selection_changed_signal.emit(True); self.update()
     def ungroup_selected(self):
         current_layer = self.get_current_layer();
         if not current_layer or current_layer.is_locked: return
@@ -230,15 +309,80 @@ class CanvasWidget(QWidget):
         for group in groups_in_selection: command = UngroupCommand(current_layer, group); self.execute_command(command); newly_ungrouped_shapes.extend(command.shapes_inside)
         remaining_selection = [s for s in self.selected_shapes if not isinstance(s, ShapeGroup)]; self.selected_shapes = remaining_selection + newly_ungrouped_shapes; self.selection_changed_signal.emit(bool(self.selected_shapes)); self.update()
 
+    # --- 视口 (缩放与平移) ---
+    def view_transform(self):
+        return CanvasRenderer.view_transform(self)
+    def map_to_world(self, pos):
+        return QPointF((pos.x() - self.view_offset.x()) / self.view_scale, (pos.y() - self.view_offset.y()) / self.view_scale)
+    def map_to_screen(self, pos):
+        return QPointF(pos.x() * self.view_scale + self.view_offset.x(), pos.y() * self.view_scale + self.view_offset.y())
+    def world_length(self, pixels):
+        """屏幕上 pixels 个像素对应的世界坐标长度；点选容差、控制柄大小等按屏幕像素给出，不随缩放变化。"""
+        return pixels / self.view_scale
+    def set_view(self, scale, offset):
+        scale = max(self.MIN_ZOOM, min(self.MAX_ZOOM, scale))
+        if scale == self.view_scale and offset == self.view_offset: return
+        self.view_scale, self.view_offset = scale, QPointF(offset)
+        self._finish_text_editing()
+        self.viewport_changed.emit(); self.update()
+    def zoom_at(self, factor, anchor):
+        """以控件坐标 anchor 为不动点缩放。"""
+        anchor = QPointF(anchor); world = self.map_to_world(anchor)
+        scale = max(self.MIN_ZOOM, min(self.MAX_ZOOM, self.view_scale * factor))
+        self.set_view(scale, anchor - world * scale)
+    def zoom_in(self): self.zoom_at(self.WHEEL_ZOOM_STEP ** 2, QRectF(self.rect()).center())
+    def zoom_out(self): self.zoom_at(self.WHEEL_ZOOM_STEP ** -2, QRectF(self.rect()).center())
+    def reset_view(self): self.set_view(1.0, QPointF(0, 0))
+    def zoom_to_fit(self):
+        """缩放并平移到能看到全部图形 (画布是无限的，内容可能在任何位置)。"""
+        content = QRectF()
+        for layer in self.layers:
+            if layer.is_visible: content = content.united(layer.index.bounds())
+        if content.isEmpty(): self.reset_view(); return
+        margin = 20
+        scale = min((self.width() - 2 * margin) / content.width(), (self.height() - 2 * margin) / content.height())
+        scale = max(self.MIN_ZOOM, min(self.MAX_ZOOM, scale))
+        self.set_view(scale, QRectF(self.rect()).center() - content.center() * scale)
+    def pan_by(self, dx, dy): self.set_view(self.view_scale, self.view_offset + QPointF(dx, dy))
+    def _to_world_event(self, event, detach=False):
+        """
+        把鼠标事件的位置换算到世界坐标，工具代码因此无需关心视口。
+        detach: 返回独立的副本；事件要排队到下一拍处理时必须复制，Qt 会在处理函数返回后回收原事件。
+        """
+        if self.view_scale == 1.0 and self.view_offset.isNull() and not detach: return event
+        return QMouseEvent(event.type(), self.map_to_world(event.position()), event.globalPosition(),
+                           event.button(), event.buttons(), event.modifiers())
+    def wheelEvent(self, event):
+        delta = event.angleDelta()
+        if event.modifiers() & Qt.KeyboardModifier.ControlModifier:
+            if delta.y(): self.zoom_at(self.WHEEL_ZOOM_STEP ** (delta.y() / 120), event.position())
+        else:
+            pixel_delta = event.pixelDelta()
+            dx, dy = (pixel_delta.x(), pixel_delta.y()) if not pixel_delta.isNull() else (delta.x() / 3, delta.y() / 3)
+            if event.modifiers() & Qt.KeyboardModifier.ShiftModifier: dx, dy = dy, dx
+            self.pan_by(dx, dy)
+        event.accept()
+
+    def resizeEvent(self, event):
+        # 🟢 缩放过程中合成缓冲只增不减 (按档位预留，新露出的条带单独合成)，停下来之后再收缩
+        super().resizeEvent(event)
+        self._resize_timer.start(self.RESIZE_SETTLE_MS)
+
     def paintEvent(self, event):
         painter = QPainter(self)
         painter.canvas = self 
+        profiler.begin_frame()
         # 🟢 1. 调用渲染器 (绘制背景 + 网格 + 所有图层 + 工具预览)
         CanvasRenderer.paint(painter, self)
 
         # 🟢 2. 绘制参考线 (Guides)
         # 放在最后，确保参考线永远覆盖在最上层 (Overlay)
-        self.draw_guides(painter)
+        with profiler.stage("guides"):
+            self.draw_guides(painter)
+        profiler.end_frame()
+
+        # 🟢 3. 性能监视器 HUD (不计入帧耗时)
+        if profiler.enabled: profiler.draw_hud(painter)
     def _draw_arrow(self, painter, p1, p2, color, width):
         CanvasRenderer.draw_arrow(painter, p1, p2, color, width)
 
@@ -257,28 +401,51 @@ class CanvasWidget(QWidget):
     def draw_guides(self, painter):
         if not self.guides_enabled: return
         pen = QPen(QColor(0, 150, 255, 150), 1, Qt.PenStyle.DashLine); painter.setPen(pen); width, height = self.width(), self.height()
-        for y in self.horizontal_guides: painter.drawLine(0, y, width, y)
-        for x in self.vertical_guides: painter.drawLine(x, 0, x, height)
+        # 参考线存的是世界坐标，画的时候换算到屏幕
+        for y in self.horizontal_guides: sy = y * self.view_scale + self.view_offset.y(); painter.drawLine(QLineF(0, sy, width, sy))
+        for x in self.vertical_guides: sx = x * self.view_scale + self.view_offset.x(); painter.drawLine(QLineF(sx, 0, sx, height))
     def mousePressEvent(self, event):
         self._finish_text_editing()
-        if self.current_tool_obj: self.current_tool_obj.mousePressEvent(event)
+        self._flush_input()
+        if event.button() == Qt.MouseButton.MiddleButton: self._pan_anchor = event.position(); return
+        event = self._to_world_event(event)
+        if self.current_tool_obj: self._dispatch_tool_event("mousePressEvent", event)
         self.selection_changed_signal.emit(bool(self.selected_shapes))
     def mouseMoveEvent(self, event):
-        self.last_mouse_pos = event.pos(); self.mouse_moved_signal.emit(event.pos())
-        if self.current_tool_obj: self.current_tool_obj.mouseMoveEvent(event)
+        if self._pan_anchor is not None:
+            self.mouse_moved_signal.emit(event.pos())
+            delta = event.position() - self._pan_anchor; self._pan_anchor = event.position(); self.pan_by(delta.x(), delta.y()); return
+        # 高频鼠标 / 数位板每秒上千个事件：只排队，由渲染时钟每拍交给工具一次
+        self._pending_moves.append(self._to_world_event(event, detach=True))
+        self._pending_screen_pos = event.pos()
+        self._schedule_tick()
     def mouseReleaseEvent(self, event):
-        if self.current_tool_obj: self.current_tool_obj.mouseReleaseEvent(event)
+        self._flush_input()
+        if event.button() == Qt.MouseButton.MiddleButton: self._pan_anchor = None; return
+        event = self._to_world_event(event)
+        if self.current_tool_obj: self._dispatch_tool_event("mouseReleaseEvent", event)
         self.selection_changed_signal.emit(bool(self.selected_shapes))
     def mouseDoubleClickEvent(self, event):
-        shape_clicked, layer_of_shape = self._get_shape_at(event.pos())
+        self._flush_input()
+        event = self._to_world_event(event)
+        shape_clicked, layer_of_shape = self._get_shape_at(event.position())
         if shape_clicked and isinstance(shape_clicked, Text) and layer_of_shape and not layer_of_shape.is_locked: self._start_text_editing(shape_clicked)
-        elif self.current_tool_obj: self.current_tool_obj.mouseDoubleClickEvent(event)
+        elif self.current_tool_obj: self._dispatch_tool_event("mouseDoubleClickEvent", event)
     def keyPressEvent(self, event):
+        self._flush_input()
         if event.matches(QKeySequence.StandardKey.Copy): self.copy_selected(); return
         if event.key() == Qt.Key.Key_V and event.modifiers() == (Qt.KeyboardModifier.ControlModifier | Qt.KeyboardModifier.ShiftModifier): self.paste_in_place(); return
         if event.matches(QKeySequence.StandardKey.Paste): self.paste(); return
-        if self.current_tool_obj: self.current_tool_obj.keyPressEvent(event)
+        if self.current_tool_obj: self._dispatch_tool_event("keyPressEvent", event)
         else: super().keyPressEvent(event)
+    def _dispatch_tool_event(self, handler_name, event):
+        """把事件交给当前工具；经由性能追踪钩子调用，日志里记录工具名和事件位置/按键。"""
+        tool = self.current_tool_obj
+        def describe():
+            last = event[-1] if isinstance(event, list) else event
+            where = f"({last.position().x():.0f}, {last.position().y():.0f})" if hasattr(last, 'position') else f"key={last.key()}"
+            return f"{type(tool).__name__} {where}" + (f" x{len(event)}" if isinstance(event, list) else "")
+        hooks.call(f"tool.{handler_name}", getattr(tool, handler_name), event, detail=describe)
     def contextMenuEvent(self, event):
         if isinstance(self.current_tool_obj, SelectTool) and self.selected_shapes:
             # 🔴 修复2: 在函数顶部定义 main_window，确保其作用域覆盖整个函数
@@ -356,12 +523,14 @@ class CanvasWidget(QWidget):
             self.setFocus()
             
     def delete_selected(self):
-        if self.selected_shapes: shapes_by_layer = {};
-        for shape in self.selected_shapes: layer = self._get_layer_for_shape(shape);
-        if layer and not layer.is_locked:
-            if layer not in shapes_by_layer: shapes_by_layer[layer] = []
-            shapes_by_layer[layer].append(shape)
+        shapes_by_layer = {}
+        for shape in self.selected_shapes:
+            layer = self._get_layer_for_shape(shape)
+            if layer and not layer.is_locked:
+                shapes_by_layer.setdefault(layer, []).append(shape)
+        self.begin_transaction()
         for layer, shapes_in_layer in shapes_by_layer.items(): self.execute_command(RemoveShapesCommand(layer, shapes_in_layer))
+        self.commit_transaction()
         self.selected_shapes.clear(); self.selection_changed_signal.emit(False)
         if hasattr(self.current_tool_obj, 'node_editing_active'): self.current_tool_obj.node_editing_active = False
         self.update()
@@ -446,7 +615,7 @@ class CanvasWidget(QWidget):
         palette.setColor(QPalette.ColorRole.Text, self.editing_shape.color)
         self.text_editor.setPalette(palette)
         self.text_editor.setStyleSheet(f"QTextEdit {{ background-color: rgba(255, 255, 255, 0.9); border: 1px solid #0078d7; }}")
-        self.text_editor.setGeometry(text_shape.get_bounding_box())
+        self.text_editor.setGeometry(self.view_transform().mapRect(text_shape.get_bounding_box()).toAlignedRect())
         self.text_editor.installEventFilter(self)
         self.text_editor.show()
         self.text_editor.setFocus()
@@ -494,7 +663,8 @@ class CanvasWidget(QWidget):
         
         for layer in self.layers:
             if not layer.is_visible: continue
-            for shape in reversed(layer.shapes):
+            # 🟢 只检查空间索引给出的候选，从最上层往下找
+            for shape in reversed(layer.shapes_in(QRectF(posF, posF))):
                 # 现在传入 posF (QPointF) 就不会报错了
                 if shape.get_transformed_bounding_box().contains(posF): 
                     return shape, layer
@@ -504,7 +674,7 @@ class CanvasWidget(QWidget):
     def paste(self, position=None):
         current_layer = self.get_current_layer();
         if not self.clipboard or not current_layer or current_layer.is_locked: return
-        target_pos = position if isinstance(position, QPoint) else self.last_mouse_pos; clipboard_bbox = self.clipboard[0].get_transformed_bounding_box();
+        target_pos = QPointF(position) if isinstance(position, (QPoint, QPointF)) else self.last_mouse_pos; clipboard_bbox = self.clipboard[0].get_transformed_bounding_box();
         for shape in self.clipboard[1:]: clipboard_bbox = clipboard_bbox.united(shape.get_transformed_bounding_box())
         offset = target_pos - clipboard_bbox.topLeft(); pasted_shapes = [s.clone() for s in self.clipboard];
         for s in pasted_shapes: s.move(offset.x(), offset.y())
@@ -521,10 +691,18 @@ class CanvasWidget(QWidget):
         if not moves_to_perform: return
         move_commands = [MoveShapesCommand([shape], dx, dy) for shape, dx, dy in moves_to_perform]; self.execute_command(CompositeCommand(move_commands))
     def toggle_grid(self, enabled): self.grid_enabled = enabled; self.update()
+    def toggle_profiler(self, enabled):
+        """开关性能监视器：开启时清空旧统计，并在画布左上角显示 HUD。"""
+        if enabled and not profiler.enabled: profiler.reset()
+        profiler.enabled = enabled; self.update()
+    def export_profiler_stats(self):
+        file_path, _ = QFileDialog.getSaveFileName(self, "导出性能统计", "", "JSON Files (*.json)")
+        if file_path: profiler.export_json(file_path)
     def toggle_snapping(self, enabled): self.snap_enabled = enabled
     def snap_point(self, point):
         if not self.snap_enabled: return point
-        snapped_x, snapped_y = point.x(), point.y(); min_dist_x, min_dist_y = self.snap_threshold + 1, self.snap_threshold + 1
+        threshold = self.world_length(self.snap_threshold) # 吸附距离按屏幕像素计
+        snapped_x, snapped_y = point.x(), point.y(); min_dist_x, min_dist_y = threshold + 1, threshold + 1
         if self.grid_enabled: grid_x = round(point.x() / self.grid_size) * self.grid_size; dist_x = abs(point.x() - grid_x);
         if dist_x < min_dist_x: min_dist_x = dist_x; snapped_x = grid_x
         grid_y = round(point.y() / self.grid_size) * self.grid_size; dist_y = abs(point.y() - grid_y);
@@ -533,12 +711,14 @@ class CanvasWidget(QWidget):
         if dist_x < min_dist_x: min_dist_x = dist_x; snapped_x = x_guide
         for y_guide in self.horizontal_guides: dist_y = abs(point.y() - y_guide);
         if dist_y < min_dist_y: min_dist_y = dist_y; snapped_y = y_guide
-        final_x = snapped_x if min_dist_x <= self.snap_threshold else point.x(); final_y = snapped_y if min_dist_y <= self.snap_threshold else point.y()
-        return QPoint(final_x, final_y)
+        final_x = snapped_x if min_dist_x <= threshold else point.x(); final_y = snapped_y if min_dist_y <= threshold else point.y()
+        return QPointF(final_x, final_y)
     def toggle_guides(self, enabled): self.guides_enabled = enabled; self.update()
     def add_horizontal_guide(self, y):
+        y = round(self.map_to_world(QPointF(0, y)).y()) # 标尺给出的是屏幕坐标
         if y not in self.horizontal_guides: self.horizontal_guides.append(y); self.update()
     def add_vertical_guide(self, x):
+        x = round(self.map_to_world(QPointF(x, 0)).x())
         if x not in self.vertical_guides: self.vertical_guides.append(x); self.update()
     
     def set_background_color(self, color):
@@ -558,6 +738,10 @@ class CanvasWidget(QWidget):
         for layer in self.layers:
             layer.is_dirty = True
         self.update()
+    def toggle_partial_erase(self, enabled: bool):
+        """由主窗口的工具栏调用，切换橡皮擦是整个删除还是只擦掉扫过的部分。"""
+        self.partial_erase = enabled
+
     # 🟢 [满分写法] 使用 Command 模式，支持 Ctrl+Z 撤销
     def toggle_surface_property(self, prop_name, value):
         # 1. 筛选出选中的曲面
@@ -0,0 +1,344 @@
+# clipping.py - 局部擦除：按橡皮扫过的区域切分图形
+#
+# 橡皮扫过的区域是若干个胶囊 (相邻两次采样之间的线段外扩半径 r) 的并集。
+#   描边图形 (折线、无填充的多边形和路径)：沿中心线求出落在胶囊内的参数区间并删掉，剩下的部分成为新的折线 / 路径。
+#       直线段与胶囊的交是一个区间 (两者都是凸的)，由两端圆盘的二次方程解和中间矩形带的 Liang–Barsky 裁剪合并得到；
+#       三次贝塞尔段按不超过 r/2 的间距采样定出区间，边界再二分细化，保留的部分用 de Casteljau 切出来，仍然是曲线。
+#   有填充的多边形和路径：用 QPainterPath 的布尔运算减去扫过区域。没有洞时每块仍是原类型，带洞时合成一个 Path。
+# 所有计算都在世界坐标下进行，结果图形不带旋转/缩放；CutState 保存中间结果，每拍只处理新的胶囊。
+
+import math
+
+from PyQt6.QtGui import QPainterPath, QPainterPathStroker, QPolygonF
+from PyQt6.QtCore import Qt, QPointF
+
+from shapes import *
+from geometry import from_qtransform, map_xy, shape_base_transform
+from hit_testing import point_segment_distance_sq, point_in_polygon, is_filled
+
+BISECT_STEPS = 20     # 曲线上区间边界的二分次数
+MIN_PIECE_LENGTH = 1e-3
+
+
+# --- 区间 ---
+def _segment_circle_interval(px, py, dx, dy, cx, cy, r):
+    """P + t·D 落在圆 (C, r) 内的 t 区间 (未截断到 [0, 1])；没有交点时返回 None。"""
+    fx, fy = px - cx, py - cy
+    a = dx * dx + dy * dy
+    c = fx * fx + fy * fy - r * r
+    if a == 0: return (-math.inf, math.inf) if c <= 0 else None
+    b = 2 * (fx * dx + fy * dy)
+    disc = b * b - 4 * a * c
+    if disc < 0: return None
+    # 数值稳定的求根公式：避免两个相近的数相减
+    q = -0.5 * (b + math.copysign(math.sqrt(disc), b))
+    if q == 0: return (0.0, 0.0)
+    t0, t1 = q / a, c / q
+    return (t0, t1) if t0 <= t1 else (t1, t0)
+
+def _clip_linear(t0, t1, value0, slope, low, high):
+    """把 t 区间限制在 low <= value0 + slope·t <= high 上 (Liang–Barsky 的一步)。"""
+    if slope == 0:
+        return (t0, t1) if low <= value0 <= high else None
+    a, b = (low - value0) / slope, (high - value0) / slope
+    if a > b: a, b = b, a
+    t0, t1 = max(t0, a), min(t1, b)
+    return (t0, t1) if t0 <= t1 else None
+
+def segment_capsule_interval(px, py, qx, qy, capsule, radius):
+    """线段 PQ 上落在胶囊内的参数区间 (截断到 [0, 1])；不相交时返回 None。"""
+    ax, ay, bx, by = capsule
+    dx, dy = qx - px, qy - py
+    parts = [_segment_circle_interval(px, py, dx, dy, ax, ay, radius), _segment_circle_interval(px, py, dx, dy, bx, by, radius)]
+    length = math.hypot(bx - ax, by - ay)
+    if length:
+        # 中间的矩形带：沿胶囊方向 0..length，垂直方向 -r..r
+        ux, uy = (bx - ax) / length, (by - ay) / length
+        band = _clip_linear(-math.inf, math.inf, (px - ax) * ux + (py - ay) * uy, dx * ux + dy * uy, 0.0, length)
+        if band: band = _clip_linear(band[0], band[1], (px - ax) * -uy + (py - ay) * ux, dx * -uy + dy * ux, -radius, radius)
+        parts.append(band)
+    parts = [p for p in parts if p is not None]
+    if not parts: return None
+    # 胶囊是凸的，三部分的并集仍是一个区间
+    t0, t1 = max(0.0, min(p[0] for p in parts)), min(1.0, max(p[1] for p in parts))
+    return (t0, t1) if t0 <= t1 else None
+
+def _merge(intervals):
+    intervals.sort()
+    merged = []
+    for t0, t1 in intervals:
+        if merged and t0 <= merged[-1][1]: merged[-1][1] = max(merged[-1][1], t1)
+        else: merged.append([t0, t1])
+    return merged
+
+def _complement(removed):
+    """[0, 1] 去掉 removed 之后剩下的区间。"""
+    kept, cursor = [], 0.0
+    for t0, t1 in removed:
+        if t0 > cursor: kept.append((cursor, t0))
+        cursor = max(cursor, t1)
+    if cursor < 1.0: kept.append((cursor, 1.0))
+    return kept
+
+
+# --- 边：直线段与三次贝塞尔 ---
+def _cubic_at(c, t):
+    (x0, y0), (x1, y1), (x2, y2), (x3, y3) = c
+    s = 1 - t
+    b0, b1, b2, b3 = s * s * s, 3 * s * s * t, 3 * s * t * t, t * t * t
+    return (b0 * x0 + b1 * x1 + b2 * x2 + b3 * x3, b0 * y0 + b1 * y1 + b2 * y2 + b3 * y3)
+
+def _cubic_split(c, t):
+    (x0, y0), (x1, y1), (x2, y2), (x3, y3) = c
+    def lerp(a, b): return (a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t)
+    p01, p12, p23 = lerp((x0, y0), (x1, y1)), lerp((x1, y1), (x2, y2)), lerp((x2, y2), (x3, y3))
+    p012, p123 = lerp(p01, p12), lerp(p12, p23)
+    mid = lerp(p012, p123)
+    return ((x0, y0), p01, p012, mid), (mid, p123, p23, (x3, y3))
+
+def _cubic_sub(c, t0, t1):
+    """c 在 [t0, t1] 上的一段，仍是三次贝塞尔。"""
+    if t1 < 1.0: c = _cubic_split(c, t1)[0]
+    if t0 > 0.0: c = _cubic_split(c, t0 / t1)[1]
+    return c
+
+def _edge_box(edge):
+    xs, ys = [p[0] for p in edge], [p[1] for p in edge]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def _edge_removed(edge, capsules, radius):
+    """边上落在任一胶囊内的参数区间 (已合并)。edge 是 2 个点 (直线) 或 4 个点 (三次贝塞尔)。"""
+    x0, y0, x1, y1 = _edge_box(edge)
+    near = [c for c in capsules if min(c[0], c[2]) - radius <= x1 and max(c[0], c[2]) + radius >= x0
+            and min(c[1], c[3]) - radius <= y1 and max(c[1], c[3]) + radius >= y0]
+    if not near: return []
+    if len(edge) == 2:
+        (px, py), (qx, qy) = edge
+        # 只是相切 (区间长度为 0) 时不切开
+        return _merge([i for i in (segment_capsule_interval(px, py, qx, qy, c, radius) for c in near) if i and i[1] - i[0] > 1e-9])
+
+    radius_sq = radius * radius
+    def inside(t):
+        x, y = _cubic_at(edge, t)
+        return any(point_segment_distance_sq(x, y, *c) <= radius_sq for c in near)
+    # 控制多边形的长度是曲线长度的上界；采样间距不超过 r/2，擦过曲线的胶囊不会漏掉
+    length = sum(math.hypot(b[0] - a[0], b[1] - a[1]) for a, b in zip(edge, edge[1:]))
+    steps = max(4, min(512, math.ceil(length / max(radius * 0.5, 1e-6))))
+    samples = [inside(k / steps) for k in range(steps + 1)]
+    if not any(samples): return []
+    def boundary(lo, hi):
+        # lo 与 hi 的 inside 不同，二分找交界
+        inside_lo = inside(lo)
+        for _ in range(BISECT_STEPS):
+            mid = (lo + hi) / 2
+            if inside(mid) == inside_lo: lo = mid
+            else: hi = mid
+        return (lo + hi) / 2
+    removed, start = [], None
+    for k, flag in enumerate(samples):
+        t = k / steps
+        if flag and start is None:
+            start = 0.0 if k == 0 else boundary((k - 1) / steps, t)
+        elif not flag and start is not None:
+            removed.append([start, boundary((k - 1) / steps, t)]); start = None
+    if start is not None: removed.append([start, 1.0])
+    return removed
+
+def _edge_sub(edge, t0, t1):
+    if len(edge) == 2:
+        # 端点原样保留 (t 为 0 或 1 时不经过插值)，闭合链首尾相接的判断依赖这一点
+        (px, py), (qx, qy) = edge
+        start = edge[0] if t0 == 0.0 else (px + (qx - px) * t0, py + (qy - py) * t0)
+        end = edge[1] if t1 == 1.0 else (px + (qx - px) * t1, py + (qy - py) * t1)
+        return (start, end)
+    return _cubic_sub(edge, t0, t1)
+
+def _edge_length(edge):
+    return sum(math.hypot(b[0] - a[0], b[1] - a[1]) for a, b in zip(edge, edge[1:]))
+
+
+# --- 链：首尾相接的边 ---
+def cut_chain(edges, capsules, radius, closed=False):
+    """删掉胶囊覆盖的部分，返回剩下的链列表；没有边被碰到时返回 None。closed 的链首尾剩余部分接回一条。"""
+    # 先用所有胶囊的总范围粗筛，长链上离笔划远的边只做几次比较
+    left = min(min(c[0], c[2]) for c in capsules) - radius; right = max(max(c[0], c[2]) for c in capsules) + radius
+    top = min(min(c[1], c[3]) for c in capsules) - radius; bottom = max(max(c[1], c[3]) for c in capsules) + radius
+    pieces, current, touched = [], None, False
+    for edge in edges:
+        if (all(p[0] < left for p in edge) or all(p[0] > right for p in edge)
+                or all(p[1] < top for p in edge) or all(p[1] > bottom for p in edge)):
+            removed = None
+        else:
+            removed = _edge_removed(edge, capsules, radius)
+        if not removed:
+            if current is None: current = []
+            current.append(edge)
+            continue
+        touched = True
+        for t0, t1 in _complement(removed):
+            if t0 > 0.0 or current is None:
+                if current: pieces.append(current)
+                current = []
+            current.append(_edge_sub(edge, t0, t1))
+            if t1 < 1.0:
+                pieces.append(current); current = None
+        if removed[-1][1] >= 1.0 and current is not None:
+            pieces.append(current); current = None
+    if current: pieces.append(current)
+    if not touched: return None
+    if closed and len(pieces) >= 2 and pieces[0][0][0] == edges[0][0] and pieces[-1][-1][-1] == edges[-1][-1]:
+        # 闭合链的起点没被擦到：最后一段与第一段实际上连在一起
+        pieces[0] = pieces.pop() + pieces[0]
+    return [piece for piece in pieces if sum(_edge_length(e) for e in piece) > MIN_PIECE_LENGTH]
+
+
+# --- 图形 <-> 链 ---
+def is_splittable(shape):
+    return type(shape) in (Polyline, Polygon, Path)
+
+def _world_matrix(shape):
+    return from_qtransform(shape_base_transform(shape))
+
+def shape_chains(shape):
+    """可切分的图形 -> [(边列表, 是否闭合)]，世界坐标；路径的每条边是三次贝塞尔的 4 个控制点。"""
+    m = _world_matrix(shape)
+    if isinstance(shape, Polygon): # Polyline 是 Polygon 的子类
+        c = shape.coords
+        points = [map_xy(m, c[i], c[i + 1]) for i in range(0, len(c), 2)]
+        closed = type(shape) is Polygon and len(points) >= 3
+        if closed: points = points + [points[0]]
+        return [(list(zip(points, points[1:])), closed)] if len(points) >= 2 else []
+    chains = []
+    for sub_path in shape.sub_paths:
+        if len(sub_path) < 2: continue
+        edges = []
+        for start, end in zip(sub_path, sub_path[1:]):
+            edges.append((map_xy(m, start.ax, start.ay), map_xy(m, start.h2x, start.h2y),
+                          map_xy(m, end.h1x, end.h1y), map_xy(m, end.ax, end.ay)))
+        closed = sub_path[0].ax == sub_path[-1].ax and sub_path[0].ay == sub_path[-1].ay
+        chains.append((edges, closed))
+    return chains
+
+def _chain_to_segments(edges):
+    """三次贝塞尔链 -> PathSegment 列表；接点处两侧控制柄共线时标为平滑节点。"""
+    segments = [PathSegment(QPointF(*edges[0][0]), None, QPointF(*edges[0][1]), PathSegment.CORNER)]
+    for previous, edge in zip(edges, edges[1:]):
+        (ix, iy), (ax, ay), (ox, oy) = previous[2], edge[0], edge[1]
+        cross = (ax - ix) * (oy - ay) - (ay - iy) * (ox - ax)
+        dot = (ax - ix) * (ox - ax) + (ay - iy) * (oy - ay)
+        smooth = dot > 0 and abs(cross) <= 1e-6 * max(1.0, math.hypot(ax - ix, ay - iy) * math.hypot(ox - ax, oy - ay))
+        segments.append(PathSegment(QPointF(ax, ay), QPointF(ix, iy), QPointF(ox, oy), PathSegment.SMOOTH if smooth else PathSegment.CORNER))
+    last = edges[-1]
+    segments.append(PathSegment(QPointF(*last[3]), QPointF(*last[2]), None, PathSegment.CORNER))
+    return segments
+
+# 可切分的图形共有的样式槽位；切分后类型改变时按名字复制
+STYLE_SLOTS = ('color', 'width', 'fill_color', 'fill_style')
+
+def _derived(shape, cls, geometry):
+    """克隆原图形 (沿用全部样式)，只把几何换成 geometry：Polygon/Polyline 是点列表，Path 是 sub_paths。"""
+    piece = shape.clone()
+    if type(piece) is not cls:
+        # 闭合多边形切开成折线、带洞的区域成为 Path
+        target = cls(geometry)
+        for name in STYLE_SLOTS: setattr(target, name, getattr(piece, name))
+        piece = target
+    elif cls is Path:
+        piece.sub_paths = geometry; piece.invalidate_geometry()
+    else:
+        piece.points = geometry
+    # 切出的几何已在世界坐标下
+    piece.angle, piece.scale_x, piece.scale_y = 0.0, 1.0, 1.0
+    return piece
+
+
+# --- 有填充的图形：面积相减 ---
+def world_path(shape):
+    if isinstance(shape, Path): path = shape.get_painter_path()
+    else:
+        path = QPainterPath(); path.addPolygon(QPolygonF(shape.points)); path.closeSubpath()
+    return shape_base_transform(shape).map(path)
+
+def swept_path(capsules, radius):
+    """胶囊并集的轮廓：沿采样折线用圆头圆角描边。"""
+    path = QPainterPath()
+    for ax, ay, bx, by in capsules:
+        path.moveTo(ax, ay); path.lineTo(bx, by)
+    stroker = QPainterPathStroker()
+    stroker.setWidth(radius * 2)
+    stroker.setCapStyle(Qt.PenCapStyle.RoundCap); stroker.setJoinStyle(Qt.PenJoinStyle.RoundJoin)
+    swept = stroker.createStroke(path)
+    # 长度为 0 的胶囊 (单击) 描边后是空的，补上圆盘
+    dots = QPainterPath()
+    for ax, ay, bx, by in capsules:
+        if ax == bx and ay == by: dots.addEllipse(QPointF(ax, ay), radius, radius)
+    return swept.united(dots) if not dots.isEmpty() else swept
+
+def area_to_shapes(shape, area: QPainterPath):
+    """相减后的区域 -> 新图形列表。多边形没有洞时每块仍是 Polygon；否则合成一个闭合折线子路径组成的 Path (奇偶填充)。"""
+    rings = []
+    for polygon in area.toSubpathPolygons():
+        points = [QPointF(p) for p in polygon]
+        if len(points) >= 2 and points[0] == points[-1]: points.pop()
+        if len(points) >= 3: rings.append(points)
+    if not rings: return []
+    xy = [[(p.x(), p.y()) for p in ring] for ring in rings]
+    nested = any(point_in_polygon(*a[0], b) for a in xy for b in xy if a is not b)
+    if isinstance(shape, Polygon) and not nested:
+        return [_derived(shape, Polygon, ring) for ring in rings]
+    return [_derived(shape, Path, [[PathSegment(p) for p in ring + [QPointF(ring[0])]] for ring in rings])]
+
+
+class CutState:
+    """一个图形在一次笔划中的切分状态 (剩下的链或区域)；apply() 每拍只处理新的胶囊。"""
+    __slots__ = ('shape', 'filled', 'chains', 'area', 'changed')
+
+    def __init__(self, shape):
+        self.shape = shape
+        self.filled = is_filled(shape)
+        self.changed = False
+        if self.filled:
+            self.area, self.chains = world_path(shape), None
+        else:
+            self.area, self.chains = None, shape_chains(shape)
+
+    def apply(self, capsules, radius):
+        if self.filled:
+            swept = swept_path(capsules, radius)
+            if swept.intersects(self.area):
+                self.area = self.area.subtracted(swept); self.changed = True
+            return
+        chains = []
+        for edges, closed in self.chains:
+            pieces = cut_chain(edges, capsules, radius, closed)
+            if pieces is None: chains.append((edges, closed))
+            else:
+                self.changed = True
+                # 闭合链被切开后，剩下的部分都是开放的
+                chains.extend((piece, False) for piece in pieces)
+        self.chains = chains
+
+    def result(self):
+        """替换原图形的新图形列表 (可能为空)。"""
+        if self.filled: return area_to_shapes(self.shape, self.area)
+        if isinstance(self.shape, Path):
+            # 剩下的各条链作为子路径合成一个 Path；没被切到的闭合子路径首尾锚点仍然重合，照样闭合
+            sub_paths = [_chain_to_segments(edges) for edges, _ in self.chains]
+            if not sub_paths: return []
+            return [_derived(self.shape, Path, sub_paths)]
+        result = []
+        for edges, closed in self.chains:
+            points = [QPointF(*edges[0][0])] + [QPointF(*edge[-1]) for edge in edges]
+            result.append(_derived(self.shape, Polygon, points[:-1]) if closed else _derived(self.shape, Polyline, points))
+        return result
+
+    def preview_path(self) -> QPainterPath:
+        """剩余部分的世界坐标路径，笔划期间用来预览。"""
+        if self.filled: return self.area
+        path = QPainterPath()
+        for edges, closed in self.chains:
+            path.moveTo(*edges[0][0])
+            for edge in edges:
+                if len(edge) == 2: path.lineTo(*edge[1])
+                else: path.cubicTo(*edge[1], *edge[2], *edge[3])
+        return path
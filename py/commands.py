@@ -1,18 +1,47 @@
 from PyQt6.QtGui import QColor
-from shapes import ShapeGroup
+from shapes import BaseShape, ShapeGroup, PathSegment, Symbol, SymbolInstance
+from geometry import translation, scaling_about, transform_shapes
+
+# --- 撤销历史的内存估算 (字节，数量级正确即可) ---
+COMMAND_BASE_BYTES = 256      # 命令对象本身 + __dict__
+SHAPE_BASE_BYTES = 400        # 图形对象 (__slots__)、QColor、变换属性等
+POINT_BYTES = 72              # 一个 QPointF 包装对象 + 列表槽位
+COORD_POINT_BYTES = 16        # array('d') 中的一个点 (x, y)
+SEGMENT_BYTES = 120 + 6 * 24  # 带 __slots__ 的 PathSegment：六个 float + 节点类型
+REFERENCE_BYTES = 8           # 只引用 (不独占) 的对象按指针大小计
+
+def estimate_shape_bytes(shape):
+    """粗略估算一个图形及其坐标数据占用的内存。"""
+    size = SHAPE_BASE_BYTES
+    if isinstance(shape, ShapeGroup):
+        return size + sum(estimate_shape_bytes(s) for s in shape.shapes)
+    if hasattr(shape, 'sub_paths'):
+        size += sum(len(sp) for sp in shape.sub_paths) * SEGMENT_BYTES
+    if hasattr(shape, 'coords'):
+        size += shape.point_count * COORD_POINT_BYTES
+    if hasattr(shape, 'text'):
+        size += len(shape.text) * 4
+    return size
+
+def estimate_layer_bytes(layer):
+    size = SHAPE_BASE_BYTES + sum(estimate_shape_bytes(s) for s in layer.shapes)
+    return size + sum(entry[0].sizeInBytes() for entry in layer.tiles.values() if entry[0] is not None)
 
 class Command:
     def undo(self): raise NotImplementedError
     def redo(self): raise NotImplementedError
+    def merge_with(self, other):
+        """尝试把紧随其后、已经执行过的 other 折叠进自身；成功时返回 True。"""
+        return False
+    def estimate_size(self):
+        """该命令在撤销栈中独占的内存 (字节)。默认只计命令本身和对图形的引用。"""
+        return COMMAND_BASE_BYTES + len(getattr(self, 'shapes', ())) * REFERENCE_BYTES
 
-# --- 辅助函数，用于从shapes中找到所有受影响的图层 ---
-def _get_affected_layers(shapes):
-    layers = set()
-    for shape in shapes:
-        # 假设 shape 对象能够反向引用到它的 layer
-        if hasattr(shape, 'layer') and shape.layer:
-            layers.add(shape.layer)
-    return layers
+# --- 辅助函数 ---
+# 图形命令不必标记图层：图形的增删和几何/样式变化会通知所在图层，图层据此只作废受影响的瓦片
+def _same_shapes(a, b):
+    """两组图形是否为同一批对象 (按身份比较，顺序无关)。"""
+    return len(a) == len(b) and {id(s) for s in a} == {id(s) for s in b}
 
 # --- 图层操作命令 ---
 # 对于图层本身的增删改，我们通常需要重绘所有内容，
@@ -26,8 +55,14 @@ class AddLayerCommand(Command):
 class RemoveLayerCommand(Command):
     def __init__(self, canvas, layer, index):
         self.canvas, self.layer, self.index = canvas, layer, index
-    def undo(self): self.canvas.layers.insert(self.index, self.layer)
-    def redo(self): self.canvas.layers.pop(self.index)
+    def undo(self):
+        self.canvas.layers.insert(self.index, self.layer)
+        self.layer.is_dirty = True
+    def redo(self):
+        self.canvas.layers.pop(self.index)
+        # 🟢 被删除的图层只活在撤销栈里，没必要继续占着瓦片缓存
+        self.layer.tiles.clear()
+    def estimate_size(self): return COMMAND_BASE_BYTES + estimate_layer_bytes(self.layer)
 
 class MoveLayerCommand(Command):
     def __init__(self, canvas, from_index, to_index):
@@ -44,54 +79,93 @@ class AddShapeCommand(Command):
     def __init__(self, layer, shape):
         self.layer, self.shape = layer, shape
     def undo(self):
-        if self.shape in self.layer.shapes: self.layer.shapes.remove(self.shape)
-        self.layer.is_dirty = True
+        self.layer.shapes.discard(self.shape)
     def redo(self):
+        # 追加到最上层：图层会把它直接叠画到已有瓦片上
         self.layer.shapes.append(self.shape)
-        self.layer.is_dirty = True
 
 class AddShapesCommand(Command):
     def __init__(self, layer, shapes):
         self.layer = layer
         self.shapes = list(shapes)
     def undo(self):
-        self.layer.shapes = [s for s in self.layer.shapes if s not in self.shapes]
-        self.layer.is_dirty = True
+        self.layer.shapes.remove_many(self.shapes)
     def redo(self):
         self.layer.shapes.extend(self.shapes)
-        self.layer.is_dirty = True
 
 class RemoveShapesCommand(Command):
     def __init__(self, layer, shapes):
         self.layer, self.shapes = layer, list(shapes)
+        # 🟢 合并后的命令包含多批先后发生的删除；每批删除前的位置单独记录，撤销时逆序插回，z-order 不变
+        self.batches = [self.shapes]
+        self.batch_positions = []
     def undo(self):
-        self.layer.shapes.extend(self.shapes)
-        self.layer.is_dirty = True
+        for positions in reversed(self.batch_positions):
+            self.layer.shapes.insert_many(positions)
     def redo(self):
-        self.layer.shapes = [s for s in self.layer.shapes if s not in self.shapes]
-        self.layer.is_dirty = True
+        self.batch_positions = []
+        for batch in self.batches:
+            self.batch_positions.append(self.layer.shapes.positions_of(batch))
+            self.layer.shapes.remove_many(batch)
+            # 🟢 被删除的编组只活在撤销栈里，丢掉它的合成图缓存
+            for shape in batch:
+                if isinstance(shape, ShapeGroup): shape.render_cache = None
+    def merge_with(self, other):
+        if type(other) is not RemoveShapesCommand or other.layer is not self.layer: return False
+        self.batches = self.batches + other.batches
+        self.batch_positions = self.batch_positions + other.batch_positions
+        self.shapes = self.shapes + other.shapes
+        return True
+    def estimate_size(self):
+        # 被删除的图形只被这个命令引用，全部算在它头上
+        return COMMAND_BASE_BYTES + sum(estimate_shape_bytes(s) for s in self.shapes)
+
+class ReplaceShapesCommand(Command):
+    """replacements: [(原图形, [新图形, ...])]；新图形 (可以为空) 占据原图形在 z-order 中的位置。"""
+    def __init__(self, layer, replacements):
+        self.layer = layer
+        self.replacements = [(old, list(new)) for old, new in replacements]
+        self.positions = []
+    @property
+    def shapes(self): return [old for old, _ in self.replacements]
+    def redo(self):
+        new_by_old = {id(old): new for old, new in self.replacements}
+        self.positions = self.layer.shapes.positions_of(self.shapes)
+        self.layer.shapes.remove_many(self.shapes)
+        # 第 k 个被删的图形原来在 index；它前面已经删了 k 个、插入了 inserted 个
+        positioned, inserted = [], 0
+        for k, (index, old) in enumerate(self.positions):
+            for j, shape in enumerate(new_by_old[id(old)]): positioned.append((index - k + inserted + j, shape))
+            inserted += len(new_by_old[id(old)])
+        self.layer.shapes.insert_many(positioned)
+    def undo(self):
+        self.layer.shapes.remove_many([shape for _, new in self.replacements for shape in new])
+        self.layer.shapes.insert_many(self.positions)
+    def estimate_size(self):
+        # 原图形只被撤销栈引用；新图形在图层里，按引用计
+        return (COMMAND_BASE_BYTES + sum(estimate_shape_bytes(old) for old, _ in self.replacements)
+                + sum(len(new) for _, new in self.replacements) * REFERENCE_BYTES)
 
 class MoveShapesCommand(Command):
     def __init__(self, shapes, dx, dy):
         self.shapes, self.dx, self.dy = list(shapes), dx, dy
-        # 🔴 预先找出所有受影响的图层
-        self.affected_layers = _get_affected_layers(self.shapes)
 
     def undo(self):
-        for shape in self.shapes: shape.move(-self.dx, -self.dy)
-        for layer in self.affected_layers: layer.is_dirty = True # 🔴 标记
+        transform_shapes(self.shapes, translation(-self.dx, -self.dy))
             
     def redo(self):
-        for shape in self.shapes: shape.move(self.dx, self.dy)
-        for layer in self.affected_layers: layer.is_dirty = True # 🔴 标记
+        transform_shapes(self.shapes, translation(self.dx, self.dy))
+
+    def merge_with(self, other):
+        if type(other) is not MoveShapesCommand or not _same_shapes(self.shapes, other.shapes): return False
+        self.dx += other.dx; self.dy += other.dy
+        return True
 
 class ChangePropertiesCommand(Command):
     def __init__(self, shapes, new_properties):
         self.shapes = list(shapes)
         self.new_properties = new_properties
         self.old_properties = {}
-        # 🔴 预先找出所有受影响的图层
-        self.affected_layers = _get_affected_layers(self.shapes)
         
         for shape in self.shapes:
             self.old_properties[shape] = {}
@@ -100,94 +174,131 @@ class ChangePropertiesCommand(Command):
                 if hasattr(shape, prop_name):
                     self.old_properties[shape][prop_name] = getattr(shape, prop_name)
 
+    def merge_with(self, other):
+        # 只合并对同一批对象、同一组属性的连续修改 (例如拖动字号/透明度)；旧值保持为第一条命令记录的值
+        if type(other) is not ChangePropertiesCommand or not _same_shapes(self.shapes, other.shapes): return False
+        if set(other.new_properties) != set(self.new_properties): return False
+        self.new_properties = dict(other.new_properties)
+        return True
+
+    def estimate_size(self):
+        return COMMAND_BASE_BYTES + len(self.shapes) * (REFERENCE_BYTES + len(self.new_properties) * 2 * POINT_BYTES)
+
+    def _notify_changed(self):
+        # 按属性种类递增图形的几何/样式版本号；图层没有版本号
+        for shape in self.shapes:
+            if isinstance(shape, BaseShape): shape.properties_changed(self.new_properties)
+
     def undo(self):
         for shape in self.shapes:
             for prop_name, value in self.old_properties[shape].items():
                 setattr(shape, prop_name, value)
-        # 🔴 如果改变的是图层本身的属性（比如透明度），shape就是layer，也能被正确标记
-        for layer in self.affected_layers: layer.is_dirty = True
+        self._notify_changed()
             
     def redo(self):
         for shape in self.shapes:
             for prop_name, value in self.new_properties.items():
                 setattr(shape, prop_name, value)
-        for layer in self.affected_layers: layer.is_dirty = True
+        self._notify_changed()
 
 class GroupCommand(Command):
     def __init__(self, layer, shapes_to_group):
         self.layer = layer
-        self.shapes_to_group = list(shapes_to_group)
+        # 组内顺序按图层中的 z-order 排列，而不是选择顺序
+        self.positions = layer.shapes.positions_of(shapes_to_group)
+        self.shapes_to_group = [shape for _, shape in self.positions]
         self.group = ShapeGroup(self.shapes_to_group)
     def undo(self):
-        self.layer.shapes.remove(self.group)
-        self.layer.shapes.extend(self.shapes_to_group)
-        self.layer.is_dirty = True # 🔴 标记
+        self.layer.shapes.discard(self.group)
+        self.group.release_children()
+        self.layer.shapes.insert_many(self.positions)
     def redo(self):
-        for shape in self.shapes_to_group:
-            if shape in self.layer.shapes: self.layer.shapes.remove(shape)
-        self.layer.shapes.append(self.group)
-        self.layer.is_dirty = True # 🔴 标记
+        self.positions = self.layer.shapes.positions_of(self.shapes_to_group)
+        self.layer.shapes.remove_many(self.shapes_to_group)
+        self.group.adopt_children()
+        # 编组放在原先最上层成员的位置
+        group_index = self.positions[-1][0] - (len(self.positions) - 1) if self.positions else len(self.layer.shapes)
+        self.layer.shapes.insert(group_index, self.group)
 
 class UngroupCommand(Command):
     def __init__(self, layer, group_to_ungroup):
         self.layer = layer
         self.group = group_to_ungroup
         self.shapes_inside = list(group_to_ungroup.shapes)
+        self.group_index = None
     def undo(self):
-        for shape in self.shapes_inside:
-            if shape in self.layer.shapes: self.layer.shapes.remove(shape)
-        self.layer.shapes.append(self.group)
-        self.layer.is_dirty = True # 🔴 标记
+        self.layer.shapes.remove_many(self.shapes_inside)
+        self.group.adopt_children()
+        self.layer.shapes.insert(self.group_index, self.group)
     def redo(self):
+        self.group_index = self.layer.shapes.index(self.group)
         self.layer.shapes.remove(self.group)
-        self.layer.shapes.extend(self.shapes_inside)
-        self.layer.is_dirty = True # 🔴 标记
+        self.group.release_children()
+        self.layer.shapes.insert_many([(self.group_index + i, shape) for i, shape in enumerate(self.shapes_inside)])
+
+class CreateSymbolCommand(Command):
+    """把选中的图形转换为一个新符号，并在原位置放一个引用它的实例。"""
+    def __init__(self, layer, shapes, name):
+        self.layer = layer
+        self.positions = layer.shapes.positions_of(shapes)
+        self.shapes = [shape for _, shape in self.positions]
+        # 母版使用克隆 (写时复制，不复制坐标)，撤销后原图形再被编辑也不会影响符号
+        self.symbol = Symbol(name, [shape.clone() for shape in self.shapes])
+        self.instance = SymbolInstance(self.symbol)
+    def undo(self):
+        self.layer.shapes.discard(self.instance)
+        self.layer.shapes.insert_many(self.positions)
+    def redo(self):
+        self.positions = self.layer.shapes.positions_of(self.shapes)
+        self.layer.shapes.remove_many(self.shapes)
+        index = self.positions[-1][0] - (len(self.positions) - 1) if self.positions else len(self.layer.shapes)
+        self.layer.shapes.insert(index, self.instance)
+    def estimate_size(self):
+        return COMMAND_BASE_BYTES + SHAPE_BASE_BYTES + sum(estimate_shape_bytes(s) for s in self.symbol.shapes)
 
 class ScaleCommand(Command):
     def __init__(self, shapes, factor, center):
         self.shapes = list(shapes); self.factor = factor; self.center = center
-        self.affected_layers = _get_affected_layers(self.shapes) # 🔴
     def undo(self):
         if self.factor == 0: return
         inverse_factor = 1.0 / self.factor
-        for shape in self.shapes: shape.scale(inverse_factor, self.center)
-        for layer in self.affected_layers: layer.is_dirty = True # 🔴
+        transform_shapes(self.shapes, scaling_about(inverse_factor, self.center.x(), self.center.y()))
     def redo(self):
-        for shape in self.shapes: shape.scale(self.factor, self.center)
-        for layer in self.affected_layers: layer.is_dirty = True # 🔴
+        transform_shapes(self.shapes, scaling_about(self.factor, self.center.x(), self.center.y()))
+    def merge_with(self, other):
+        if type(other) is not ScaleCommand or not _same_shapes(self.shapes, other.shapes): return False
+        if other.center != self.center or other.factor == 0: return False
+        self.factor *= other.factor
+        return True
 
 class RotateCommand(Command):
     def __init__(self, shapes, rotation_delta):
         self.shapes = list(shapes); self.rotation_delta = rotation_delta
-        self.affected_layers = _get_affected_layers(self.shapes) # 🔴
     def undo(self):
         for shape in self.shapes: shape.rotate(-self.rotation_delta)
-        for layer in self.affected_layers: layer.is_dirty = True # 🔴
     def redo(self):
         for shape in self.shapes: shape.rotate(self.rotation_delta)
-        for layer in self.affected_layers: layer.is_dirty = True # 🔴
+    def merge_with(self, other):
+        if type(other) is not RotateCommand or not _same_shapes(self.shapes, other.shapes): return False
+        self.rotation_delta += other.rotation_delta
+        return True
 
 class FlipCommand(Command):
     def __init__(self, shapes, direction):
         self.shapes = list(shapes); self.direction = direction
-        self.affected_layers = _get_affected_layers(self.shapes) # 🔴
     def undo(self): self.redo()
     def redo(self):
         for shape in self.shapes:
             if self.direction == 'horizontal': shape.flip_horizontal()
             elif self.direction == 'vertical': shape.flip_vertical()
-        for layer in self.affected_layers: layer.is_dirty = True # 🔴
 
 class ModifyNodeCommand(Command):
     def __init__(self, shape, node_index, old_pos, new_pos):
         self.shape, self.node_index = shape, node_index; self.old_pos, self.new_pos = old_pos, new_pos
-        self.affected_layers = _get_affected_layers([self.shape]) # 🔴
     def undo(self):
         self.shape.set_node_at(self.node_index, self.old_pos)
-        for layer in self.affected_layers: layer.is_dirty = True # 🔴
     def redo(self):
         self.shape.set_node_at(self.node_index, self.new_pos)
-        for layer in self.affected_layers: layer.is_dirty = True # 🔴
 
 class CompositeCommand(Command):
     def __init__(self, commands):
@@ -196,16 +307,72 @@ class CompositeCommand(Command):
         for cmd in reversed(self.commands): cmd.undo()
     def redo(self):
         for cmd in self.commands: cmd.redo()
+    def estimate_size(self):
+        return COMMAND_BASE_BYTES + sum(cmd.estimate_size() for cmd in self.commands)
 
 class ModifyPathCommand(Command):
-    def __init__(self, path_shape, old_sub_paths, new_sub_paths):
+    """
+    以增量记录对 Path 的修改 (state 为 PathSegment.get_state())：
+        ("set", sp_idx, seg_idx, old_state, new_state) / ("insert" | "remove", sp_idx, seg_idx, state)
+        ("insert_sub_path" | "remove_sub_path", sp_idx, [state, ...])
+    """
+    def __init__(self, path_shape, ops):
         self.path_shape = path_shape
-        self.old_sub_paths = [ [seg.clone() for seg in sp] for sp in old_sub_paths ]
-        self.new_sub_paths = [ [seg.clone() for seg in sp] for sp in new_sub_paths ]
-        self.affected_layers = _get_affected_layers([self.path_shape]) # 🔴
+        self.ops = list(ops)
+
+    @staticmethod
+    def _inverse(op):
+        kind = op[0]
+        if kind == "set": return ("set", op[1], op[2], op[4], op[3])
+        if kind == "insert": return ("remove",) + op[1:]
+        if kind == "remove": return ("insert",) + op[1:]
+        if kind == "insert_sub_path": return ("remove_sub_path",) + op[1:]
+        if kind == "remove_sub_path": return ("insert_sub_path",) + op[1:]
+        raise ValueError(f"未知的路径操作: {kind}")
+
+    def _apply(self, op):
+        kind, sub_paths = op[0], self.path_shape.detach() # 与克隆体共享的节点先复制一份
+        if kind == "set": sub_paths[op[1]][op[2]].set_state(op[4])
+        elif kind == "insert": sub_paths[op[1]].insert(op[2], PathSegment.from_state(op[3]))
+        elif kind == "remove": sub_paths[op[1]].pop(op[2])
+        elif kind == "insert_sub_path": sub_paths.insert(op[1], [PathSegment.from_state(st) for st in op[2]])
+        elif kind == "remove_sub_path": sub_paths.pop(op[1])
+
     def undo(self):
-        self.path_shape.sub_paths = self.old_sub_paths
-        for layer in self.affected_layers: layer.is_dirty = True # 🔴
+        for op in reversed(self.ops): self._apply(self._inverse(op))
+        self.path_shape.invalidate_geometry()
     def redo(self):
-        self.path_shape.sub_paths = self.new_sub_paths
-        for layer in self.affected_layers: layer.is_dirty = True # 🔴
\ No newline at end of file
+        for op in self.ops: self._apply(op)
+        self.path_shape.invalidate_geometry()
+    def merge_with(self, other):
+        if type(other) is not ModifyPathCommand or other.path_shape is not self.path_shape: return False
+        self.ops.extend(other.ops)
+        return True
+    def estimate_size(self):
+        return COMMAND_BASE_BYTES + sum(SEGMENT_BYTES * (len(op[2]) if op[0].endswith("sub_path") else 1) for op in self.ops)
+
+    # --- 常用操作的构造辅助 ---
+    @staticmethod
+    def segment_changes(path_shape, original_states):
+        """
+        original_states: {(sp_idx, seg_idx): 修改前的状态}。
+        与当前状态比较，只为真正变化了的节点生成 "set" 操作。
+        """
+        ops = []
+        for (sp_idx, seg_idx), old_state in original_states.items():
+            new_state = path_shape.sub_paths[sp_idx][seg_idx].get_state()
+            if new_state != old_state: ops.append(("set", sp_idx, seg_idx, old_state, new_state))
+        return ops
+
+    @staticmethod
+    def segment_removal(path_shape, sp_idx, seg_idx):
+        """生成与 Path.remove_segment 等价的操作序列 (不修改路径本身)。"""
+        sub_path = path_shape.sub_paths[sp_idx]
+        is_closed_path = len(sub_path) > 1 and sub_path[0].anchor == sub_path[-1].anchor
+        if is_closed_path and (seg_idx == 0 or seg_idx == len(sub_path) - 1):
+            indices = [len(sub_path) - 1, 0]
+        else:
+            indices = [seg_idx]
+        if len(indices) == len(sub_path):
+            return [("remove_sub_path", sp_idx, [seg.get_state() for seg in sub_path])]
+        return [("remove", sp_idx, i, sub_path[i].get_state()) for i in indices]
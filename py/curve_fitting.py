@@ -0,0 +1,306 @@
+# curve_fitting.py - 手绘笔划的折线简化与三次贝塞尔拟合
+#
+# 一笔手绘有几百上千个采样点；简化 (RDP / Visvalingam) 或拟合成贝塞尔 (Schneider) 后再存成图形。
+# 输入是 QPoint / QPointF 序列，内部用 (x, y) 浮点元组计算；容差都是世界坐标下的距离。
+
+import math
+import heapq
+
+from PyQt6.QtCore import QPointF
+
+from shapes import PathSegment
+
+FREEHAND_MODES = {
+    "raw": "保留全部采样点",
+    "simplify": "简化折线",
+    "bezier": "拟合贝塞尔曲线",
+}
+DEFAULT_FREEHAND_MODE = "simplify"
+DEFAULT_TOLERANCE = 1.0 # 屏幕像素；手绘工具按当前缩放换算成世界坐标
+
+
+def _coords(points):
+    return [(float(p.x()), float(p.y())) for p in points]
+
+def _segment_distance_sq(px, py, ax, ay, bx, by):
+    """点到线段 (而不是直线) 的距离平方：笔划折返时直线距离会把远处的点误判为很近。"""
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq:
+        t = ((px - ax) * dx + (py - ay) * dy) / length_sq
+        if t > 1: ax, ay = bx, by
+        elif t > 0: ax, ay = ax + t * dx, ay + t * dy
+    return (px - ax) ** 2 + (py - ay) ** 2
+
+
+# --- 折线简化 ---
+def rdp_indices(coords, tolerance):
+    """RDP 保留下来的下标 (升序，含首尾)；显式栈代替递归。"""
+    count = len(coords)
+    if count < 3: return list(range(count))
+    tolerance_sq = tolerance * tolerance
+    keep = [False] * count
+    keep[0] = keep[-1] = True
+    stack = [(0, count - 1)]
+    while stack:
+        first, last = stack.pop()
+        (ax, ay), (bx, by) = coords[first], coords[last]
+        worst, worst_index = tolerance_sq, None
+        for i in range(first + 1, last):
+            d = _segment_distance_sq(coords[i][0], coords[i][1], ax, ay, bx, by)
+            if d > worst: worst, worst_index = d, i
+        if worst_index is not None:
+            keep[worst_index] = True
+            stack.append((first, worst_index)); stack.append((worst_index, last))
+    return [i for i in range(count) if keep[i]]
+
+def simplify_rdp(points, tolerance):
+    """保留原来的点对象，只删掉可以省略的点。"""
+    return [points[i] for i in rdp_indices(_coords(points), tolerance)]
+
+def simplify_visvalingam(points, tolerance):
+    """删到剩下的每个点与邻点围成的三角形面积都不小于 tolerance² 为止。"""
+    coords = _coords(points)
+    count = len(coords)
+    if count < 3: return list(points)
+    min_area = tolerance * tolerance
+    prev = list(range(-1, count - 1))
+    next_ = list(range(1, count + 1))
+    removed = [False] * count
+
+    def area(i):
+        (ax, ay), (bx, by), (cx, cy) = coords[prev[i]], coords[i], coords[next_[i]]
+        return abs((bx - ax) * (cy - ay) - (cx - ax) * (by - ay)) * 0.5
+
+    # 堆里的旧条目不删除，弹出时与 current 比对跳过 (惰性删除)
+    current = [0.0] * count
+    heap = []
+    for i in range(1, count - 1):
+        current[i] = area(i)
+        heap.append((current[i], i))
+    heapq.heapify(heap)
+    while heap:
+        value, i = heapq.heappop(heap)
+        if removed[i] or value != current[i]: continue
+        if value >= min_area: break
+        removed[i] = True
+        p, n = prev[i], next_[i]
+        next_[p], prev[n] = n, p
+        for j in (p, n):
+            if 0 < j < count - 1:
+                # 有效面积不小于刚删掉的点，保证删除顺序单调
+                current[j] = max(area(j), value)
+                heapq.heappush(heap, (current[j], j))
+    return [points[i] for i in range(count) if not removed[i]]
+
+
+class StreamingSimplifier:
+    """边画边简化：锚点到最新点的线段代表不了中间的点时，把前一个点定下来作为新锚点。"""
+    # 待定的点最多 MAX_PENDING 个，每个采样点的开销有上界
+    MAX_PENDING = 64
+
+    def __init__(self, tolerance):
+        self.tolerance_sq = tolerance * tolerance
+        self.points = []    # 已经定下的点 (原始点对象)
+        self._pending = []  # 锚点之后还没定下的点
+        self._pending_xy = []
+        self._anchor = None
+
+    def __len__(self):
+        return len(self.points) + (1 if self._pending else 0)
+
+    def add(self, point):
+        x, y = float(point.x()), float(point.y())
+        if self._anchor is None:
+            self.points.append(point); self._anchor = (x, y)
+            return
+        last = self._pending_xy[-1] if self._pending_xy else self._anchor
+        if (x, y) == last: return # 鼠标没动时的重复采样
+        if len(self._pending) >= self.MAX_PENDING or not self._fits(x, y):
+            self.points.append(self._pending[-1]); self._anchor = self._pending_xy[-1]
+            self._pending.clear(); self._pending_xy.clear()
+        self._pending.append(point); self._pending_xy.append((x, y))
+
+    def extend(self, points):
+        for point in points: self.add(point)
+
+    def _fits(self, x, y):
+        ax, ay = self._anchor
+        tolerance_sq = self.tolerance_sq
+        for px, py in self._pending_xy:
+            if _segment_distance_sq(px, py, ax, ay, x, y) > tolerance_sq: return False
+        return True
+
+    def result(self):
+        """已定下的点加上最后一个采样点。"""
+        return self.points + self._pending[-1:]
+
+
+# --- 三次贝塞尔拟合 ---
+def _sub(a, b): return (a[0] - b[0], a[1] - b[1])
+def _dot(a, b): return a[0] * b[0] + a[1] * b[1]
+
+def _normalize(v):
+    length = math.hypot(v[0], v[1])
+    return (v[0] / length, v[1] / length) if length else (0.0, 0.0)
+
+def _bezier_at(bezier, t):
+    (x0, y0), (x1, y1), (x2, y2), (x3, y3) = bezier
+    s = 1 - t
+    b0, b1, b2, b3 = s * s * s, 3 * s * s * t, 3 * s * t * t, t * t * t
+    return (b0 * x0 + b1 * x1 + b2 * x2 + b3 * x3, b0 * y0 + b1 * y1 + b2 * y2 + b3 * y3)
+
+def _chord_parameters(coords, first, last):
+    u = [0.0]
+    for i in range(first + 1, last + 1):
+        (ax, ay), (bx, by) = coords[i - 1], coords[i]
+        u.append(u[-1] + math.hypot(bx - ax, by - ay))
+    total = u[-1] or 1.0
+    return [value / total for value in u]
+
+def _generate_bezier(coords, first, last, u, tangent1, tangent2):
+    """端点与端点切线方向固定，用最小二乘求两个控制柄的长度。"""
+    p0, p3 = coords[first], coords[last]
+    c00 = c01 = c11 = x0 = x1 = 0.0
+    for i, t in enumerate(u):
+        s = 1 - t
+        b0, b1, b2, b3 = s * s * s, 3 * s * s * t, 3 * s * t * t, t * t * t
+        a1 = (tangent1[0] * b1, tangent1[1] * b1)
+        a2 = (tangent2[0] * b2, tangent2[1] * b2)
+        c00 += _dot(a1, a1); c01 += _dot(a1, a2); c11 += _dot(a2, a2)
+        px, py = coords[first + i]
+        rest = (px - (p0[0] * (b0 + b1) + p3[0] * (b2 + b3)), py - (p0[1] * (b0 + b1) + p3[1] * (b2 + b3)))
+        x0 += _dot(a1, rest); x1 += _dot(a2, rest)
+    det = c00 * c11 - c01 * c01
+    alpha1 = (x0 * c11 - x1 * c01) / det if det else 0.0
+    alpha2 = (c00 * x1 - c01 * x0) / det if det else 0.0
+    chord = math.hypot(p3[0] - p0[0], p3[1] - p0[1])
+    if alpha1 < chord * 1e-6 or alpha2 < chord * 1e-6:
+        # 最小二乘给出退化或反向的控制柄时，退回 Wu/Barsky 的启发式：弦长的三分之一
+        alpha1 = alpha2 = chord / 3
+    return (p0, (p0[0] + tangent1[0] * alpha1, p0[1] + tangent1[1] * alpha1),
+            (p3[0] + tangent2[0] * alpha2, p3[1] + tangent2[1] * alpha2), p3)
+
+def _max_error(coords, first, last, bezier, u):
+    worst, split = 0.0, (first + last) // 2
+    for i in range(first + 1, last):
+        x, y = _bezier_at(bezier, u[i - first])
+        px, py = coords[i]
+        d = (x - px) ** 2 + (y - py) ** 2
+        if d > worst: worst, split = d, i
+    return worst, split
+
+def _reparameterize(coords, first, bezier, u):
+    """对每个点做一步牛顿迭代，让参数更接近曲线上离该点最近的位置。"""
+    (x0, y0), (x1, y1), (x2, y2), (x3, y3) = bezier
+    # 一阶、二阶导数曲线的控制点
+    d1 = ((3 * (x1 - x0), 3 * (y1 - y0)), (3 * (x2 - x1), 3 * (y2 - y1)), (3 * (x3 - x2), 3 * (y3 - y2)))
+    d2 = ((2 * (d1[1][0] - d1[0][0]), 2 * (d1[1][1] - d1[0][1])), (2 * (d1[2][0] - d1[1][0]), 2 * (d1[2][1] - d1[1][1])))
+    result = []
+    for i, t in enumerate(u):
+        s = 1 - t
+        qx, qy = _bezier_at(bezier, t)
+        q1x = s * s * d1[0][0] + 2 * s * t * d1[1][0] + t * t * d1[2][0]
+        q1y = s * s * d1[0][1] + 2 * s * t * d1[1][1] + t * t * d1[2][1]
+        q2x, q2y = s * d2[0][0] + t * d2[1][0], s * d2[0][1] + t * d2[1][1]
+        px, py = coords[first + i]
+        numerator = (qx - px) * q1x + (qy - py) * q1y
+        denominator = q1x * q1x + q1y * q1y + (qx - px) * q2x + (qy - py) * q2y
+        result.append(min(1.0, max(0.0, t - numerator / denominator)) if denominator else t)
+    return result
+
+def _center_tangent(coords, split):
+    tangent = _normalize(_sub(coords[split - 1], coords[split + 1]))
+    if tangent == (0.0, 0.0): # 笔划在这里原路折返
+        tangent = _normalize(_sub(coords[split - 1], coords[split]))
+    return tangent
+
+def _fit_range(coords, first, last, tangent1, tangent2, tolerance_sq, max_iterations, beziers):
+    """把 coords[first..last] 拟合成若干段追加到 beziers；先压右半再压左半，弹出顺序即从头到尾。"""
+    stack = [(first, last, tangent1, tangent2)]
+    while stack:
+        first, last, tangent1, tangent2 = stack.pop()
+        if last - first == 1:
+            p0, p3 = coords[first], coords[last]
+            third = math.hypot(p3[0] - p0[0], p3[1] - p0[1]) / 3
+            beziers.append((p0, (p0[0] + tangent1[0] * third, p0[1] + tangent1[1] * third),
+                            (p3[0] + tangent2[0] * third, p3[1] + tangent2[1] * third), p3))
+            continue
+        u = _chord_parameters(coords, first, last)
+        bezier = _generate_bezier(coords, first, last, u, tangent1, tangent2)
+        error, split = _max_error(coords, first, last, bezier, u)
+        if error > tolerance_sq and error < tolerance_sq * 16:
+            # 误差不太大时先尝试调整参数，往往不必拆分
+            for _ in range(max_iterations):
+                u = _reparameterize(coords, first, bezier, u)
+                bezier = _generate_bezier(coords, first, last, u, tangent1, tangent2)
+                error, split = _max_error(coords, first, last, bezier, u)
+                if error <= tolerance_sq: break
+        if error <= tolerance_sq:
+            beziers.append(bezier)
+            continue
+        center = _center_tangent(coords, split)
+        stack.append((split, last, (-center[0], -center[1]), tangent2))
+        stack.append((first, split, tangent1, center))
+    return beziers
+
+def _dedupe(points):
+    coords = []
+    for xy in _coords(points):
+        if not coords or xy != coords[-1]: coords.append(xy)
+    return coords
+
+def fit_cubic_beziers(points, tolerance, max_iterations=4):
+    """Schneider 算法：返回首尾相接、G1 连续的 [(p0, p1, p2, p3)]，每个原始点到曲线的距离不超过 tolerance。"""
+    coords = _dedupe(points)
+    if len(coords) < 2: return []
+    return _fit_range(coords, 0, len(coords) - 1, _normalize(_sub(coords[1], coords[0])),
+                      _normalize(_sub(coords[-2], coords[-1])), tolerance * tolerance, max_iterations, [])
+
+
+class StreamingBezierFitter:
+    """边画边拟合：攒够 2 × CHUNK 个点就拟合掉前 CHUNK 个，前后两块共用接点处的切线。"""
+    CHUNK = 96
+
+    def __init__(self, tolerance, max_iterations=4):
+        self.tolerance_sq = tolerance * tolerance
+        self.max_iterations = max_iterations
+        self.beziers = []
+        self._coords = []     # 还没拟合的点，第一个点是上一块的终点
+        self._tangent = None  # 上一块终点处离开的切线方向
+
+    def add(self, point):
+        xy = (float(point.x()), float(point.y()))
+        if self._coords and xy == self._coords[-1]: return
+        self._coords.append(xy)
+        if len(self._coords) > 2 * self.CHUNK: self._fit_chunk()
+
+    def extend(self, points):
+        for point in points: self.add(point)
+
+    def _fit_chunk(self):
+        coords, split = self._coords, self.CHUNK
+        tangent1 = self._tangent or _normalize(_sub(coords[1], coords[0]))
+        center = _center_tangent(coords, split)
+        _fit_range(coords, 0, split, tangent1, center, self.tolerance_sq, self.max_iterations, self.beziers)
+        self._tangent = (-center[0], -center[1])
+        del coords[:split]
+
+    def result(self):
+        """已拟合的各段加上尾部的拟合结果；不改变内部状态。"""
+        coords = self._coords
+        if len(coords) < 2: return list(self.beziers)
+        tangent1 = self._tangent or _normalize(_sub(coords[1], coords[0]))
+        return _fit_range(coords, 0, len(coords) - 1, tangent1, _normalize(_sub(coords[-2], coords[-1])),
+                          self.tolerance_sq, self.max_iterations, list(self.beziers))
+
+def beziers_to_segments(beziers):
+    """拟合结果 -> PathSegment 列表：handle1 是进入锚点的控制柄，handle2 是离开锚点的控制柄。"""
+    if not beziers: return []
+    first = beziers[0]
+    segments = [PathSegment(QPointF(*first[0]), None, QPointF(*first[1]), PathSegment.CORNER)]
+    for previous, bezier in zip(beziers, beziers[1:]):
+        segments.append(PathSegment(QPointF(*bezier[0]), QPointF(*previous[2]), QPointF(*bezier[1]), PathSegment.SMOOTH))
+    last = beziers[-1]
+    segments.append(PathSegment(QPointF(*last[3]), QPointF(*last[2]), None, PathSegment.CORNER))
+    return segments
@@ -0,0 +1,199 @@
+# frame_profiler.py - 帧耗时统计与画布性能监视器 (HUD)
+#
+# 渲染器用 stage() 计时各阶段，count() 统计缓存命中，record_shape() 记录逐个图形的光栅化耗时。
+# 未开启时这些调用立即返回；开启后可在画布左上角显示 HUD，或导出 JSON。
+
+import json
+import time
+import heapq
+import itertools
+from collections import deque
+from contextlib import nullcontext
+from functools import wraps
+
+from PyQt6.QtGui import QPainter, QColor, QFont, QPen
+from PyQt6.QtCore import QRectF, QPointF
+
+
+class FrameProfiler:
+    FRAME_HISTORY = 240          # 保留最近多少帧的耗时
+    FPS_WINDOW = 1.0             # 统计 FPS 的时间窗口 (秒)
+    WORST_SHAPES_KEPT = 10
+    HISTOGRAM_EDGES_MS = (4, 8, 16.7, 33.3, 66.7, 133.3) # 直方图分档：每档上限，最后一档是"更慢"
+
+    def __init__(self):
+        self.enabled = False
+        self._null = nullcontext()
+        self.reset()
+
+    def reset(self):
+        self.stages = {}         # 名称 -> [次数, 总耗时, 最大耗时]
+        self.counters = {}       # 名称 -> 次数，如 tile.hit / tile.miss
+        self.shape_types = {}    # 图形类名 -> [次数, 总耗时]
+        self.frame_times = deque(maxlen=self.FRAME_HISTORY)
+        self._frame_stamps = deque()
+        self._worst = []         # 小顶堆 [(耗时, 序号, 描述)]
+        self._sequence = itertools.count()
+        self._frame_start = None
+        self._frame_stages = {}
+        self.last_frame_stages = {} # 上一帧各阶段耗时，HUD 显示用
+
+    # --- 记录 ---
+    def begin_frame(self):
+        if not self.enabled: return
+        self._frame_start = time.perf_counter()
+        self._frame_stages = {}
+
+    def end_frame(self):
+        if not self.enabled or self._frame_start is None: return
+        now = time.perf_counter()
+        self.frame_times.append(now - self._frame_start)
+        self._frame_stamps.append(now)
+        while self._frame_stamps and now - self._frame_stamps[0] > self.FPS_WINDOW: self._frame_stamps.popleft()
+        self.last_frame_stages = self._frame_stages
+        self._frame_start = None
+
+    def stage(self, name, detail=None):
+        """with profiler.stage("blit", layer.name): ... 计时一个阶段，记为 "blit:图层名"；未开启时返回空上下文，也不拼接名称。"""
+        if not self.enabled: return self._null
+        return _Stage(self, name if detail is None else f"{name}:{detail}")
+
+    def timed(self, name):
+        """装饰器版本的 stage，用于整个函数都是一个阶段的场合 (如图层面板重建)。"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                with self.stage(name): return func(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def add_stage_time(self, name, seconds):
+        entry = self.stages.get(name)
+        if entry is None: entry = self.stages[name] = [0, 0.0, 0.0]
+        entry[0] += 1; entry[1] += seconds
+        if seconds > entry[2]: entry[2] = seconds
+        if self._frame_start is not None:
+            self._frame_stages[name] = self._frame_stages.get(name, 0.0) + seconds
+
+    def count(self, name, amount=1):
+        if self.enabled and amount: self.counters[name] = self.counters.get(name, 0) + amount
+
+    def record_shape(self, shape, layer_name, seconds):
+        entry = self.shape_types.get(type(shape).__name__)
+        if entry is None: entry = self.shape_types[type(shape).__name__] = [0, 0.0]
+        entry[0] += 1; entry[1] += seconds
+        if len(self._worst) < self.WORST_SHAPES_KEPT or seconds > self._worst[0][0]:
+            box = shape.get_transformed_bounding_box()
+            info = dict(type=type(shape).__name__, layer=layer_name, id=id(shape),
+                        bbox=[round(box.x(), 1), round(box.y(), 1), round(box.width(), 1), round(box.height(), 1)])
+            item = (seconds, next(self._sequence), info)
+            if len(self._worst) < self.WORST_SHAPES_KEPT: heapq.heappush(self._worst, item)
+            else: heapq.heapreplace(self._worst, item)
+
+    # --- 汇总 ---
+    def fps(self) -> float:
+        stamps = self._frame_stamps
+        if len(stamps) < 2: return 0.0
+        return (len(stamps) - 1) / max(stamps[-1] - stamps[0], 1e-9)
+
+    def histogram(self):
+        """[(上限毫秒 或 None, 帧数)]，None 表示比最后一档还慢。"""
+        counts = [0] * (len(self.HISTOGRAM_EDGES_MS) + 1)
+        for seconds in self.frame_times:
+            ms = seconds * 1000
+            index = next((i for i, edge in enumerate(self.HISTOGRAM_EDGES_MS) if ms <= edge), len(self.HISTOGRAM_EDGES_MS))
+            counts[index] += 1
+        return list(zip(list(self.HISTOGRAM_EDGES_MS) + [None], counts))
+
+    def worst_shapes(self):
+        return [dict(info, ms=round(seconds * 1000, 3)) for seconds, _, info in sorted(self._worst, reverse=True)]
+
+    def hit_rate(self, cache):
+        hits, misses = self.counters.get(f"{cache}.hit", 0), self.counters.get(f"{cache}.miss", 0)
+        return hits / (hits + misses) if hits + misses else None
+
+    def to_dict(self):
+        times = sorted(self.frame_times)
+        def percentile(p): return round(times[min(len(times) - 1, int(p * len(times)))] * 1000, 3) if times else None
+        return dict(
+            timestamp=time.strftime("%Y-%m-%dT%H:%M:%S"),
+            frames=len(times), fps=round(self.fps(), 2),
+            frame_ms=dict(mean=round(sum(times) / len(times) * 1000, 3) if times else None,
+                          p50=percentile(0.5), p95=percentile(0.95), max=percentile(1.0)),
+            histogram=[dict(le_ms=edge, frames=n) for edge, n in self.histogram()],
+            stages={name: dict(count=c, total_ms=round(t * 1000, 3), mean_ms=round(t / c * 1000, 3), max_ms=round(m * 1000, 3))
+                    for name, (c, t, m) in sorted(self.stages.items(), key=lambda kv: -kv[1][1])},
+            shape_types={name: dict(count=c, total_ms=round(t * 1000, 3), mean_ms=round(t / c * 1000, 4))
+                         for name, (c, t) in sorted(self.shape_types.items(), key=lambda kv: -kv[1][1])},
+            counters=dict(sorted(self.counters.items())),
+            worst_shapes=self.worst_shapes(),
+            frame_times_ms=[round(s * 1000, 3) for s in self.frame_times])
+
+    def export_json(self, file_path):
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+
+    # --- HUD ---
+    def draw_hud(self, painter: QPainter, origin=QPointF(8, 8)):
+        """在控件坐标 origin 处画一块半透明面板：FPS、帧耗时直方图、上一帧最慢的阶段、缓存命中率和最慢的图形。"""
+        times = list(self.frame_times)
+        lines = []
+        if times:
+            lines.append(f"FPS {self.fps():5.1f}   帧 {times[-1] * 1000:6.1f} ms   最慢 {max(times) * 1000:6.1f} ms")
+        else:
+            lines.append("等待第一帧……")
+        for name, seconds in sorted(self.last_frame_stages.items(), key=lambda kv: -kv[1])[:6]:
+            lines.append(f"  {name:<24}{seconds * 1000:7.2f} ms")
+        rates = [f"{cache} {rate:.0%}" for cache in ("composite", "tile", "group", "symbol")
+                 if (rate := self.hit_rate(cache)) is not None]
+        if rates: lines.append("命中率  " + "  ".join(rates))
+        for shape in self.worst_shapes()[:3]:
+            lines.append(f"  {shape['type']} @ {shape['layer']}  {shape['ms']:.2f} ms")
+
+        painter.save()
+        painter.resetTransform()
+        font = QFont("Monospace", 8); font.setStyleHint(QFont.StyleHint.TypeWriter)
+        painter.setFont(font)
+        line_height = painter.fontMetrics().height()
+        width = max(260, max(painter.fontMetrics().horizontalAdvance(line) for line in lines) + 16)
+        chart_height = 40
+        panel = QRectF(origin.x(), origin.y(), width, len(lines) * line_height + chart_height + 24)
+        painter.fillRect(panel, QColor(0, 0, 0, 170))
+
+        painter.setPen(QColor(230, 230, 230))
+        y = panel.top() + 6 + painter.fontMetrics().ascent()
+        painter.drawText(QPointF(panel.left() + 8, y), lines[0])
+
+        # 直方图：每档一根柱子，超过 16.7 ms (60 FPS) 的档位用红色
+        histogram = self.histogram()
+        peak = max((n for _, n in histogram), default=0) or 1
+        chart = QRectF(panel.left() + 8, panel.top() + line_height + 10, width - 16, chart_height)
+        bar_width = chart.width() / len(histogram)
+        for i, (edge, n) in enumerate(histogram):
+            height = chart.height() * n / peak
+            color = QColor(90, 200, 90) if edge is not None and edge <= 16.7 else QColor(220, 80, 70)
+            painter.fillRect(QRectF(chart.left() + i * bar_width + 1, chart.bottom() - height, bar_width - 2, height), color)
+        painter.setPen(QPen(QColor(160, 160, 160), 0))
+        painter.drawLine(chart.bottomLeft(), chart.bottomRight())
+
+        painter.setPen(QColor(230, 230, 230))
+        y = chart.bottom() + 8 + painter.fontMetrics().ascent()
+        for line in lines[1:]:
+            painter.drawText(QPointF(panel.left() + 8, y), line)
+            y += line_height
+        painter.restore()
+
+
+class _Stage:
+    __slots__ = ('profiler', 'name', 'start')
+    def __init__(self, profiler, name):
+        self.profiler = profiler; self.name = name
+    def __enter__(self):
+        self.start = time.perf_counter()
+    def __exit__(self, *exc):
+        self.profiler.add_stage_time(self.name, time.perf_counter() - self.start)
+        return False
+
+
+# 整个程序共用一个统计实例：渲染器、画布和图层面板都往这里记录
+profiler = FrameProfiler()
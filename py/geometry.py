@@ -0,0 +1,76 @@
+# geometry.py - 批量仿射变换
+#
+# 仿射矩阵用 6 元组 (m11, m12, m21, m22, dx, dy) 表示，约定与 QTransform 相同：
+#     x' = m11 * x + m21 * y + dx
+#     y' = m12 * x + m22 * y + dy
+# 纯 Python 元组可以在不创建任何 Qt 对象的情况下组合、求逆并批量作用于坐标数组。
+
+import math
+from array import array
+
+from PyQt6.QtGui import QTransform
+
+IDENTITY = (1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+def translation(dx, dy):
+    return (1.0, 0.0, 0.0, 1.0, float(dx), float(dy))
+
+def scaling_about(factor, cx, cy):
+    """以 (cx, cy) 为中心的等比缩放：p' = c + (p - c) * factor。"""
+    return (factor, 0.0, 0.0, factor, cx * (1 - factor), cy * (1 - factor))
+
+def compose(first, second):
+    """返回 "先 first 后 second" 的复合变换。"""
+    a11, a12, a21, a22, adx, ady = first
+    b11, b12, b21, b22, bdx, bdy = second
+    return (a11 * b11 + a12 * b21, a11 * b12 + a12 * b22,
+            a21 * b11 + a22 * b21, a21 * b12 + a22 * b22,
+            adx * b11 + ady * b21 + bdx, adx * b12 + ady * b22 + bdy)
+
+def invert(m):
+    m11, m12, m21, m22, dx, dy = m
+    det = m11 * m22 - m12 * m21
+    if det == 0: raise ValueError("仿射矩阵不可逆")
+    i11, i12, i21, i22 = m22 / det, -m12 / det, -m21 / det, m11 / det
+    return (i11, i12, i21, i22, -(dx * i11 + dy * i21), -(dx * i12 + dy * i22))
+
+def uniform_scale(m):
+    """矩阵的等效等比缩放系数 (总是正数)，用于半径、边长、字号等标量属性；是否镜像由 is_mirrored 判断。"""
+    return math.sqrt(abs(m[0] * m[3] - m[1] * m[2]))
+
+def is_mirrored(m):
+    return m[0] * m[3] - m[1] * m[2] < 0
+
+def is_translation(m):
+    return m[0] == 1.0 and m[1] == 0.0 and m[2] == 0.0 and m[3] == 1.0
+
+def shape_base_transform(shape) -> QTransform:
+    """图形自身的变换 (局部坐标 -> 世界坐标)：绕局部包围盒中心缩放 scale_x/scale_y 并旋转 angle。"""
+    center = shape.get_bounding_box().center()
+    return QTransform().translate(center.x(), center.y()).scale(shape.scale_x, shape.scale_y).rotate(shape.angle).translate(-center.x(), -center.y())
+
+def from_qtransform(t: QTransform):
+    return (t.m11(), t.m12(), t.m21(), t.m22(), t.dx(), t.dy())
+
+def to_qtransform(m) -> QTransform:
+    return QTransform(m[0], m[1], m[2], m[3], m[4], m[5])
+
+def map_xy(m, x, y):
+    return (m[0] * x + m[2] * y + m[4], m[1] * x + m[3] * y + m[5])
+
+def transform_coords(coords, m):
+    """原地变换 array('d') 形式的交错坐标 [x0, y0, x1, y1, ...]。"""
+    if not coords: return
+    m11, m12, m21, m22, dx, dy = m
+    xs, ys = coords[0::2], coords[1::2]
+    if m12 == 0 and m21 == 0:
+        coords[0::2] = array('d', [x * m11 + dx for x in xs])
+        coords[1::2] = array('d', [y * m22 + dy for y in ys])
+    else:
+        coords[0::2] = array('d', [m11 * x + m21 * y + dx for x, y in zip(xs, ys)])
+        coords[1::2] = array('d', [m12 * x + m22 * y + dy for x, y in zip(xs, ys)])
+
+def transform_shapes(shapes, m):
+    """把同一个仿射变换作用到一组图形 (例如整个选区) 上。"""
+    if m == IDENTITY: return
+    for shape in shapes: shape.apply_affine(m)
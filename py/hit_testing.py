@@ -0,0 +1,163 @@
+# hit_testing.py - 图形的精确几何与胶囊体查询
+#
+# 橡皮擦两次采样之间扫过的区域是一个胶囊 (线段 ab 外扩 radius)。空间索引筛出候选后：
+#   shape_outline(shape)   把图形展开成世界坐标下的轮廓 (Contour)，变换方式与渲染器一致
+#   capsule_hits(...)      胶囊是否碰到轮廓的描边或填充区域
+# 轮廓按 CHUNK_EDGES 条边分块记下范围，长折线只检查与胶囊相交的几块。
+
+from PyQt6.QtGui import QPainterPath, QTransform
+from PyQt6.QtCore import Qt
+
+from shapes import *
+from geometry import from_qtransform, to_qtransform, uniform_scale, map_xy, shape_base_transform
+import raster_algorithms
+
+CHUNK_EDGES = 32
+
+
+class Contour:
+    """世界坐标下的一条轮廓。points 是 (x, y) 列表；closed 时描边包含首尾相连的边，filled 时内部 (奇偶规则) 也算命中。"""
+    __slots__ = ('points', 'closed', 'filled', 'half_width', 'chunks')
+
+    def __init__(self, points, closed, filled, half_width):
+        self.points, self.closed, self.filled, self.half_width = points, closed, filled, half_width
+        # 每块 (起点下标, 终点下标, 范围)：相邻块共用端点
+        edge_count = len(points) - 1 + (1 if closed and len(points) > 2 else 0)
+        self.chunks = []
+        for start in range(0, max(edge_count, 1), CHUNK_EDGES):
+            end = min(start + CHUNK_EDGES, edge_count)
+            block = [points[i % len(points)] for i in range(start, end + 1)]
+            xs, ys = [p[0] for p in block], [p[1] for p in block]
+            self.chunks.append((start, end, (min(xs), min(ys), max(xs), max(ys))))
+
+    def edge(self, index):
+        points = self.points
+        return points[index], points[(index + 1) % len(points)]
+
+
+# --- 基本几何 ---
+def point_segment_distance_sq(px, py, ax, ay, bx, by):
+    dx, dy = bx - ax, by - ay
+    length_sq = dx * dx + dy * dy
+    if length_sq:
+        t = ((px - ax) * dx + (py - ay) * dy) / length_sq
+        if t > 1: ax, ay = bx, by
+        elif t > 0: ax, ay = ax + t * dx, ay + t * dy
+    return (px - ax) ** 2 + (py - ay) ** 2
+
+def _orientation(ax, ay, bx, by, cx, cy):
+    cross = (bx - ax) * (cy - ay) - (by - ay) * (cx - ax)
+    return (cross > 0) - (cross < 0)
+
+def segment_distance_sq(ax, ay, bx, by, cx, cy, dx, dy):
+    """线段 ab 与线段 cd 的最短距离平方，相交时为 0。"""
+    o1, o2 = _orientation(ax, ay, bx, by, cx, cy), _orientation(ax, ay, bx, by, dx, dy)
+    o3, o4 = _orientation(cx, cy, dx, dy, ax, ay), _orientation(cx, cy, dx, dy, bx, by)
+    if o1 * o2 < 0 and o3 * o4 < 0: return 0.0
+    return min(point_segment_distance_sq(ax, ay, cx, cy, dx, dy), point_segment_distance_sq(bx, by, cx, cy, dx, dy),
+               point_segment_distance_sq(cx, cy, ax, ay, bx, by), point_segment_distance_sq(dx, dy, ax, ay, bx, by))
+
+def point_in_polygon(x, y, points):
+    """奇偶规则，与 QPainterPath / drawPolygon 默认的填充规则一致。"""
+    inside = False
+    px, py = points[-1]
+    for qx, qy in points:
+        if (qy > y) != (py > y) and x < (px - qx) * (y - qy) / (py - qy) + qx: inside = not inside
+        px, py = qx, qy
+    return inside
+
+
+# --- 图形 -> 轮廓 ---
+def is_filled(shape):
+    return bool(getattr(shape, 'fill_color', None)) and getattr(shape, 'fill_style', Qt.BrushStyle.NoBrush) != Qt.BrushStyle.NoBrush
+
+def _local_path(shape):
+    """用 QPainterPath 描述的图形 (曲线交给 Qt 平坦化)；其余返回 None。"""
+    shape_type = type(shape)
+    if shape_type is Circle:
+        path = QPainterPath(); path.addEllipse(shape.center, shape.radius, shape.radius); return path
+    if shape_type is Ellipse:
+        path = QPainterPath(); path.addEllipse(shape.get_bounding_box()); return path
+    if shape_type is RoundedRectangle:
+        path = QPainterPath(); path.addRoundedRect(shape.get_bounding_box(), 20, 20); return path
+    if isinstance(shape, Path): return shape.get_painter_path()
+    return None
+
+def _local_points(shape):
+    """返回 (局部坐标点列表, 是否闭合, 是否按填充处理)；不认识的图形返回 None。"""
+    shape_type = type(shape)
+    if shape_type in (Line, Arrow): return [shape.p1, shape.p2], False, False
+    if shape_type is Point: return [shape.pos], False, True
+    if shape_type in (Rectangle, Square):
+        r = shape.get_bounding_box(); return [r.topLeft(), r.topRight(), r.bottomRight(), r.bottomLeft()], True, is_filled(shape)
+    if shape_type is Text:
+        # 文字按整个文本框命中
+        r = shape.get_bounding_box(); return [r.topLeft(), r.topRight(), r.bottomRight(), r.bottomLeft()], True, True
+    if shape_type is Polyline: return shape.points, False, False
+    if shape_type is Polygon: return shape.points, True, is_filled(shape)
+    if shape_type is BSpline:
+        return raster_algorithms.compute_bspline_points(shape.points, shape.degree), False, False
+    if shape_type is BezierSurface:
+        # 4x4 控制网格的外圈
+        points = shape.points
+        return [points[i] for i in (0, 1, 2, 3, 7, 11, 15, 14, 13, 12, 8, 4)], True, True
+    return None
+
+def shape_outline(shape, transform: QTransform = None):
+    """图形在世界坐标下的轮廓列表；transform 是叠加在图形自身变换之后的父级变换。"""
+    if isinstance(shape, ShapeGroup):
+        return [contour for member in shape.shapes for contour in shape_outline(member, transform)]
+    base = shape_base_transform(shape)
+    if transform is not None: base = base * transform
+    if isinstance(shape, SymbolInstance):
+        outer = to_qtransform(shape.matrix) * base
+        return [contour for member in shape.symbol.shapes for contour in shape_outline(member, outer)]
+
+    matrix = from_qtransform(base)
+    # Point 的 width 是圆点半径；其余图形的描边向两侧各伸出半个线宽
+    width = getattr(shape, 'width', 1)
+    half_width = (width if type(shape) is Point else width / 2) * uniform_scale(matrix)
+    path = _local_path(shape)
+    if path is not None:
+        # 闭合的子路径平坦化后首尾重合，按开放折线处理即可；填充区域由奇偶规则隐式闭合
+        filled = is_filled(shape)
+        polygons = ([(p.x(), p.y()) for p in polygon] for polygon in path.toSubpathPolygons(base))
+        return [Contour(points, False, filled, half_width) for points in polygons if points]
+    local = _local_points(shape)
+    if local is None:
+        # 不认识的图形退回变换后的包围盒
+        r = shape.get_transformed_bounding_box()
+        return [Contour([(r.left(), r.top()), (r.right(), r.top()), (r.right(), r.bottom()), (r.left(), r.bottom())], True, True, 0.0)]
+    points, closed, filled = local
+    points = [map_xy(matrix, p.x(), p.y()) for p in points]
+    return [Contour(points, closed, filled, half_width)] if points else []
+
+
+def outline_bounds(contours):
+    """轮廓 (含半线宽) 的范围 (left, top, right, bottom)；没有轮廓时返回 None。"""
+    boxes = [(x0 - c.half_width, y0 - c.half_width, x1 + c.half_width, y1 + c.half_width)
+             for c in contours for _, _, (x0, y0, x1, y1) in c.chunks]
+    if not boxes: return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+# --- 胶囊查询 ---
+def capsule_hits(contours, ax, ay, bx, by, radius):
+    """胶囊 (线段 ab 外扩 radius) 是否碰到任一轮廓：与描边的距离不超过 radius + 半线宽，或端点落在填充区域内。"""
+    left, right = min(ax, bx), max(ax, bx)
+    top, bottom = min(ay, by), max(ay, by)
+    for contour in contours:
+        reach = radius + contour.half_width
+        reach_sq = reach * reach
+        points = contour.points
+        if len(points) == 1:
+            if point_segment_distance_sq(points[0][0], points[0][1], ax, ay, bx, by) <= reach_sq: return True
+            continue
+        for start, end, (x0, y0, x1, y1) in contour.chunks:
+            if x0 - reach > right or x1 + reach < left or y0 - reach > bottom or y1 + reach < top: continue
+            for i in range(start, end):
+                (cx, cy), (dx, dy) = contour.edge(i)
+                if segment_distance_sq(ax, ay, bx, by, cx, cy, dx, dy) <= reach_sq: return True
+        # 整个胶囊在填充区域内部、不碰边界时，任一端点都在内部
+        if contour.filled and len(points) >= 3 and point_in_polygon(ax, ay, points): return True
+    return False
@@ -4,6 +4,8 @@ from PyQt6.QtWidgets import (QDockWidget, QListWidget, QListWidgetItem, QVBoxLay
 from PyQt6.QtCore import Qt
 from PyQt6.QtGui import QPainter
 
+from frame_profiler import profiler
+
 class LayerPanel(QDockWidget):
     def __init__(self, main_window, parent=None):
         super().__init__("图层", parent)
@@ -54,6 +56,7 @@ class LayerPanel(QDockWidget):
             "差值": QPainter.CompositionMode.CompositionMode_Difference,
         }
 
+    @profiler.timed("layer_panel")
     def update_layer_list(self, layers, current_layer_index):
         try:
             self.list_widget.currentRowChanged.disconnect()
@@ -16,6 +16,8 @@ from shapes import Text, Path, BezierSurface
 from tools import PenTool
 # 🟢 导入我们新创建的对话框
 from welcome_dialog import WelcomeDialog
+import profiling_hooks
+from undo_history import DEFAULT_MEMORY_BUDGET_MB
 
 def resource_path(relative_path):
     """
@@ -91,6 +93,12 @@ class MainWindow(QMainWindow):
         
         reset_ui_action = QAction("重置界面布局", self); reset_ui_action.triggered.connect(self.reset_ui_layout); view_menu.addAction(reset_ui_action)
         view_menu.addSeparator()
+        # 🟢 视口缩放 (也可以 Ctrl+滚轮缩放、滚轮/中键拖动平移)
+        zoom_in_action = QAction("放大", self); zoom_in_action.setShortcut(QKeySequence.StandardKey.ZoomIn); zoom_in_action.triggered.connect(self.canvas.zoom_in); view_menu.addAction(zoom_in_action)
+        zoom_out_action = QAction("缩小", self); zoom_out_action.setShortcut(QKeySequence.StandardKey.ZoomOut); zoom_out_action.triggered.connect(self.canvas.zoom_out); view_menu.addAction(zoom_out_action)
+        reset_view_action = QAction("实际大小", self); reset_view_action.setShortcut("Ctrl+0"); reset_view_action.triggered.connect(self.canvas.reset_view); view_menu.addAction(reset_view_action)
+        fit_view_action = QAction("显示全部内容", self); fit_view_action.setShortcut("Ctrl+1"); fit_view_action.triggered.connect(self.canvas.zoom_to_fit); view_menu.addAction(fit_view_action)
+        view_menu.addSeparator()
         
         self.show_grid_action = QAction("显示网格", self); self.show_grid_action.setCheckable(True); self.show_grid_action.toggled.connect(self.canvas.toggle_grid); view_menu.addAction(self.show_grid_action)
         self.show_guides_action = QAction("显示参考线", self); self.show_guides_action.setCheckable(True); self.show_guides_action.setChecked(True); self.show_guides_action.toggled.connect(self.canvas.toggle_guides); view_menu.addAction(self.show_guides_action)
@@ -98,6 +106,8 @@ class MainWindow(QMainWindow):
         
         view_menu.addSeparator()
         self.ssaa_action = QAction("启用抗锯齿 (SSAA)", self); self.ssaa_action.setCheckable(True); self.ssaa_action.setChecked(True); self.ssaa_action.toggled.connect(self.canvas.toggle_ssaa); view_menu.addAction(self.ssaa_action)
+        self.profiler_action = QAction("性能监视器", self); self.profiler_action.setCheckable(True); self.profiler_action.setShortcut("F12"); self.profiler_action.toggled.connect(self.canvas.toggle_profiler); view_menu.addAction(self.profiler_action)
+        action_export_profile = QAction("导出性能统计...", self); action_export_profile.triggered.connect(self.canvas.export_profiler_stats); view_menu.addAction(action_export_profile)
         # 🟢 [新增] 曲面显示设置子菜单
         view_menu.addSeparator()
         surface_view_menu = view_menu.addMenu("曲面显示模式")
@@ -149,11 +159,13 @@ class MainWindow(QMainWindow):
             icon, text, tool_name = item; action = create_action_with_icon(icon, text, self); action.triggered.connect(lambda checked=False, t=tool_name: self.canvas.set_tool(t)); self.draw_toolbar.addAction(action)
 
         action_eraser = create_action_with_icon("eraser.svg", "橡皮擦", self); action_eraser.triggered.connect(lambda: self.canvas.set_tool("eraser")); self.edit_attr_toolbar.addAction(action_eraser)
+        self.partial_erase_action = QAction("局部擦除", self); self.partial_erase_action.setCheckable(True); self.partial_erase_action.setToolTip("橡皮擦只擦掉扫过的部分，折线、多边形和路径会被切成几段"); self.partial_erase_action.toggled.connect(self.canvas.toggle_partial_erase); self.edit_attr_toolbar.addAction(self.partial_erase_action)
         action_clear = create_action_with_icon("clear all.svg", "清空", self); action_clear.triggered.connect(self.canvas.clear_canvas); self.edit_attr_toolbar.addAction(action_clear)
         self.edit_attr_toolbar.addSeparator()
         
         action_group = QAction("组合", self); action_group.setShortcut("Ctrl+G"); action_group.triggered.connect(self.canvas.group_selected); self.edit_attr_toolbar.addAction(action_group)
         action_ungroup = QAction("解组", self); action_ungroup.setShortcut("Ctrl+Shift+G"); action_ungroup.triggered.connect(self.canvas.ungroup_selected); self.edit_attr_toolbar.addAction(action_ungroup)
+        action_symbol = QAction("转为符号", self); action_symbol.setShortcut("F8"); action_symbol.setToolTip("把选中的图形转换为可重复使用的符号"); action_symbol.triggered.connect(self.canvas.create_symbol_from_selection); self.edit_attr_toolbar.addAction(action_symbol)
         self.edit_attr_toolbar.addSeparator()
 
         action_pen_color = create_action_with_icon("format_color_text.svg", "边框色", self); action_pen_color.triggered.connect(self.show_pen_color_dialog); self.edit_attr_toolbar.addAction(action_pen_color)
@@ -216,6 +228,7 @@ class MainWindow(QMainWindow):
 
     def _apply_initial_settings(self):
         self.spinbox_width.setValue(self.settings.get("default_pen_width", 2))
+        self._apply_trace_settings()
         font = self.settings.get("default_font", QFont("Arial", 24))
         self.font_combo.setCurrentFont(font)
         self.font_size_spinbox.setValue(font.pointSize())
@@ -285,11 +298,19 @@ class MainWindow(QMainWindow):
         self.canvas.current_width = self.settings["default_pen_width"]
         self.canvas.current_font = self.settings["default_font"]
         self.canvas.background_color = self.settings["canvas_background_color"]
+        self.canvas.history.set_memory_budget(self.settings.get("undo_memory_budget_mb", DEFAULT_MEMORY_BUDGET_MB))
+        self.canvas.freehand_mode = self.settings.get("freehand_mode", self.canvas.freehand_mode)
+        self.canvas.freehand_tolerance = self.settings.get("freehand_tolerance", self.canvas.freehand_tolerance)
+        self._apply_trace_settings()
         self.spinbox_width.setValue(self.settings["default_pen_width"])
         self.font_combo.setCurrentFont(self.settings["default_font"])
         self.font_size_spinbox.setValue(self.settings["default_font"].pointSize())
         self.canvas.update()
 
+    def _apply_trace_settings(self):
+        profiling_hooks.configure(self.settings.get("trace_mode", "off"),
+                                  self.settings.get("trace_threshold_ms", profiling_hooks.DEFAULT_THRESHOLD_MS))
+
     def update_fill_styles_for_algo(self, algo_name):
         """根据选择的算法，动态重建填充样式下拉框的内容。"""
         self.canvas.set_raster_algorithm(algo_name)
@@ -410,7 +431,8 @@ class MainWindow(QMainWindow):
         self.canvas.set_tool("text")
         
     def update_mouse_pos(self, pos):
-        self.mouse_pos_label.setText(f"坐标: ({pos.x()}, {pos.y()})")
+        world = self.canvas.map_to_world(pos)
+        self.mouse_pos_label.setText(f"坐标: ({round(world.x())}, {round(world.y())})  缩放: {self.canvas.view_scale:.0%}")
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -1,10 +1,15 @@
 # --- START OF FILE preferences_dialog.py ---
 
 from PyQt6.QtWidgets import (QDialog, QVBoxLayout, QGridLayout, QLabel, QSpinBox, 
-                             QPushButton, QFrame, QColorDialog, QFontDialog, QDialogButtonBox)
+                             QPushButton, QFrame, QColorDialog, QFontDialog, QDialogButtonBox, QComboBox,
+                             QDoubleSpinBox)
 from PyQt6.QtGui import QPalette, QFont
 from PyQt6.QtCore import Qt
 
+from undo_history import DEFAULT_MEMORY_BUDGET_MB
+from profiling_hooks import TRACE_MODES, DEFAULT_THRESHOLD_MS, default_trace_path
+from curve_fitting import FREEHAND_MODES, DEFAULT_FREEHAND_MODE, DEFAULT_TOLERANCE
+
 class PreferencesDialog(QDialog):
     def __init__(self, current_settings, parent=None):
         super().__init__(parent)
@@ -51,6 +56,46 @@ class PreferencesDialog(QDialog):
         bg_color_button.clicked.connect(self._select_bg_color)
         grid_layout.addWidget(bg_color_button, 3, 2)
 
+        # 5. 撤销历史内存上限
+        grid_layout.addWidget(QLabel("撤销历史内存上限:"), 4, 0)
+        self.undo_budget_spinbox = QSpinBox()
+        self.undo_budget_spinbox.setRange(16, 8192)
+        self.undo_budget_spinbox.setSingleStep(16)
+        self.undo_budget_spinbox.setSuffix(" MB")
+        self.undo_budget_spinbox.setValue(self.settings.get("undo_memory_budget_mb", DEFAULT_MEMORY_BUDGET_MB))
+        self.undo_budget_spinbox.setToolTip("超过上限时自动丢弃最早的撤销记录")
+        grid_layout.addWidget(self.undo_budget_spinbox, 4, 1, 1, 2)
+
+        # 6. 交互性能追踪
+        grid_layout.addWidget(QLabel("交互性能追踪:"), 5, 0)
+        self.trace_mode_combo = QComboBox()
+        for mode, label in TRACE_MODES.items(): self.trace_mode_combo.addItem(label, mode)
+        self.trace_mode_combo.setCurrentIndex(max(0, self.trace_mode_combo.findData(self.settings.get("trace_mode", "off"))))
+        self.trace_mode_combo.setToolTip(f"命令执行、撤销/重做和工具事件的耗时写入滚动日志:\n{default_trace_path()}")
+        grid_layout.addWidget(self.trace_mode_combo, 5, 1, 1, 2)
+        grid_layout.addWidget(QLabel("只记录慢于:"), 6, 0)
+        self.trace_threshold_spinbox = QSpinBox()
+        self.trace_threshold_spinbox.setRange(0, 10000)
+        self.trace_threshold_spinbox.setSuffix(" ms")
+        self.trace_threshold_spinbox.setValue(self.settings.get("trace_threshold_ms", DEFAULT_THRESHOLD_MS))
+        grid_layout.addWidget(self.trace_threshold_spinbox, 6, 1, 1, 2)
+
+        # 7. 手绘笔划
+        grid_layout.addWidget(QLabel("手绘笔划:"), 7, 0)
+        self.freehand_mode_combo = QComboBox()
+        for mode, label in FREEHAND_MODES.items(): self.freehand_mode_combo.addItem(label, mode)
+        self.freehand_mode_combo.setCurrentIndex(max(0, self.freehand_mode_combo.findData(self.settings.get("freehand_mode", DEFAULT_FREEHAND_MODE))))
+        self.freehand_mode_combo.setToolTip("简化或拟合后的笔划点数少得多，文件更小，重绘和命中测试也更快")
+        grid_layout.addWidget(self.freehand_mode_combo, 7, 1, 1, 2)
+        grid_layout.addWidget(QLabel("手绘容差:"), 8, 0)
+        self.freehand_tolerance_spinbox = QDoubleSpinBox()
+        self.freehand_tolerance_spinbox.setRange(0.1, 20.0)
+        self.freehand_tolerance_spinbox.setSingleStep(0.25)
+        self.freehand_tolerance_spinbox.setSuffix(" 像素")
+        self.freehand_tolerance_spinbox.setValue(self.settings.get("freehand_tolerance", DEFAULT_TOLERANCE))
+        self.freehand_tolerance_spinbox.setToolTip("简化 / 拟合结果与原始笔划允许的最大偏差 (按屏幕像素，与缩放无关)")
+        grid_layout.addWidget(self.freehand_tolerance_spinbox, 8, 1, 1, 2)
+
         # OK 和 Cancel 按钮
         button_box = QDialogButtonBox(QDialogButtonBox.StandardButton.Ok | QDialogButtonBox.StandardButton.Cancel)
         button_box.accepted.connect(self.accept)
@@ -88,6 +133,11 @@ class PreferencesDialog(QDialog):
     def get_settings(self):
         """在点击OK后，从UI控件收集最终的设置值。"""
         self.settings["default_pen_width"] = self.pen_width_spinbox.value()
+        self.settings["undo_memory_budget_mb"] = self.undo_budget_spinbox.value()
+        self.settings["trace_mode"] = self.trace_mode_combo.currentData()
+        self.settings["trace_threshold_ms"] = self.trace_threshold_spinbox.value()
+        self.settings["freehand_mode"] = self.freehand_mode_combo.currentData()
+        self.settings["freehand_tolerance"] = self.freehand_tolerance_spinbox.value()
         return self.settings
 
 # --- END OF FILE preferences_dialog.py ---
\ No newline at end of file
@@ -0,0 +1,186 @@
+# profiling_hooks.py - 交互入口的可插拔性能追踪
+#
+# 画布的命令执行、撤销/重做和工具事件都经由 hooks 调用；没有钩子时只多一次判断。
+# 偏好设置里打开追踪后按模式注册钩子 (timing / memory / cprofile)，慢于阈值的调用写入滚动日志。
+
+import io
+import os
+import time
+import pstats
+import logging
+import cProfile
+import tracemalloc
+from contextlib import contextmanager, ExitStack
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+
+from PyQt6.QtCore import QStandardPaths
+
+TRACE_MODES = {
+    "off": "关闭",
+    "timing": "耗时",
+    "memory": "耗时 + 内存分配 (tracemalloc)",
+    "cprofile": "耗时 + cProfile 采样",
+}
+DEFAULT_THRESHOLD_MS = 16
+TRACE_LOG_MAX_BYTES = 5 * 1024 * 1024
+TRACE_LOG_BACKUPS = 5
+
+trace_logger = logging.getLogger("shapepainter.trace")
+trace_logger.setLevel(logging.INFO)
+trace_logger.propagate = False
+
+
+class HookRegistry:
+    """钩子是一个可调用对象 hook(入口名, 详情)，返回包住这次调用的上下文管理器。"""
+    def __init__(self):
+        self._hooks = []
+
+    def __bool__(self): return bool(self._hooks)
+
+    def register(self, hook):
+        self._hooks.append(hook)
+        return hook
+
+    def unregister(self, hook):
+        if hook in self._hooks:
+            self._hooks.remove(hook)
+            if hasattr(hook, 'close'): hook.close()
+
+    def clear(self):
+        for hook in list(self._hooks): self.unregister(hook)
+
+    def call(self, point, func, *args, detail=None):
+        """经由钩子调用 func(*args)；detail 为函数时只在有钩子时求值。"""
+        if not self._hooks: return func(*args)
+        if callable(detail): detail = detail()
+        with ExitStack() as stack:
+            for hook in list(self._hooks): stack.enter_context(hook(point, detail))
+            return func(*args)
+
+    def hooked(self, point, detail=None):
+        """方法装饰器版本；detail(*args) 用被装饰方法的参数生成详情。"""
+        def decorator(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self._hooks: return func(*args, **kwargs)
+                return self.call(point, lambda: func(*args, **kwargs),
+                                 detail=(lambda: detail(*args, **kwargs)) if detail else None)
+            return wrapper
+        return decorator
+
+
+class TimingHook:
+    def __init__(self, threshold_ms=DEFAULT_THRESHOLD_MS):
+        self.threshold = threshold_ms / 1000.0
+        self._depth = 0
+
+    @contextmanager
+    def __call__(self, point, detail):
+        self._depth += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.threshold:
+                # 缩进表示嵌套 (如松开鼠标时执行的命令)
+                trace_logger.info("%s%s %.2f ms  %s", "  " * self._depth, point, elapsed * 1000, detail or "")
+
+
+class TracemallocHook:
+    """只追踪最外层调用 (tracemalloc 的峰值是全局的)。"""
+    REPORT_BYTES = 1024 * 1024 # 峰值超过这个数时即使不慢也写日志
+    TRACE_FRAMES = 1
+
+    def __init__(self, threshold_ms=DEFAULT_THRESHOLD_MS):
+        self.threshold = threshold_ms / 1000.0
+        self._depth = 0
+        self._started = False
+
+    @contextmanager
+    def __call__(self, point, detail):
+        if self._depth:
+            yield
+            return
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.TRACE_FRAMES); self._started = True
+        tracemalloc.reset_peak()
+        before, _ = tracemalloc.get_traced_memory()
+        start = time.perf_counter()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            elapsed = time.perf_counter() - start
+            current, peak = tracemalloc.get_traced_memory()
+            if elapsed >= self.threshold or peak - before >= self.REPORT_BYTES:
+                trace_logger.info("%s 内存: 净分配 %+.1f KB, 峰值 +%.1f KB  %s",
+                                  point, (current - before) / 1024, (peak - before) / 1024, detail or "")
+
+    def close(self):
+        if self._started and tracemalloc.is_tracing(): tracemalloc.stop()
+        self._started = False
+
+
+class CProfileHook:
+    """每个入口每 sample_every 次最外层调用采样一次，慢调用的热点函数写进日志。"""
+    SAMPLE_EVERY = 10
+    TOP_FUNCTIONS = 20
+
+    def __init__(self, threshold_ms=DEFAULT_THRESHOLD_MS, sample_every=SAMPLE_EVERY):
+        self.threshold = threshold_ms / 1000.0
+        self.sample_every = max(1, sample_every)
+        self._calls = {}
+        self._active = False
+
+    @contextmanager
+    def __call__(self, point, detail):
+        count = self._calls[point] = self._calls.get(point, 0) + 1
+        if self._active or count % self.sample_every:
+            yield
+            return
+        profile = cProfile.Profile()
+        self._active = True
+        start = time.perf_counter()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            self._active = False
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.threshold:
+                text = io.StringIO()
+                pstats.Stats(profile, stream=text).sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.TOP_FUNCTIONS)
+                trace_logger.info("%s cProfile 采样 %.2f ms  %s\n%s", point, elapsed * 1000, detail or "", text.getvalue().strip())
+
+
+def default_trace_path():
+    base = QStandardPaths.writableLocation(QStandardPaths.StandardLocation.AppDataLocation) or os.path.expanduser("~")
+    return os.path.join(base, "traces", "interaction_trace.log")
+
+def configure(mode, threshold_ms=DEFAULT_THRESHOLD_MS, log_path=None):
+    """按设置重建钩子；返回日志文件路径，关闭时返回 None。"""
+    hooks.clear()
+    for handler in list(trace_logger.handlers):
+        trace_logger.removeHandler(handler); handler.close()
+    if mode not in TRACE_MODES or mode == "off": return None
+
+    log_path = log_path or default_trace_path()
+    os.makedirs(os.path.dirname(log_path), exist_ok=True)
+    handler = RotatingFileHandler(log_path, maxBytes=TRACE_LOG_MAX_BYTES, backupCount=TRACE_LOG_BACKUPS, encoding="utf-8")
+    handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    trace_logger.addHandler(handler)
+    trace_logger.info("---- 追踪开始: 模式 %s, 阈值 %s ms ----", mode, threshold_ms)
+
+    hooks.register(TimingHook(threshold_ms))
+    if mode == "memory": hooks.register(TracemallocHook(threshold_ms))
+    elif mode == "cprofile": hooks.register(CProfileHook(threshold_ms))
+    return log_path
+
+
+# 整个程序共用一个注册表
+hooks = HookRegistry()
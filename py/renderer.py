@@ -1,43 +1,198 @@
 import math
+import time
+from bisect import bisect_left
+from operator import itemgetter
 from typing import Union
 from PyQt6.QtWidgets import QWidget
 # 🔴 修正：从这里删除了 QLine
 from PyQt6.QtGui import (QPainter, QPen, QColor, QBrush, QPolygon, QPolygonF, 
                          QPainterPath, QImage, QTransform, QLinearGradient)
 # 🟢 修正：将 QLine 加到了这里
-from PyQt6.QtCore import Qt, QRect, QPoint, QPointF, QLineF, QRectF, QLine
+from PyQt6.QtCore import Qt, QRect, QPoint, QPointF, QLineF, QRectF, QLine, QSize
 
 from shapes import *
+from geometry import to_qtransform, from_qtransform, shape_base_transform
+from frame_profiler import profiler
 import raster_algorithms
 
 AnyShape = Union[Text, Square, Ellipse, RoundedRectangle, Polygon, Circle, Rectangle,
-                 Point, Line, Path, Polyline, ShapeGroup, Arrow]
+                 Point, Line, Path, Polyline, ShapeGroup, Arrow, SymbolInstance]
 
 class CanvasRenderer:
-    SSAA_BASE_FACTOR = 2
+    SSAA_BASE_FACTOR = 2 # 画布 ssaa_factor 的默认值
+
+    # 符号光栅缓存的档位：缩放每倍频程 8 档 (相邻档位相差约 9%)，旋转每 5 度一档
+    SYMBOL_SCALE_STEPS_PER_OCTAVE = 8
+    SYMBOL_ANGLE_STEP = 5
+    SYMBOL_RASTER_CACHE_SIZE = 16          # 每个符号最多保留的档位数
+    SYMBOL_MAX_RASTER_PIXELS = 4096 * 4096 # 超过这个尺寸就直接矢量绘制，不再缓存
+
+    GROUP_CACHE_MIN_SHAPES = 4             # 成员太少的编组直接绘制比缓存更划算
+    GROUP_CACHE_MAX_PIXELS = 4096 * 4096
+
+    # 细节层次 (LOD)：采样密度按图形在帧缓冲上的实际像素尺寸决定，下面的单位都是物理像素
+    LOD_CURVE_TOLERANCE = 0.75   # 贝塞尔平坦化的最大弦高误差
+    LOD_SAMPLE_SPACING = 2.0     # B 样条相邻采样点的大致间距
+    LOD_SURFACE_CELL = 16.0      # 贝塞尔曲面每个细分格子的大致边长
+    LOD_SUBPIXEL_SIZE = 1.0      # 连同线宽都小于这个尺寸的图形只画一个点
+
+    # 视口缓存：每个图层按 2 的整数次幂缩放档位 (mip 层级) 切成固定大小的瓦片。
+    # 平移只是把已有瓦片贴到新位置；同一档位内的连续缩放只做一次重采样，跨档位时才重新光栅化。
+    TILE_SIZE = 256                             # 瓦片边长 (物理像素)
+    TILE_CACHE_MAX_BYTES = 256 * 1024 * 1024    # 所有图层瓦片的总内存上限，超出后按最近最少使用淘汰
+    COMPOSITE_BUCKET = 256                      # 画布合成缓冲的尺寸按这个物理像素数向上取整
+    EMPTY_TILE_BYTES = 64                       # 空白瓦片只是一条记录，按这个大小计入预算
+    REPAIR_MAX_RECTS = 32                       # 一帧作废的范围不超过这么多个时，可见瓦片就地修补，否则整块丢弃
+    _frame = 0                                  # 帧计数，作为瓦片的 LRU 时间戳
 
     @staticmethod
     def paint(painter: QPainter, canvas: QWidget):
         CanvasRenderer.draw_layers(painter, canvas)
         if canvas.current_tool_obj:
-            canvas.current_tool_obj.paint(painter)
+            # 工具预览和选择框都使用世界坐标
+            with profiler.stage("tool_overlay"):
+                painter.save()
+                painter.setTransform(CanvasRenderer.view_transform(canvas), True)
+                canvas.current_tool_obj.paint(painter)
+                painter.restore()
 
     @staticmethod
     def draw_layers(painter: QPainter, canvas: QWidget):
-        ssaa_factor = CanvasRenderer.SSAA_BASE_FACTOR if canvas.ssaa_enabled else 1
-        size = canvas.size()
+        with profiler.stage("composite"):
+            buffer, frame_size = CanvasRenderer._update_composite(canvas)
+        with profiler.stage("present"):
+            painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, True)
+            # 合成缓冲可能比画面大 (按档位预留)，只取左上角 frame_size 部分
+            painter.drawImage(QRectF(canvas.rect()), buffer, QRectF(0, 0, frame_size.width(), frame_size.height()))
+
+    @staticmethod
+    def view_transform(canvas) -> QTransform:
+        """世界坐标 -> 控件逻辑坐标。"""
+        scale, offset = canvas.view_scale, canvas.view_offset
+        return QTransform(scale, 0, 0, scale, offset.x(), offset.y())
+
+    @staticmethod
+    def zoom_level(scale: float) -> int:
+        """离视图缩放最近的 mip 档位，瓦片按 2 ** level 倍光栅化，残差缩放在 [0.71, 1.41] 之间。"""
+        return round(math.log2(scale))
+
+    @staticmethod
+    def ssaa_factor_of(canvas) -> int:
+        """画布当前的超采样倍数：倍数存在画布上，不同画布 (如批量渲染) 互不影响。"""
+        return canvas.ssaa_factor if canvas.ssaa_enabled else 1
+
+    @staticmethod
+    def render_layers_to_image(canvas) -> QImage:
+        """把背景、网格和可见图层合成到一张离屏 QImage (未降采样)；canvas 也可以是 HeadlessCanvas。"""
+        ssaa_factor = CanvasRenderer.ssaa_factor_of(canvas)
         pixel_ratio = canvas.devicePixelRatioF()
-        buffer_size = size * pixel_ratio * ssaa_factor
+        buffer_size = canvas.size() * pixel_ratio * ssaa_factor
         
         final_buffer = QImage(buffer_size, QImage.Format.Format_ARGB32_Premultiplied)
         final_buffer.setDevicePixelRatio(pixel_ratio * ssaa_factor)
-        
-        # 1. 填充背景色
-        final_buffer.fill(canvas.background_color)
+        CanvasRenderer._frame += 1
+        CanvasRenderer._compose_region(canvas, final_buffer, QRect(QPoint(0, 0), buffer_size), CanvasRenderer._frame)
+        CanvasRenderer._evict_tiles(canvas.layers, CanvasRenderer._frame)
+        return final_buffer
+
+    @staticmethod
+    def _composite_state(canvas, ratio):
+        """除图层内容之外，所有会影响合成结果的状态；与上一帧相同且没有脏图层时，合成缓冲可以原样复用。"""
+        return (canvas.view_scale, canvas.view_offset.x(), canvas.view_offset.y(), ratio,
+                canvas.background_color.rgba(), canvas.grid_enabled, canvas.grid_size, canvas.current_raster_algorithm,
+                id(canvas.editing_shape),
+                tuple((id(layer), layer.is_visible, layer.opacity, layer.blend_mode) for layer in canvas.layers))
+
+    @staticmethod
+    def _update_composite(canvas):
+        """
+        画布的持久合成缓冲 canvas.composite = [QImage, 合成状态, 有效区域尺寸]。
+        - 尺寸按 COMPOSITE_BUCKET 向上取整，窗口在一档之内缩放不会重新分配；超出时换一张更大的并保留已有像素。
+        - 视图、图层都没变时直接复用 (工具预览、悬停高亮等重绘只需贴一次图)。
+        - 窗口变大时只合成新露出的条带，缺失的瓦片也只渲染这些条带覆盖到的部分。
+        返回 (缓冲, 本帧画面的物理像素尺寸)。
+        """
+        ratio = canvas.devicePixelRatioF() * CanvasRenderer.ssaa_factor_of(canvas)
+        frame_size = canvas.size() * ratio
+        fw, fh = frame_size.width(), frame_size.height()
+        state = CanvasRenderer._composite_state(canvas, ratio)
+
+        composite = canvas.composite
+        if composite is None or composite[0].devicePixelRatioF() != ratio:
+            composite = canvas.composite = [CanvasRenderer._allocate_composite(fw, fh, ratio), None, QSize()]
+        elif composite[0].width() < fw or composite[0].height() < fh:
+            composite[0] = CanvasRenderer._allocate_composite(fw, fh, ratio, composite[0])
+        if composite[1] != state or any(layer.has_changes() for layer in canvas.layers if layer.is_visible):
+            composite[1], composite[2] = state, QSize()
+
+        valid = composite[2]
+        vw, vh = valid.width(), valid.height()
+        if fw <= vw and fh <= vh:
+            profiler.count("composite.hit")
+            return composite[0], frame_size
+        profiler.count("composite.miss")
+
+        if valid.isEmpty():
+            regions = [QRect(0, 0, fw, fh)]
+        else:
+            regions = []
+            if fw > vw: regions.append(QRect(vw, 0, fw - vw, min(fh, vh)))
+            if fh > vh: regions.append(QRect(0, vh, fw, fh - vh))
+        CanvasRenderer._frame += 1
+        for region in regions:
+            CanvasRenderer._compose_region(canvas, composite[0], region, CanvasRenderer._frame)
+        composite[2] = QSize(fw, fh)
+        CanvasRenderer._evict_tiles(canvas.layers, CanvasRenderer._frame)
+        return composite[0], frame_size
+
+    @staticmethod
+    def _allocate_composite(width, height, ratio, previous: QImage = None) -> QImage:
+        bucket = CanvasRenderer.COMPOSITE_BUCKET
+        image = QImage(max(1, math.ceil(width / bucket)) * bucket, max(1, math.ceil(height / bucket)) * bucket,
+                       QImage.Format.Format_ARGB32_Premultiplied)
+        image.setDevicePixelRatio(ratio)
+        if previous is not None:
+            # 保留旧缓冲里已经合成好的像素，调用方据此只补新露出的部分
+            painter = QPainter(image)
+            painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+            painter.drawImage(0, 0, previous) # 两张图像素比相同，按像素原样拷贝
+            painter.end()
+        return image
+
+    @staticmethod
+    def trim_composite(canvas):
+        """窗口缩放停止后调用：把按档位放大的合成缓冲收回到当前尺寸所需的档位，保留已有像素。"""
+        composite = canvas.composite
+        if composite is None: return
+        bucket = CanvasRenderer.COMPOSITE_BUCKET
+        frame_size = canvas.size() * composite[0].devicePixelRatioF()
+        width = max(1, math.ceil(frame_size.width() / bucket)) * bucket
+        height = max(1, math.ceil(frame_size.height() / bucket)) * bucket
+        if composite[0].width() > width or composite[0].height() > height:
+            composite[0] = composite[0].copy(0, 0, width, height)
+            composite[2] = composite[2].boundedTo(QSize(width, height))
+
+    @staticmethod
+    def _compose_region(canvas, image: QImage, region: QRect, frame: int):
+        """在 image 的 region (物理像素) 内重新合成背景、网格和所有可见图层，region 以外的像素不受影响。"""
+        ratio = image.devicePixelRatioF()
+        clip = QRectF(region.x() / ratio, region.y() / ratio, region.width() / ratio, region.height() / ratio)
+        view = CanvasRenderer.view_transform(canvas)
+        # 本区域对应的世界坐标范围
+        visible = view.inverted()[0].mapRect(clip)
+
+        # 1. 填充背景色 (Source 模式：覆盖掉区域里原有的像素)
+        with profiler.stage("background"):
+            background_painter = QPainter(image)
+            background_painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+            background_painter.fillRect(clip, canvas.background_color)
+            background_painter.end()
 
         # 🟢 [最终修正版] 网格绘制：利用 Qt 原生逻辑坐标
         if canvas.grid_enabled:
-            grid_painter = QPainter(final_buffer)
+            grid_start = time.perf_counter() if profiler.enabled else None
+            grid_painter = QPainter(image)
+            grid_painter.setClipRect(clip)
             
             # ❌ 不要手动 scale，Qt 会根据 setDevicePixelRatio 自动处理
             # ❌ 不要手动乘 total_scale
@@ -47,68 +202,370 @@ class CanvasRenderer:
             # 这样既能对齐刻度，线又非常细致
             grid_pen = QPen(QColor(150, 150, 150), 0, Qt.PenStyle.SolidLine)
             grid_painter.setPen(grid_pen)
+            grid_painter.setTransform(view)
 
-            # 直接使用逻辑宽、高
-            w_logical = canvas.width()
-            h_logical = canvas.height()
-            step = canvas.grid_size # 直接用 50
+            # 网格线在世界坐标中等距；缩得太小时隔行抽稀，避免糊成一片
+            step = canvas.grid_size
+            while step * canvas.view_scale < 8: step *= 2
             
             # 画竖线
-            for x in range(0, w_logical, step):
-                grid_painter.drawLine(x, 0, x, h_logical)
+            x = math.floor(visible.left() / step) * step
+            while x < visible.right():
+                grid_painter.drawLine(QLineF(x, visible.top(), x, visible.bottom()))
+                x += step
                 
             # 画横线
-            for y in range(0, h_logical, step):
-                grid_painter.drawLine(0, y, w_logical, y)
+            y = math.floor(visible.top() / step) * step
+            while y < visible.bottom():
+                grid_painter.drawLine(QLineF(visible.left(), y, visible.right(), y))
+                y += step
                 
             grid_painter.end()
+            if grid_start is not None: profiler.add_stage_time("grid", time.perf_counter() - grid_start)
+
+        tile = CanvasRenderer.TILE_SIZE
+        level_scale = 2.0 ** CanvasRenderer.zoom_level(canvas.view_scale)
+        tile_ratio = ratio * level_scale # 瓦片上每个世界单位的物理像素数
+        # 区域覆盖的瓦片范围
+        tx0, ty0 = math.floor(visible.left() * tile_ratio / tile), math.floor(visible.top() * tile_ratio / tile)
+        tx1, ty1 = math.ceil(visible.right() * tile_ratio / tile), math.ceil(visible.bottom() * tile_ratio / tile)
+        # 瓦片像素 -> 控件逻辑坐标；相邻瓦片共用同一个变换，拼接处不会出现缝隙
+        tile_to_view = QTransform().scale(1.0 / tile_ratio, 1.0 / tile_ratio) * view
+
         for layer in canvas.layers:
             if not layer.is_visible: continue
-            if layer.is_dirty or layer.cache is None or layer.cache.size() != buffer_size:
-                layer.cache = QImage(buffer_size, QImage.Format.Format_ARGB32_Premultiplied)
-                layer.cache.setDevicePixelRatio(pixel_ratio * ssaa_factor)
-                layer.cache.fill(Qt.GlobalColor.transparent)
-                for shape in layer.shapes:
-                    if shape == canvas.editing_shape: continue
-                    CanvasRenderer._draw_shape_recursive(layer.cache, shape, canvas)
-                layer.is_dirty = False
+            damage = layer.take_damage()
+            if damage is None:
+                layer.tiles.clear()
+                layer.pending_stamps.clear()
+            else:
+                if damage: CanvasRenderer._invalidate_tiles(layer, canvas, damage, tile_ratio, (tx0, ty0, tx1, ty1))
+                if layer.pending_stamps:
+                    with profiler.stage("stamp", layer.name):
+                        CanvasRenderer._stamp_tiles(layer, canvas)
+            missing = [(tx, ty) for ty in range(ty0, ty1) for tx in range(tx0, tx1) if (tile_ratio, tx, ty) not in layer.tiles]
+            profiler.count("tile.miss", len(missing))
+            profiler.count("tile.hit", (tx1 - tx0) * (ty1 - ty0) - len(missing))
+            if missing:
+                with profiler.stage("rasterize", layer.name):
+                    CanvasRenderer._render_tiles(layer, canvas, tile_ratio, missing, frame)
             
-            buffer_painter = QPainter(final_buffer)
-            buffer_painter.setOpacity(layer.opacity)
-            buffer_painter.setCompositionMode(layer.blend_mode)
-            buffer_painter.drawImage(0, 0, layer.cache)
-            buffer_painter.end()
+            with profiler.stage("blit", layer.name):
+                buffer_painter = QPainter(image)
+                buffer_painter.setClipRect(clip) # 先裁剪再设变换，裁剪框按逻辑坐标解释
+                buffer_painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, True)
+                buffer_painter.setOpacity(layer.opacity)
+                buffer_painter.setCompositionMode(layer.blend_mode)
+                buffer_painter.setTransform(tile_to_view)
+                for ty in range(ty0, ty1):
+                    for tx in range(tx0, tx1):
+                        entry = layer.tiles[(tile_ratio, tx, ty)]
+                        entry[1] = frame
+                        if entry[0] is not None: buffer_painter.drawImage(QRectF(tx * tile, ty * tile, tile, tile), entry[0])
+                buffer_painter.end()
 
-        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, True)
-        painter.drawImage(canvas.rect(), final_buffer)
+    @staticmethod
+    def _render_tiles(layer: Layer, canvas: QWidget, tile_ratio: float, missing, frame: int):
+        """
+        一次性光栅化图层缺失的瓦片：从空间索引取出覆盖这些瓦片的图形，再按范围分到各个瓦片。
+        瓦片只在真正有图形落入时才分配 QImage，空白区域记为 None，不占内存。
+        """
+        tile = CanvasRenderer.TILE_SIZE
+        mx0, my0 = min(k[0] for k in missing), min(k[1] for k in missing)
+        mx1, my1 = max(k[0] for k in missing), max(k[1] for k in missing)
+        world_tile = tile / tile_ratio
+        area = QRectF(mx0 * world_tile, my0 * world_tile, (mx1 - mx0 + 1) * world_tile, (my1 - my0 + 1) * world_tile)
+        wanted = set(missing)
+        images = {}
+        timed = profiler.enabled # 逐个图形计时，供性能监视器统计各类图形的耗时和最慢的图形
+        hidden = layer.hidden
+        for shape in layer.shapes_in(area):
+            if shape is canvas.editing_shape or id(shape) in hidden: continue
+            extent = shape.get_world_extent()
+            if extent is None:
+                targets = missing
+            else:
+                cx0, cy0 = math.floor(extent.left() * tile_ratio / tile), math.floor(extent.top() * tile_ratio / tile)
+                cx1, cy1 = math.floor(extent.right() * tile_ratio / tile), math.floor(extent.bottom() * tile_ratio / tile)
+                targets = [(tx, ty) for ty in range(max(cy0, my0), min(cy1, my1) + 1)
+                           for tx in range(max(cx0, mx0), min(cx1, mx1) + 1) if (tx, ty) in wanted]
+            if timed: start = time.perf_counter()
+            spans = {} # 这个图形的扫描线只生成一次，分给它覆盖的每块瓦片
+            for tx, ty in targets:
+                image = images.get((tx, ty))
+                if image is None:
+                    image = images[(tx, ty)] = QImage(tile, tile, QImage.Format.Format_ARGB32_Premultiplied)
+                    image.setDevicePixelRatio(tile_ratio)
+                    image.fill(Qt.GlobalColor.transparent)
+                CanvasRenderer._draw_shape_recursive(image, shape, canvas, None, (tx * tile, ty * tile), spans)
+            if timed: profiler.record_shape(shape, layer.name, time.perf_counter() - start)
+        for tx, ty in missing:
+            layer.tiles[(tile_ratio, tx, ty)] = [images.get((tx, ty)), frame]
+
+    @staticmethod
+    def _invalidate_tiles(layer: Layer, canvas: QWidget, damage, tile_ratio: float, visible_tiles):
+        """
+        处理 damage (世界坐标矩形列表)：当前档位可见的瓦片只重画受影响的那一块 (同一瓦片的多个范围合并成一块)，
+        其余档位和不可见的瓦片直接丢弃，下次用到时重新光栅化。
+        """
+        tile = CanvasRenderer.TILE_SIZE
+        vx0, vy0, vx1, vy1 = visible_tiles
+        repair = len(damage) <= CanvasRenderer.REPAIR_MAX_RECTS
+        patches = {} # 瓦片键 -> 要重画的范围
+        for ratio in {key[0] for key in layer.tiles}:
+            scale = ratio / tile
+            for rect in damage:
+                cx0, cy0 = math.floor(rect.left() * scale), math.floor(rect.top() * scale)
+                cx1, cy1 = math.floor(rect.right() * scale), math.floor(rect.bottom() * scale)
+                if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(layer.tiles):
+                    keys = [key for key in layer.tiles if key[0] == ratio and cx0 <= key[1] <= cx1 and cy0 <= key[2] <= cy1]
+                else:
+                    keys = [(ratio, tx, ty) for ty in range(cy0, cy1 + 1) for tx in range(cx0, cx1 + 1)]
+                for key in keys:
+                    if key not in layer.tiles: continue
+                    if repair and ratio == tile_ratio and vx0 <= key[1] < vx1 and vy0 <= key[2] < vy1:
+                        patches[key] = patches[key].united(rect) if key in patches else rect
+                    else:
+                        del layer.tiles[key]
+                        profiler.count("tile.invalidate")
+        spans = {} # 所有补丁共用：跨多块瓦片的图形只生成一次扫描线
+        for key, rect in patches.items():
+            CanvasRenderer._repair_tile(layer, canvas, key, layer.tiles[key], rect, spans)
+            profiler.count("tile.repair")
+
+    @staticmethod
+    def _repair_tile(layer: Layer, canvas: QWidget, key, entry, rect: QRectF, spans=None):
+        """清掉瓦片中 rect 覆盖的像素，只重画与之相交的图形；补丁按整像素对齐，结果与重新光栅化整块瓦片相同。"""
+        tile_ratio, tx, ty = key
+        tile = CanvasRenderer.TILE_SIZE
+        x0, y0 = max(0, math.floor(rect.left() * tile_ratio) - tx * tile), max(0, math.floor(rect.top() * tile_ratio) - ty * tile)
+        x1, y1 = min(tile, math.ceil(rect.right() * tile_ratio) - tx * tile), min(tile, math.ceil(rect.bottom() * tile_ratio) - ty * tile)
+        if x1 <= x0 or y1 <= y0: return
+        origin = (tx * tile + x0, ty * tile + y0)
+        area = QRectF(origin[0] / tile_ratio, origin[1] / tile_ratio, (x1 - x0) / tile_ratio, (y1 - y0) / tile_ratio)
+        patch = QImage(x1 - x0, y1 - y0, QImage.Format.Format_ARGB32_Premultiplied)
+        patch.setDevicePixelRatio(tile_ratio)
+        patch.fill(Qt.GlobalColor.transparent)
+        drawn = False
+        for shape in layer.shapes_in(area, exact=True):
+            if shape is canvas.editing_shape or id(shape) in layer.hidden: continue
+            CanvasRenderer._draw_shape_recursive(patch, shape, canvas, None, origin, spans)
+            drawn = True
+        if entry[0] is None:
+            if not drawn: return
+            entry[0] = QImage(tile, tile, QImage.Format.Format_ARGB32_Premultiplied)
+            entry[0].setDevicePixelRatio(tile_ratio)
+            entry[0].fill(Qt.GlobalColor.transparent)
+        painter = QPainter(entry[0])
+        painter.setCompositionMode(QPainter.CompositionMode.CompositionMode_Source)
+        painter.drawImage(QPointF(x0 / tile_ratio, y0 / tile_ratio), patch)
+        painter.end()
 
     @staticmethod
-    def _draw_shape_recursive(framebuffer: QImage, shape: AnyShape, canvas: QWidget):
+    def _stamp_tiles(layer: Layer, canvas: QWidget):
+        """
+        把新追加到最上层的图形直接叠画到已缓存的瓦片上 (所有档位)，结果与重新光栅化整块瓦片相同。
+        刚画完的一笔因此只需光栅化它自己覆盖的瓦片，而不是整个图层。
+        """
+        stamps, layer.pending_stamps = layer.pending_stamps, []
+        tile = CanvasRenderer.TILE_SIZE
+        for shape in stamps:
+            if shape is canvas.editing_shape or id(shape) in layer.hidden: continue
+            extent = shape.get_world_extent()
+            if extent is None:
+                # 范围未知 (如文本)：无法确定要改哪些瓦片，退回整层重建
+                layer.tiles.clear()
+                return
+            spans = {} # 键里含像素比，各档位的扫描线分开缓存
+            for (tile_ratio, tx, ty), entry in layer.tiles.items():
+                world_tile = tile / tile_ratio
+                if not extent.intersects(QRectF(tx * world_tile, ty * world_tile, world_tile, world_tile)): continue
+                if entry[0] is None:
+                    entry[0] = QImage(tile, tile, QImage.Format.Format_ARGB32_Premultiplied)
+                    entry[0].setDevicePixelRatio(tile_ratio)
+                    entry[0].fill(Qt.GlobalColor.transparent)
+                CanvasRenderer._draw_shape_recursive(entry[0], shape, canvas, None, (tx * tile, ty * tile), spans)
+                profiler.count("tile.stamp")
+
+    @staticmethod
+    def _evict_tiles(layers, frame: int):
+        """所有图层的瓦片共用一个内存预算；超出时先丢弃最久没用过的，本帧用到的瓦片不会被淘汰。"""
+        entries = [(entry[1], layer, key, entry[0].sizeInBytes() if entry[0] is not None else CanvasRenderer.EMPTY_TILE_BYTES)
+                   for layer in layers for key, entry in layer.tiles.items()]
+        total = sum(e[3] for e in entries)
+        if total <= CanvasRenderer.TILE_CACHE_MAX_BYTES: return
+        entries.sort(key=lambda e: e[0])
+        for stamp, layer, key, size in entries:
+            if total <= CanvasRenderer.TILE_CACHE_MAX_BYTES or stamp == frame: break
+            del layer.tiles[key]
+            total -= size
+
+    @staticmethod
+    def _draw_shape_recursive(framebuffer: QImage, shape: AnyShape, canvas: QWidget, transform: QTransform = None, origin=None, spans=None):
+        """
+        transform: 可选的附加变换 (逻辑坐标 -> 逻辑坐标)，在图形自身的旋转/缩放之后应用。
+        origin: framebuffer 是一张局部离屏图时，它的左上角在完整帧缓冲中的物理像素坐标 (整数元组)。
+                所有坐标照常按完整帧缓冲计算，只在落笔时整体平移，因此结果与直接绘制逐像素一致。
+        spans: 把同一批图形画进同一档位的多块瓦片时共用的字典，自定义光栅化引擎生成的扫描线存在里面重复使用。
+        """
         if isinstance(shape, ShapeGroup):
-            for sub_shape in shape.shapes:
-                CanvasRenderer._draw_shape_recursive(framebuffer, sub_shape, canvas)
+            CanvasRenderer._draw_group(framebuffer, shape, canvas, transform, origin, spans)
+        elif isinstance(shape, SymbolInstance):
+            CanvasRenderer._draw_symbol_instance(framebuffer, shape, canvas, transform, origin, spans)
+        else:
+            CanvasRenderer._draw_single_shape_to_buffer(framebuffer, shape, canvas, transform, origin, spans)
+
+    @staticmethod
+    def _origin_offset(framebuffer: QImage, origin) -> QTransform:
+        """origin 对应的逻辑坐标平移 (作为 QPainter 的世界变换)。"""
+        if origin is None: return QTransform()
+        ratio = framebuffer.devicePixelRatioF()
+        return QTransform.fromTranslate(-origin[0] / ratio, -origin[1] / ratio)
+
+    @staticmethod
+    def _draw_group(framebuffer: QImage, group: ShapeGroup, canvas: QWidget, transform: QTransform = None, origin=None, spans=None):
+        """
+        编组的合成图缓存：把所有成员预先画到一张与帧缓冲像素对齐的离屏图上，之后图层重建时一次贴图即可。
+        缓存键包含编组的几何/样式版本号 (成员变化会冒泡到编组)、像素比、光栅算法和附加变换。
+        正在被拖动的编组每帧版本号都在变，所以同一个键第二次出现时才真正生成合成图。
+        """
+        total_pixel_ratio = framebuffer.devicePixelRatioF()
+        key = (group.geometry_version, group.style_version, total_pixel_ratio, canvas.current_raster_algorithm,
+               None if transform is None else from_qtransform(transform))
+        cache = group.render_cache
+        if len(group.shapes) >= CanvasRenderer.GROUP_CACHE_MIN_SHAPES and cache is not None and cache[0] == key:
+            profiler.count("group.hit" if cache[1] is not None else "group.miss")
+            if cache[1] is None:
+                cache = CanvasRenderer._render_group_composite(group, canvas, total_pixel_ratio, transform, key)
+            if cache[1] is not None:
+                painter = QPainter(framebuffer)
+                painter.setTransform(CanvasRenderer._origin_offset(framebuffer, origin))
+                painter.drawImage(cache[2], cache[1])
+                painter.end()
+                return
         else:
-            CanvasRenderer._draw_single_shape_to_buffer(framebuffer, shape, canvas)
+            if len(group.shapes) >= CanvasRenderer.GROUP_CACHE_MIN_SHAPES: profiler.count("group.miss")
+            group.render_cache = (key, None, None)
+
+        for sub_shape in group.shapes:
+            CanvasRenderer._draw_shape_recursive(framebuffer, sub_shape, canvas, transform, origin, spans)
+
+    @staticmethod
+    def _render_group_composite(group: ShapeGroup, canvas: QWidget, total_pixel_ratio: float, transform: QTransform, key):
+        to_device = (transform if transform is not None else QTransform()) * QTransform().scale(total_pixel_ratio, total_pixel_ratio)
+        area = QRectF()
+        for shape in group.shapes: area = area.united(shape.get_transformed_bounding_box())
+        area = to_device.mapRect(area)
+        pad = (max_stroke_width(group.shapes) + 2) * math.sqrt(abs(to_device.determinant()))
+        area.adjust(-pad, -pad, pad, pad)
+
+        # 原点取整到物理像素，贴图时不需要重采样
+        left, top = math.floor(area.left()), math.floor(area.top())
+        width, height = math.ceil(area.right()) - left, math.ceil(area.bottom()) - top
+        if width <= 0 or height <= 0 or width * height > CanvasRenderer.GROUP_CACHE_MAX_PIXELS:
+            group.render_cache = (key, None, None)
+            return group.render_cache
+
+        image = QImage(width, height, QImage.Format.Format_ARGB32_Premultiplied)
+        image.setDevicePixelRatio(total_pixel_ratio)
+        image.fill(Qt.GlobalColor.transparent)
+        for shape in group.shapes:
+            CanvasRenderer._draw_shape_recursive(image, shape, canvas, transform, (left, top))
+        group.render_cache = (key, image, QPointF(left / total_pixel_ratio, top / total_pixel_ratio))
+        return group.render_cache
+
+    @staticmethod
+    def _draw_symbol_instance(framebuffer: QImage, instance: SymbolInstance, canvas: QWidget, transform: QTransform = None, origin=None, spans=None):
+        """从符号的光栅缓存盖印一个实例；缓存按 (缩放档位, 旋转档位, 光栅算法) 区分，只有残差变换需要重采样。"""
+        symbol = instance.symbol
+        total_pixel_ratio = framebuffer.devicePixelRatioF()
+        # 母版坐标 -> 帧缓冲物理像素
+        device_transform = to_qtransform(instance.matrix) * shape_base_transform(instance)
+        if transform is not None: device_transform = device_transform * transform
+        device_transform = device_transform * QTransform().scale(total_pixel_ratio, total_pixel_ratio)
+
+        scale = math.sqrt(abs(device_transform.determinant()))
+        if scale == 0 or not symbol.shapes: return
+        steps = CanvasRenderer.SYMBOL_SCALE_STEPS_PER_OCTAVE
+        scale_bucket = round(math.log2(scale) * steps)
+        angle_bucket = round(math.degrees(math.atan2(device_transform.m12(), device_transform.m11())) / CanvasRenderer.SYMBOL_ANGLE_STEP)
+        angle_bucket %= 360 // CanvasRenderer.SYMBOL_ANGLE_STEP
+        key = (scale_bucket, angle_bucket, canvas.current_raster_algorithm)
+
+        entry = symbol.raster_cache.get(key)
+        profiler.count("symbol.miss" if entry is None else "symbol.hit")
+        if entry is None:
+            bucket_scale = 2 ** (scale_bucket / steps)
+            raster_transform = QTransform().rotate(angle_bucket * CanvasRenderer.SYMBOL_ANGLE_STEP).scale(bucket_scale, bucket_scale)
+            pad = (symbol.max_stroke_width() + 2) * bucket_scale
+            area = raster_transform.mapRect(symbol.get_bounding_box()).adjusted(-pad, -pad, pad, pad)
+            width, height = math.ceil(area.width()), math.ceil(area.height())
+            if width * height > CanvasRenderer.SYMBOL_MAX_RASTER_PIXELS:
+                # 放得太大时缓存不划算，直接按实际变换矢量绘制
+                direct = to_qtransform(instance.matrix) * shape_base_transform(instance)
+                if transform is not None: direct = direct * transform
+                for shape in symbol.shapes: CanvasRenderer._draw_shape_recursive(framebuffer, shape, canvas, direct, origin, spans)
+                return
+            raster_transform = raster_transform * QTransform.fromTranslate(-area.left(), -area.top())
+            image = QImage(max(1, width), max(1, height), QImage.Format.Format_ARGB32_Premultiplied)
+            image.fill(Qt.GlobalColor.transparent)
+            for shape in symbol.shapes: CanvasRenderer._draw_shape_recursive(image, shape, canvas, raster_transform)
+            if len(symbol.raster_cache) >= CanvasRenderer.SYMBOL_RASTER_CACHE_SIZE:
+                symbol.raster_cache.pop(next(iter(symbol.raster_cache)))
+            entry = symbol.raster_cache[key] = (image, raster_transform)
+
+        image, raster_transform = entry
+        # 残差变换：光栅像素 -> 帧缓冲物理像素；实例只是平移时它就是一次平移
+        residual = raster_transform.inverted()[0] * device_transform
+        painter = QPainter(framebuffer)
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, True)
+        painter.setTransform(residual * QTransform().scale(1.0 / total_pixel_ratio, 1.0 / total_pixel_ratio) * CanvasRenderer._origin_offset(framebuffer, origin))
+        painter.drawImage(0, 0, image)
+        painter.end()
             
     @staticmethod
-    def _draw_single_shape_to_buffer(framebuffer: QImage, shape: AnyShape, canvas: QWidget):
-        ssaa_factor = CanvasRenderer.SSAA_BASE_FACTOR if canvas.ssaa_enabled else 1
+    def _draw_single_shape_to_buffer(framebuffer: QImage, shape: AnyShape, canvas: QWidget, transform: QTransform = None, origin=None, spans=None):
+        ssaa_factor = CanvasRenderer.ssaa_factor_of(canvas)
         bbox = shape.get_bounding_box()
-        center = bbox.center()
         
         # 构建变换矩阵 (注意 center 现在可能是 QPointF)
-        base_transform = QTransform().translate(center.x(), center.y()).scale(shape.scale_x, shape.scale_y).rotate(shape.angle).translate(-center.x(), -center.y())
+        base_transform = shape_base_transform(shape)
+        # 附加变换的等效缩放系数，用于线宽、半径等标量
+        extra_scale = 1.0
+        if transform is not None:
+            base_transform = base_transform * transform
+            extra_scale = math.sqrt(abs(transform.determinant()))
         
         total_pixel_ratio = framebuffer.devicePixelRatioF()
         current_algo = canvas.current_raster_algorithm
         shape_type = type(shape)
+        # 图形局部坐标 -> 帧缓冲物理像素
+        final_transform = base_transform * QTransform().scale(total_pixel_ratio, total_pixel_ratio)
+
+        # 🟢 视锥裁剪与亚像素图形：文本可能溢出自身矩形，始终正常绘制
+        if shape_type is not Text:
+            device_bbox = final_transform.mapRect(bbox)
+            stroke = getattr(shape, 'width', 1) * total_pixel_ratio * extra_scale
+            # 箭头的头部会伸出包围盒，按它的尺寸 (10 + 2 * 线宽) 留足余量
+            pad = stroke + (10 + 2 * getattr(shape, 'width', 1)) * total_pixel_ratio * extra_scale
+            ox, oy = origin if origin is not None else (0, 0)
+            visible = QRectF(ox, oy, framebuffer.width(), framebuffer.height())
+            if not device_bbox.adjusted(-pad, -pad, pad, pad).intersects(visible): return
+            if max(device_bbox.width(), device_bbox.height()) + stroke < CanvasRenderer.LOD_SUBPIXEL_SIZE:
+                dot_painter = QPainter(framebuffer)
+                dot_painter.setTransform(CanvasRenderer._origin_offset(framebuffer, origin))
+                dot_painter.scale(1.0 / total_pixel_ratio, 1.0 / total_pixel_ratio)
+                center = device_bbox.center()
+                dot_painter.fillRect(QRect(math.floor(center.x()), math.floor(center.y()), 1, 1), shape.color)
+                dot_painter.end()
+                return
 
         # --- 模式 1: Native Qt Rendering (原生渲染) ---
         # 文本始终使用原生渲染，或者当用户选择 "PyQt原生" 算法时
         if shape_type is Text or current_algo == 'PyQt原生':
             painter = QPainter(framebuffer)
             painter.setRenderHint(QPainter.RenderHint.Antialiasing)
-            painter.setTransform(base_transform)
+            painter.setTransform(base_transform * CanvasRenderer._origin_offset(framebuffer, origin))
             
             should_fill = (hasattr(shape, 'fill_color') and shape.fill_color and hasattr(shape, 'fill_style') and shape.fill_style != Qt.BrushStyle.NoBrush)
             
@@ -144,11 +601,22 @@ class CanvasRenderer:
             return
 
         # --- 模式 2: Custom Rasterization Engine (自定义光栅化引擎) ---
-        
-        final_transform = base_transform * QTransform().scale(total_pixel_ratio, total_pixel_ratio)
-        physical_width = max(1, int(shape.width * total_pixel_ratio))
+        # 扫描线按完整帧缓冲坐标生成，与 origin 无关：同一档位下一个图形跨多块瓦片时只生成一次，每块瓦片只画自己的行
+        span_key = (id(shape), total_pixel_ratio, None if transform is None else from_qtransform(transform))
+        primitives = spans.get(span_key) if spans is not None else None
+        if primitives is None:
+            primitives = CanvasRenderer._rasterize_custom(shape, bbox, device_bbox, final_transform, total_pixel_ratio, extra_scale)
+            if spans is not None: spans[span_key] = primitives
+        CanvasRenderer._draw_primitives(framebuffer, shape, primitives, total_pixel_ratio, origin)
+
+    @staticmethod
+    def _rasterize_custom(shape: AnyShape, bbox: QRectF, device_bbox: QRectF, final_transform: QTransform, total_pixel_ratio: float, extra_scale: float):
+        """自定义光栅化引擎生成的图元 (Gouraud 扫描线, 填充扫描线, 轮廓扫描线, 离散点)，坐标为帧缓冲物理像素，各自按行排序。"""
+        shape_type = type(shape)
+        physical_width = max(1, int(shape.width * total_pixel_ratio * extra_scale))
         should_fill = (hasattr(shape, 'fill_color') and shape.fill_color and hasattr(shape, 'fill_style') and shape.fill_style != Qt.BrushStyle.NoBrush)
 
+        gouraud_spans = []   # 颜色插值区域 (贝塞尔曲面)
         fill_spans = []      # 填充区域
         outline_spans = []   # 边框区域
         points_to_draw = []  # 离散点
@@ -164,7 +632,7 @@ class CanvasRenderer:
                 
             elif shape_type is Circle:
                 t_center = final_transform.map(shape.center)
-                t_radius = shape.radius * (abs(shape.scale_x)+abs(shape.scale_y))/2 * total_pixel_ratio
+                t_radius = shape.radius * (abs(shape.scale_x)+abs(shape.scale_y))/2 * total_pixel_ratio * extra_scale
                 # 🟢 强制转 int，防止 range() 报错
                 fill_spans.extend(raster_algorithms.scanline_fill_circle(
                     int(t_center.x()), int(t_center.y()), int(t_radius)
@@ -280,7 +748,7 @@ class CanvasRenderer:
                     
         elif shape_type is Circle:
             t_center = final_transform.map(shape.center)
-            base_radius = shape.radius * (abs(shape.scale_x)+abs(shape.scale_y))/2 * total_pixel_ratio
+            base_radius = shape.radius * (abs(shape.scale_x)+abs(shape.scale_y))/2 * total_pixel_ratio * extra_scale
             offset = int(physical_width / 2)
             # 🟢 强制转 int
             base_r_int = int(base_radius)
@@ -307,13 +775,15 @@ class CanvasRenderer:
                 flattened_points = []
                 for i in range(len(sub_path) - 1):
                     start_seg, end_seg = sub_path[i], sub_path[i+1]
-                    # 贝塞尔平坦化
-                    segment_points = raster_algorithms.flatten_bezier(start_seg.anchor, start_seg.handle2, end_seg.handle1, end_seg.anchor, tolerance=0.75)
+                    # 🟢 贝塞尔曲线的仿射像就是控制点的仿射像：先变换到物理像素再平坦化，分段数随屏幕尺寸自适应
+                    segment_points = raster_algorithms.flatten_bezier(
+                        final_transform.map(start_seg.anchor), final_transform.map(start_seg.handle2),
+                        final_transform.map(end_seg.handle1), final_transform.map(end_seg.anchor),
+                        tolerance=CanvasRenderer.LOD_CURVE_TOLERANCE)
                     if flattened_points: flattened_points.extend(segment_points[1:])
                     else: flattened_points.extend(segment_points)
                 
-                # 转换坐标
-                t_points = final_transform.map(QPolygonF([QPointF(p) for p in flattened_points]))
+                t_points = QPolygonF([QPointF(p) for p in flattened_points])
                 
                 # 绘制宽线
                 if len(t_points) >= 2:
@@ -323,7 +793,11 @@ class CanvasRenderer:
                         
         elif isinstance(shape, BSpline):
             # B样条
-            curve_points = raster_algorithms.compute_bspline_points(shape.points, shape.degree)
+            # 采样数跟控制多边形在屏幕上的长度成正比，上限仍是原来的 n * 20
+            control_polygon = final_transform.map(QPolygonF(shape.points))
+            screen_length = sum(QLineF(control_polygon[i], control_polygon[i + 1]).length() for i in range(len(control_polygon) - 1))
+            num_samples = max(2, min(shape.point_count * 20, int(screen_length / CanvasRenderer.LOD_SAMPLE_SPACING) + 2))
+            curve_points = raster_algorithms.compute_bspline_points(shape.points, shape.degree, num_samples)
             t_points = final_transform.map(QPolygonF(curve_points))
             
             if len(t_points) >= 2:
@@ -338,25 +812,19 @@ class CanvasRenderer:
         elif isinstance(shape, BezierSurface):
             # 贝塞尔曲面 (重点逻辑)
             t_control_points = [final_transform.map(p) for p in shape.points]
+            screen_size = max(device_bbox.width(), device_bbox.height())
+            surface_steps = max(2, math.ceil(screen_size / CanvasRenderer.LOD_SURFACE_CELL))
             
             # 1. 如果开启填充 -> Gouraud 着色
             if getattr(shape, 'show_fill', True):
-                triangles = raster_algorithms.tessellate_bezier_surface(t_control_points, steps=15)
-                gouraud_spans = []
+                triangles = raster_algorithms.tessellate_bezier_surface(t_control_points, steps=min(15, surface_steps))
                 for p1, c1, p2, c2, p3, c3 in triangles:
-                    spans = raster_algorithms.rasterize_triangle_gouraud(p1, c1, p2, c2, p3, c3)
-                    gouraud_spans.extend(spans)
-                
-                local_painter = QPainter(framebuffer)
-                inv_scale = 1.0 / total_pixel_ratio
-                local_painter.scale(inv_scale, inv_scale)
-                CanvasRenderer.draw_gouraud_spans(local_painter, gouraud_spans)
-                local_painter.end()
+                    gouraud_spans.extend(raster_algorithms.rasterize_triangle_gouraud(p1, c1, p2, c2, p3, c3))
 
             # 2. 如果开启网格线 -> 绘制 Wireframe
             if getattr(shape, 'show_wireframe', True):
-                wireframe_width = max(1, int(1 * total_pixel_ratio))
-                grid_lines = raster_algorithms.compute_bezier_surface_wireframe(shape.points, steps=12)
+                wireframe_width = max(1, int(1 * total_pixel_ratio * extra_scale))
+                grid_lines = raster_algorithms.compute_bezier_surface_wireframe(shape.points, steps=min(12, surface_steps))
                 for line_points in grid_lines:
                      t_points = final_transform.map(QPolygonF(line_points))
                      if len(t_points) >= 2:
@@ -368,12 +836,35 @@ class CanvasRenderer:
                              )
                              outline_spans.extend(raster_algorithms.scanline_fill_polygon(poly_points))
 
-        # 3. 最终批量绘制 (Batch Draw)
-        
+        # 按行排序 (稳定排序，同一行内的先后不变)，绘制时用二分查找截取落在帧缓冲内的行
+        row = itemgetter(0)
+        gouraud_spans.sort(key=row)
+        fill_spans.sort(key=row)
+        outline_spans.sort(key=row)
+        points_to_draw.sort(key=itemgetter(1))
+        return gouraud_spans, fill_spans, outline_spans, points_to_draw
+
+    @staticmethod
+    def _draw_primitives(framebuffer: QImage, shape: AnyShape, primitives, total_pixel_ratio: float, origin=None):
+        """3. 最终批量绘制 (Batch Draw)：只取 framebuffer 覆盖的那些行。"""
+        gouraud_spans, fill_spans, outline_spans, points_to_draw = primitives
+        top = origin[1] if origin is not None else 0
+        bottom = top + framebuffer.height()
+        def rows(items, index=0):
+            key = itemgetter(index)
+            return items[bisect_left(items, top, key=key):bisect_left(items, bottom, key=key)]
+        gouraud_spans, fill_spans, outline_spans, points_to_draw = rows(gouraud_spans), rows(fill_spans), rows(outline_spans), rows(points_to_draw, 1)
+        if not (gouraud_spans or fill_spans or outline_spans or points_to_draw): return
+
         batch_painter = QPainter(framebuffer)
         inv_scale = 1.0 / total_pixel_ratio
+        batch_painter.setTransform(CanvasRenderer._origin_offset(framebuffer, origin))
         batch_painter.scale(inv_scale, inv_scale)
-        
+
+        # Gouraud (贝塞尔曲面的颜色插值)，画在填充和轮廓下面
+        if gouraud_spans:
+            CanvasRenderer.draw_gouraud_spans(batch_painter, gouraud_spans)
+
         # A. Fill (纯色填充)
         if fill_spans:
             batch_painter.setPen(QPen(shape.fill_color, 1))
@@ -393,6 +884,7 @@ class CanvasRenderer:
             batch_painter.drawPoints(points)
             
         batch_painter.end()
+
     @staticmethod
     def draw_arrow(painter: QPainter, p1: QPoint, p2: QPoint, color: QColor, width: int, only_head=False):
         if p1 is None or p2 is None or p1 == p2: return
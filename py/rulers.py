@@ -1,9 +1,11 @@
 from PyQt6.QtWidgets import QWidget, QGridLayout
 from PyQt6.QtGui import QPainter, QPen, QColor, QFont
 from PyQt6.QtCore import Qt, QPoint, pyqtSignal, QRect
+import math
 
 # 🟢 [修改] 增大标尺宽度，解决拥挤问题
 RULER_SIZE = 40 
+MIN_TICK_SPACING = 8 # 相邻小刻度在屏幕上至少相隔的像素数
 
 class Ruler(QWidget):
     guide_dragged = pyqtSignal(int) # 发送拖拽结束的位置
@@ -14,6 +16,9 @@ class Ruler(QWidget):
         self.mouse_pos = QPoint(-100, -100) # 初始移出屏幕外
         self.is_dragging_guide = False
         self.drag_pos = 0
+        # 🟢 与画布视口同步：屏幕坐标 = 世界坐标 * scale + offset (本标尺方向上的分量)
+        self.scale = 1.0
+        self.offset = 0.0
         self.setMouseTracking(True)
         
         if self.orientation == Qt.Orientation.Horizontal:
@@ -25,6 +30,33 @@ class Ruler(QWidget):
         self.mouse_pos = pos
         self.update()
 
+    def set_view(self, scale, offset):
+        self.scale, self.offset = scale, offset
+        self.update()
+
+    def _tick_step(self):
+        """小刻度的世界间距，取 1/2/5 x 10^n 中在屏幕上不小于 MIN_TICK_SPACING 的最小值。"""
+        exponent = math.floor(math.log10(MIN_TICK_SPACING / self.scale))
+        for base in (1, 2, 5, 10):
+            step = base * 10 ** exponent
+            if step * self.scale >= MIN_TICK_SPACING: return step
+        return 10 ** (exponent + 1)
+
+    def _ticks(self, length):
+        """产出 (屏幕位置, 刻度序号, 世界坐标)；序号逢 10 为大刻度，逢 5 为中刻度。"""
+        step = self._tick_step()
+        index = math.floor(-self.offset / self.scale / step)
+        while True:
+            value = index * step
+            pos = round(value * self.scale + self.offset)
+            if pos >= length: return
+            if pos >= 0: yield pos, index, value
+            index += 1
+
+    @staticmethod
+    def _label(value):
+        return str(int(round(value))) if abs(value - round(value)) < 1e-9 else f"{value:g}"
+
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
             self.is_dragging_guide = True
@@ -71,14 +103,13 @@ class Ruler(QWidget):
         painter.setFont(font)
 
         if self.orientation == Qt.Orientation.Horizontal:
-            start, end = 0, self.width()
-            # 绘制水平刻度
-            for i in range(start, end, 10):
-                if i % 100 == 0: 
+            # 绘制水平刻度 (标注世界坐标)
+            for i, index, value in self._ticks(self.width()):
+                if index % 10 == 0: 
                     painter.drawLine(i, 0, i, 15)
                     # 调整文字位置，使其在宽标尺中居中
-                    painter.drawText(i + 4, 25, str(i))
-                elif i % 50 == 0: 
+                    painter.drawText(i + 4, 25, self._label(value))
+                elif index % 5 == 0: 
                     painter.drawLine(i, 0, i, 10)
                 else: 
                     painter.drawLine(i, 0, i, 5)
@@ -92,18 +123,17 @@ class Ruler(QWidget):
                 painter.setPen(QPen(QColor(255, 0, 0), 1, Qt.PenStyle.DashLine))
                 painter.drawLine(self.drag_pos, 0, self.drag_pos, self.height())
         else:
-            start, end = 0, self.height()
-            # 绘制垂直刻度
-            for i in range(start, end, 10):
-                if i % 100 == 0: 
+            # 绘制垂直刻度 (标注世界坐标)
+            for i, index, value in self._ticks(self.height()):
+                if index % 10 == 0: 
                     painter.drawLine(0, i, 15, i)
                     painter.save()
                     painter.translate(0, i)
                     painter.rotate(-90) # 旋转文字让它竖着排，或者直接横排
                     painter.restore()
                     # 简单的横排显示
-                    painter.drawText(15, i + 10, str(i))
-                elif i % 50 == 0: 
+                    painter.drawText(15, i + 10, self._label(value))
+                elif index % 5 == 0: 
                     painter.drawLine(0, i, 10, i)
                 else: 
                     painter.drawLine(0, i, 5, i)
@@ -143,10 +173,16 @@ class CanvasView(QWidget):
         
         # 信号连接
         self.canvas.mouse_moved_signal.connect(self.update_rulers)
+        self.canvas.viewport_changed.connect(self.update_ruler_view)
         # 🟢 [关键连接] 确保这里连接了 add_xxx_guide 方法
         self.top_ruler.guide_dragged.connect(self.canvas.add_vertical_guide)
         self.left_ruler.guide_dragged.connect(self.canvas.add_horizontal_guide)
     
     def update_rulers(self, pos):
         self.top_ruler.set_mouse_pos(pos)
-        self.left_ruler.set_mouse_pos(pos)
\ No newline at end of file
+        self.left_ruler.set_mouse_pos(pos)
+
+    def update_ruler_view(self):
+        scale, offset = self.canvas.view_scale, self.canvas.view_offset
+        self.top_ruler.set_view(scale, offset.x())
+        self.left_ruler.set_view(scale, offset.y())
\ No newline at end of file
@@ -1,6 +1,10 @@
 from PyQt6.QtCore import QSettings
 from PyQt6.QtGui import QColor, QFont
 
+from undo_history import DEFAULT_MEMORY_BUDGET_MB
+from profiling_hooks import DEFAULT_THRESHOLD_MS
+from curve_fitting import DEFAULT_FREEHAND_MODE, DEFAULT_TOLERANCE
+
 class SettingsManager:
     def __init__(self, organization="ShapePainterOrg", application="ShapePainter"):
         self.settings = QSettings(organization, application)
@@ -12,7 +16,15 @@ class SettingsManager:
             "default_font": QFont("Arial", 24),
             "canvas_background_color": QColor(255, 255, 255),
             # 新增的、更通用的设置项
-            "show_welcome_on_startup": True
+            "show_welcome_on_startup": True,
+            # 撤销历史的内存上限 (MB)
+            "undo_memory_budget_mb": DEFAULT_MEMORY_BUDGET_MB,
+            # 交互性能追踪：模式见 profiling_hooks.TRACE_MODES，只记录慢于阈值的调用
+            "trace_mode": "off",
+            "trace_threshold_ms": DEFAULT_THRESHOLD_MS,
+            # 手绘笔划：模式见 curve_fitting.FREEHAND_MODES，容差单位是屏幕像素
+            "freehand_mode": DEFAULT_FREEHAND_MODE,
+            "freehand_tolerance": DEFAULT_TOLERANCE
         }
 
     def load_settings(self):
@@ -35,6 +47,12 @@ class SettingsManager:
         settings["show_welcome_on_startup"] = self.settings.value("general/show_welcome_on_startup", 
                                                                   defaults["show_welcome_on_startup"], 
                                                                   type=bool)
+        settings["undo_memory_budget_mb"] = int(self.settings.value("history/undo_memory_budget_mb",
+                                                                    defaults["undo_memory_budget_mb"]))
+        settings["trace_mode"] = str(self.settings.value("diagnostics/trace_mode", defaults["trace_mode"]))
+        settings["trace_threshold_ms"] = int(self.settings.value("diagnostics/trace_threshold_ms", defaults["trace_threshold_ms"]))
+        settings["freehand_mode"] = str(self.settings.value("tools/freehand_mode", defaults["freehand_mode"]))
+        settings["freehand_tolerance"] = float(self.settings.value("tools/freehand_tolerance", defaults["freehand_tolerance"]))
         return settings
 
     def save_settings(self, settings):
@@ -46,5 +64,13 @@ class SettingsManager:
         # 新增保存逻辑
         if "show_welcome_on_startup" in settings:
             self.settings.setValue("general/show_welcome_on_startup", settings["show_welcome_on_startup"])
+        if "undo_memory_budget_mb" in settings:
+            self.settings.setValue("history/undo_memory_budget_mb", settings["undo_memory_budget_mb"])
+        if "trace_mode" in settings:
+            self.settings.setValue("diagnostics/trace_mode", settings["trace_mode"])
+            self.settings.setValue("diagnostics/trace_threshold_ms", settings["trace_threshold_ms"])
+        if "freehand_mode" in settings:
+            self.settings.setValue("tools/freehand_mode", settings["freehand_mode"])
+            self.settings.setValue("tools/freehand_tolerance", settings["freehand_tolerance"])
         
         self.settings.sync()
\ No newline at end of file
@@ -1,17 +1,169 @@
 import copy
-from PyQt6.QtGui import QColor, QPolygonF, QPainterPath, QFont, QTransform, QPainter
+from array import array
+from PyQt6.QtGui import QColor, QPolygonF, QPainterPath, QFont, QPainter
 from PyQt6.QtCore import Qt, QRect, QPoint, QPointF, QRectF
 
+from spatial_index import SpatialIndex
+from geometry import (IDENTITY, translation, scaling_about, compose, map_xy, uniform_scale, is_translation,
+                      to_qtransform, transform_coords, transform_shapes, shape_base_transform)
+
+class ShapeList:
+    """图层内图形的有序集合 (顺序即 z-order)，成员判断、追加、删除都是 O(1)。"""
+    # _items: id -> 图形，dict 保持插入顺序；_order: id -> 单调序号，用于把空间索引的无序候选按 z-order 排序
+    # _sequence: 按下标访问用的顺序数组，删除或插入后作废，下次按下标访问时再建
+    # owner (所属图层) 在图形进出集合时收到 shape_added / shape_removed 通知
+    def __init__(self, shapes=(), owner=None):
+        self.owner = owner
+        self._items = {}
+        self._order = {}
+        self._next_order = 0
+        self._sequence = []
+        self.extend(shapes)
+
+    def __len__(self): return len(self._items)
+    def __bool__(self): return bool(self._items)
+    # 🟢 直接遍历 dict 视图，不复制；循环体里要增删图形时由调用方先 list() 取快照
+    def __iter__(self): return iter(self._items.values())
+    def __reversed__(self): return reversed(self._items.values())
+    def __contains__(self, shape): return self._items.get(id(shape)) is shape
+    def __repr__(self): return f"ShapeList({list(self._items.values())!r})"
+
+    def __getitem__(self, index):
+        if self._sequence is None: self._sequence = list(self._items.values())
+        return self._sequence[index]
+
+    def append(self, shape):
+        key = id(shape)
+        if key in self._items: return
+        self._items[key] = shape
+        self._order[key] = self._next_order; self._next_order += 1
+        if self._sequence is not None: self._sequence.append(shape)
+        if self.owner is not None: self.owner.shape_added(shape, on_top=True)
+    def extend(self, shapes):
+        for shape in shapes: self.append(shape)
+
+    def remove(self, shape):
+        if shape not in self: raise ValueError("shape is not in layer")
+        self.discard(shape)
+
+    def discard(self, shape):
+        if shape in self:
+            del self._items[id(shape)]; del self._order[id(shape)]
+            self._sequence = None
+            if self.owner is not None: self.owner.shape_removed(shape)
+
+    def remove_many(self, shapes):
+        for shape in shapes: self.discard(shape)
+
+    def index(self, shape):
+        if shape not in self: raise ValueError("shape is not in layer")
+        if self._sequence is None: self._sequence = list(self._items.values())
+        return next(i for i, s in enumerate(self._sequence) if s is shape)
+
+    def positions_of(self, shapes):
+        """一次遍历求出 shapes 中各图形的下标，返回按下标升序的 [(index, shape), ...]，不在集合中的忽略。"""
+        wanted = {id(s) for s in shapes}
+        return [(i, s) for i, s in enumerate(self._items.values()) if id(s) in wanted]
+
+    def in_z_order(self, shapes):
+        """把集合中的一批图形按 z-order (从下到上) 排序。"""
+        order = self._order
+        return sorted(shapes, key=lambda s: order[id(s)])
+
+    def insert(self, index, shape): self.insert_many([(index, shape)])
+
+    def insert_many(self, positioned_shapes):
+        """positioned_shapes: 按下标升序的 [(插入后的下标, 图形), ...]，即 positions_of 的返回值。"""
+        existing = iter(self._items.values())
+        result = []
+        for index, shape in positioned_shapes:
+            while len(result) < index:
+                nxt = next(existing, None)
+                if nxt is None: break
+                result.append(nxt)
+            result.append(shape)
+        result.extend(existing)
+        self._items = {id(s): s for s in result}
+        self._sequence = result
+        self._order = {key: i for i, key in enumerate(self._items)}
+        self._next_order = len(result)
+        if self.owner is not None:
+            for _, shape in positioned_shapes: self.owner.shape_added(shape)
+
 class Layer:
     def __init__(self, name):
         self.name = name
-        self.shapes = []
+        self.index = SpatialIndex() # 世界坐标空间索引，随 shapes 的增删和图形的几何变化同步
+        self.shapes = ShapeList()
         self.is_visible = True
         self.is_locked = False
         self.opacity = 1.0
         self.blend_mode = QPainter.CompositionMode.CompositionMode_SourceOver
-        self.cache = None
+        self.tiles = {}  # (瓦片分辨率, tx, ty) -> [QImage 或 None (空白瓦片), 最近使用的帧号]，由 CanvasRenderer 维护
+        self.pending_stamps = [] # 追加到最上层、还没画进已有瓦片的图形；渲染器直接叠画上去，不必重建整个图层
+        self.is_dirty = True # 整个图层的瓦片都要重建
+        self.damage = [] # 世界坐标矩形：其中的瓦片已过期，由 CanvasRenderer 通过 take_damage() 取走
+        self._changed = {} # id -> (图形, 变化前的范围)：上次渲染之后几何或样式变过的图形，新范围在取走时再算
+        self.hidden = {} # id -> 图形：暂时不画进瓦片的图形 (如橡皮擦笔划中待删除的)
+
+    @property
+    def shapes(self): return self._shapes
+
+    @shapes.setter
+    def shapes(self, shapes):
+        self.index.clear()
         self.is_dirty = True
+        self._shapes = ShapeList(shapes, owner=self)
+
+    def shape_added(self, shape, on_top=False):
+        """on_top: 图形追加在最上层，画在已有瓦片之上与重建结果一致，因此只记入 pending_stamps。"""
+        shape.layer = self
+        self.index.insert(shape)
+        if on_top and not self.is_dirty: self.pending_stamps.append(shape)
+        else: self.invalidate(shape.get_world_extent())
+    def shape_removed(self, shape):
+        changed = self._changed.pop(id(shape), None)
+        self.invalidate(changed[1] if changed else self.index.extent_of(shape))
+        self.index.remove(shape)
+        if self.pending_stamps: self.pending_stamps = [s for s in self.pending_stamps if s is not shape]
+    def shape_changed(self, shape, kind):
+        """图层内的图形发出变更通知 (见 BaseShape._notify)。"""
+        if shape not in self._shapes: return # 还没加入图层 (execute_command 会提前设置 layer)
+        # 🟢 只记下变化前的范围 (即空间索引里登记的范围)，同一帧内连续变化只记第一次
+        if not self.is_dirty and id(shape) not in self._changed: self._changed[id(shape)] = (shape, self.index.extent_of(shape))
+        # 线宽也会影响范围，样式变化同样要重新登记
+        self.index.mark_stale(shape)
+
+    def invalidate(self, rect):
+        """世界坐标矩形 rect 内的瓦片作废；rect 为 None (范围未知) 时整个图层作废。"""
+        if rect is None: self.is_dirty = True
+        elif not self.is_dirty: self.damage.append(rect)
+    def set_hidden(self, shape, hidden):
+        """暂时隐藏或恢复一个图形，只作废它覆盖的瓦片。"""
+        if hidden == (id(shape) in self.hidden): return
+        if hidden: self.hidden[id(shape)] = shape
+        else: del self.hidden[id(shape)]
+        self.invalidate(shape.get_world_extent())
+    def show_all(self):
+        for shape in list(self.hidden.values()): self.set_hidden(shape, False)
+    def has_changes(self):
+        return self.is_dirty or bool(self.damage or self._changed or self.pending_stamps)
+    def take_damage(self):
+        """取走上次渲染以来作废的世界坐标范围 (图形变化前后的范围都在内)；返回 None 表示整个图层都要重建。"""
+        damage, changed = self.damage, self._changed
+        self.damage, self._changed = [], {}
+        if self.is_dirty:
+            self.is_dirty = False
+            return None
+        for shape, old_extent in changed.values():
+            new_extent = shape.get_world_extent()
+            if old_extent is None or new_extent is None: return None
+            damage.append(old_extent); damage.append(new_extent)
+        return damage
+
+    def shapes_in(self, rect, exact=False):
+        """与世界坐标矩形 rect 可能相交的图形，按 z-order 从下到上排列；exact 见 SpatialIndex.query。"""
+        return self._shapes.in_z_order(self.index.query(rect, exact))
 
     def clone(self):
         # 手动实现克隆
@@ -22,23 +174,61 @@ class Layer:
         new_layer.blend_mode = self.blend_mode
         # 递归地克隆所有图形
         new_layer.shapes = [s.clone() for s in self.shapes]
+        for shape in new_layer.shapes: shape.layer = new_layer
         return new_layer
 
 class PathSegment:
     CORNER = 'corner'; SMOOTH = 'smooth'
+    # 🟢 六个浮点数直接存成槽位，anchor/handle1/handle2 只在访问时才包装成 QPointF
+    __slots__ = ('ax', 'ay', 'h1x', 'h1y', 'h2x', 'h2y', 'node_type')
+
     def __init__(self, anchor, handle1=None, handle2=None, node_type=CORNER): 
-        # 🟢 [修改] 强制转为 QPointF
-        self.anchor = QPointF(anchor)
-        self.handle1 = QPointF(handle1) if handle1 is not None else QPointF(anchor)
-        self.handle2 = QPointF(handle2) if handle2 is not None else QPointF(anchor)
+        self.ax, self.ay = anchor.x(), anchor.y()
+        self.h1x, self.h1y = (handle1.x(), handle1.y()) if handle1 is not None else (self.ax, self.ay)
+        self.h2x, self.h2y = (handle2.x(), handle2.y()) if handle2 is not None else (self.ax, self.ay)
         self.node_type = node_type
+
+    @property
+    def anchor(self): return QPointF(self.ax, self.ay)
+    @anchor.setter
+    def anchor(self, p): self.ax, self.ay = p.x(), p.y()
+
+    @property
+    def handle1(self): return QPointF(self.h1x, self.h1y)
+    @handle1.setter
+    def handle1(self, p): self.h1x, self.h1y = p.x(), p.y()
+
+    @property
+    def handle2(self): return QPointF(self.h2x, self.h2y)
+    @handle2.setter
+    def handle2(self, p): self.h2x, self.h2y = p.x(), p.y()
         
     def clone(self): 
-        return PathSegment(QPointF(self.anchor), QPointF(self.handle1), QPointF(self.handle2), self.node_type)
+        return PathSegment.from_state(self.get_state())
+
+    def get_state(self):
+        """返回一个不可变的纯数据快照，用于撤销命令记录单个节点的变化。"""
+        return (self.ax, self.ay, self.h1x, self.h1y, self.h2x, self.h2y, self.node_type)
+
+    def set_state(self, state):
+        self.ax, self.ay, self.h1x, self.h1y, self.h2x, self.h2y, self.node_type = state
+
+    @staticmethod
+    def from_state(state):
+        seg = PathSegment.__new__(PathSegment)
+        seg.set_state(state)
+        return seg
+
+    def apply_affine(self, m):
+        m11, m12, m21, m22, dx, dy = m
+        ax, ay, h1x, h1y, h2x, h2y = self.ax, self.ay, self.h1x, self.h1y, self.h2x, self.h2y
+        self.ax, self.ay = m11 * ax + m21 * ay + dx, m12 * ax + m22 * ay + dy
+        self.h1x, self.h1y = m11 * h1x + m21 * h1y + dx, m12 * h1x + m22 * h1y + dy
+        self.h2x, self.h2y = m11 * h2x + m21 * h2y + dx, m12 * h2x + m22 * h2y + dy
         
     def to_corner(self): 
-        self.handle1 = QPointF(self.anchor)
-        self.handle2 = QPointF(self.anchor)
+        self.h1x, self.h1y = self.ax, self.ay
+        self.h2x, self.h2y = self.ax, self.ay
         self.node_type = self.CORNER
         
     def to_smooth(self, handle=None):
@@ -52,31 +242,150 @@ class PathSegment:
         self.node_type = self.SMOOTH
 
 def get_transformed_rect(shape):
-    if shape.angle == 0 and shape.scale_x == 1 and shape.scale_y == 1: 
-        return shape.get_bounding_box() # 返回 QRectF
-        
+    """应用 angle/scale_x/scale_y 之后的包围盒 (QRectF)，结果缓存在图形上。"""
+    return shape.get_transformed_bounding_box()
+
+def _compute_transformed_rect(shape):
     original_bbox = shape.get_bounding_box()
-    center = original_bbox.center()
-    
-    transform = QTransform().translate(center.x(), center.y()).rotate(shape.angle).scale(shape.scale_x, shape.scale_y).translate(-center.x(), -center.y())
-    
-    # mapRect 返回的就是 QRectF
-    return transform.mapRect(original_bbox)
+    if shape.angle == 0 and shape.scale_x == 1 and shape.scale_y == 1: 
+        return original_bbox
+    # 与渲染使用同一个变换，非等比缩放加旋转时包围盒才与画出来的一致
+    return shape_base_transform(shape).mapRect(original_bbox)
+
+def _slot_names(cls):
+    """收集类及其所有基类声明的 __slots__ (不含 __weakref__)。结果按类缓存。"""
+    names = cls.__dict__.get('_all_slots')
+    if names is None:
+        names = []
+        for klass in reversed(cls.__mro__):
+            for name in klass.__dict__.get('__slots__', ()):
+                if name != '__weakref__' and name not in names: names.append(name)
+        names = tuple(names)
+        cls._all_slots = names
+    return names
+
+# 变更通知的种类
+GEOMETRY_CHANGED = 'geometry'
+STYLE_CHANGED = 'style'
+
+# 记账用的槽位：不属于图形的几何/样式，assign_from 时不复制
+_BOOKKEEPING_SLOTS = ('layer', 'parent', '_bbox', '_transformed_bbox', 'geometry_version', 'style_version', '_observers',
+                      'render_cache')
+
+# 改变这些属性会改变局部包围盒；其余属性 (颜色、线宽、填充……) 只影响外观
+GEOMETRY_PROPERTIES = frozenset(('rect', 'top_left', 'bottom_right', 'size', 'center', 'radius', 'pos', 'p1', 'p2',
+                                 'coords', 'points', 'sub_paths', 'shapes'))
+
+def _transform_property(slot):
+    """angle/scale_x/scale_y 的属性包装：赋值时只需丢弃变换后的包围盒，局部包围盒不受影响。"""
+    def getter(self): return getattr(self, slot)
+    def setter(self, value):
+        setattr(self, slot, value)
+        self._geometry_changed(local=False)
+    return property(getter, setter)
 
 class BaseShape:
-    def __init__(self): self.angle = 0.0; self.scale_x = 1.0; self.scale_y = 1.0; self.layer = None
-    def get_transformed_bounding_box(self): return get_transformed_rect(self)
+    # 🟢 所有图形类都使用 __slots__，不再为每个对象分配 __dict__
+    __slots__ = ('_angle', '_scale_x', '_scale_y', 'layer', 'parent', '_bbox', '_transformed_bbox',
+                 'geometry_version', 'style_version', '_observers', '__weakref__')
+    geometry_properties = GEOMETRY_PROPERTIES
+
+    angle = _transform_property('_angle')
+    scale_x = _transform_property('_scale_x')
+    scale_y = _transform_property('_scale_y')
+
+    def __init__(self):
+        self._angle = 0.0; self._scale_x = 1.0; self._scale_y = 1.0
+        self.layer = None; self.parent = None # parent: 所属的 ShapeGroup
+        self._bbox = None; self._transformed_bbox = None
+        # 🟢 单调递增的版本号：缓存只要记下生成时的 (geometry_version, style_version)，比较一下就知道是否过期
+        self.geometry_version = 0; self.style_version = 0
+        self._observers = None
+
+    # --- 变更通知 ---
+    def add_observer(self, callback):
+        """注册 callback(shape, kind)，kind 为 GEOMETRY_CHANGED 或 STYLE_CHANGED。"""
+        if self._observers is None: self._observers = []
+        if callback not in self._observers: self._observers.append(callback)
+    def remove_observer(self, callback):
+        if self._observers and callback in self._observers: self._observers.remove(callback)
+
+    def _notify(self, kind):
+        # 所在图层的光栅缓存和空间索引随之失效；编组成员的变化会冒泡到编组
+        if self.layer is not None: self.layer.shape_changed(self, kind)
+        if self._observers:
+            for callback in list(self._observers): callback(self, kind)
+        if self.parent is not None:
+            if kind == GEOMETRY_CHANGED: self.parent.invalidate_geometry()
+            else: self.parent.mark_style_changed()
+
+    def _geometry_changed(self, local=True):
+        if local: self._bbox = None
+        self._transformed_bbox = None
+        self.geometry_version += 1
+        self._notify(GEOMETRY_CHANGED)
+
+    # 🟢 包围盒缓存：命中时是 O(1)；所有改变几何的方法 (以及直接改写节点的命令/工具) 负责调用 invalidate_geometry
+    def invalidate_geometry(self): self._geometry_changed()
+    def mark_style_changed(self):
+        self.style_version += 1
+        self._notify(STYLE_CHANGED)
+    def properties_changed(self, names):
+        """直接 setattr 修改属性之后调用 (例如 ChangePropertiesCommand)，按属性种类递增对应的版本号。"""
+        if self.geometry_properties.intersection(names): self.invalidate_geometry()
+        else: self.mark_style_changed()
+    def get_bounding_box(self):
+        bbox = self._bbox
+        if bbox is None: bbox = self._bbox = self._compute_bounding_box()
+        return QRectF(bbox) # 返回副本，调用方可能原地 adjust/translate
+    def get_transformed_bounding_box(self):
+        bbox = self._transformed_bbox
+        if bbox is None: bbox = self._transformed_bbox = _compute_transformed_rect(self)
+        return QRectF(bbox)
+    def _compute_bounding_box(self):
+        raise NotImplementedError
+    def get_world_extent(self):
+        """可能落笔的世界坐标范围：变换后的包围盒加上线宽和箭头头部的余量；None 表示无法确定。"""
+        width = getattr(self, 'width', 1)
+        pad = 3 * width * max(abs(self.scale_x), abs(self.scale_y), 1) + 10
+        return self.get_transformed_bounding_box().adjusted(-pad, -pad, pad, pad)
+
     def rotate(self, rotation_delta=0): self.angle = (self.angle + rotation_delta) % 360
     def flip_horizontal(self): self.scale_x *= -1
     def flip_vertical(self): self.scale_y *= -1
+    # 🟢 平移和缩放都归结为一次仿射变换，子类只需实现 _apply_affine
+    def move(self, dx, dy): self.apply_affine(translation(dx, dy))
+    def scale(self, factor, center): self.apply_affine(scaling_about(factor, center.x(), center.y()))
+    def apply_affine(self, m):
+        """把仿射矩阵 m (见 geometry.py) 作用到图形的定义坐标上；半径、边长等标量按等效缩放系数缩放。"""
+        self._apply_affine(m)
+        self.invalidate_geometry()
+    def _apply_affine(self, m):
+        raise NotImplementedError
     def clone_transform(self, cloned_shape):
         cloned_shape.angle = self.angle
         cloned_shape.scale_x = self.scale_x
         cloned_shape.scale_y = self.scale_y
         cloned_shape.layer = None
+        cloned_shape.parent = None
+        # 克隆体的几何与原图形相同，包围盒缓存直接沿用 (缓存的 QRectF 只以副本形式返回，可以共享)
+        cloned_shape._bbox, cloned_shape._transformed_bbox = self._bbox, self._transformed_bbox
         return cloned_shape
+    def detach(self):
+        """写时复制：原地修改与克隆体共享的几何数据之前调用。简单图形没有共享数据。"""
+        pass
+    def assign_from(self, other):
+        """
+        原地用 other (通常是刚克隆出的快照) 的几何与样式覆盖自身，保留对象身份和 layer 引用。
+        拖动/缩放/旋转过程中每帧从原始快照复位时使用。
+        """
+        for name in _slot_names(type(self)):
+            if name not in _BOOKKEEPING_SLOTS: setattr(self, name, getattr(other, name))
+        self.invalidate_geometry()
+        self.mark_style_changed()
 
 class Text(BaseShape):
+    __slots__ = ('rect', 'text', 'font', 'color', 'has_border', 'border_color', 'alignment')
     def __init__(self, rect, text, font, color=QColor(0,0,0), has_border=False, border_color=QColor(0,0,0), alignment=Qt.AlignmentFlag.AlignLeft):
         super().__init__()
         # Text 比较特殊，Qt 底层绘制依赖整数 Rect，但我们这里存 Rect 并在 scale 时做浮点计算
@@ -84,28 +393,29 @@ class Text(BaseShape):
         self.text, self.font, self.color = text, font, color
         self.has_border, self.border_color, self.alignment = has_border, border_color, alignment
         
-    def get_bounding_box(self): 
+    def _compute_bounding_box(self): 
         # 🟢 [修改] 返回 QRectF
         return QRectF(self.rect)
+    def get_world_extent(self): return None # 文字可能溢出文本框
+        
+    def _apply_affine(self, m):
+        if is_translation(m):
+            self.rect.translate(int(m[4]), int(m[5])); return
+        # 🟢 [修改] 使用浮点运算后转回 Int，避免累积误差
+        tl = QPointF(*map_xy(m, self.rect.left(), self.rect.top()))
+        br = QPointF(*map_xy(m, self.rect.right(), self.rect.bottom()))
+        # 镜像或负缩放会让两个角互换，规范化后文本框仍然覆盖变换后的区域
+        self.rect = QRectF(tl, br).normalized().toRect()
         
-    def move(self, dx, dy): 
-        self.rect.translate(int(dx), int(dy))
+        new_size = self.font.pointSizeF() * uniform_scale(m)
+        if new_size >= 1: self.font.setPointSizeF(new_size)
         
     def clone(self): 
         cloned = Text(QRect(self.rect), self.text, QFont(self.font), QColor(self.color), self.has_border, QColor(self.border_color), self.alignment)
         return self.clone_transform(cloned)
         
-    def scale(self, factor, center):
-        centerF = QPointF(center)
-        # 🟢 [修改] 使用浮点运算后转回 Int，避免累积误差
-        tl = centerF + (QPointF(self.rect.topLeft()) - centerF) * factor
-        br = centerF + (QPointF(self.rect.bottomRight()) - centerF) * factor
-        self.rect = QRectF(tl, br).toRect()
-        
-        new_size = self.font.pointSizeF() * factor
-        if new_size >= 1: self.font.setPointSizeF(new_size)
-
 class Square(BaseShape):
+    __slots__ = ('top_left', 'size', 'color', 'width', 'fill_color', 'fill_style')
     def __init__(self, top_left, size, color=QColor(0,0,0), width=2, fill_color=None, fill_style=Qt.BrushStyle.SolidPattern):
         super().__init__()
         # 🟢 [修改] QPointF
@@ -114,24 +424,22 @@ class Square(BaseShape):
         self.color, self.width = color, width
         self.fill_color, self.fill_style = fill_color, fill_style
         
-    def get_bounding_box(self): 
+    def _compute_bounding_box(self): 
         return QRectF(self.top_left.x(), self.top_left.y(), self.size, self.size)
         
-    def move(self, dx, dy): 
-        self.top_left.setX(self.top_left.x() + dx)
-        self.top_left.setY(self.top_left.y() + dy)
+    def _apply_affine(self, m):
+        x, y = self.top_left.x(), self.top_left.y()
+        (x0, y0), (x1, y1) = map_xy(m, x, y), map_xy(m, x + self.size, y + self.size)
+        # 镜像或负缩放时变换后的左上角来自原来的另一个角
+        self.top_left = QPointF(min(x0, x1), min(y0, y1))
+        self.size *= uniform_scale(m)
         
     def clone(self): 
         cloned = Square(QPointF(self.top_left), self.size, QColor(self.color), self.width, QColor(self.fill_color) if self.fill_color else None, self.fill_style)
         return self.clone_transform(cloned)
         
-    def scale(self, factor, center): 
-        centerF = QPointF(center)
-        # 🟢 [修改] 移除 .toPoint()
-        self.top_left = centerF + (self.top_left - centerF) * factor
-        self.size *= factor
-
 class Ellipse(BaseShape):
+    __slots__ = ('top_left', 'bottom_right', 'color', 'width', 'fill_color', 'fill_style')
     def __init__(self, top_left, bottom_right, color=QColor(0,0,0), width=2, fill_color=None, fill_style=Qt.BrushStyle.SolidPattern):
         super().__init__()
         # 🟢 [修改] QPointF
@@ -140,65 +448,101 @@ class Ellipse(BaseShape):
         self.color, self.width = color, width
         self.fill_color, self.fill_style = fill_color, fill_style
         
-    def get_bounding_box(self): 
+    def _compute_bounding_box(self): 
         return QRectF(self.top_left, self.bottom_right).normalized()
         
-    def move(self, dx, dy): 
-        self.top_left.setX(self.top_left.x() + dx)
-        self.top_left.setY(self.top_left.y() + dy)
-        self.bottom_right.setX(self.bottom_right.x() + dx)
-        self.bottom_right.setY(self.bottom_right.y() + dy)
+    def _apply_affine(self, m):
+        self.top_left = QPointF(*map_xy(m, self.top_left.x(), self.top_left.y()))
+        self.bottom_right = QPointF(*map_xy(m, self.bottom_right.x(), self.bottom_right.y()))
         
     def clone(self): 
         cloned = Ellipse(QPointF(self.top_left), QPointF(self.bottom_right), QColor(self.color), self.width, QColor(self.fill_color) if self.fill_color else None, self.fill_style)
         return self.clone_transform(cloned)
         
-    def scale(self, factor, center): 
-        centerF = QPointF(center)
-        # 🟢 [修改] 移除 .toPoint()
-        self.top_left = centerF + (self.top_left - centerF) * factor
-        self.bottom_right = centerF + (self.bottom_right - centerF) * factor
-
 class RoundedRectangle(Ellipse):
+    __slots__ = ()
     def clone(self):
         cloned = RoundedRectangle(QPointF(self.top_left), QPointF(self.bottom_right), QColor(self.color), self.width, QColor(self.fill_color) if self.fill_color else None, self.fill_style)
         return self.clone_transform(cloned)
 
 class Rectangle(Ellipse):
+    __slots__ = ()
     def clone(self):
         cloned = Rectangle(QPointF(self.top_left), QPointF(self.bottom_right), QColor(self.color), self.width, QColor(self.fill_color) if self.fill_color else None, self.fill_style)
         return self.clone_transform(cloned)
 
-class Polygon(BaseShape):
+def _to_coords(points):
+    """把 QPoint/QPointF 序列或已有的坐标数组转成新的 array('d') [x0, y0, x1, y1, ...]。"""
+    if isinstance(points, array): return array('d', points)
+    return array('d', [v for p in points for v in (p.x(), p.y())])
+
+class PointArrayShape(BaseShape):
+    """点数多的图形 (多边形、折线、B样条、曲面) 的公共基类，坐标存放在 array('d') 里。"""
+    # 🟢 克隆时共享坐标数组 (写时复制)，任何一方第一次修改坐标前才复制自己的一份
+    # 修改坐标只能通过 points = ...、set_node_at() 或 detach() 返回的数组 (改完调用 invalidate_geometry())
+    __slots__ = ('coords', '_coords_shared')
+
+    def __init__(self):
+        super().__init__()
+        self.coords = array('d'); self._coords_shared = False
+
+    @property
+    def points(self):
+        # 只读的元组：shape.points[i] = ... / shape.points.append(...) 改不到坐标数组，直接报错而不是悄悄失效
+        c = self.coords
+        return tuple(QPointF(c[i], c[i + 1]) for i in range(0, len(c), 2))
+    @points.setter
+    def points(self, points):
+        self.coords = _to_coords(points); self._coords_shared = False
+        self.invalidate_geometry()
+
+    def detach(self):
+        if self._coords_shared:
+            self.coords = array('d', self.coords); self._coords_shared = False
+        return self.coords
+    def _share_coords(self, cloned):
+        cloned.coords = self.coords
+        cloned._coords_shared = self._coords_shared = True
+        return cloned
+    def assign_from(self, other):
+        super().assign_from(other)
+        self._coords_shared = other._coords_shared = True # 赋值后与 other 共享同一个数组
+
+    @property
+    def point_count(self): return len(self.coords) // 2
+    def get_point(self, index): return QPointF(self.coords[2 * index], self.coords[2 * index + 1])
+    def to_polygon(self): return QPolygonF(self.points)
+
+    def _compute_bounding_box(self):
+        if not self.coords: return QRectF()
+        xs, ys = self.coords[0::2], self.coords[1::2]
+        min_x, min_y = min(xs), min(ys)
+        return QRectF(min_x, min_y, max(xs) - min_x, max(ys) - min_y)
+
+    def _apply_affine(self, m):
+        transform_coords(self.detach(), m)
+        
+    def get_nodes(self): return self.points
+    def set_node_at(self, index, pos):
+        if 0 <= index < self.point_count:
+            coords = self.detach()
+            coords[2 * index] = pos.x(); coords[2 * index + 1] = pos.y()
+            self.invalidate_geometry()
+
+class Polygon(PointArrayShape):
+    __slots__ = ('color', 'width', 'fill_color', 'fill_style')
     def __init__(self, points, color=QColor(0,0,0), width=2, fill_color=None, fill_style=Qt.BrushStyle.SolidPattern):
         super().__init__()
-        # 🟢 [修改] QPointF List
-        self.points = [QPointF(p) for p in points]
+        self.points = points
         self.color, self.width, self.fill_color = color, width, fill_color
         self.fill_style = fill_style
-        
-    def get_bounding_box(self): 
-        return QPolygonF(self.points).boundingRect()
-        
-    def move(self, dx, dy):
-        for p in self.points: 
-            p.setX(p.x() + dx); p.setY(p.y() + dy)
             
     def clone(self): 
-        cloned_points = [QPointF(p) for p in self.points]
-        cloned = Polygon(cloned_points, QColor(self.color), self.width, QColor(self.fill_color) if self.fill_color else None, self.fill_style)
-        return self.clone_transform(cloned)
-        
-    def scale(self, factor, center): 
-        centerF = QPointF(center)
-        # 🟢 [修改] 移除 .toPoint()
-        self.points = [centerF + (p - centerF) * factor for p in self.points]
-        
-    def get_nodes(self): return self.points
-    def set_node_at(self, index, pos):
-        if 0 <= index < len(self.points): self.points[index] = QPointF(pos)
+        cloned = Polygon((), QColor(self.color), self.width, QColor(self.fill_color) if self.fill_color else None, self.fill_style)
+        return self.clone_transform(self._share_coords(cloned))
 
 class Circle(BaseShape):
+    __slots__ = ('center', 'radius', 'color', 'width', 'fill_color', 'fill_style')
     def __init__(self, center, radius, color=QColor(0,0,0), width=2, fill_color=None, fill_style=Qt.BrushStyle.SolidPattern):
         super().__init__()
         # 🟢 [修改] QPointF
@@ -207,73 +551,71 @@ class Circle(BaseShape):
         self.color, self.width = color, width
         self.fill_color, self.fill_style = fill_color, fill_style
         
-    def get_bounding_box(self): 
+    def _compute_bounding_box(self): 
         return QRectF(self.center.x() - self.radius, self.center.y() - self.radius, self.radius * 2, self.radius * 2)
         
-    def move(self, dx, dy): 
-        self.center.setX(self.center.x() + dx)
-        self.center.setY(self.center.y() + dy)
+    def _apply_affine(self, m):
+        self.center = QPointF(*map_xy(m, self.center.x(), self.center.y()))
+        self.radius *= uniform_scale(m)
         
     def clone(self): 
         cloned = Circle(QPointF(self.center), self.radius, QColor(self.color), self.width, QColor(self.fill_color) if self.fill_color else None, self.fill_style)
         return self.clone_transform(cloned)
         
-    def scale(self, factor, center_of_selection): 
-        centerF = QPointF(center_of_selection)
-        # 🟢 [修改] 移除 .toPoint()
-        self.center = centerF + (self.center - centerF) * factor
-        self.radius *= factor
-
 class Point(BaseShape):
+    __slots__ = ('pos', 'color', 'width')
+    geometry_properties = GEOMETRY_PROPERTIES | {'width'} # 点的包围盒由线宽决定
     def __init__(self, pos, color=QColor(0,0,0), width=2): 
         super().__init__()
         self.pos = QPointF(pos) # 🟢 QPointF
         self.color, self.width = color, width
         
-    def get_bounding_box(self): 
+    def _compute_bounding_box(self): 
         return QRectF(self.pos.x() - self.width, self.pos.y() - self.width, self.width * 2, self.width * 2)
         
-    def move(self, dx, dy): 
-        self.pos.setX(self.pos.x() + dx)
-        self.pos.setY(self.pos.y() + dy)
+    def _apply_affine(self, m):
+        self.pos = QPointF(*map_xy(m, self.pos.x(), self.pos.y()))
         
     def clone(self):
         cloned = Point(QPointF(self.pos), QColor(self.color), self.width)
         return self.clone_transform(cloned)
         
-    def scale(self, factor, center): 
-        centerF = QPointF(center)
-        self.pos = centerF + (self.pos - centerF) * factor
-
 class Line(BaseShape):
+    __slots__ = ('p1', 'p2', 'color', 'width')
     def __init__(self, p1, p2, color=QColor(0,0,0), width=2): 
         super().__init__()
         self.p1 = QPointF(p1) # 🟢 QPointF
         self.p2 = QPointF(p2)
         self.color, self.width = color, width
         
-    def get_bounding_box(self): 
+    def _compute_bounding_box(self): 
         return QRectF(self.p1, self.p2).normalized()
         
-    def move(self, dx, dy): 
-        self.p1.setX(self.p1.x() + dx)
-        self.p1.setY(self.p1.y() + dy)
-        self.p2.setX(self.p2.x() + dx)
-        self.p2.setY(self.p2.y() + dy)
+    def _apply_affine(self, m):
+        self.p1 = QPointF(*map_xy(m, self.p1.x(), self.p1.y()))
+        self.p2 = QPointF(*map_xy(m, self.p2.x(), self.p2.y()))
         
     def clone(self):
         cloned = Line(QPointF(self.p1), QPointF(self.p2), QColor(self.color), self.width)
         return self.clone_transform(cloned)
         
-    def scale(self, factor, center): 
-        centerF = QPointF(center)
-        self.p1 = centerF + (self.p1 - centerF) * factor
-        self.p2 = centerF + (self.p2 - centerF) * factor
-
 class Path(BaseShape):
+    # 🟢 克隆体与原路径共享 sub_paths (写时复制)；原地修改子路径或节点之前必须先调用 detach()
+    __slots__ = ('sub_paths', 'color', 'width', 'fill_color', 'fill_style', '_segments_shared')
     def __init__(self, sub_paths, color=QColor(0,0,0), width=2, fill_color=None, fill_style=Qt.BrushStyle.SolidPattern):
         super().__init__()
         self.sub_paths = sub_paths; self.color = color; self.width = width; self.fill_color = fill_color; self.fill_style = fill_style
+        self._segments_shared = False
+
+    def detach(self):
+        """如果节点还与克隆体共享，先复制出自己的一份；返回可以原地修改的 sub_paths。"""
+        if self._segments_shared:
+            self.sub_paths = [[seg.clone() for seg in sp] for sp in self.sub_paths]
+            self._segments_shared = False
+        return self.sub_paths
+    def assign_from(self, other):
+        super().assign_from(other)
+        self._segments_shared = other._segments_shared = True
     
     @property
     def is_closed(self):
@@ -293,30 +635,18 @@ class Path(BaseShape):
             final_path.addPath(path)
         return final_path
         
-    def get_bounding_box(self): 
+    def _compute_bounding_box(self): 
         return self.get_painter_path().boundingRect() # 返回 QRectF
         
-    def move(self, dx, dy):
-        for sub_path in self.sub_paths:
-            for seg in sub_path: 
-                seg.anchor += QPointF(dx, dy)
-                seg.handle1 += QPointF(dx, dy)
-                seg.handle2 += QPointF(dx, dy)
-                
+    def _apply_affine(self, m):
+        for sub_path in self.detach():
+            for seg in sub_path: seg.apply_affine(m)
+        
     def clone(self):
-        cloned_sub_paths = [[seg.clone() for seg in sp] for sp in self.sub_paths]
-        cloned = Path(cloned_sub_paths, QColor(self.color), self.width, QColor(self.fill_color) if self.fill_color else None, self.fill_style)
+        cloned = Path(self.sub_paths, QColor(self.color), self.width, QColor(self.fill_color) if self.fill_color else None, self.fill_style)
+        cloned._segments_shared = self._segments_shared = True
         return self.clone_transform(cloned)
         
-    def scale(self, factor, center):
-        centerF = QPointF(center)
-        # 🟢 [修改] 移除 .toPoint()
-        for sub_path in self.sub_paths:
-            for seg in sub_path: 
-                seg.anchor = centerF + (QPointF(seg.anchor) - centerF) * factor
-                seg.handle1 = centerF + (QPointF(seg.handle1) - centerF) * factor
-                seg.handle2 = centerF + (QPointF(seg.handle2) - centerF) * factor
-                
     def get_nodes(self):
         nodes = [];
         for sub_path in self.sub_paths:
@@ -326,52 +656,81 @@ class Path(BaseShape):
     def set_node_at(self, index, pos):
         count = 0
         posF = QPointF(pos)
-        for sub_path in self.sub_paths:
+        for sub_path in self.detach():
             num_nodes_in_subpath = len(sub_path) * 3
             if count + num_nodes_in_subpath > index:
                 local_index = index - count; seg_index = local_index // 3; node_type = local_index % 3
                 if node_type == 0: sub_path[seg_index].anchor = posF
                 elif node_type == 1: sub_path[seg_index].handle1 = posF
                 elif node_type == 2: sub_path[seg_index].handle2 = posF
+                self.invalidate_geometry()
                 return
             count += num_nodes_in_subpath
             
     def remove_segment(self, sub_path_index, segment_index):
         if 0 <= sub_path_index < len(self.sub_paths):
-            sub_path = self.sub_paths[sub_path_index]
+            sub_path = self.detach()[sub_path_index]
             if 0 <= segment_index < len(sub_path):
                 is_closed_path = len(sub_path) > 1 and sub_path[0].anchor == sub_path[-1].anchor
                 if is_closed_path and (segment_index == 0 or segment_index == len(sub_path) - 1): sub_path.pop(-1); sub_path.pop(0)
                 else: sub_path.pop(segment_index)
                 if not sub_path: self.sub_paths.pop(sub_path_index)
+                self.invalidate_geometry()
                 return True
         return False
 
 class Polyline(Polygon):
+    __slots__ = ()
     def clone(self): 
-        cloned_points = [QPointF(p) for p in self.points]
-        cloned = Polyline(cloned_points, QColor(self.color), self.width, QColor(self.fill_color) if self.fill_color else None, self.fill_style)
-        return self.clone_transform(cloned)
+        cloned = Polyline((), QColor(self.color), self.width, QColor(self.fill_color) if self.fill_color else None, self.fill_style)
+        return self.clone_transform(self._share_coords(cloned))
 
 class ShapeGroup(BaseShape):
-    def __init__(self, shapes): super().__init__(); self.shapes = shapes; self.color = QColor(0,0,0)
+    __slots__ = ('shapes', 'color', 'render_cache')
+    def __init__(self, shapes):
+        super().__init__(); self.shapes = shapes; self.color = QColor(0,0,0)
+        self.render_cache = None # 由渲染器维护的合成图缓存，见 CanvasRenderer._draw_group
+        self.adopt_children()
+
+    def adopt_children(self):
+        """让成员的变更通知冒泡到本编组。"""
+        for shape in self.shapes: shape.parent = self
+    def release_children(self):
+        for shape in self.shapes:
+            if shape.parent is self: shape.parent = None
+
+    def assign_from(self, other):
+        # 逐个成员复位，保持成员对象的身份不变
+        if len(other.shapes) != len(self.shapes):
+            super().assign_from(other); self.adopt_children(); return
+        self.angle, self.scale_x, self.scale_y, self.color = other.angle, other.scale_x, other.scale_y, other.color
+        for shape, other_shape in zip(self.shapes, other.shapes): shape.assign_from(other_shape)
+        self.invalidate_geometry()
     
-    def get_bounding_box(self):
+    def _compute_bounding_box(self):
         if not self.shapes: return QRectF() # QRectF
         total_bbox = self.shapes[0].get_bounding_box()
         for shape in self.shapes[1:]: total_bbox = total_bbox.united(shape.get_bounding_box())
         return total_bbox
-        
-    def move(self, dx, dy):
-        for shape in self.shapes: shape.move(dx, dy)
+    def get_world_extent(self):
+        # 编组本身不带变换，范围就是成员范围的并集
+        extent = QRectF()
+        for shape in self.shapes:
+            shape_extent = shape.get_world_extent()
+            if shape_extent is None: return None
+            extent = extent.united(shape_extent)
+        return extent
+        
+    def _apply_affine(self, m):
+        transform_shapes(self.shapes, m)
+    def detach(self):
+        for shape in self.shapes: shape.detach()
         
     def clone(self): 
         cloned_shapes = [s.clone() for s in self.shapes]
         cloned_group = ShapeGroup(cloned_shapes)
         return self.clone_transform(cloned_group)
         
-    def scale(self, factor, center):
-        for shape in self.shapes: shape.scale(factor, center)
     def rotate(self, rotation_delta=0):
         for shape in self.shapes: shape.rotate(rotation_delta)
     def flip_horizontal(self):
@@ -380,50 +739,30 @@ class ShapeGroup(BaseShape):
         for shape in self.shapes: shape.flip_vertical()
 
 class Arrow(Line):
+    __slots__ = ()
     def clone(self):
         cloned = Arrow(QPointF(self.p1), QPointF(self.p2), QColor(self.color), self.width)
         return self.clone_transform(cloned)
     
-class BSpline(BaseShape):
+class BSpline(PointArrayShape):
+    __slots__ = ('degree', 'color', 'width')
     def __init__(self, points, degree=3, color=QColor(0,0,0), width=2):
         super().__init__()
-        # 🟢 [修改] QPointF
-        self.points = [QPointF(p) for p in points]
+        self.points = points
         self.degree = degree 
         self.color = color
         self.width = width
-    
-    def get_bounding_box(self):
-        if not self.points: return QRectF()
-        return QPolygonF(self.points).boundingRect()
-    
-    def move(self, dx, dy):
-        for p in self.points:
-            p.setX(p.x() + dx)
-            p.setY(p.y() + dy)
             
     def clone(self):
-        cloned_points = [QPointF(p) for p in self.points]
-        cloned = BSpline(cloned_points, self.degree, QColor(self.color), self.width)
-        return self.clone_transform(cloned)
-        
-    def scale(self, factor, center):
-        centerF = QPointF(center)
-        # 🟢 [修改] 移除 .toPoint()
-        self.points = [centerF + (p - centerF) * factor for p in self.points]
-        
-    def get_nodes(self): return self.points
-        
-    def set_node_at(self, index, pos):
-        if 0 <= index < len(self.points):
-            self.points[index] = QPointF(pos)
+        cloned = BSpline((), self.degree, QColor(self.color), self.width)
+        return self.clone_transform(self._share_coords(cloned))
 
-class BezierSurface(BaseShape):
+class BezierSurface(PointArrayShape):
+    __slots__ = ('color', 'width', 'show_fill', 'show_wireframe')
     def __init__(self, rect, color=QColor(0,0,0), width=1):
         super().__init__()
         self.color = color
         self.width = width
-        self.points = []
         
         # 🟢 [新增] 显示属性开关
         self.show_fill = True
@@ -433,26 +772,16 @@ class BezierSurface(BaseShape):
         # 初始创建时使用 rect (整数或浮点皆可)
         x_step = rect.width() / (cols - 1)
         y_step = rect.height() / (rows - 1)
+        self.coords = array('d')
         for r in range(rows):
             for c in range(cols):
-                x = rect.x() + c * x_step
-                y = rect.y() + r * y_step
-                # 🟢 [修改] 存储为 QPointF
-                self.points.append(QPointF(x, y))
-
-    def get_bounding_box(self):
-        if not self.points: return QRectF()
-        return QPolygonF(self.points).boundingRect()
-
-    def move(self, dx, dy):
-        for p in self.points:
-            p.setX(p.x() + dx)
-            p.setY(p.y() + dy)
+                self.coords.append(rect.x() + c * x_step)
+                self.coords.append(rect.y() + r * y_step)
 
     def clone(self):
         dummy_rect = QRect(0,0,1,1)
         cloned = BezierSurface(dummy_rect, self.color, self.width)
-        cloned.points = [QPointF(p) for p in self.points]
+        self._share_coords(cloned)
         
         # 🟢 [关键] 手动克隆显示属性，防止拖动时状态重置
         cloned.show_fill = self.show_fill
@@ -460,14 +789,81 @@ class BezierSurface(BaseShape):
         
         return self.clone_transform(cloned)
 
-    def scale(self, factor, center):
-        centerF = QPointF(center)
-        # 🟢 [修改] 移除 .toPoint()
-        self.points = [centerF + (p - centerF) * factor for p in self.points]
+def max_stroke_width(shapes):
+    """一组图形 (含编组内部) 中最粗的线宽，离屏光栅化时据此给包围盒留边。"""
+    widths = [0]
+    stack = list(shapes)
+    while stack:
+        shape = stack.pop()
+        if isinstance(shape, ShapeGroup): stack.extend(shape.shapes)
+        else: widths.append(getattr(shape, 'width', 1))
+    return max(widths)
 
-    def get_nodes(self):
-        return self.points
+class Symbol:
+    """
+    符号 (母版)：一组只定义一次的图形，坐标即母版的局部坐标。
+    画布上的 SymbolInstance 只引用它并携带一个仿射矩阵；渲染器按缩放/旋转档位把母版光栅化一次，
+    所有实例都从 raster_cache 里盖印。
+    """
+    def __init__(self, name, shapes):
+        self.name = name
+        self.shapes = []
+        self.version = 0
+        self.raster_cache = {} # 由渲染器维护：{档位: (QImage, 母版坐标 -> 光栅像素的 QTransform)}
+        self._bbox = None
+        self.add_shapes(shapes)
+
+    def add_shapes(self, shapes):
+        for shape in shapes:
+            self.shapes.append(shape)
+            shape.add_observer(self._on_master_changed)
+        self.invalidate()
+    def _on_master_changed(self, shape, kind): self.invalidate()
+    def invalidate(self):
+        """母版被修改：丢弃包围盒与所有光栅缓存，实例通过 version 得知需要刷新。"""
+        self.version += 1
+        self.raster_cache.clear()
+        self._bbox = None
+
+    def get_bounding_box(self):
+        if self._bbox is None:
+            bbox = QRectF()
+            for shape in self.shapes: bbox = bbox.united(shape.get_transformed_bounding_box())
+            self._bbox = bbox
+        return QRectF(self._bbox)
+
+    def max_stroke_width(self): return max_stroke_width(self.shapes)
+
+class SymbolInstance(BaseShape):
+    """符号的一个实例：只保存 symbol 引用和 6 元组仿射矩阵 (母版坐标 -> 画布坐标)，克隆是 O(1) 的。"""
+    __slots__ = ('symbol', 'matrix', 'color', '_symbol_version')
+    def __init__(self, symbol, matrix=IDENTITY):
+        super().__init__()
+        self.symbol = symbol
+        self.matrix = tuple(matrix)
+        self.color = QColor(0,0,0)
+        self._symbol_version = symbol.version
+
+    def get_bounding_box(self):
+        if self._symbol_version != self.symbol.version:
+            self._symbol_version = self.symbol.version
+            self.invalidate_geometry()
+        return super().get_bounding_box()
+    def get_transformed_bounding_box(self):
+        self.get_bounding_box() # 顺便检查母版是否已改变
+        return super().get_transformed_bounding_box()
+
+    def _compute_bounding_box(self):
+        return to_qtransform(self.matrix).mapRect(self.symbol.get_bounding_box())
+    def get_world_extent(self):
+        pad = 3 * self.symbol.max_stroke_width() * uniform_scale(self.matrix) * max(abs(self.scale_x), abs(self.scale_y), 1) + 10
+        return self.get_transformed_bounding_box().adjusted(-pad, -pad, pad, pad)
+
+    def _apply_affine(self, m):
+        self.matrix = compose(self.matrix, m)
+
+    def clone(self):
+        cloned = SymbolInstance(self.symbol, self.matrix)
+        cloned.color = QColor(self.color)
+        return self.clone_transform(cloned)
 
-    def set_node_at(self, index, pos):
-        if 0 <= index < len(self.points):
-            self.points[index] = QPointF(pos)
\ No newline at end of file
@@ -0,0 +1,107 @@
+# spatial_index.py - 世界坐标空间索引
+#
+# 均匀网格哈希：世界平面按 CELL_SIZE 划分成格子，每个格子记录与之相交的图形。
+# 世界坐标没有边界，只有真正放了图形的格子才会出现在字典里，因此画布可以无限延伸。
+# 图形登记的范围来自 get_world_extent() (变换后的包围盒加线宽余量)，查询结果是候选集，调用方再做精确判断。
+
+import math
+from PyQt6.QtCore import QRectF, QPointF
+
+
+class SpatialIndex:
+    CELL_SIZE = 256.0
+    MAX_CELLS_PER_SHAPE = 4096  # 覆盖格子太多的超大图形不拆进格子，单独存放，每次查询都返回
+
+    def __init__(self, shapes=()):
+        self._cells = {}     # (cx, cy) -> {id(shape): shape}
+        self._entries = {}   # id(shape) -> (shape, 格子范围 或 None, 登记时的范围)
+        self._unbounded = {} # id(shape) -> shape：范围未知 (如文本) 或过大的图形
+        self._stale = {}     # 几何已变化、下次查询前需要重新登记的图形
+        for shape in shapes: self.insert(shape)
+
+    def __len__(self): return len(self._entries)
+
+    def _cell_range(self, rect):
+        size = self.CELL_SIZE
+        return (math.floor(rect.left() / size), math.floor(rect.top() / size),
+                math.floor(rect.right() / size), math.floor(rect.bottom() / size))
+
+    def insert(self, shape):
+        key = id(shape)
+        if key in self._entries: self._unlink(key)
+        extent = shape.get_world_extent()
+        cells = None if extent is None else self._cell_range(extent)
+        if cells is not None and (cells[2] - cells[0] + 1) * (cells[3] - cells[1] + 1) > self.MAX_CELLS_PER_SHAPE:
+            cells = None
+        self._entries[key] = (shape, cells, extent)
+        if cells is None:
+            self._unbounded[key] = shape
+            return
+        cx0, cy0, cx1, cy1 = cells
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                self._cells.setdefault((cx, cy), {})[key] = shape
+
+    def remove(self, shape):
+        key = id(shape)
+        self._stale.pop(key, None)
+        if key in self._entries: self._unlink(key)
+
+    def _unlink(self, key):
+        shape, cells, _ = self._entries.pop(key)
+        if cells is None:
+            del self._unbounded[key]
+            return
+        cx0, cy0, cx1, cy1 = cells
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                bucket = self._cells[(cx, cy)]
+                del bucket[key]
+                if not bucket: del self._cells[(cx, cy)]
+
+    def extent_of(self, shape):
+        """图形最近一次登记的范围，即它上次被重新登记时所在的位置；范围未知或未登记时返回 None。"""
+        entry = self._entries.get(id(shape))
+        return None if entry is None else entry[2]
+
+    def mark_stale(self, shape):
+        """图形几何变化后调用；真正的重新登记推迟到下一次查询，连续拖动时只做一次。"""
+        if id(shape) in self._entries: self._stale[id(shape)] = shape
+
+    def clear(self):
+        self._cells.clear(); self._entries.clear(); self._unbounded.clear(); self._stale.clear()
+
+    def _flush(self):
+        if not self._stale: return
+        stale, self._stale = self._stale, {}
+        for shape in stale.values(): self.insert(shape)
+
+    def query(self, rect: QRectF, exact=False):
+        """与 rect 可能相交的图形 (无序，不重复)；exact 时再按登记的范围筛掉格子里不相交的图形。"""
+        self._flush()
+        found = dict(self._unbounded)
+        cx0, cy0, cx1, cy1 = self._cell_range(rect)
+        if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) > len(self._cells):
+            # 查询范围比已占用的格子还多时，直接遍历已占用的格子
+            for (cx, cy), bucket in self._cells.items():
+                if cx0 <= cx <= cx1 and cy0 <= cy <= cy1: found.update(bucket)
+        else:
+            for cy in range(cy0, cy1 + 1):
+                for cx in range(cx0, cx1 + 1):
+                    bucket = self._cells.get((cx, cy))
+                    if bucket: found.update(bucket)
+        if exact:
+            entries = self._entries
+            return [shape for key, shape in found.items() if entries[key][2] is None or entries[key][2].intersects(rect)]
+        return list(found.values())
+
+    def query_point(self, point: QPointF):
+        return self.query(QRectF(point.x(), point.y(), 0, 0))
+
+    def bounds(self) -> QRectF:
+        """所有已登记图形的范围并集 (不含范围未知的图形)；没有图形时返回空矩形。"""
+        self._flush()
+        result = QRectF()
+        for _, _, extent in self._entries.values():
+            if extent is not None: result = result.united(extent)
+        return result
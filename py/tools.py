@@ -1,20 +1,26 @@
 import math
 from PyQt6.QtWidgets import QApplication
-from PyQt6.QtGui import (QPainter, QPen, QColor, QBrush, QPolygon, QPainterPath, QCursor, QTransform, QFont, QKeySequence, QPixmap)
-from PyQt6.QtCore import Qt, QPoint, QRect, QPointF ,QRectF
+from PyQt6.QtGui import (QPainter, QPen, QColor, QBrush, QPolygonF, QPainterPath, QCursor, QTransform, QFont, QKeySequence, QPixmap, QImage)
+from PyQt6.QtCore import Qt, QPointF ,QRectF
 
 from shapes import *
 from commands import (AddShapeCommand, RemoveShapesCommand, MoveShapesCommand,
                       ScaleCommand, ChangePropertiesCommand, RotateCommand, FlipCommand, ModifyNodeCommand,
-                      CompositeCommand, ModifyPathCommand)
+                      CompositeCommand, ModifyPathCommand, ReplaceShapesCommand)
 from renderer import CanvasRenderer
 import raster_algorithms
+import hit_testing
+import clipping
+from curve_fitting import StreamingSimplifier, StreamingBezierFitter, beziers_to_segments
 
 
 class Tool:
     def __init__(self, canvas): self.canvas = canvas
     def mousePressEvent(self, event): pass
     def mouseMoveEvent(self, event): pass
+    def mouseMoveEvents(self, events):
+        """画布每个刷新周期调用一次，events 是这一拍攒下的全部移动；默认只处理最新的位置。"""
+        self.mouseMoveEvent(events[-1])
     def mouseReleaseEvent(self, event): pass
     def mouseDoubleClickEvent(self, event): pass
     def keyPressEvent(self, event): pass
@@ -23,6 +29,13 @@ class Tool:
     def paint(self, painter): pass
 
 class SelectTool(Tool):
+    # 以下尺寸都是屏幕像素，使用时经 canvas.world_length 换算，放大缩小时控制柄和点选范围在屏幕上大小不变
+    PICK_RADIUS = 5        # 节点、控制柄的点选范围 (曼哈顿距离)
+    CLICK_DISTANCE = 3     # 按下到松开移动不超过它算点击
+    DRAG_THRESHOLD = 4     # 拖出控制柄的最小距离
+    SELECTION_MARGIN = 5   # 选择框比包围盒向外扩的距离
+    CORNER_SIZE = 10       # 缩放控制柄的边长
+    ROTATE_HANDLE = 20     # 旋转控制柄伸出选择框的长度
     def __init__(self, canvas):
         super().__init__(canvas)
         self.is_multiselecting = False
@@ -40,13 +53,14 @@ class SelectTool(Tool):
         self.continuing_path_info = None
         self.is_dragging_new_handle = False
         self.new_node_start_pos = None
-        self.old_paths_snapshot = None
-        self.original_sub_paths_for_drag = None
+        self.pending_insert_index = None
+        self.original_segment_states_for_drag = None
 
     def activate(self):
         self.deactivate()
 
     def deactivate(self):
+        self._discard_pending_insert()
         self.canvas.selected_shapes.clear()
         self.is_multiselecting = False
         self.selection_rect = None
@@ -61,8 +75,7 @@ class SelectTool(Tool):
         self.continuing_path_info = None
         self.is_dragging_new_handle = False
         self.new_node_start_pos = None
-        self.old_paths_snapshot = None
-        self.original_sub_paths_for_drag = None
+        self.original_segment_states_for_drag = None
         self.canvas.setCursor(QCursor(Qt.CursorShape.ArrowCursor))
         super().deactivate()
 
@@ -88,15 +101,16 @@ class SelectTool(Tool):
 
     def mousePressEvent(self, event):
         if event.button() != Qt.MouseButton.LeftButton: return
-        self.action_start_position = event.pos()
+        self.action_start_position = event.position()
 
         if self.continuing_path_info:
-            shape, sp_idx = self.continuing_path_info
-            snapped_pos = self.canvas.snap_point(event.pos())
-            self.old_paths_snapshot = [ [s.clone() for s in sp] for sp in shape.sub_paths ]
-            shape.sub_paths[sp_idx].append(PathSegment(QPointF(snapped_pos), node_type=PathSegment.CORNER))
+            shape, sp_idx, at_start = self.continuing_path_info
+            snapped_pos = self.canvas.snap_point(event.position())
+            # 🟢 从起点继续时新节点插到最前面，从终点继续时追加到末尾；松开鼠标时才生成命令
+            self.pending_insert_index = 0 if at_start else len(shape.sub_paths[sp_idx])
+            shape.detach()[sp_idx].insert(self.pending_insert_index, PathSegment(QPointF(snapped_pos), node_type=PathSegment.CORNER))
+            shape.invalidate_geometry()
             self.new_node_start_pos = snapped_pos
-            if shape.layer: shape.layer.is_dirty = True
             self.canvas.update()
             return
 
@@ -107,7 +121,7 @@ class SelectTool(Tool):
         if self.node_editing_active:
             if self._handle_node_press(event): return
 
-        handle_type = self._get_handle_type_at(event.pos())
+        handle_type = self._get_handle_type_at(event.position())
         if handle_type and self.canvas.selected_shapes:
             if any(s.layer and not s.layer.is_locked for s in self.canvas.selected_shapes):
                 if handle_type == "rotate":
@@ -122,39 +136,42 @@ class SelectTool(Tool):
             self._handle_node_move_with_reset(event); return
             
         if self.continuing_path_info and self.new_node_start_pos and (event.buttons() & Qt.MouseButton.LeftButton):
-            shape, sp_idx = self.continuing_path_info
-            snapped_pos = self.canvas.snap_point(event.pos())
-            if not self.is_dragging_new_handle and (snapped_pos - self.new_node_start_pos).manhattanLength() > 4:
+            shape, sp_idx, at_start = self.continuing_path_info
+            snapped_pos = self.canvas.snap_point(event.position())
+            if not self.is_dragging_new_handle and (snapped_pos - self.new_node_start_pos).manhattanLength() > self._px(self.DRAG_THRESHOLD):
                 self.is_dragging_new_handle = True
-            if self.is_dragging_new_handle:
-                sub_path = shape.sub_paths[sp_idx]
-                if sub_path: sub_path[-1].to_smooth(handle=QPointF(snapped_pos))
-            if shape.layer: shape.layer.is_dirty = True
+            if self.is_dragging_new_handle and self.pending_insert_index is not None:
+                new_seg = shape.detach()[sp_idx][self.pending_insert_index]
+                handle = QPointF(snapped_pos)
+                # 拖出的方向是绘制方向；在起点前插入时，路径方向与之相反，出控制柄要取镜像
+                if at_start: handle = new_seg.anchor - (handle - new_seg.anchor)
+                new_seg.to_smooth(handle=handle)
+                shape.invalidate_geometry()
             self.canvas.update(); return
 
         if self.continuing_path_info: self.canvas.update(); return
 
         if not (event.buttons() & Qt.MouseButton.LeftButton):
-            self._update_cursor(event.pos()); return
+            self._update_cursor(event.position()); return
 
         if self.rotating: self._handle_rotate_move(event)
         elif self.scaling: self._handle_scale_move(event)
         elif self.dragging: self._handle_drag_move(event)
         elif self.is_multiselecting:
-            self.selection_rect = QRect(self.action_start_position, event.pos()).normalized()
+            self.selection_rect = QRectF(self.action_start_position, event.position()).normalized()
             self.canvas.update()
 
     def mouseReleaseEvent(self, event):
         if event.button() != Qt.MouseButton.LeftButton: return
 
-        if self.continuing_path_info and self.old_paths_snapshot:
-            shape, _ = self.continuing_path_info
-            new_paths = [ [s.clone() for s in sp] for sp in shape.sub_paths ]
-            command = ModifyPathCommand(shape, self.old_paths_snapshot, new_paths)
+        if self.continuing_path_info and self.pending_insert_index is not None:
+            shape, sp_idx, _ = self.continuing_path_info
+            new_seg = shape.detach()[sp_idx].pop(self.pending_insert_index) # 撤回实时修改，交给命令执行
+            command = ModifyPathCommand(shape, [("insert", sp_idx, self.pending_insert_index, new_seg.get_state())])
             self.canvas.execute_command(command)
             self.is_dragging_new_handle = False
             self.new_node_start_pos = None
-            self.old_paths_snapshot = None
+            self.pending_insert_index = None
             self.canvas.update(); return
 
         if self.dragged_node_info: self._handle_node_release(event)
@@ -175,7 +192,7 @@ class SelectTool(Tool):
         self.continuing_path_info = None
         modifiers = QApplication.keyboardModifiers()
         is_shift_pressed = modifiers == Qt.KeyboardModifier.ShiftModifier
-        shape_clicked, layer_of_shape = self.canvas._get_shape_at(event.pos()) # canvas 那边已修复 posF
+        shape_clicked, layer_of_shape = self.canvas._get_shape_at(event.position()) # canvas 那边已修复 posF
 
         if self.node_editing_active:
             if not shape_clicked or (self.canvas.selected_shapes and shape_clicked is not self.canvas.selected_shapes[0]):
@@ -197,35 +214,28 @@ class SelectTool(Tool):
             if not is_shift_pressed:
                 self.canvas.selected_shapes.clear()
             self.is_multiselecting = True
-            self.selection_rect = QRect(event.pos(), event.pos())
+            self.selection_rect = QRectF(event.position(), event.position())
         
         self.canvas.update()
 
     def _handle_drag_move(self, event):
-        snapped_current_pos = self.canvas.snap_point(event.pos())
+        snapped_current_pos = self.canvas.snap_point(event.position())
         if not self.action_start_position: return
         delta = snapped_current_pos - self.action_start_position
         
-        affected_layers = set()
         for i, original_shape in enumerate(self.original_shapes_for_action):
             current_shape = self.canvas.selected_shapes[i]
-            original_layer_ref = current_shape.layer
-            
-            current_shape.__dict__ = original_shape.clone().__dict__
+            current_shape.assign_from(original_shape.clone())
             current_shape.move(delta.x(), delta.y())
-            
-            current_shape.layer = original_layer_ref
-            if current_shape.layer: affected_layers.add(current_shape.layer)
 
-        for layer in affected_layers: layer.is_dirty = True
         self.canvas.update()
 
     def _handle_drag_finish(self, event):
         if not self.action_start_position: return
-        snapped_current_pos = self.canvas.snap_point(event.pos())
+        snapped_current_pos = self.canvas.snap_point(event.position())
         total_delta = snapped_current_pos - self.action_start_position
         
-        if total_delta.manhattanLength() > 2:
+        if total_delta.manhattanLength() > self._px(2):
             for shape in self.canvas.selected_shapes:
                 shape.move(-total_delta.x(), -total_delta.y())
             
@@ -236,30 +246,28 @@ class SelectTool(Tool):
 
     def _handle_multiselect_finish(self):
         if not self.selection_rect: return
-        # selection_rect 是整数 QRect，但 get_transformed_bounding_box 是 QRectF
-        # intersects 支持混合类型
         selection_box = self.selection_rect.normalized()
         modifiers = QApplication.keyboardModifiers()
         if not (modifiers == Qt.KeyboardModifier.ShiftModifier): 
             self.canvas.selected_shapes.clear()
         for layer in self.canvas.layers:
             if not layer.is_visible or layer.is_locked: continue
-            for shape in layer.shapes:
-                if selection_box.intersects(shape.get_transformed_bounding_box().toRect()) and shape not in self.canvas.selected_shapes:
+            for shape in layer.shapes_in(selection_box):
+                if selection_box.intersects(shape.get_transformed_bounding_box()) and shape not in self.canvas.selected_shapes:
                     self.canvas.selected_shapes.append(shape)
         self.canvas.update()
 
     # 🟢 [核心重写] 解决漂移问题
     def _handle_scale_start(self, event, corner_name):
         self.dragging = False; self.scaling = True; self.scale_corner = corner_name
-        self.action_start_position = event.pos()
+        self.action_start_position = event.position()
         self.original_shapes_for_action = [s.clone() for s in self.canvas.selected_shapes]
         
         # 1. 如果选中了多个图形，不得不使用 AABB (Axis-Aligned Bounding Box)
         # 这时只能退回到旧的逻辑，会有微小漂移，但这是多选变换的数学代价
         if len(self.canvas.selected_shapes) > 1:
             total_bbox = self.canvas._get_selection_bbox() # AABB
-            corners = self._get_corner_rects(total_bbox.adjusted(-5, -5, 5, 5))
+            corners = self._get_corner_rects(self._selection_frame(total_bbox))
             if corner_name == 'topLeft': self.scale_center = QPointF(corners['bottomRight'].center())
             elif corner_name == 'topRight': self.scale_center = QPointF(corners['bottomLeft'].center())
             elif corner_name == 'bottomLeft': self.scale_center = QPointF(corners['topRight'].center())
@@ -283,7 +291,7 @@ class SelectTool(Tool):
             self.scale_center = transform.map(local_anchor)
     def _handle_scale_move(self, event):
         if not self.scale_center: return
-        snapped_pos = QPointF(self.canvas.snap_point(event.pos()))
+        snapped_pos = QPointF(self.canvas.snap_point(event.position()))
         # 计算距离使用浮点数
         dist_start_vec = QPointF(self.action_start_position) - self.scale_center
         dist_end_vec = snapped_pos - self.scale_center
@@ -292,23 +300,16 @@ class SelectTool(Tool):
         if dist_start_len == 0: return
         factor = dist_end_len / dist_start_len
         
-        affected_layers = set()
         for i, original_shape in enumerate(self.original_shapes_for_action):
             current_shape = self.canvas.selected_shapes[i]
-            original_layer_ref = current_shape.layer
-            
-            current_shape.__dict__ = original_shape.clone().__dict__
+            current_shape.assign_from(original_shape.clone())
             current_shape.scale(factor, self.scale_center)
-            
-            current_shape.layer = original_layer_ref
-            if current_shape.layer: affected_layers.add(current_shape.layer)
 
-        for layer in affected_layers: layer.is_dirty = True
         self.canvas.update()
 
     def _handle_scale_finish(self, event):
         if not self.scale_center: return
-        snapped_pos = QPointF(self.canvas.snap_point(event.pos()))
+        snapped_pos = QPointF(self.canvas.snap_point(event.position()))
         dist_start_vec = QPointF(self.action_start_position) - self.scale_center
         dist_end_vec = snapped_pos - self.scale_center
         dist_start_len = math.sqrt(dist_start_vec.x() ** 2 + dist_start_vec.y() ** 2)
@@ -323,40 +324,33 @@ class SelectTool(Tool):
             self.canvas.execute_command(command)
 
     def _handle_rotate_start(self, event):
-        self.rotating = True; self.action_start_position = event.pos()
+        self.rotating = True; self.action_start_position = event.position()
         self.original_shapes_for_action = [s.clone() for s in self.canvas.selected_shapes]
         self.scale_center = self.canvas._get_selection_bbox().center() # QPointF
 
     def _handle_rotate_move(self, event):
         if not self.scale_center: return
         start_vec = QPointF(self.action_start_position) - self.scale_center
-        current_vec = QPointF(event.pos()) - self.scale_center
+        current_vec = QPointF(event.position()) - self.scale_center
         start_angle = math.atan2(start_vec.y(), start_vec.x())
         current_angle = math.atan2(current_vec.y(), current_vec.x())
         angle_delta_rad = current_angle - start_angle
         angle_delta_deg = math.degrees(angle_delta_rad)
 
-        affected_layers = set()
         for i, original_shape in enumerate(self.original_shapes_for_action):
             current_shape = self.canvas.selected_shapes[i]
-            original_layer_ref = current_shape.layer
-
-            current_shape.__dict__ = original_shape.clone().__dict__
+            current_shape.assign_from(original_shape.clone())
             final_angle_delta = angle_delta_deg
             if current_shape.scale_x * current_shape.scale_y < 0:
                 final_angle_delta = -angle_delta_deg
             current_shape.rotate(rotation_delta=final_angle_delta)
-            
-            current_shape.layer = original_layer_ref
-            if current_shape.layer: affected_layers.add(current_shape.layer)
 
-        for layer in affected_layers: layer.is_dirty = True
         self.canvas.update()
 
     def _handle_rotate_finish(self, event):
         if not self.scale_center: return
         start_vec = QPointF(self.action_start_position) - self.scale_center
-        current_vec = QPointF(event.pos()) - self.scale_center
+        current_vec = QPointF(event.position()) - self.scale_center
         start_angle = math.atan2(start_vec.y(), start_vec.x())
         current_angle = math.atan2(current_vec.y(), current_vec.x())
         angle_delta_rad = current_angle - start_angle
@@ -377,7 +371,7 @@ class SelectTool(Tool):
 
     def mouseDoubleClickEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
-            shape_clicked, layer_of_shape = self.canvas._get_shape_at(event.pos())
+            shape_clicked, layer_of_shape = self.canvas._get_shape_at(event.position())
             if shape_clicked and layer_of_shape and not layer_of_shape.is_locked:
                 if hasattr(shape_clicked, 'get_nodes') and len(
                         self.canvas.selected_shapes) == 1 and self.canvas.selected_shapes[0] is shape_clicked:
@@ -388,18 +382,37 @@ class SelectTool(Tool):
 
     def keyPressEvent(self, event):
         if self.continuing_path_info and event.key() == Qt.Key.Key_Escape:
-            if self.old_paths_snapshot:
-                shape, _ = self.continuing_path_info
-                shape.sub_paths = self.old_paths_snapshot
-                self.old_paths_snapshot = None
-                self.is_dragging_new_handle = False
-                self.new_node_start_pos = None
+            self._discard_pending_insert()
             self.continuing_path_info = None
             self.canvas.update()
             event.accept()
             return
         if event.key() == Qt.Key.Key_Backspace and self.canvas.selected_shapes:
-            self.canvas.delete_selected()
+            self.canvas.delete_selected(); return
+        if event.key() in self.NUDGE_KEYS and self.canvas.selected_shapes and not self.dragged_node_info:
+            self._nudge_selection(event)
+
+    # 方向键微移：按住 Shift 时步长更大
+    NUDGE_KEYS = {Qt.Key.Key_Left: (-1, 0), Qt.Key.Key_Right: (1, 0), Qt.Key.Key_Up: (0, -1), Qt.Key.Key_Down: (0, 1)}
+
+    def _nudge_selection(self, event):
+        shapes = [s for s in self.canvas.selected_shapes if s.layer and not s.layer.is_locked]
+        if not shapes: return
+        step = 10 if event.modifiers() & Qt.KeyboardModifier.ShiftModifier else 1
+        dx, dy = self.NUDGE_KEYS[event.key()]
+        # 🟢 连续的微移会被折叠成一个撤销步骤
+        self.canvas.execute_command(MoveShapesCommand(shapes, dx * step, dy * step), merge=True)
+        event.accept()
+
+    def _discard_pending_insert(self):
+        """撤回按下鼠标时实时插入、但尚未提交为命令的新节点。"""
+        if self.continuing_path_info and self.pending_insert_index is not None:
+            shape, sp_idx, _ = self.continuing_path_info
+            shape.detach()[sp_idx].pop(self.pending_insert_index)
+            shape.invalidate_geometry()
+        self.pending_insert_index = None
+        self.is_dragging_new_handle = False
+        self.new_node_start_pos = None
 
     def paint(self, painter):
         # 1. 绘制多选框
@@ -418,19 +431,21 @@ class SelectTool(Tool):
             transform, _ = self._get_transform_for_shape(shape)
             
             if self.continuing_path_info:
-                path_shape, sp_idx = self.continuing_path_info
+                path_shape, sp_idx, at_start = self.continuing_path_info
                 sub_path = path_shape.sub_paths[sp_idx]
                 if sub_path:
-                    if self.is_dragging_new_handle:
-                        temp_path = QPainterPath(transform.map(QPointF(sub_path[-2].anchor)))
-                        temp_path.cubicTo(transform.map(QPointF(sub_path[-2].handle2)),
-                                          transform.map(QPointF(sub_path[-1].handle1)),
-                                          transform.map(QPointF(sub_path[-1].anchor)))
+                    if self.is_dragging_new_handle and len(sub_path) > 1:
+                        # 路径顺序上的前后两个节点 (从起点继续时新节点在 0 号位置)
+                        first, second = (sub_path[0], sub_path[1]) if at_start else (sub_path[-2], sub_path[-1])
+                        temp_path = QPainterPath(transform.map(QPointF(first.anchor)))
+                        temp_path.cubicTo(transform.map(QPointF(first.handle2)),
+                                          transform.map(QPointF(second.handle1)),
+                                          transform.map(QPointF(second.anchor)))
                         pen = QPen(QColor("magenta"), 1, Qt.PenStyle.DashLine)
                         painter.setPen(pen)
                         painter.drawPath(temp_path)
                     else:
-                        last_point = transform.map(QPointF(sub_path[-1].anchor))
+                        last_point = transform.map(QPointF(sub_path[0 if at_start else -1].anchor))
                         cursor_pos = self.canvas.last_mouse_pos
                         pen = QPen(QColor("blue"), 1, Qt.PenStyle.DashLine)
                         painter.setPen(pen)
@@ -447,22 +462,21 @@ class SelectTool(Tool):
                 painter.setBrush(QColor("white"))
                 painter.setPen(QPen(QColor("black"), 1))
                 for p in mapped_points:
-                    painter.drawRect(QRectF(p.x() - 4, p.y() - 4, 8.0, 8.0)) # 🟢 QRectF
+                    painter.drawRect(self._node_rect(p))
 
             elif isinstance(shape, BezierSurface):
                 cage_pen = QPen(QColor(100, 100, 100), 1, Qt.PenStyle.DashLine)
                 painter.setPen(cage_pen)
                 # 🟢 强制转换 QPointF，防止 drawPolyline 报错
                 for r in range(4):
-                    row_pts = [QPointF(transform.map(shape.points[r*4 + c])) for c in range(4)]
+                    row_pts = [QPointF(transform.map(shape.get_point(r*4 + c))) for c in range(4)]
                     painter.drawPolyline(QPolygonF(row_pts))
                 for c in range(4):
-                    col_pts = [QPointF(transform.map(shape.points[r*4 + c])) for r in range(4)]
+                    col_pts = [QPointF(transform.map(shape.get_point(r*4 + c))) for r in range(4)]
                     painter.drawPolyline(QPolygonF(col_pts))
                 
                 for i, node_pos in enumerate(shape.get_nodes()):
-                    transformed_node = transform.map(node_pos)
-                    node_rect = QRectF(transformed_node.x() - 4, transformed_node.y() - 4, 8, 8) # 🟢 QRectF
+                    node_rect = self._node_rect(transform.map(node_pos))
                     painter.setBrush(QColor("white"))
                     painter.setPen(QPen(QColor("black"), 1))
                     painter.drawRect(node_rect)
@@ -476,8 +490,7 @@ class SelectTool(Tool):
                 
                 for sub_path in shape.sub_paths:
                     for seg in sub_path:
-                        transformed_anchor = transform.map(seg.anchor)
-                        anchor_rect = QRectF(transformed_anchor.x() - 4, transformed_anchor.y() - 4, 8, 8) # 🟢 QRectF
+                        anchor_rect = self._node_rect(transform.map(seg.anchor))
                         painter.setBrush(QColor("white"))
                         painter.setPen(QPen(QColor("black"), 1))
                         painter.drawRect(anchor_rect)
@@ -487,13 +500,13 @@ class SelectTool(Tool):
                             transformed_h2 = transform.map(seg.handle2)
                             painter.setBrush(QColor("lightblue"))
                             painter.setPen(QPen(QColor("blue"), 1))
-                            painter.drawEllipse(transformed_h1, 4, 4)
-                            painter.drawEllipse(transformed_h2, 4, 4)
+                            radius = self._px(4)
+                            painter.drawEllipse(transformed_h1, radius, radius)
+                            painter.drawEllipse(transformed_h2, radius, radius)
             
             elif hasattr(shape, 'get_nodes'):
                 for i, node_pos in enumerate(shape.get_nodes()):
-                    transformed_node = transform.map(node_pos)
-                    node_rect = QRectF(transformed_node.x() - 4, transformed_node.y() - 4, 8, 8) # 🟢 QRectF
+                    node_rect = self._node_rect(transform.map(node_pos))
                     painter.setBrush(QColor("white"))
                     painter.setPen(QPen(QColor("black"), 1))
                     painter.drawRect(node_rect)
@@ -518,18 +531,20 @@ class SelectTool(Tool):
             pen = QPen(QColor(0, 150, 255), 2, Qt.PenStyle.DashLine)
             painter.setPen(pen)
             painter.setBrush(Qt.BrushStyle.NoBrush)
-            painter.drawRect(bbox_to_draw.adjusted(-5, -5, 5, 5))
+            frame = self._selection_frame(bbox_to_draw)
+            painter.drawRect(frame)
             
             # 🟢 [关键修复] QPointF
-            handle_start = QPointF(bbox_to_draw.center().x(), bbox_to_draw.top() - 5)
-            handle_end = QPointF(handle_start.x(), handle_start.y() - 20)
+            handle_start = QPointF(frame.center().x(), frame.top())
+            handle_end = self._rotate_handle_pos(bbox_to_draw)
             painter.setPen(QPen(QColor(0, 150, 255), 2))
             painter.drawLine(handle_start, handle_end)
             painter.setBrush(QColor("white"))
             painter.setPen(QColor("black"))
-            painter.drawEllipse(handle_end, 5, 5)
+            radius = self._px(self.PICK_RADIUS)
+            painter.drawEllipse(handle_end, radius, radius)
             
-            for corner_rect in self._get_corner_rects(bbox_to_draw.adjusted(-5, -5, 5, 5)).values():
+            for corner_rect in self._get_corner_rects(frame).values():
                 painter.drawRect(corner_rect) # QRectF
             
             painter.restore()
@@ -541,11 +556,11 @@ class SelectTool(Tool):
         shape = self.canvas.selected_shapes[0]
         transform, _ = self._get_transform_for_shape(shape)
         self.dragged_node_info = None
+        self.original_segment_states_for_drag = None
         
-        posF = QPointF(event.pos()) # 🟢
+        posF = event.position()
 
         if isinstance(shape, Path):
-            self.original_sub_paths_for_drag = [ [s.clone() for s in sp] for sp in shape.sub_paths ]
             modifiers = QApplication.keyboardModifiers()
             is_delete_action = (modifiers == (Qt.KeyboardModifier.ControlModifier | Qt.KeyboardModifier.AltModifier))
 
@@ -553,51 +568,63 @@ class SelectTool(Tool):
                 for sp_idx, sub_path in enumerate(shape.sub_paths):
                     for seg_idx, seg in enumerate(sub_path):
                         if seg.node_type == PathSegment.SMOOTH:
-                            if (posF - transform.map(seg.handle1)).manhattanLength() < 5: 
+                            if (posF - transform.map(seg.handle1)).manhattanLength() < self._px(self.PICK_RADIUS): 
                                 self.dragged_node_info = (shape, (sp_idx, seg_idx), "handle1")
                                 self.original_node_position = QPointF(seg.handle1) # 🟢
+                                self.original_segment_states_for_drag = {(sp_idx, seg_idx): seg.get_state()}
                                 return True
-                            if (posF - transform.map(seg.handle2)).manhattanLength() < 5: 
+                            if (posF - transform.map(seg.handle2)).manhattanLength() < self._px(self.PICK_RADIUS): 
                                 self.dragged_node_info = (shape, (sp_idx, seg_idx), "handle2")
                                 self.original_node_position = QPointF(seg.handle2) # 🟢
+                                self.original_segment_states_for_drag = {(sp_idx, seg_idx): seg.get_state()}
                                 return True
 
             for sp_idx, sub_path in enumerate(shape.sub_paths):
                 for seg_idx, seg in enumerate(sub_path):
-                    if (posF - transform.map(seg.anchor)).manhattanLength() < 5:
+                    if (posF - transform.map(seg.anchor)).manhattanLength() < self._px(self.PICK_RADIUS):
                         self.dragged_node_info = (shape, (sp_idx, seg_idx), "anchor")
                         self.original_node_position = (QPointF(seg.anchor), QPointF(seg.handle1), QPointF(seg.handle2)) # 🟢
+                        # 🟢 只记录会跟着移动的节点 (与该锚点重合的所有节点，例如闭合路径的首尾)
+                        self.original_segment_states_for_drag = {
+                            (i, j): other.get_state()
+                            for i, sp in enumerate(shape.sub_paths) for j, other in enumerate(sp)
+                            if (other.anchor - seg.anchor).manhattanLength() < 1
+                        }
                         return True
         else:
-            self.original_sub_paths_for_drag = None
             for i, node_pos in enumerate(shape.get_nodes()):
-                if (posF - transform.map(node_pos)).manhattanLength() < 5:
+                if (posF - transform.map(node_pos)).manhattanLength() < self._px(self.PICK_RADIUS):
                     self.dragged_node_info = (shape, i, 'node')
                     self.original_node_position = QPointF(node_pos) # 🟢
                     return True
         
-        self.original_sub_paths_for_drag = None
         return False
 
+    def _restore_dragged_segments(self, shape):
+        """把本次拖动涉及的节点恢复到按下鼠标时的状态，开销只与这些节点有关。"""
+        sub_paths = shape.detach()
+        for (sp_idx, seg_idx), state in self.original_segment_states_for_drag.items():
+            sub_paths[sp_idx][seg_idx].set_state(state)
+        shape.invalidate_geometry()
+
     def _handle_node_move_with_reset(self, event):
         shape, index, node_type_str = self.dragged_node_info
         
-        if isinstance(shape, Path) and self.original_sub_paths_for_drag:
-            shape.sub_paths = [ [s.clone() for s in sp] for sp in self.original_sub_paths_for_drag ]
+        if isinstance(shape, Path) and self.original_segment_states_for_drag:
+            self._restore_dragged_segments(shape)
 
-        snapped_pos = self.canvas.snap_point(event.pos())
+        snapped_pos = self.canvas.snap_point(event.position())
         _, inverted_transform = self._get_transform_for_shape(shape)
         local_mouse_pos = inverted_transform.map(QPointF(snapped_pos)) # 🟢
 
         if node_type_str == "anchor":
             original_anchor_pos = self.original_node_position[0]
             offset = local_mouse_pos - original_anchor_pos
-            for sub_path in shape.sub_paths:
-                for seg in sub_path:
-                    if (seg.anchor - original_anchor_pos).manhattanLength() < 1:
-                        seg.anchor += offset
-                        seg.handle1 += offset
-                        seg.handle2 += offset
+            for sp_idx, seg_idx in self.original_segment_states_for_drag:
+                seg = shape.sub_paths[sp_idx][seg_idx]
+                seg.anchor += offset
+                seg.handle1 += offset
+                seg.handle2 += offset
                         
         elif isinstance(shape, Path): # Handle
             sub_path_idx, seg_idx = index
@@ -615,18 +642,23 @@ class SelectTool(Tool):
         else: 
             shape.set_node_at(index, local_mouse_pos)
 
-        if shape.layer: shape.layer.is_dirty = True
+        # 🟢 上面直接改写了节点，需要手动通知 (会作废包围盒缓存并标记图层)
+        shape.invalidate_geometry()
         self.canvas.update()
 
     def _handle_node_release(self, event):
         if not (self.dragged_node_info and self.original_node_position):
-            self.original_sub_paths_for_drag = None
+            self.original_segment_states_for_drag = None
             return
 
         shape, index, node_type_str = self.dragged_node_info
-        is_click = (event.pos() - self.action_start_position).manhattanLength() < 3
+        is_click = (event.position() - self.action_start_position).manhattanLength() < self._px(self.CLICK_DISTANCE)
 
         if is_click:
+            # 点击期间可能有不足 3 像素的微小拖动，先恢复原状
+            if isinstance(shape, Path): self._restore_dragged_segments(shape)
+            elif node_type_str == 'node': shape.set_node_at(index, self.original_node_position)
+
             modifiers = QApplication.keyboardModifiers()
             is_delete_action = (modifiers == (Qt.KeyboardModifier.ControlModifier | Qt.KeyboardModifier.AltModifier))
             
@@ -636,98 +668,69 @@ class SelectTool(Tool):
                 
                 if is_delete_action:
                     if len(sub_path) > 2:
-                        old_paths = self.original_sub_paths_for_drag
-                        shape.remove_segment(sub_path_idx, seg_idx)
-                        new_paths = [ [s.clone() for s in sp] for sp in shape.sub_paths ]
-                        command = ModifyPathCommand(shape, old_paths, new_paths)
-                        self.canvas.execute_command(command)
+                        ops = ModifyPathCommand.segment_removal(shape, sub_path_idx, seg_idx)
+                        self.canvas.execute_command(ModifyPathCommand(shape, ops))
                 
                 elif modifiers == Qt.KeyboardModifier.AltModifier:
-                    old_paths = self.original_sub_paths_for_drag
-                    seg = sub_path[seg_idx]
+                    # 在副本上切换节点类型，只为得到新状态；路径本身交给命令修改
+                    seg = sub_path[seg_idx].clone()
+                    old_state = seg.get_state()
                     if seg.node_type == PathSegment.CORNER: seg.to_smooth()
                     else: seg.to_corner()
-                    new_paths = [ [s.clone() for s in sp] for sp in shape.sub_paths ]
-                    command = ModifyPathCommand(shape, old_paths, new_paths)
-                    self.canvas.execute_command(command)
+                    new_state = seg.get_state()
+                    if new_state != old_state:
+                        command = ModifyPathCommand(shape, [("set", sub_path_idx, seg_idx, old_state, new_state)])
+                        self.canvas.execute_command(command)
                 
                 elif not shape.is_closed:
                     is_start_node = (seg_idx == 0)
                     is_end_node = (seg_idx == len(sub_path) - 1)
                     if is_start_node or is_end_node:
-                        if is_start_node: sub_path.reverse()
-                        self.continuing_path_info = (shape, sub_path_idx)
+                        # 🟢 不再原地反转子路径 (那会改变所有节点的下标且不进入撤销栈)，改为记录从哪一端继续
+                        self.continuing_path_info = (shape, sub_path_idx, is_start_node and not is_end_node)
             
             self.canvas.update()
             
         else: # Is a drag
-            commands = []
-            _, inverted_transform = self._get_transform_for_shape(shape)
-
-            if isinstance(shape, Path) and node_type_str == "anchor":
-                original_anchor_pos, _, _ = self.original_node_position
-                final_mouse_pos = inverted_transform.map(QPointF(self.canvas.snap_point(event.pos())))
-                offset = final_mouse_pos - original_anchor_pos
-                if offset.manhattanLength() >= 1:
-                    flat_index_counter = 0
-                    for sp_idx, sub_path in enumerate(self.original_sub_paths_for_drag):
-                        for seg_idx, original_seg in enumerate(sub_path):
-                            if (original_seg.anchor - original_anchor_pos).manhattanLength() < 1:
-                                current_seg = shape.sub_paths[sp_idx][seg_idx]
-                                
-                                # 🟢 [关键修复] 强制使用 QPointF，否则 ModifyNodeCommand 报错
-                                orig_anchor = QPointF(original_seg.anchor)
-                                orig_h1 = QPointF(original_seg.handle1)
-                                orig_h2 = QPointF(original_seg.handle2)
-                                final_anchor = QPointF(current_seg.anchor)
-                                final_h1 = QPointF(current_seg.handle1)
-                                final_h2 = QPointF(current_seg.handle2)
-                                
-                                anchor_flat_idx, h1_flat_idx, h2_flat_idx = flat_index_counter, flat_index_counter + 1, flat_index_counter + 2
-                                shape.set_node_at(anchor_flat_idx, orig_anchor); shape.set_node_at(h1_flat_idx, orig_h1); shape.set_node_at(h2_flat_idx, orig_h2)
-                                cmd_anchor = ModifyNodeCommand(shape, anchor_flat_idx, orig_anchor, final_anchor)
-                                cmd_h1 = ModifyNodeCommand(shape, h1_flat_idx, orig_h1, final_h1)
-                                cmd_h2 = ModifyNodeCommand(shape, h2_flat_idx, orig_h2, final_h2)
-                                commands.append(CompositeCommand([cmd_anchor, cmd_h1, cmd_h2]))
-                            flat_index_counter += 3
-            elif isinstance(shape, Path): 
-                final_pos = None
-                sub_path_idx, seg_idx = index
-                if node_type_str == "handle1": final_pos = QPointF(shape.sub_paths[sub_path_idx][seg_idx].handle1)
-                elif node_type_str == "handle2": final_pos = QPointF(shape.sub_paths[sub_path_idx][seg_idx].handle2)
-                if final_pos and final_pos != self.original_node_position:
-                    flat_index = -1; count = 0; found = False
-                    for sp_idx, sub_path in enumerate(shape.sub_paths):
-                        for s_idx in range(len(sub_path)):
-                            if sp_idx == sub_path_idx and s_idx == seg_idx:
-                                if node_type_str == "handle1": flat_index = count + 1
-                                elif node_type_str == "handle2": flat_index = count + 2
-                                found = True; break
-                            count += 3
-                        if found: break
-                    if flat_index != -1:
-                        shape.set_node_at(flat_index, self.original_node_position)
-                        command = ModifyNodeCommand(shape, flat_index, self.original_node_position, final_pos)
-                        commands.append(command)
+            command = None
+
+            if isinstance(shape, Path):
+                if node_type_str == "anchor":
+                    _, inverted_transform = self._get_transform_for_shape(shape)
+                    original_anchor_pos, _, _ = self.original_node_position
+                    final_mouse_pos = inverted_transform.map(QPointF(self.canvas.snap_point(event.position())))
+                    if (final_mouse_pos - original_anchor_pos).manhattanLength() < self._px(1):
+                        self._restore_dragged_segments(shape)
+                ops = ModifyPathCommand.segment_changes(shape, self.original_segment_states_for_drag)
+                if ops:
+                    self._restore_dragged_segments(shape) # 撤回实时修改，交给命令执行
+                    command = ModifyPathCommand(shape, ops)
             else:
                 final_pos = QPointF(shape.get_nodes()[index])
                 if final_pos != self.original_node_position:
                     shape.set_node_at(index, self.original_node_position)
                     command = ModifyNodeCommand(shape, index, self.original_node_position, final_pos)
-                    commands.append(command)
 
-            if len(commands) > 1:
-                self.canvas.execute_command(CompositeCommand(commands))
-            elif len(commands) == 1:
-                self.canvas.execute_command(commands[0])
+            if command:
+                self.canvas.execute_command(command)
 
         self.dragged_node_info = None
         self.original_node_position = None
-        self.original_sub_paths_for_drag = None
+        self.original_segment_states_for_drag = None
         self.canvas.update()
 
+    def _px(self, pixels): return self.canvas.world_length(pixels)
+    def _selection_frame(self, bbox):
+        margin = self._px(self.SELECTION_MARGIN)
+        return bbox.adjusted(-margin, -margin, margin, margin)
+    def _rotate_handle_pos(self, bbox):
+        return QPointF(bbox.center().x(), bbox.top() - self._px(self.SELECTION_MARGIN + self.ROTATE_HANDLE))
+    def _node_rect(self, pos):
+        half = self._px(4)
+        return QRectF(pos.x() - half, pos.y() - half, 2 * half, 2 * half)
+
     def _get_corner_rects(self, main_rect):
-        size = 10.0
+        size = self._px(self.CORNER_SIZE)
         # 🟢 [关键修复] 返回 QRectF
         return { 
             'topLeft': QRectF(main_rect.left()-size/2, main_rect.top()-size/2, size, size), 
@@ -743,11 +746,11 @@ class SelectTool(Tool):
         
         if len(self.canvas.selected_shapes) > 1:
             total_bbox = self.canvas._get_selection_bbox() # QRectF
-            handle_end = QPointF(total_bbox.center().x(), total_bbox.top() - 25) # 🟢 QPointF
+            handle_end = self._rotate_handle_pos(total_bbox)
             
-            if (posF - handle_end).manhattanLength() < 10: return "rotate"
+            if (posF - handle_end).manhattanLength() < self._px(2 * self.PICK_RADIUS): return "rotate"
             
-            corners = self._get_corner_rects(total_bbox.adjusted(-5,-5,5,5))
+            corners = self._get_corner_rects(self._selection_frame(total_bbox))
             for name, rect in corners.items():
                 if rect.contains(posF): return name
             return None
@@ -755,11 +758,11 @@ class SelectTool(Tool):
         shape_to_check = self.canvas.selected_shapes[0]; bbox_untransformed = shape_to_check.get_bounding_box()
         _, inverted_transform = self._get_transform_for_shape(shape_to_check)
         local_pos = inverted_transform.map(posF)
-        handle_end = QPointF(bbox_untransformed.center().x(), bbox_untransformed.top() - 25) # 🟢 QPointF
+        handle_end = self._rotate_handle_pos(bbox_untransformed)
         
-        if (local_pos - handle_end).manhattanLength() < 10: return "rotate"
+        if (local_pos - handle_end).manhattanLength() < self._px(2 * self.PICK_RADIUS): return "rotate"
         
-        corners = self._get_corner_rects(bbox_untransformed.adjusted(-5,-5,5,5))
+        corners = self._get_corner_rects(self._selection_frame(bbox_untransformed))
         for name, rect in corners.items():
             if rect.contains(local_pos): return name
         return None
@@ -831,8 +834,8 @@ class SelectTool(Tool):
                 if not shape.is_closed:
                     for sp_idx, sub_path in enumerate(shape.sub_paths):
                         if not sub_path: continue
-                        if (posF - transform.map(sub_path[0].anchor)).manhattanLength() < 5 or \
-                           (posF - transform.map(sub_path[-1].anchor)).manhattanLength() < 5:
+                        if (posF - transform.map(sub_path[0].anchor)).manhattanLength() < self._px(self.PICK_RADIUS) or \
+                           (posF - transform.map(sub_path[-1].anchor)).manhattanLength() < self._px(self.PICK_RADIUS):
                             self.canvas.setCursor(QCursor(Qt.CursorShape.CrossCursor)); return
             if hasattr(shape, 'get_nodes'):
                 nodes_to_check = []
@@ -843,7 +846,7 @@ class SelectTool(Tool):
                             if seg.node_type == PathSegment.SMOOTH: nodes_to_check.append(seg.handle1); nodes_to_check.append(seg.handle2)
                 else: nodes_to_check = shape.get_nodes()
                 for node in nodes_to_check:
-                    if (posF - transform.map(node)).manhattanLength() < 5: cursor = QCursor(Qt.CursorShape.PointingHandCursor); break
+                    if (posF - transform.map(node)).manhattanLength() < self._px(self.PICK_RADIUS): cursor = QCursor(Qt.CursorShape.PointingHandCursor); break
 
         else:
             # 普通选择模式
@@ -904,7 +907,7 @@ class PenTool(Tool):
         if event.button() != Qt.MouseButton.LeftButton:
             return
             
-        snapped_pos = self.canvas.snap_point(event.pos())
+        snapped_pos = self.canvas.snap_point(event.position())
         self.drag_start_pos = snapped_pos
         self.is_dragging_handle = False
 
@@ -912,7 +915,7 @@ class PenTool(Tool):
             active_sub_path = next((sp for sp in reversed(self.current_path.sub_paths) if sp), None)
 
             # 🔴 --- 逻辑 1：闭合路径并准备新路径 ---
-            if active_sub_path and len(active_sub_path) > 1 and (snapped_pos - active_sub_path[0].anchor).manhattanLength() < 10:
+            if active_sub_path and len(active_sub_path) > 1 and (snapped_pos - active_sub_path[0].anchor).manhattanLength() < self.canvas.world_length(10):
                 active_sub_path.append(PathSegment(active_sub_path[0].anchor, node_type=PathSegment.CORNER))
                 # 不结束绘制，而是准备开始一个新的子路径
                 self.current_path.sub_paths.append([])
@@ -922,7 +925,7 @@ class PenTool(Tool):
             # 逻辑 2：创建新分支
             for sub_path in self.current_path.sub_paths:
                 for seg in sub_path:
-                    if (snapped_pos - seg.anchor).manhattanLength() < 10:
+                    if (snapped_pos - seg.anchor).manhattanLength() < self.canvas.world_length(10):
                         new_branch_start_segment = PathSegment(seg.anchor, node_type=PathSegment.CORNER)
                         self.current_path.sub_paths.append([new_branch_start_segment])
                         self.canvas.update()
@@ -941,12 +944,12 @@ class PenTool(Tool):
         self.canvas.update()
 
     def mouseMoveEvent(self, event):
-        snapped_pos = self.canvas.snap_point(event.pos())
+        snapped_pos = self.canvas.snap_point(event.position())
         if self.current_path and self.drag_start_pos and (event.buttons() & Qt.MouseButton.LeftButton):
             active_sub_path = next((sp for sp in reversed(self.current_path.sub_paths) if sp), None)
             if not active_sub_path: return
 
-            if not self.is_dragging_handle and (snapped_pos - self.drag_start_pos).manhattanLength() > 4:
+            if not self.is_dragging_handle and (snapped_pos - self.drag_start_pos).manhattanLength() > self.canvas.world_length(4):
                 self.is_dragging_handle = True
             
             if self.is_dragging_handle:
@@ -991,6 +994,7 @@ class PenTool(Tool):
         if self.current_path:
             # 过滤掉所有空的或只有一个点的子路径
             self.current_path.sub_paths = [sp for sp in self.current_path.sub_paths if len(sp) > 1]
+            self.current_path.invalidate_geometry()
             if self.current_path.sub_paths:
                 current_layer = self.canvas.get_current_layer()
                 if current_layer:
@@ -1006,16 +1010,17 @@ class PenTool(Tool):
             painter.drawPath(self.current_path.get_painter_path())
             
             painter.setPen(QPen(QColor("blue"), 1))
+            half = self.canvas.world_length(3) # 节点标记在屏幕上大小不变
             for sub_path in self.current_path.sub_paths:
                 for seg in sub_path:
                     painter.setBrush(QColor("white"))
-                    painter.drawRect(QRect(seg.anchor.x() - 3, seg.anchor.y() - 3, 6, 6))
+                    painter.drawRect(QRectF(seg.anchor.x() - half, seg.anchor.y() - half, 2 * half, 2 * half))
                     if seg.node_type == PathSegment.SMOOTH:
                         painter.setBrush(QColor("lightblue"))
                         painter.drawLine(seg.anchor, seg.handle1)
-                        painter.drawEllipse(seg.handle1, 3, 3)
+                        painter.drawEllipse(seg.handle1, half, half)
                         painter.drawLine(seg.anchor, seg.handle2)
-                        painter.drawEllipse(seg.handle2, 3, 3)
+                        painter.drawEllipse(seg.handle2, half, half)
 
 class BaseDrawingTool(Tool):
     def __init__(self, canvas):
@@ -1024,17 +1029,18 @@ class BaseDrawingTool(Tool):
         current_layer = self.canvas.get_current_layer()
         if event.button() == Qt.MouseButton.LeftButton and current_layer and not current_layer.is_locked:
             self.drawing = True
-            snapped_pos = self.canvas.snap_point(event.pos())
+            snapped_pos = self.canvas.snap_point(event.position())
             self.start_point, self.end_point = snapped_pos, snapped_pos
     def mouseMoveEvent(self, event):
-        if self.drawing: self.end_point = self.canvas.snap_point(event.pos()); self.canvas.update()
+        if self.drawing: self.end_point = self.canvas.snap_point(event.position()); self.canvas.update()
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton and self.drawing:
             self.drawing = False
             current_layer = self.canvas.get_current_layer()
             if current_layer:
-                final_rect = QRect(self.start_point, self.end_point).normalized()
-                if final_rect.width() < 2 and final_rect.height() < 2 and not isinstance(self, (LineTool, ArrowTool, CircleTool)): self.canvas.update(); return
+                final_rect = QRectF(self.start_point, self.end_point).normalized()
+                min_size = self.canvas.world_length(2)
+                if final_rect.width() < min_size and final_rect.height() < min_size and not isinstance(self, (LineTool, ArrowTool, CircleTool)): self.canvas.update(); return
                 new_shape = self.create_shape()
                 if new_shape:
                     command = AddShapeCommand(current_layer, new_shape)
@@ -1054,7 +1060,7 @@ class PointTool(Tool):
     def mousePressEvent(self, event):
         current_layer = self.canvas.get_current_layer()
         if event.button() == Qt.MouseButton.LeftButton and current_layer and not current_layer.is_locked:
-            snapped_pos = self.canvas.snap_point(event.pos())
+            snapped_pos = self.canvas.snap_point(event.position())
             new_shape = Point(snapped_pos, self.canvas.current_pen_color, self.canvas.current_width)
             command = AddShapeCommand(current_layer, new_shape); self.canvas.execute_command(command)
 
@@ -1085,32 +1091,33 @@ class ArrowTool(BaseDrawingTool):
         # 箭头工具的预览总是箭头
         CanvasRenderer.draw_arrow(painter, self.start_point, self.end_point, self.canvas.current_pen_color, self.canvas.current_width)
 class RectangleTool(BaseDrawingTool):
-    def create_shape(self): rect = QRect(self.start_point, self.end_point).normalized(); return Rectangle(rect.topLeft(), rect.bottomRight(), self.canvas.current_pen_color, self.canvas.current_width, self.canvas.current_fill_color, self.canvas.current_fill_style)
-    def draw_preview(self, painter): painter.drawRect(QRect(self.start_point, self.end_point).normalized())
+    def create_shape(self): rect = QRectF(self.start_point, self.end_point).normalized(); return Rectangle(rect.topLeft(), rect.bottomRight(), self.canvas.current_pen_color, self.canvas.current_width, self.canvas.current_fill_color, self.canvas.current_fill_style)
+    def draw_preview(self, painter): painter.drawRect(QRectF(self.start_point, self.end_point).normalized())
 
 class SquareTool(BaseDrawingTool):
-    def create_shape(self): rect = QRect(self.start_point, self.end_point).normalized(); side = max(rect.width(), rect.height()); return Square(rect.topLeft(), side, self.canvas.current_pen_color, self.canvas.current_width, self.canvas.current_fill_color, self.canvas.current_fill_style)
-    def draw_preview(self, painter): rect = QRect(self.start_point, self.end_point).normalized(); side = max(rect.width(), rect.height()); painter.drawRect(QRect(rect.left(), rect.top(), side, side))
+    def create_shape(self): rect = QRectF(self.start_point, self.end_point).normalized(); side = max(rect.width(), rect.height()); return Square(rect.topLeft(), side, self.canvas.current_pen_color, self.canvas.current_width, self.canvas.current_fill_color, self.canvas.current_fill_style)
+    def draw_preview(self, painter): rect = QRectF(self.start_point, self.end_point).normalized(); side = max(rect.width(), rect.height()); painter.drawRect(QRectF(rect.left(), rect.top(), side, side))
 
 class CircleTool(BaseDrawingTool):
     def create_shape(self): radius = math.sqrt((self.end_point.x() - self.start_point.x())**2 + (self.end_point.y() - self.start_point.y())**2); return Circle(self.start_point, radius, self.canvas.current_pen_color, self.canvas.current_width, self.canvas.current_fill_color, self.canvas.current_fill_style)
-    def draw_preview(self, painter): radius = math.sqrt((self.end_point.x() - self.start_point.x())**2 + (self.end_point.y() - self.start_point.y())**2); painter.drawEllipse(self.start_point, int(radius), int(radius))
+    def draw_preview(self, painter): radius = math.sqrt((self.end_point.x() - self.start_point.x())**2 + (self.end_point.y() - self.start_point.y())**2); painter.drawEllipse(self.start_point, radius, radius)
 
 class EllipseTool(BaseDrawingTool):
-    def create_shape(self): rect = QRect(self.start_point, self.end_point).normalized(); return Ellipse(rect.topLeft(), rect.bottomRight(), self.canvas.current_pen_color, self.canvas.current_width, self.canvas.current_fill_color, self.canvas.current_fill_style)
-    def draw_preview(self, painter): painter.drawEllipse(QRect(self.start_point, self.end_point).normalized())
+    def create_shape(self): rect = QRectF(self.start_point, self.end_point).normalized(); return Ellipse(rect.topLeft(), rect.bottomRight(), self.canvas.current_pen_color, self.canvas.current_width, self.canvas.current_fill_color, self.canvas.current_fill_style)
+    def draw_preview(self, painter): painter.drawEllipse(QRectF(self.start_point, self.end_point).normalized())
 
 class RoundedRectangleTool(BaseDrawingTool):
-    def create_shape(self): rect = QRect(self.start_point, self.end_point).normalized(); return RoundedRectangle(rect.topLeft(), rect.bottomRight(), self.canvas.current_pen_color, self.canvas.current_width, self.canvas.current_fill_color, self.canvas.current_fill_style)
-    def draw_preview(self, painter): painter.drawRoundedRect(QRect(self.start_point, self.end_point).normalized(), 20, 20)
+    def create_shape(self): rect = QRectF(self.start_point, self.end_point).normalized(); return RoundedRectangle(rect.topLeft(), rect.bottomRight(), self.canvas.current_pen_color, self.canvas.current_width, self.canvas.current_fill_color, self.canvas.current_fill_style)
+    def draw_preview(self, painter): painter.drawRoundedRect(QRectF(self.start_point, self.end_point).normalized(), 20, 20)
 
 class TextTool(BaseDrawingTool):
     def create_shape(self):
-        text_rect = QRect(self.start_point, self.end_point).normalized()
-        if text_rect.width() > 10 and text_rect.height() > 10:
+        text_rect = QRectF(self.start_point, self.end_point).normalized()
+        min_size = self.canvas.world_length(10)
+        if text_rect.width() > min_size and text_rect.height() > min_size:
             font = QFont(self.canvas.current_font)
             new_shape = Text(
-                text_rect, 
+                text_rect.toRect(), 
                 "", 
                 font, 
                 self.canvas.current_pen_color, 
@@ -1121,7 +1128,7 @@ class TextTool(BaseDrawingTool):
             self.canvas.start_text_editing_on_creation(new_shape)
             return None
         return None
-    def draw_preview(self, painter): painter.setBrush(Qt.BrushStyle.NoBrush); painter.drawRect(QRect(self.start_point, self.end_point).normalized())
+    def draw_preview(self, painter): painter.setBrush(Qt.BrushStyle.NoBrush); painter.drawRect(QRectF(self.start_point, self.end_point).normalized())
 
 class BaseMultiStepTool(Tool):
     def __init__(self, canvas):
@@ -1131,11 +1138,11 @@ class BaseMultiStepTool(Tool):
     def mousePressEvent(self, event):
         current_layer = self.canvas.get_current_layer()
         if event.button() == Qt.MouseButton.LeftButton and current_layer and not current_layer.is_locked:
-            snapped_pos = self.canvas.snap_point(event.pos())
+            snapped_pos = self.canvas.snap_point(event.position())
             self.points.append(snapped_pos); self.cursor_pos = snapped_pos
             self.handle_step(); self.canvas.update()
     def mouseMoveEvent(self, event):
-        self.cursor_pos = self.canvas.snap_point(event.pos()); self.canvas.update()
+        self.cursor_pos = self.canvas.snap_point(event.position()); self.canvas.update()
     def handle_step(self): pass
 
 class PolylineTool(BaseMultiStepTool):
@@ -1154,7 +1161,7 @@ class PolylineTool(BaseMultiStepTool):
         if not self.points: return
         pen = QPen(self.canvas.current_pen_color, self.canvas.current_width, Qt.PenStyle.DashLine); painter.setPen(pen)
         points_to_draw = self.points + ([self.cursor_pos] if self.cursor_pos else [])
-        painter.drawPolyline(QPolygon(points_to_draw))
+        painter.drawPolyline(QPolygonF(points_to_draw))
 
 class BSplineTool(BaseMultiStepTool):
     def mouseDoubleClickEvent(self, event):
@@ -1236,88 +1243,222 @@ class PolygonTool(BaseMultiStepTool):
         pen = QPen(self.canvas.current_pen_color, self.canvas.current_width, Qt.PenStyle.DashLine)
         painter.setPen(pen); painter.setBrush(Qt.BrushStyle.NoBrush)
         points_to_draw = self.points + ([self.cursor_pos] if self.cursor_pos else [])
-        painter.drawPolyline(QPolygon(points_to_draw))
+        painter.drawPolyline(QPolygonF(points_to_draw))
         if len(self.points) >= 2 and self.cursor_pos: painter.drawLine(self.cursor_pos, self.points[0])
 
 class FreehandTool(Tool):
+    """
+    手绘预览画在一张与画面等大的透明叠加图上，每拍只追加新采样点之间的线段，笔划再长每帧的开销也不变。
+    松开后图形追加到图层最上层，渲染器把它直接叠画进已有瓦片 (见 Layer.pending_stamps)。
+    canvas.freehand_mode 决定保存什么 (见 curve_fitting.FREEHAND_MODES)：全部采样点、边画边简化的折线，
+    或边画边拟合的贝塞尔路径；容差 canvas.freehand_tolerance 按屏幕像素给出。预览总是画原始采样点。
+    """
     def __init__(self, canvas):
         super().__init__(canvas)
         self.drawing = False
         self.points = []
+        self.overlay = None      # 预览叠加图 (物理像素，控件坐标)
+        self._overlay_key = None # 叠加图对应的画面尺寸、视口和画笔；任何一项变化都要整条重画
+        self._drawn_count = 0    # 已画进叠加图的点数
+        self.reducer = None      # StreamingSimplifier / StreamingBezierFitter，保留全部点时为 None
     def mousePressEvent(self, event):
         current_layer = self.canvas.get_current_layer()
         if event.button() == Qt.MouseButton.LeftButton and current_layer and not current_layer.is_locked:
             self.drawing = True
             self.points.clear()
-            self.points.append(self.canvas.snap_point(event.pos()))
+            self.points.append(self.canvas.snap_point(event.position()))
+            self.overlay = None
+            self.reducer = self._create_reducer()
+            if self.reducer is not None: self.reducer.add(self.points[0])
+    def _create_reducer(self):
+        # 容差按屏幕像素给出：放大时画得更细，保留的细节也更多
+        tolerance = self.canvas.freehand_tolerance / self.canvas.view_scale
+        mode = self.canvas.freehand_mode
+        if mode == "simplify": return StreamingSimplifier(tolerance)
+        if mode == "bezier": return StreamingBezierFitter(tolerance)
+        return None
     def mouseMoveEvent(self, event):
+        self.mouseMoveEvents([event])
+    def mouseMoveEvents(self, events):
+        # 手绘需要完整的点流，一拍内的每个采样点都保留，只重绘一次
         if self.drawing:
-            self.points.append(self.canvas.snap_point(event.pos()))
+            start = len(self.points)
+            self.points.extend(self.canvas.snap_point(event.position()) for event in events)
+            if self.reducer is not None: self.reducer.extend(self.points[start:])
+            self._extend_overlay()
             self.canvas.update()
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton and self.drawing:
             self.drawing = False
             current_layer = self.canvas.get_current_layer()
             if current_layer and len(self.points) >= 2:
-                shape = Polyline(self.points.copy(), self.canvas.current_pen_color, self.canvas.current_width)
-                command = AddShapeCommand(current_layer, shape)
+                command = AddShapeCommand(current_layer, self._build_shape())
                 self.canvas.execute_command(command)
             self.points.clear()
+            self.overlay = None; self.reducer = None
+    def _build_shape(self):
+        color, width = self.canvas.current_pen_color, self.canvas.current_width
+        if isinstance(self.reducer, StreamingBezierFitter):
+            segments = beziers_to_segments(self.reducer.result())
+            if len(segments) >= 2: return Path([segments], color, width)
+        elif isinstance(self.reducer, StreamingSimplifier) and len(self.reducer) >= 2:
+            return Polyline(self.reducer.result(), color, width)
+        return Polyline(self.points.copy(), color, width)
+    def deactivate(self):
+        self.drawing = False; self.points.clear(); self.overlay = None; self.reducer = None
+        super().deactivate()
+    def _extend_overlay(self):
+        canvas = self.canvas
+        ratio = canvas.devicePixelRatioF()
+        key = (canvas.width(), canvas.height(), ratio, canvas.view_scale, canvas.view_offset.x(), canvas.view_offset.y(),
+               canvas.current_pen_color.rgba(), canvas.current_width)
+        if self.overlay is None or key != self._overlay_key:
+            # 第一次或视口变了 (笔划中途缩放 / 平移)：新建叠加图，整条重画一次
+            self.overlay = QImage(canvas.size() * ratio, QImage.Format.Format_ARGB32_Premultiplied)
+            self.overlay.setDevicePixelRatio(ratio)
+            self.overlay.fill(Qt.GlobalColor.transparent)
+            self._overlay_key, self._drawn_count = key, 0
+        if len(self.points) < 2 or self._drawn_count == len(self.points): return
+        painter = QPainter(self.overlay)
+        painter.setRenderHint(QPainter.RenderHint.Antialiasing, True)
+        painter.setTransform(canvas.view_transform())
+        # 圆头圆角：相邻两批线段在接点处重叠，看不出拼接
+        painter.setPen(QPen(canvas.current_pen_color, canvas.current_width, Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin))
+        start = max(0, self._drawn_count - 1) # 从上一批的最后一个点接着画
+        painter.drawPolyline(QPolygonF([QPointF(p) for p in self.points[start:]]))
+        painter.end()
+        self._drawn_count = len(self.points)
     def paint(self, painter):
         if self.drawing and len(self.points) >= 2:
-            pen = QPen(self.canvas.current_pen_color, self.canvas.current_width, Qt.PenStyle.SolidLine)
-            painter.setPen(pen)
-            painter.drawPolyline(QPolygon(self.points))
+            self._extend_overlay()
+            painter.save()
+            painter.resetTransform() # 叠加图按控件坐标保存
+            painter.drawImage(QRectF(self.canvas.rect()), self.overlay)
+            painter.restore()
 
 class EraserTool(Tool):
+    """橡皮擦：相邻两次采样扫过的胶囊先查空间索引，再用 hit_testing 精确判断；松开时一次性删除或切开。"""
+    # 笔划期间碰到的图形在图层里暂时隐藏 (只重画它覆盖的瓦片一次)，被切开的图形由 paint 画出剩下的部分
     def __init__(self, canvas):
         super().__init__(canvas); self.erasing = False; self.cursor_pos = None
+        self.last_pos = None # 上一个采样点，下一拍的胶囊从这里开始
+        self.pending = {}    # 图层 -> {id(图形): 图形}，按碰到的先后顺序
+        self._outlines = {}  # id(图形) -> (几何版本, 轮廓)，一次笔划内复用
+        self.cuts = {}       # 图层 -> {id(图形): clipping.CutState}，局部擦除时正在被切的图形
+    @property
+    def radius(self): return self.canvas.current_width * 5
     def mousePressEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton:
-            self.erasing = True; self.cursor_pos = event.pos()
-            self._erase_at(self.cursor_pos); self.canvas.update()
+            self.erasing = True; self.cursor_pos = event.position(); self.last_pos = None
+            self._erase_along(self.cursor_pos); self.canvas.update()
     def mouseMoveEvent(self, event):
-        self.cursor_pos = event.pos()
-        if self.erasing: self._erase_at(self.cursor_pos)
+        self.mouseMoveEvents([event])
+    def mouseMoveEvents(self, events):
+        self.cursor_pos = events[-1].position()
+        if self.erasing: self._erase_along(*(event.position() for event in events))
         self.canvas.update()
     def mouseReleaseEvent(self, event):
         if event.button() == Qt.MouseButton.LeftButton and self.erasing:
-            self.erasing = False; self.cursor_pos = None; self.canvas.update()
+            self.erasing = False; self.cursor_pos = None
+            self._commit()
+    def deactivate(self):
+        if self.erasing:
+            self.erasing = False; self.cursor_pos = None
+            self._commit()
+        super().deactivate()
     def paint(self, painter):
+        cut_states = [state for states in self.cuts.values() for state in states.values() if state.changed]
+        if cut_states:
+            # 被切开的图形已在图层中隐藏，按原来的笔和填充画出剩下的部分
+            painter.save()
+            for state in cut_states:
+                shape = state.shape
+                painter.setPen(QPen(shape.color, shape.width, Qt.PenStyle.SolidLine, Qt.PenCapStyle.RoundCap, Qt.PenJoinStyle.RoundJoin))
+                painter.setBrush(QBrush(shape.fill_color, shape.fill_style) if state.filled else Qt.BrushStyle.NoBrush)
+                painter.drawPath(state.preview_path())
+            painter.restore()
         if self.cursor_pos:
             painter.setPen(QPen(Qt.GlobalColor.black, 1, Qt.PenStyle.DashLine)); painter.setBrush(Qt.BrushStyle.NoBrush)
-            eraser_size = self.canvas.current_width * 5
-            painter.drawEllipse(self.cursor_pos, eraser_size, eraser_size)
-    def _erase_at(self, pos):
-        eraser_size = self.canvas.current_width * 5
-        eraser_rect = QRect(pos.x() - eraser_size, pos.y() - eraser_size, eraser_size * 2, eraser_size * 2)
-        shapes_to_delete_map = {}
+            painter.drawEllipse(QPointF(self.cursor_pos), self.radius, self.radius)
+    def _outline(self, shape):
+        """(轮廓, 范围)，按几何版本缓存。"""
+        entry = self._outlines.get(id(shape))
+        if entry is None or entry[0] != shape.geometry_version:
+            contours = hit_testing.shape_outline(shape)
+            entry = self._outlines[id(shape)] = (shape.geometry_version, contours, hit_testing.outline_bounds(contours))
+        return entry[1], entry[2]
+    def _erase_along(self, *positions):
+        """一拍内的所有采样点连成若干个胶囊，第一个胶囊从上一拍的最后一个点开始。"""
+        points = ([self.last_pos] if self.last_pos is not None else []) + [QPointF(p) for p in positions]
+        self.last_pos = points[-1]
+        radius = self.radius
+        capsules = [(a.x(), a.y(), b.x(), b.y()) for a, b in (list(zip(points, points[1:])) or [(points[0], points[0])])]
+        # 每个胶囊外扩半径后的范围；整拍只按它们的并集查询一次空间索引
+        boxes = [(min(ax, bx) - radius, min(ay, by) - radius, max(ax, bx) + radius, max(ay, by) + radius) for ax, ay, bx, by in capsules]
+        area = QRectF(QPointF(min(b[0] for b in boxes), min(b[1] for b in boxes)), QPointF(max(b[2] for b in boxes), max(b[3] for b in boxes)))
+        partial = self.canvas.partial_erase
         for layer in self.canvas.layers:
             if layer.is_locked or not layer.is_visible: continue
-            shapes_in_layer_to_delete = [s for s in layer.shapes if eraser_rect.intersects(s.get_bounding_box())]
-            if shapes_in_layer_to_delete: shapes_to_delete_map[layer] = shapes_in_layer_to_delete
-        if shapes_to_delete_map:
-            for layer, shapes in shapes_to_delete_map.items():
-                command = RemoveShapesCommand(layer, shapes); self.canvas.execute_command(command)
+            found, cuts = self.pending.get(layer, {}), self.cuts.get(layer, {})
+            for shape in layer.index.query(area): # 擦除与 z-order 无关，不必排序
+                if id(shape) in found: continue
+                contours, bounds = self._outline(shape)
+                if bounds is None: continue
+                left, top, right, bottom = bounds
+                near = [capsule for capsule, (x0, y0, x1, y1) in zip(capsules, boxes)
+                        if not (x0 > right or x1 < left or y0 > bottom or y1 < top)]
+                if not near: continue
+                state = cuts.get(id(shape))
+                if state is not None:
+                    # 已经在切的图形：只把这一拍的胶囊再切一次
+                    state.apply(near, radius)
+                    if state.changed: layer.set_hidden(shape, True)
+                    continue
+                for ax, ay, bx, by in near:
+                    if hit_testing.capsule_hits(contours, ax, ay, bx, by, radius):
+                        if partial and clipping.is_splittable(shape):
+                            state = cuts[id(shape)] = clipping.CutState(shape); state.apply(near, radius)
+                            if state.changed: layer.set_hidden(shape, True)
+                        else:
+                            found[id(shape)] = shape; layer.set_hidden(shape, True)
+                        break
+            if found: self.pending[layer] = found
+            if cuts: self.cuts[layer] = cuts
+    def _commit(self):
+        commands = []
+        for layer in list(self.pending) + [layer for layer in self.cuts if layer not in self.pending]:
+            removed = [s for s in self.pending.get(layer, {}).values() if s in layer.shapes]
+            cut = [state for state in self.cuts.get(layer, {}).values() if state.changed and state.shape in layer.shapes]
+            if cut:
+                # 整个删除的图形换成空列表，被切开的图形换成剩下的几段，都留在原来的 z-order 位置
+                commands.append(ReplaceShapesCommand(layer, [(s, []) for s in removed] + [(state.shape, state.result()) for state in cut]))
+            elif removed:
+                commands.append(RemoveShapesCommand(layer, removed))
+        for layer in set(self.pending) | set(self.cuts): layer.show_all()
+        self.pending = {}; self.cuts = {}; self._outlines = {}; self.last_pos = None
+        if commands:
+            self.canvas.execute_command(commands[0] if len(commands) == 1 else CompositeCommand(commands))
+        else:
+            self.canvas.update()
 
 class PaintBucketTool(Tool):
     def mousePressEvent(self, event):
         if event.button() != Qt.MouseButton.LeftButton: return
-        shape_clicked, layer_of_shape = self.canvas._get_shape_at(event.pos())
+        shape_clicked, layer_of_shape = self.canvas._get_shape_at(event.position())
         if (shape_clicked and layer_of_shape and not layer_of_shape.is_locked and hasattr(shape_clicked, 'fill_color')):
             properties_to_change = { 'fill_style': self.canvas.current_fill_style, 'fill_color': self.canvas.current_fill_color }
             command = ChangePropertiesCommand([shape_clicked], properties_to_change); self.canvas.execute_command(command)
 
 class SurfaceTool(BaseDrawingTool):
     def create_shape(self):
-        rect = QRect(self.start_point, self.end_point).normalized()
+        rect = QRectF(self.start_point, self.end_point).normalized()
         # 限制最小尺寸
         if rect.width() < 20 or rect.height() < 20: return None
         return BezierSurface(rect, self.canvas.current_pen_color, self.canvas.current_width)
         
     def draw_preview(self, painter):
         # 🟢 预览时也画真实的 4x4 网格，实现“所见即所得”
-        rect = QRect(self.start_point, self.end_point).normalized()
+        rect = QRectF(self.start_point, self.end_point).normalized()
         
         # 临时生成一个 BezierSurface 对象用来计算网格点
         # 这里只做轻量级计算，不需要创建真正的 Shape 对象
@@ -1328,7 +1469,7 @@ class SurfaceTool(BaseDrawingTool):
         temp_points = []
         for r in range(rows):
             for c in range(cols):
-                temp_points.append(QPoint(int(rect.x() + c * x_step), int(rect.y() + r * y_step)))
+                temp_points.append(QPointF(rect.x() + c * x_step, rect.y() + r * y_step))
         
        # 🟢 修改：将 steps 提高到 12，与 renderer.py 保持一致，实现所见即所得
         # 现在的渲染引擎足够快，不需要降级处理
@@ -0,0 +1,142 @@
+import time
+from collections import deque
+
+from commands import CompositeCommand
+
+DEFAULT_MEMORY_BUDGET_MB = 256
+MERGE_WINDOW_SECONDS = 1.0   # 两次可合并的操作间隔超过它，就各自成为独立的撤销步骤
+
+class UndoHistory:
+    """有内存上限的撤销/重做历史：超出预算时从最旧的一端淘汰命令，最近一条始终保留。"""
+    # push(merge=True) 把连续的同类操作折叠进上一条；begin/commit_transaction 之间的命令合并为一步
+    def __init__(self, memory_budget_mb=DEFAULT_MEMORY_BUDGET_MB):
+        self.undo_stack = deque()   # 元素为 (command, size)，右端是最新的
+        self.redo_stack = []        # 元素为 (command, size)，末尾是下一个要重做的
+        self.total_bytes = 0
+        self.evicted_count = 0
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        # 🟢 保存点用 "从会话开始已执行的命令数" 表示，淘汰旧命令不会影响它
+        self._saved_position = 0
+        self._last_push_time = 0.0
+        self._transaction_depth = 0
+        self._transaction_commands = []
+
+    # --- 栈操作 ---
+    def push(self, command, merge=False):
+        """记录一条已经执行过的命令；merge=True 时尝试折叠进时间窗口内的上一条兼容命令。"""
+        if self._transaction_depth:
+            pending = self._transaction_commands
+            if not (pending and pending[-1].merge_with(command)):
+                pending.append(command)
+            return
+
+        now = time.monotonic()
+        if merge and self._try_merge(command, now):
+            self._last_push_time = now
+            return
+        self._last_push_time = now
+
+        if self.redo_stack:
+            # 保存点落在被丢弃的重做分支上时，已不可能再回到它
+            if self._saved_position > self.position:
+                self._saved_position = -1
+            self.total_bytes -= sum(size for _, size in self.redo_stack)
+            self.redo_stack.clear()
+
+        size = self._estimate(command)
+        self.undo_stack.append((command, size))
+        self.total_bytes += size
+        self._enforce_budget()
+
+    def _try_merge(self, command, now):
+        if not self.undo_stack or self.redo_stack: return False
+        if now - self._last_push_time > MERGE_WINDOW_SECONDS: return False
+        # 上一步恰好是保存点时不能合并，否则合并后的状态会被误认为 "已保存"
+        if self.position == self._saved_position: return False
+        last_command, last_size = self.undo_stack[-1]
+        if not last_command.merge_with(command): return False
+        size = self._estimate(last_command)
+        self.undo_stack[-1] = (last_command, size)
+        self.total_bytes += size - last_size
+        self._enforce_budget()
+        return True
+
+    # --- 事务 ---
+    @property
+    def in_transaction(self):
+        return self._transaction_depth > 0
+
+    def begin_transaction(self):
+        """开始一个事务；可以嵌套，最外层提交时才真正入栈。"""
+        self._transaction_depth += 1
+
+    def commit_transaction(self):
+        """结束事务。最外层提交且事务中确实有命令时返回 True。"""
+        if not self._transaction_depth: return False
+        self._transaction_depth -= 1
+        if self._transaction_depth: return False
+        commands, self._transaction_commands = self._transaction_commands, []
+        if not commands: return False
+        self.push(commands[0] if len(commands) == 1 else CompositeCommand(commands))
+        return True
+
+    def undo(self):
+        """撤销最近一条命令并返回它；没有可撤销的命令时返回 None。"""
+        if self._transaction_depth or not self.undo_stack: return None
+        entry = self.undo_stack.pop()
+        entry[0].undo()
+        self.redo_stack.append(entry)
+        return entry[0]
+
+    def redo(self):
+        if self._transaction_depth or not self.redo_stack: return None
+        entry = self.redo_stack.pop()
+        entry[0].redo()
+        self.undo_stack.append(entry)
+        return entry[0]
+
+    def clear(self):
+        self.undo_stack.clear(); self.redo_stack.clear()
+        self._transaction_depth = 0; self._transaction_commands = []
+        self.total_bytes = 0
+        self.evicted_count = 0
+        self._saved_position = 0
+
+    def can_undo(self): return bool(self.undo_stack)
+    def can_redo(self): return bool(self.redo_stack)
+
+    # --- 保存状态 ---
+    @property
+    def position(self):
+        return self.evicted_count + len(self.undo_stack)
+
+    def mark_saved(self):
+        self._saved_position = self.position
+
+    @property
+    def is_dirty(self):
+        return self.position != self._saved_position
+
+    # --- 内存预算 ---
+    def set_memory_budget(self, memory_budget_mb):
+        self.memory_budget = int(memory_budget_mb * 1024 * 1024)
+        self._enforce_budget()
+
+    def _enforce_budget(self):
+        # 重做分支比最旧的撤销记录更不可能被用到，先丢它 (从最远的一端开始)
+        while self.total_bytes > self.memory_budget and self.redo_stack:
+            _, size = self.redo_stack.pop(0)
+            self.total_bytes -= size
+            if self._saved_position > self.position + len(self.redo_stack):
+                self._saved_position = -1
+        while self.total_bytes > self.memory_budget and len(self.undo_stack) > 1:
+            _, size = self.undo_stack.popleft()
+            self.total_bytes -= size
+            self.evicted_count += 1
+
+    @staticmethod
+    def _estimate(command):
+        try:
+            return max(0, int(command.estimate_size()))
+        except (AttributeError, NotImplementedError):
+            return 0
@@ -0,0 +1,14 @@
+import os
+import sys
+
+# 与 batch_render 相同：导入 Qt 之前指定 offscreen 平台
+os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "py"))
+
+import pytest
+from PyQt6.QtWidgets import QApplication
+
+
+@pytest.fixture(scope="session", autouse=True)
+def qapp():
+    return QApplication.instance() or QApplication([sys.argv[0]])
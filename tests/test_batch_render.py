@@ -0,0 +1,78 @@
+import argparse
+import os
+
+import pytest
+from PyQt6.QtCore import Qt, QPointF, QSize
+from PyQt6.QtGui import QColor, QImage
+
+import batch_render
+from batch_render import render_layers, render_batch, _parse_size
+from file_handler import ProjectHandler
+from renderer import CanvasRenderer
+from shapes import Layer, Rectangle
+
+
+def half_pixel_square():
+    """边缘落在半像素上的黑色方块：超采样后降采样，边缘像素是灰色。"""
+    layer = Layer("L")
+    layer.shapes.append(Rectangle(QPointF(10.5, 10.5), QPointF(30.5, 30.5), QColor(0, 0, 0, 0), 1,
+                                  QColor("black"), Qt.BrushStyle.SolidPattern))
+    return [layer]
+
+
+@pytest.mark.parametrize("ssaa, factor, ratio", [(True, 3, 1.5), (False, 3, 2.0), (True, 2, 1.0)])
+def test_output_size_ignores_ssaa_factor(ssaa, factor, ratio):
+    image = render_layers(half_pixel_square(), 64, 48, ssaa, pixel_ratio=ratio, ssaa_factor=factor)
+    assert image.size() == QSize(int(64 * ratio), int(48 * ratio)) and image.devicePixelRatio() == ratio
+
+
+def test_ssaa_buffer_is_downsampled():
+    image = render_layers(half_pixel_square(), 64, 48, True, ssaa_factor=4)
+    assert image.pixelColor(20, 20) == QColor("black") and image.pixelColor(5, 5) == QColor("white")
+    edge = image.pixelColor(10, 20).red()
+    assert 64 < edge < 192 # 一半被覆盖
+    plain = render_layers(half_pixel_square(), 64, 48, False)
+    assert plain.pixelColor(10, 20) != image.pixelColor(10, 20)
+
+
+def test_ssaa_factor_stays_on_the_canvas():
+    default = CanvasRenderer.SSAA_BASE_FACTOR
+    canvas = batch_render.HeadlessCanvas([], 10, 10, ssaa_factor=5)
+    assert CanvasRenderer.render_layers_to_image(canvas).size() == QSize(50, 50)
+    assert CanvasRenderer.SSAA_BASE_FACTOR == default
+    assert CanvasRenderer.render_layers_to_image(batch_render.HeadlessCanvas([], 10, 10)).size() == QSize(10 * default, 10 * default)
+
+
+@pytest.mark.parametrize("text", ["1280", "axb", "12x", "0x10", "10x-3", "1.5x2"])
+def test_parse_size_rejects_bad_input(text):
+    with pytest.raises(argparse.ArgumentTypeError):
+        _parse_size(text)
+
+
+def test_parse_size_accepts_either_case():
+    assert _parse_size("1280x720") == (1280, 720) and _parse_size("64X48") == (64, 48)
+
+
+def test_render_batch_in_process(tmp_path):
+    project = str(tmp_path / "square.json")
+    ProjectHandler.save(half_pixel_square(), project)
+    jobs = [(project, str(tmp_path / "a.png"), 64, 48, True, 3, "PyQt原生", 1.0, None),
+            (project, str(tmp_path / "b.png"), 32, 24, False, 1, "Bresenham", 2.0, "#ff0000"),
+            (str(tmp_path / "missing.json"), str(tmp_path / "c.png"), 32, 24, True, 2, "DDA", 1.0, None)]
+    results = list(render_batch(jobs, processes=1))
+    assert [r[:2] for r in results] == [job[:2] for job in jobs]
+    assert results[0][2] is None and results[1][2] is None
+    assert results[2][2].startswith("FileNotFoundError")
+    assert QImage(str(tmp_path / "a.png")).size() == QSize(64, 48)
+    b = QImage(str(tmp_path / "b.png"))
+    assert b.size() == QSize(64, 48) and b.pixelColor(1, 1) == QColor("#ff0000")
+    assert not os.path.exists(tmp_path / "c.png")
+
+
+def test_main_does_not_change_process_state(tmp_path):
+    project = str(tmp_path / "square.json")
+    ProjectHandler.save(half_pixel_square(), project)
+    default = CanvasRenderer.SSAA_BASE_FACTOR
+    assert batch_render.main([project, "-o", str(tmp_path / "out"), "--size", "40x30", "--ssaa-factor", "4", "-j", "1"]) == 0
+    assert QImage(str(tmp_path / "out" / "square.png")).size() == QSize(40, 30)
+    assert CanvasRenderer.SSAA_BASE_FACTOR == default and "SHAPEPAINTER_SSAA_FACTOR" not in os.environ
@@ -0,0 +1,51 @@
+import pytest
+from PyQt6.QtCore import QPointF, QRectF
+
+from commands import ChangePropertiesCommand
+from geometry import scaling_about
+from shapes import Circle, Polygon, ShapeGroup
+
+
+def triangle():
+    return Polygon([QPointF(0, 0), QPointF(100, 0), QPointF(100, 50)])
+
+
+def test_cached_bounds_are_returned_as_copies():
+    circle = Circle(QPointF(10, 10), 5)
+    box = circle.get_bounding_box()
+    cached = circle._bbox
+    box.translate(100, 100)
+    circle.get_transformed_bounding_box().translate(100, 100)
+    assert circle.get_bounding_box() == QRectF(5, 5, 10, 10) and circle._bbox is cached
+    assert circle.get_transformed_bounding_box() == QRectF(5, 5, 10, 10)
+
+
+@pytest.mark.parametrize("mutate, expected", [
+    (lambda s: s.move(10, 0), QRectF(10, 0, 100, 50)),
+    (lambda s: s.apply_affine(scaling_about(2, 0, 0)), QRectF(0, 0, 200, 100)),
+    (lambda s: s.set_node_at(1, QPointF(300, 0)), QRectF(0, 0, 300, 50)),
+    (lambda s: ChangePropertiesCommand([s], {'points': [QPointF(0, 0), QPointF(20, 20), QPointF(0, 20)]}).redo(),
+     QRectF(0, 0, 20, 20)),
+])
+def test_geometry_changes_refresh_cached_bounds(mutate, expected):
+    shape = triangle()
+    shape.get_bounding_box(); shape.get_transformed_bounding_box()
+    mutate(shape)
+    assert shape.get_bounding_box() == expected and shape.get_transformed_bounding_box() == expected
+
+
+def test_rotation_keeps_local_bounds():
+    shape = triangle()
+    local = shape.get_bounding_box()
+    cached = shape._bbox
+    shape.angle = 90
+    assert shape._bbox is cached and shape.get_bounding_box() == local
+    assert shape.get_transformed_bounding_box() == QRectF(25, -25, 50, 100)
+
+
+def test_member_move_refreshes_group_bounds():
+    a, b = Circle(QPointF(0, 0), 5), Circle(QPointF(100, 0), 5)
+    group = ShapeGroup([a, b])
+    assert group.get_bounding_box() == QRectF(-5, -5, 110, 10)
+    a.move(0, 50)
+    assert group.get_bounding_box() == QRectF(-5, -5, 110, 60)
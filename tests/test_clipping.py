@@ -0,0 +1,96 @@
+import pytest
+from PyQt6.QtCore import Qt, QPointF
+from PyQt6.QtGui import QColor
+
+from clipping import CutState
+from commands import ReplaceShapesCommand
+from shapes import Layer, Circle, Polyline, Polygon, Path, PathSegment
+
+
+def cut(shape, capsules, radius):
+    state = CutState(shape)
+    state.apply(capsules, radius)
+    return state.result()
+
+
+def xy(shape):
+    return [(round(p.x(), 6), round(p.y(), 6)) for p in shape.points]
+
+
+def test_polyline_is_split_at_the_capsule():
+    line = Polyline([QPointF(0, 0), QPointF(200, 0)], QColor("blue"), 3)
+    pieces = cut(line, [(100, -50, 100, 50)], 10)
+    assert [type(p) for p in pieces] == [Polyline, Polyline]
+    assert [xy(p) for p in pieces] == [[(0, 0), (90, 0)], [(110, 0), (200, 0)]]
+    assert all(p.color == QColor("blue") and p.width == 3 for p in pieces)
+
+
+def test_untouched_shape_is_kept():
+    line = Polyline([QPointF(0, 0), QPointF(200, 0)], QColor("blue"), 3)
+    state = CutState(line)
+    state.apply([(100, 50, 100, 80)], 10)
+    assert not state.changed
+
+
+def test_closed_polygon_opens_into_one_polyline():
+    square = Polygon([QPointF(0, 0), QPointF(100, 0), QPointF(100, 100), QPointF(0, 100)], QColor("black"), 2)
+    pieces = cut(square, [(50, -20, 50, 20)], 5)
+    assert len(pieces) == 1 and type(pieces[0]) is Polyline
+    assert xy(pieces[0]) == [(55, 0), (100, 0), (100, 100), (0, 100), (0, 0), (45, 0)]
+
+
+def test_rotated_polyline_bakes_in_its_angle():
+    line = Polyline([QPointF(0, 0), QPointF(100, 0)], QColor("black"), 2)
+    line.angle = 90 # 绕中心 (50, 0) 转成竖线
+    pieces = cut(line, [(0, 0, 100, 0)], 10)
+    assert all(p.angle == 0 and p.scale_x == 1 and p.scale_y == 1 for p in pieces)
+    assert sorted(xy(p) for p in pieces) == [[(50, -50), (50, -10)], [(50, 10), (50, 50)]]
+
+
+def filled_square():
+    return Polygon([QPointF(0, 0), QPointF(100, 0), QPointF(100, 100), QPointF(0, 100)], QColor("black"), 4,
+                   QColor("red"), Qt.BrushStyle.Dense3Pattern)
+
+
+def test_filled_polygon_with_hole_becomes_two_subpath_path():
+    pieces = cut(filled_square(), [(50, 50, 50, 50)], 10)
+    assert len(pieces) == 1 and type(pieces[0]) is Path
+    path = pieces[0]
+    assert len(path.sub_paths) == 2 and all(sp[0].anchor == sp[-1].anchor for sp in path.sub_paths)
+    assert path.fill_color == QColor("red") and path.fill_style == Qt.BrushStyle.Dense3Pattern and path.width == 4
+    assert not path.get_painter_path().contains(QPointF(50, 50))
+    assert path.get_painter_path().contains(QPointF(20, 20))
+
+
+def test_filled_polygon_cut_in_two_stays_polygons():
+    pieces = cut(filled_square(), [(50, -20, 50, 120)], 5)
+    assert [type(p) for p in pieces] == [Polygon, Polygon]
+    assert all(p.fill_color == QColor("red") and p.fill_style == Qt.BrushStyle.Dense3Pattern for p in pieces)
+    assert sorted(round(p.get_bounding_box().width()) for p in pieces) == [45, 45]
+
+
+def test_cubic_edge_boundaries_are_bisected():
+    start = PathSegment(QPointF(0, 0), None, QPointF(0, -100))
+    end = PathSegment(QPointF(100, 0), QPointF(100, -100), None)
+    path = Path([[start, end]], QColor("black"), 2)
+    pieces = cut(path, [(50, -200, 50, 200)], 5)
+    assert len(pieces) == 1 and type(pieces[0]) is Path
+    left, right = pieces[0].sub_paths
+    assert left[0].anchor == QPointF(0, 0) and right[-1].anchor == QPointF(100, 0)
+    assert left[-1].anchor.x() == pytest.approx(45, abs=1e-3) and right[0].anchor.x() == pytest.approx(55, abs=1e-3)
+    # 保留的部分仍是曲线：控制柄没有退化到锚点上
+    assert left[-1].handle1 != left[-1].anchor and right[0].handle2 != right[0].anchor
+
+
+def test_replace_command_keeps_z_order_through_undo_redo():
+    layer = Layer("L")
+    a, b, c, d = (Circle(QPointF(i * 50, 0), 10) for i in range(4))
+    layer.shapes.extend([a, b, c, d])
+    b1, b2 = Circle(QPointF(0, 100), 5), Circle(QPointF(50, 100), 5)
+    command = ReplaceShapesCommand(layer, [(d, []), (b, [b1, b2])])
+    command.redo()
+    assert list(layer.shapes) == [a, b1, b2, c]
+    command.undo()
+    assert list(layer.shapes) == [a, b, c, d]
+    command.redo()
+    assert list(layer.shapes) == [a, b1, b2, c]
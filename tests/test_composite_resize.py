@@ -0,0 +1,75 @@
+import pytest
+from PyQt6.QtCore import QPointF, QRect
+
+from canvas import CanvasWidget
+from renderer import CanvasRenderer
+from shapes import Circle
+
+
+@pytest.fixture
+def canvas(monkeypatch):
+    canvas = CanvasWidget()
+    canvas.resize(300, 200)
+    canvas.initialize_layers()
+    layer = canvas.get_current_layer()
+    for i in range(60):
+        layer.shapes.append(Circle(QPointF(15 + (i % 10) * 40, 15 + (i // 10) * 45), 14))
+    canvas.regions = []
+    compose = CanvasRenderer._compose_region
+    def recording(canvas, image, region, frame):
+        canvas.regions.append(QRect(region))
+        compose(canvas, image, region, frame)
+    monkeypatch.setattr(CanvasRenderer, "_compose_region", staticmethod(recording))
+    return canvas
+
+
+def frame(canvas):
+    image, size = CanvasRenderer._update_composite(canvas)
+    return image.copy(0, 0, size.width(), size.height())
+
+
+def fresh(canvas):
+    """丢掉合成缓冲后从头合成的画面，作为对照。"""
+    canvas.composite = None
+    return frame(canvas)
+
+
+def test_growing_composes_only_the_new_strips(canvas):
+    ratio = canvas.devicePixelRatioF() * canvas.ssaa_factor
+    old = frame(canvas)
+    assert canvas.regions == [QRect(0, 0, round(300 * ratio), round(200 * ratio))]
+    buffer = canvas.composite[0]
+    canvas.regions.clear()
+    canvas.resize(400, 260)
+    grown = frame(canvas)
+    w, h, vw, vh = round(400 * ratio), round(260 * ratio), old.width(), old.height()
+    assert canvas.composite[0] is not buffer # 超出了当前档位，换了更大的缓冲
+    assert canvas.regions == [QRect(vw, 0, w - vw, vh), QRect(0, vh, w, h - vh)]
+    assert grown.copy(0, 0, vw, vh) == old
+    assert grown == fresh(canvas)
+
+
+def test_unchanged_frame_is_reused(canvas):
+    frame(canvas)
+    canvas.regions.clear()
+    buffer = canvas.composite[0]
+    frame(canvas)
+    assert canvas.regions == [] and canvas.composite[0] is buffer
+
+
+def test_shrinking_keeps_the_buffer_until_trimmed(canvas):
+    ratio = canvas.devicePixelRatioF() * canvas.ssaa_factor
+    bucket = CanvasRenderer.COMPOSITE_BUCKET
+    canvas.resize(400, 260)
+    frame(canvas)
+    buffer = canvas.composite[0]
+    canvas.regions.clear()
+    canvas.resize(120, 100)
+    small = frame(canvas)
+    assert canvas.regions == [] and canvas.composite[0] is buffer
+    CanvasRenderer.trim_composite(canvas)
+    trimmed = canvas.composite[0]
+    assert trimmed.width() % bucket == 0 and trimmed.width() < buffer.width()
+    assert trimmed.width() >= 120 * ratio and trimmed.height() >= 100 * ratio
+    # 收缩后仍然有效，不需要重新合成
+    assert frame(canvas) == small and canvas.regions == []
@@ -0,0 +1,124 @@
+import math
+import random
+
+from PyQt6.QtCore import QPointF
+
+from curve_fitting import (simplify_rdp, simplify_visvalingam, StreamingSimplifier, fit_cubic_beziers,
+                           StreamingBezierFitter, beziers_to_segments, _segment_distance_sq, _bezier_at)
+
+
+def stroke(count, seed=1):
+    """带抖动的手写笔划：一段螺旋加随机噪声。"""
+    rng = random.Random(seed)
+    return [QPointF(200 + (60 + i * 0.3) * math.cos(i / 40) + rng.uniform(-0.3, 0.3),
+                    200 + (60 + i * 0.3) * math.sin(i / 40) + rng.uniform(-0.3, 0.3)) for i in range(count)]
+
+
+def polyline_distance(point, polyline):
+    return math.sqrt(min(_segment_distance_sq(point.x(), point.y(), a.x(), a.y(), b.x(), b.y())
+                         for a, b in zip(polyline, polyline[1:])))
+
+
+def curve_distance(point, beziers, samples=32):
+    """点到一串贝塞尔曲线的距离：先粗采样，再在最近的采样附近三分搜索。"""
+    def distance(bezier, t):
+        x, y = _bezier_at(bezier, t)
+        return math.hypot(x - point.x(), y - point.y())
+    best = math.inf
+    for bezier in beziers:
+        k = min(range(samples + 1), key=lambda k: distance(bezier, k / samples))
+        lo, hi = max(0.0, (k - 1) / samples), min(1.0, (k + 1) / samples)
+        for _ in range(40):
+            m1, m2 = lo + (hi - lo) / 3, hi - (hi - lo) / 3
+            if distance(bezier, m1) < distance(bezier, m2): hi = m2
+            else: lo = m1
+        best = min(best, distance(bezier, k / samples), distance(bezier, (lo + hi) / 2))
+    return best
+
+
+def test_rdp_stays_within_tolerance_and_keeps_endpoints():
+    points = stroke(600)
+    result = simplify_rdp(points, 1.5)
+    assert result[0] is points[0] and result[-1] is points[-1]
+    assert len(result) < len(points) / 3
+    assert max(polyline_distance(p, result) for p in points) <= 1.5 + 1e-9
+
+
+def test_streaming_simplifier_stays_within_tolerance():
+    points = stroke(600)
+    simplifier = StreamingSimplifier(1.5)
+    simplifier.extend(points)
+    result = simplifier.result()
+    assert result[0] is points[0] and result[-1] is points[-1]
+    assert len(result) == len(simplifier) < len(points) / 3
+    assert max(polyline_distance(p, result) for p in points) <= 1.5 + 1e-9
+
+
+def test_streaming_simplifier_bounds_pending_points_and_skips_repeats():
+    straight = [QPointF(i, 0) for i in range(500)]
+    simplifier = StreamingSimplifier(1.0)
+    for p in straight: simplifier.add(p); simplifier.add(QPointF(p))
+    result = simplifier.result()
+    # 直线上的点都能被代表，只因待定点数达到上限才定下新锚点
+    assert len(result) == math.ceil((len(straight) - 1) / StreamingSimplifier.MAX_PENDING) + 1
+    assert all(result[k] is straight[k * StreamingSimplifier.MAX_PENDING] for k in range(len(result) - 1))
+
+
+def test_visvalingam_keeps_endpoints_and_large_triangles():
+    points = stroke(600)
+    result = simplify_visvalingam(points, 1.5)
+    assert result[0] is points[0] and result[-1] is points[-1]
+    assert len(result) < len(points) / 3
+    index = {id(p): i for i, p in enumerate(points)}
+    assert [index[id(p)] for p in result] == sorted(index[id(p)] for p in result)
+    for a, b, c in zip(result, result[1:], result[2:]):
+        area = abs((b.x() - a.x()) * (c.y() - a.y()) - (c.x() - a.x()) * (b.y() - a.y())) * 0.5
+        assert area >= 1.5 * 1.5
+
+
+def test_short_inputs_are_returned_unchanged():
+    two = [QPointF(0, 0), QPointF(5, 5)]
+    assert simplify_rdp(two, 1) == two and simplify_visvalingam(two, 1) == two
+    assert fit_cubic_beziers(two[:1], 1) == []
+
+
+def test_bezier_fit_stays_within_tolerance_and_is_continuous():
+    points = stroke(300)
+    beziers = fit_cubic_beziers(points, 1.0)
+    assert beziers[0][0] == (points[0].x(), points[0].y()) and beziers[-1][3] == (points[-1].x(), points[-1].y())
+    assert len(beziers) < len(points) / 5
+    assert max(curve_distance(p, beziers) for p in points) <= 1.0 + 1e-6
+    for previous, bezier in zip(beziers, beziers[1:]):
+        assert previous[3] == bezier[0]
+        # G1：接点两侧的控制柄共线且方向相反
+        out = (bezier[1][0] - bezier[0][0], bezier[1][1] - bezier[0][1])
+        back = (previous[2][0] - previous[3][0], previous[2][1] - previous[3][1])
+        cross = out[0] * back[1] - out[1] * back[0]
+        assert abs(cross) <= 1e-6 * math.hypot(*out) * math.hypot(*back) and out[0] * back[0] + out[1] * back[1] <= 0
+
+
+def test_streaming_fitter_matches_batch_fit():
+    points = stroke(2 * StreamingBezierFitter.CHUNK)
+    fitter = StreamingBezierFitter(1.0)
+    fitter.extend(points)
+    assert fitter.result() == fit_cubic_beziers(points, 1.0)
+
+
+def test_streaming_fitter_long_stroke_stays_within_tolerance():
+    points = stroke(5 * StreamingBezierFitter.CHUNK)
+    fitter = StreamingBezierFitter(1.0)
+    fitter.extend(points)
+    beziers = fitter.result()
+    assert fitter.result() == beziers # result() 不改变内部状态
+    assert beziers[0][0] == (points[0].x(), points[0].y()) and beziers[-1][3] == (points[-1].x(), points[-1].y())
+    assert all(a[3] == b[0] for a, b in zip(beziers, beziers[1:]))
+    assert max(curve_distance(p, beziers) for p in points) <= 1.0 + 1e-6
+
+
+def test_beziers_to_segments_round_trip():
+    beziers = fit_cubic_beziers(stroke(200), 1.0)
+    segments = beziers_to_segments(beziers)
+    assert len(segments) == len(beziers) + 1
+    for segment, bezier in zip(segments, beziers):
+        assert (segment.anchor.x(), segment.anchor.y()) == bezier[0]
+        assert (segment.handle2.x(), segment.handle2.y()) == bezier[1]
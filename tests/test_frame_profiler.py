@@ -0,0 +1,72 @@
+import pytest
+from PyQt6.QtCore import QPointF
+
+import frame_profiler
+from frame_profiler import FrameProfiler
+from shapes import Circle
+
+
+@pytest.fixture
+def profiler():
+    profiler = FrameProfiler()
+    profiler.enabled = True
+    return profiler
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(frame_profiler.time, "perf_counter", lambda: now[0])
+    return now
+
+
+def test_disabled_profiler_records_nothing():
+    profiler = FrameProfiler()
+    with profiler.stage("blit", "L"): pass
+    profiler.count("tile.hit")
+    profiler.begin_frame(); profiler.end_frame()
+    assert profiler.stage("blit") is profiler.stage("paint") # 同一个空上下文
+    assert not profiler.stages and not profiler.counters and not profiler.frame_times
+
+
+def test_stages_are_named_with_detail_and_summed_per_frame(profiler, clock):
+    profiler.begin_frame()
+    for seconds in (0.002, 0.003):
+        with profiler.stage("blit", "L1"): clock[0] += seconds
+    with profiler.stage("composite"): clock[0] += 0.001
+    profiler.end_frame()
+    count, total, worst = profiler.stages["blit:L1"]
+    assert count == 2 and total == pytest.approx(0.005) and worst == pytest.approx(0.003)
+    assert profiler.last_frame_stages == pytest.approx({"blit:L1": 0.005, "composite": 0.001})
+    assert list(profiler.frame_times) == [pytest.approx(0.006)]
+
+
+def test_histogram_buckets_by_upper_edge(profiler):
+    profiler.frame_times.extend(ms / 1000 for ms in (1, 4, 4.5, 16.7, 20, 500))
+    assert profiler.histogram() == [(4, 2), (8, 1), (16.7, 1), (33.3, 1), (66.7, 0), (133.3, 0), (None, 1)]
+
+
+def test_to_dict_percentiles(profiler):
+    profiler.frame_times.extend(ms / 1000 for ms in range(1, 101))
+    frame_ms = profiler.to_dict()["frame_ms"]
+    assert frame_ms == dict(mean=50.5, p50=51.0, p95=96.0, max=100.0)
+    assert FrameProfiler().to_dict()["frame_ms"] == dict(mean=None, p50=None, p95=None, max=None)
+
+
+def test_hit_rate(profiler):
+    assert profiler.hit_rate("tile") is None
+    profiler.count("tile.hit", 3); profiler.count("tile.miss")
+    profiler.count("tile.hit", 0) # 0 不建计数项
+    assert profiler.hit_rate("tile") == 0.75
+    assert profiler.hit_rate("group") is None
+
+
+def test_record_shape_keeps_worst_n(profiler):
+    shapes = [Circle(QPointF(i, 0), 5) for i in range(30)]
+    for i, shape in enumerate(shapes):
+        profiler.record_shape(shape, "L", ((i * 7) % 30) / 1000) # 打乱顺序的 0..29 ms
+    worst = profiler.worst_shapes()
+    assert [entry["ms"] for entry in worst] == [float(ms) for ms in range(29, 29 - FrameProfiler.WORST_SHAPES_KEPT, -1)]
+    assert worst[0]["id"] == id(shapes[[(i * 7) % 30 for i in range(30)].index(29)])
+    assert worst[0]["type"] == "Circle" and worst[0]["layer"] == "L"
+    assert profiler.shape_types["Circle"][0] == 30
@@ -0,0 +1,60 @@
+import math
+from array import array
+
+import pytest
+from PyQt6.QtCore import QPointF, QRect, QRectF
+from PyQt6.QtGui import QColor, QFont, QTransform
+
+from geometry import (IDENTITY, translation, scaling_about, compose, invert, uniform_scale, is_mirrored,
+                      from_qtransform, to_qtransform, map_xy, transform_coords)
+from shapes import Square, Text, Circle
+
+MIRROR_X = (-1.0, 0.0, 0.0, 1.0, 0.0, 0.0)
+
+
+def close(a, b):
+    return all(math.isclose(x, y, abs_tol=1e-9) for x, y in zip(a, b))
+
+
+def test_compose_matches_qtransform():
+    first, second = from_qtransform(QTransform().rotate(30)), scaling_about(2.0, 5, 7)
+    expected = from_qtransform(to_qtransform(first) * to_qtransform(second))
+    assert close(compose(first, second), expected)
+    assert close(map_xy(compose(first, second), 3, 4), map_xy(second, *map_xy(first, 3, 4)))
+
+
+def test_invert_round_trip():
+    m = compose(from_qtransform(QTransform().rotate(40).scale(2, 3)), translation(5, -2))
+    assert close(compose(m, invert(m)), IDENTITY)
+    with pytest.raises(ValueError): invert((0.0, 0.0, 0.0, 0.0, 1.0, 1.0))
+
+
+@pytest.mark.parametrize("m", [scaling_about(2.5, 10, 20), translation(3, 4),
+                               from_qtransform(QTransform().rotate(33).translate(1, 2)), MIRROR_X])
+def test_transform_coords_matches_map_xy(m):
+    points = [(float(i), float(i * i % 7)) for i in range(100)]
+    coords = array('d', [v for p in points for v in p])
+    transform_coords(coords, m)
+    assert close(coords, [v for x, y in points for v in map_xy(m, x, y)])
+
+
+def test_uniform_scale_and_mirror():
+    assert uniform_scale(scaling_about(3.0, 1, 1)) == pytest.approx(3.0)
+    assert uniform_scale(MIRROR_X) == pytest.approx(1.0)
+    assert is_mirrored(MIRROR_X) and not is_mirrored(scaling_about(-2.0, 0, 0))
+    assert not is_mirrored(from_qtransform(QTransform().rotate(90)))
+
+
+@pytest.mark.parametrize("m", [MIRROR_X, scaling_about(-2.0, 0, 0), (1.0, 0.0, 0.0, -1.0, 0.0, 0.0)])
+def test_scalar_shapes_cover_mapped_region(m):
+    square = Square(QPointF(10, 20), 5, QColor("black"))
+    square.apply_affine(m)
+    (x0, y0), (x1, y1) = map_xy(m, 10, 20), map_xy(m, 15, 25)
+    expected = QRectF(QPointF(x0, y0), QPointF(x1, y1)).normalized()
+    assert square.get_bounding_box() == expected
+    text = Text(QRect(10, 20, 40, 30), "a", QFont("Arial", 12), QColor("black"))
+    text.apply_affine(m)
+    assert text.rect.width() > 0 and text.rect.height() > 0
+    circle = Circle(QPointF(10, 20), 5, QColor("black"))
+    circle.apply_affine(m)
+    assert circle.radius == pytest.approx(5 * uniform_scale(m))
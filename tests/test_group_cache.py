@@ -0,0 +1,67 @@
+import pytest
+from PyQt6.QtCore import Qt, QPointF
+from PyQt6.QtGui import QColor, QImage
+
+from canvas import CanvasWidget
+from frame_profiler import profiler
+from renderer import CanvasRenderer
+from shapes import Circle, ShapeGroup
+
+
+@pytest.fixture
+def counters(monkeypatch):
+    monkeypatch.setattr(profiler, "enabled", True)
+    profiler.reset()
+    yield profiler.counters
+    profiler.reset()
+
+
+def make_group(count=CanvasRenderer.GROUP_CACHE_MIN_SHAPES + 1):
+    return ShapeGroup([Circle(QPointF(40 + i * 30, 60), 12, QColor("navy"), 2, QColor("orange")) for i in range(count)])
+
+
+def draw(canvas, shape):
+    image = QImage(300, 200, QImage.Format.Format_ARGB32_Premultiplied)
+    image.fill(Qt.GlobalColor.transparent)
+    CanvasRenderer._draw_shape_recursive(image, shape, canvas)
+    return image
+
+
+def direct(canvas, group):
+    """逐个成员直接绘制，作为合成图的对照。"""
+    image = QImage(300, 200, QImage.Format.Format_ARGB32_Premultiplied)
+    image.fill(Qt.GlobalColor.transparent)
+    for shape in group.shapes: CanvasRenderer._draw_shape_recursive(image, shape, canvas)
+    return image
+
+
+def test_composite_is_built_when_the_same_key_comes_back(counters):
+    canvas = CanvasWidget()
+    group = make_group()
+    first = draw(canvas, group)
+    assert group.render_cache[1] is None and counters == {"group.miss": 1}
+    second = draw(canvas, group)
+    composite = group.render_cache[1]
+    assert composite is not None and counters == {"group.miss": 2}
+    third = draw(canvas, group)
+    assert group.render_cache[1] is composite and counters == {"group.miss": 2, "group.hit": 1}
+    assert first.pixelColor(40, 60).alpha() > 0
+    assert first == second == third == direct(canvas, group)
+
+
+def test_member_change_drops_the_composite(counters):
+    canvas = CanvasWidget()
+    group = make_group()
+    draw(canvas, group); draw(canvas, group)
+    assert group.render_cache[1] is not None
+    group.shapes[0].move(5, 0)
+    image = draw(canvas, group)
+    assert group.render_cache[1] is None and counters["group.miss"] == 3
+    assert image == direct(canvas, group)
+
+
+def test_small_groups_are_drawn_directly(counters):
+    canvas = CanvasWidget()
+    group = make_group(CanvasRenderer.GROUP_CACHE_MIN_SHAPES - 1)
+    for _ in range(3): draw(canvas, group)
+    assert group.render_cache[1] is None and counters == {}
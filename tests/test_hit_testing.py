@@ -0,0 +1,78 @@
+import math
+
+from PyQt6.QtCore import Qt, QPointF
+from PyQt6.QtGui import QColor
+
+from hit_testing import Contour, CHUNK_EDGES, shape_outline, outline_bounds, capsule_hits
+from shapes import Line, Polyline, Polygon, Rectangle, Path, PathSegment
+
+
+def hits(shape, a, b, radius=3):
+    return capsule_hits(shape_outline(shape), a[0], a[1], b[0], b[1], radius)
+
+
+def test_segment_reach_includes_half_stroke_width():
+    line = Line(QPointF(0, 0), QPointF(100, 0), QColor("black"), 2)
+    # 半线宽 1 + 半径 3
+    assert hits(line, (50, 4), (60, 4))
+    assert not hits(line, (50, 4.5), (60, 4.5))
+    assert not hits(line, (104.5, 0), (110, 0))
+
+
+def test_fast_stroke_crossing_a_segment_hits():
+    line = Line(QPointF(0, 0), QPointF(100, 0), QColor("black"), 2)
+    # 两个采样点都离线很远，但扫过的胶囊横穿了它
+    assert hits(line, (50, -50), (50, 50))
+
+
+def test_cubic_is_tested_along_the_curve_not_the_chord():
+    start = PathSegment(QPointF(0, 0), None, QPointF(0, -100))
+    end = PathSegment(QPointF(100, 0), QPointF(100, -100), None)
+    path = Path([[start, end]], QColor("black"), 2)
+    # 曲线中点在 y = -75；弦的中点 (50, 0) 离曲线很远
+    assert hits(path, (50, -75), (50, -75))
+    assert not hits(path, (50, 0), (50, 0))
+    assert not hits(path, (50, -40), (50, -40))
+
+
+def test_closed_contour_includes_closing_edge():
+    triangle = [QPointF(0, 0), QPointF(100, 0), QPointF(0, 100)]
+    polygon = Polygon(triangle, QColor("black"), 2)
+    open_line = Polyline(triangle, QColor("black"), 2)
+    # (0, 100) -> (0, 0) 是闭合边：多边形有，折线没有
+    assert hits(polygon, (0, 50), (0, 50))
+    assert not hits(open_line, (0, 50), (0, 50))
+    assert hits(open_line, (50, 50), (50, 50))
+    # 没有填充时内部不算命中
+    assert not hits(polygon, (20, 20), (25, 25))
+
+
+def test_filled_interior_hits():
+    polygon = Polygon([QPointF(0, 0), QPointF(100, 0), QPointF(0, 100)], QColor("black"), 2,
+                      QColor("red"), Qt.BrushStyle.SolidPattern)
+    assert hits(polygon, (20, 20), (25, 25))
+    assert not hits(polygon, (80, 80), (85, 85))
+
+
+def test_rotated_shape_uses_drawn_geometry():
+    rect = Rectangle(QPointF(100, 100), QPointF(200, 200), QColor("black"), 2)
+    rect.angle = 45
+    # 未旋转时的角落已经不在旋转后的菱形上
+    assert not hits(rect, (103, 103), (106, 106))
+    top = (150, 150 - 50 * math.sqrt(2))
+    assert hits(rect, top, top)
+
+
+def test_contour_chunks_cover_every_edge():
+    points = [(float(i), float(i % 2)) for i in range(3 * CHUNK_EDGES + 5)]
+    contour = Contour(points, False, False, 1.0)
+    assert len(contour.chunks) == 4
+    assert contour.chunks[0][0] == 0 and contour.chunks[-1][1] == len(points) - 1
+    assert all(a[1] == b[0] for a, b in zip(contour.chunks, contour.chunks[1:]))
+    closed = Contour([(0, 0), (10, 0), (10, 10), (0, 10)], True, False, 0.0)
+    assert closed.chunks == [(0, 4, (0, 0, 10, 10))]
+    assert closed.edge(3) == ((0, 10), (0, 0))
+    # 只有最后一块的范围与胶囊相交，仍能命中最后一条边
+    x, y = points[-1]
+    assert capsule_hits([contour], x, y + 5, x, y + 5, 3.5)
+    assert outline_bounds([contour]) == (-1.0, -1.0, points[-1][0] + 1, 2.0)
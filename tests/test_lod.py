@@ -0,0 +1,67 @@
+from PyQt6.QtCore import Qt, QPointF
+from PyQt6.QtGui import QColor, QImage
+
+from canvas import CanvasWidget
+from renderer import CanvasRenderer
+from shapes import Circle, Polygon
+
+
+def blank(width=60, height=60):
+    image = QImage(width, height, QImage.Format.Format_ARGB32_Premultiplied)
+    image.fill(Qt.GlobalColor.transparent)
+    return image
+
+
+def painted(image):
+    return [(x, y) for y in range(image.height()) for x in range(image.width()) if image.pixelColor(x, y).alpha()]
+
+
+def bresenham_canvas(monkeypatch, calls):
+    canvas = CanvasWidget()
+    canvas.set_raster_algorithm("Bresenham")
+    rasterize = CanvasRenderer._rasterize_custom
+    def counting(shape, *args):
+        calls.append(shape)
+        return rasterize(shape, *args)
+    monkeypatch.setattr(CanvasRenderer, "_rasterize_custom", staticmethod(counting))
+    return canvas
+
+
+def test_off_screen_shapes_are_skipped(monkeypatch):
+    calls = []
+    canvas = bresenham_canvas(monkeypatch, calls)
+    image = blank()
+    far = Circle(QPointF(500, 500), 20, QColor("red"), 2, QColor("red"))
+    CanvasRenderer._draw_single_shape_to_buffer(image, far, canvas)
+    assert calls == [] and painted(image) == []
+    # 局部离屏图：按 origin 平移后的可见范围判断
+    near = Circle(QPointF(30, 30), 10, QColor("red"), 2)
+    CanvasRenderer._draw_single_shape_to_buffer(image, near, canvas, None, (200, 0))
+    assert calls == [] and painted(image) == []
+    CanvasRenderer._draw_single_shape_to_buffer(image, near, canvas)
+    assert calls == [near] and painted(image)
+
+
+def test_stroke_reaching_into_view_is_still_drawn(monkeypatch):
+    calls = []
+    canvas = bresenham_canvas(monkeypatch, calls)
+    image = blank()
+    # 包围盒在画面外 2 像素，但 5 像素宽的线条会伸进来
+    edge = Polygon([QPointF(62, 10), QPointF(90, 10), QPointF(90, 40), QPointF(62, 40)], QColor("black"), 5)
+    CanvasRenderer._draw_single_shape_to_buffer(image, edge, canvas)
+    assert calls == [edge]
+
+
+def test_sub_pixel_shape_becomes_one_dot(monkeypatch):
+    calls = []
+    canvas = bresenham_canvas(monkeypatch, calls)
+    image = blank()
+    speck = Circle(QPointF(20.6, 33.2), 0.2, QColor("blue"), 0.3)
+    CanvasRenderer._draw_single_shape_to_buffer(image, speck, canvas)
+    assert calls == [] and painted(image) == [(20, 33)]
+    assert image.pixelColor(20, 33) == QColor("blue")
+    # 原生渲染同样只画一个点
+    canvas.set_raster_algorithm("PyQt原生")
+    native = blank()
+    CanvasRenderer._draw_single_shape_to_buffer(native, speck, canvas, None, (10, 10))
+    assert painted(native) == [(10, 23)]
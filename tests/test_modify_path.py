@@ -0,0 +1,101 @@
+import pytest
+from PyQt6.QtCore import QPointF
+from PyQt6.QtGui import QColor
+
+from commands import ModifyPathCommand, ChangePropertiesCommand
+from shapes import Path, PathSegment
+
+
+def make_path(*sub_paths):
+    return Path([[PathSegment(QPointF(x, y)) for x, y in sp] for sp in sub_paths], QColor("black"), 2)
+
+
+def anchors(path):
+    return [[(seg.anchor.x(), seg.anchor.y()) for seg in sp] for sp in path.sub_paths]
+
+
+def states(path):
+    return [[seg.get_state() for seg in sp] for sp in path.sub_paths]
+
+
+def round_trip(path, ops):
+    """执行、撤销、重做，返回 (执行后的节点, 撤销后的节点)。"""
+    before = states(path)
+    command = ModifyPathCommand(path, ops)
+    command.redo(); after = states(path)
+    command.undo(); assert states(path) == before
+    command.redo(); assert states(path) == after
+    command.undo()
+    return after
+
+
+def test_set_round_trip():
+    path = make_path([(0, 0), (10, 0), (20, 0)])
+    old = path.sub_paths[0][1].get_state()
+    moved = PathSegment(QPointF(10, 5), QPointF(8, 5), QPointF(12, 5), PathSegment.SMOOTH).get_state()
+    after = round_trip(path, [("set", 0, 1, old, moved)])
+    assert PathSegment.from_state(after[0][1]).anchor == QPointF(10, 5)
+    assert path.sub_paths[0][1].get_state() == old
+
+
+def test_insert_and_remove_round_trip():
+    path = make_path([(0, 0), (10, 0), (20, 0)])
+    extra = PathSegment(QPointF(5, 5)).get_state()
+    round_trip(path, [("insert", 0, 1, extra)])
+    ops = [("remove", 0, 2, path.sub_paths[0][2].get_state()), ("insert", 0, 0, extra)]
+    after = round_trip(path, ops)
+    assert [PathSegment.from_state(st).anchor for st in after[0]] == [QPointF(5, 5), QPointF(0, 0), QPointF(10, 0)]
+    assert anchors(path) == [[(0, 0), (10, 0), (20, 0)]]
+
+
+def test_sub_path_round_trip():
+    path = make_path([(0, 0), (10, 0)], [(50, 50), (60, 60)])
+    new = [PathSegment(QPointF(1, 1)).get_state(), PathSegment(QPointF(2, 2)).get_state()]
+    assert len(round_trip(path, [("insert_sub_path", 1, new)])) == 3
+    after = round_trip(path, [("remove_sub_path", 0, states(path)[0])])
+    assert len(after) == 1 and PathSegment.from_state(after[0][0]).anchor == QPointF(50, 50)
+
+
+@pytest.mark.parametrize("sub_path, seg_idx", [
+    ([(0, 0), (10, 0), (20, 0)], 1),                   # 开放路径的中间节点
+    ([(0, 0), (10, 0), (10, 10), (0, 0)], 0),          # 闭合路径的起点：首尾重合的两个节点一起删
+    ([(0, 0), (10, 0), (10, 10), (0, 0)], 3),
+    ([(0, 0), (10, 0), (10, 10), (0, 0)], 2),
+    ([(0, 0), (0, 0)], 1),                             # 只剩首尾两个节点的闭合路径：整条子路径删掉
+    ([(5, 5)], 0),                                     # 单节点子路径
+])
+def test_segment_removal_matches_remove_segment(sub_path, seg_idx):
+    expected = make_path(sub_path, [(100, 100), (110, 100)])
+    expected.remove_segment(0, seg_idx)
+    path = make_path(sub_path, [(100, 100), (110, 100)])
+    ops = ModifyPathCommand.segment_removal(path, 0, seg_idx)
+    assert anchors(path)[0] == sub_path # 只生成操作，不修改路径
+    after = round_trip(path, ops)
+    assert after == states(expected)
+
+
+def test_merge_with_same_path_only():
+    path, other = make_path([(0, 0), (10, 0)]), make_path([(0, 0), (10, 0)])
+    first = ModifyPathCommand(path, [("insert", 0, 1, PathSegment(QPointF(5, 0)).get_state())])
+    second = ModifyPathCommand(path, [("remove", 0, 0, PathSegment(QPointF(0, 0)).get_state())])
+    assert not first.merge_with(ModifyPathCommand(other, []))
+    assert not first.merge_with(ChangePropertiesCommand([path], {'width': 3}))
+    assert first.merge_with(second) and len(first.ops) == 2
+    first.redo(); assert anchors(path) == [[(5, 0), (10, 0)]]
+    first.undo(); assert anchors(path) == [[(0, 0), (10, 0)]]
+
+
+def test_detach_leaves_clone_untouched():
+    path = make_path([(0, 0), (10, 0), (20, 0)])
+    clone = path.clone()
+    assert clone.sub_paths is path.sub_paths
+    old = path.sub_paths[0][1].get_state()
+    moved = PathSegment(QPointF(10, 9)).get_state()
+    command = ModifyPathCommand(path, [("set", 0, 1, old, moved), ("insert", 0, 0, moved)])
+    version = path.geometry_version
+    command.redo()
+    assert anchors(clone) == [[(0, 0), (10, 0), (20, 0)]]
+    assert anchors(path) == [[(10, 9), (0, 0), (10, 9), (20, 0)]]
+    assert path.geometry_version > version and path.get_bounding_box().height() == 9
+    command.undo()
+    assert anchors(path) == anchors(clone) and path.sub_paths is not clone.sub_paths
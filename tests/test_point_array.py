@@ -0,0 +1,40 @@
+import pytest
+from PyQt6.QtCore import QPointF, QRectF
+from PyQt6.QtGui import QColor
+
+from shapes import Polyline, Polygon
+
+
+def make_polyline():
+    return Polyline([QPointF(0, 0), QPointF(10, 0), QPointF(10, 10)], QColor("black"))
+
+
+def coords(shape):
+    return [(p.x(), p.y()) for p in shape.points]
+
+
+def test_points_is_read_only():
+    shape = make_polyline()
+    with pytest.raises(TypeError):
+        shape.points[0] = QPointF(5, 5)
+    with pytest.raises(AttributeError):
+        shape.points.append(QPointF(5, 5))
+    assert coords(shape) == [(0, 0), (10, 0), (10, 10)]
+
+
+def test_mutators_update_geometry():
+    shape = make_polyline()
+    assert shape.get_bounding_box() == QRectF(0, 0, 10, 10)
+    shape.set_node_at(2, QPointF(20, 30))
+    assert coords(shape)[2] == (20, 30) and shape.get_bounding_box() == QRectF(0, 0, 20, 30)
+    shape.points = list(shape.points) + [QPointF(-5, 0)]
+    assert shape.point_count == 4 and shape.get_bounding_box().left() == -5
+
+
+def test_clone_shares_coords_until_written():
+    shape = Polygon([QPointF(0, 0), QPointF(4, 0), QPointF(0, 4)], QColor("black"))
+    clone = shape.clone()
+    assert clone.coords is shape.coords
+    clone.set_node_at(0, QPointF(1, 1))
+    assert clone.coords is not shape.coords
+    assert coords(shape)[0] == (0, 0) and coords(clone)[0] == (1, 1)
@@ -0,0 +1,80 @@
+from contextlib import contextmanager
+
+import profiling_hooks
+from profiling_hooks import HookRegistry, TimingHook
+
+
+def recording_hook(log, name):
+    @contextmanager
+    def hook(point, detail):
+        log.append((name, "enter", point, detail))
+        yield
+        log.append((name, "exit", point, detail))
+    return hook
+
+
+def test_no_hooks_skips_detail():
+    registry = HookRegistry()
+    def detail(): raise AssertionError("detail evaluated without hooks")
+    assert not registry
+    assert registry.call("command", lambda a, b: a + b, 2, 3, detail=detail) == 5
+
+    @registry.hooked("tool", detail=lambda *args: detail())
+    def handler(value): return value * 2
+    assert handler(4) == 8
+
+
+def test_nested_hooks_all_wrap_the_call():
+    registry, log = HookRegistry(), []
+    registry.register(recording_hook(log, "outer"))
+    registry.register(recording_hook(log, "inner"))
+    result = registry.call("command", lambda: log.append("call") or 7, detail=lambda: "Move")
+    assert result == 7
+    assert log == [("outer", "enter", "command", "Move"), ("inner", "enter", "command", "Move"), "call",
+                   ("inner", "exit", "command", "Move"), ("outer", "exit", "command", "Move")]
+
+
+def test_hooked_method_passes_arguments_to_detail():
+    registry, log = HookRegistry(), []
+    registry.register(recording_hook(log, "h"))
+
+    class Tool:
+        @registry.hooked("tool.press", detail=lambda self, pos: f"at {pos}")
+        def press(self, pos): return pos + 1
+    assert Tool().press(1) == 2
+    assert log[0] == ("h", "enter", "tool.press", "at 1")
+
+
+def test_unregister_closes_hook():
+    registry = HookRegistry()
+    class Hook:
+        closed = False
+        def __call__(self, point, detail): return contextmanager(lambda: (yield))()
+        def close(self): self.closed = True
+    hook = registry.register(Hook())
+    registry.unregister(hook)
+    assert hook.closed and not registry
+
+
+def test_only_slow_calls_are_logged(tmp_path, monkeypatch):
+    now = [0.0]
+    monkeypatch.setattr(profiling_hooks.time, "perf_counter", lambda: now[0])
+    log_path = str(tmp_path / "trace.log")
+    try:
+        assert profiling_hooks.configure("timing", 10, log_path) == log_path
+        def run(seconds):
+            def body(): now[0] += seconds
+            return body
+        profiling_hooks.hooks.call("command.fast", run(0.005), detail="quick")
+        profiling_hooks.hooks.call("command.slow", run(0.025), detail="Scale")
+        # 嵌套调用缩进一级，外层在内层之后写入
+        profiling_hooks.hooks.call("tool.release", lambda: profiling_hooks.hooks.call("command.inner", run(0.02)))
+    finally:
+        profiling_hooks.configure("off")
+    lines = open(log_path, encoding="utf-8").read().splitlines()[1:]
+    assert len(lines) == 3
+    assert "command.slow 25.00 ms  Scale" in lines[0] and "command.fast" not in "".join(lines)
+    assert "   command.inner 20.00 ms" in lines[1]
+    assert " tool.release 20.00 ms" in lines[2] and "  tool.release" not in lines[2]
+    assert not profiling_hooks.hooks
+
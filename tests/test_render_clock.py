@@ -0,0 +1,75 @@
+import pytest
+from PyQt6.QtCore import Qt, QPointF, QEvent
+from PyQt6.QtGui import QMouseEvent
+
+from canvas import CanvasWidget
+from tools import Tool
+
+
+class RecordingTool(Tool):
+    def __init__(self, canvas):
+        super().__init__(canvas); self.log = []
+    def mouseMoveEvents(self, events): self.log.append(("moves", [(e.position().x(), e.position().y()) for e in events]))
+    def mousePressEvent(self, event): self.log.append(("press", (event.position().x(), event.position().y())))
+    def mouseReleaseEvent(self, event): self.log.append(("release", (event.position().x(), event.position().y())))
+
+
+def mouse(kind, x, y, button=Qt.MouseButton.NoButton):
+    buttons = Qt.MouseButton.LeftButton if kind != QEvent.Type.MouseButtonRelease else Qt.MouseButton.NoButton
+    return QMouseEvent(kind, QPointF(x, y), QPointF(x, y), button, buttons, Qt.KeyboardModifier.NoModifier)
+
+
+def move(canvas, x, y): canvas.mouseMoveEvent(mouse(QEvent.Type.MouseMove, x, y))
+
+
+@pytest.fixture
+def canvas():
+    canvas = CanvasWidget()
+    canvas.resize(400, 300)
+    canvas.initialize_layers()
+    canvas.current_tool_obj = RecordingTool(canvas)
+    canvas._on_frame_tick(); canvas._on_frame_tick() # 让初始化排下的重绘走完，时钟停下
+    assert not canvas._render_clock.isActive()
+    yield canvas
+    canvas._render_clock.stop()
+
+
+def test_queued_moves_reach_tool_as_one_batch(canvas):
+    tool = canvas.current_tool_obj
+    canvas.zoom_at(2.0, QPointF(0, 0))
+    canvas._on_frame_tick()
+    move(canvas, 10, 10) # 空闲时第一个移动立即处理
+    assert tool.log == [("moves", [(5, 5)])] and canvas._render_clock.isActive()
+    for x in (20, 30, 40): move(canvas, x, 10)
+    assert len(tool.log) == 1 # 同一拍内只排队
+    canvas._on_frame_tick()
+    assert tool.log[1] == ("moves", [(10, 5), (15, 5), (20, 5)])
+    assert canvas.last_mouse_pos == QPointF(20, 5)
+
+
+@pytest.mark.parametrize("kind", [QEvent.Type.MouseButtonPress, QEvent.Type.MouseButtonRelease])
+def test_press_and_release_flush_pending_moves_first(canvas, kind):
+    tool = canvas.current_tool_obj
+    move(canvas, 1, 1)
+    move(canvas, 2, 2); move(canvas, 3, 3)
+    event = mouse(kind, 3, 3, Qt.MouseButton.LeftButton)
+    if kind == QEvent.Type.MouseButtonPress: canvas.mousePressEvent(event)
+    else: canvas.mouseReleaseEvent(event)
+    name = "press" if kind == QEvent.Type.MouseButtonPress else "release"
+    assert tool.log == [("moves", [(1, 1)]), ("moves", [(2, 2), (3, 3)]), (name, (3, 3))]
+    assert not canvas._pending_moves
+
+
+def test_clock_stops_after_an_idle_tick(canvas):
+    canvas.update()
+    assert canvas._render_clock.isActive() and not canvas._frame_requested # 空闲时立即重绘
+    canvas.update(); canvas.update()
+    assert canvas._frame_requested
+    canvas._on_frame_tick() # 合并成一次重绘
+    assert canvas._render_clock.isActive() and not canvas._frame_requested
+    canvas._on_frame_tick()
+    assert not canvas._render_clock.isActive()
+    move(canvas, 5, 5)
+    assert canvas._render_clock.isActive()
+    canvas._on_frame_tick()
+    assert not canvas._render_clock.isActive()
@@ -0,0 +1,74 @@
+import pytest
+from PyQt6.QtCore import QPointF, QRectF
+from PyQt6.QtGui import QColor
+
+from shapes import ShapeList, Layer, Line
+
+
+def make_lines(count):
+    return [Line(QPointF(i, 0), QPointF(i + 1, 1), QColor("black")) for i in range(count)]
+
+
+def test_remove_then_insert_many_restores_z_order():
+    shapes = make_lines(8)
+    items = ShapeList(shapes)
+    removed = [shapes[1], shapes[4], shapes[7]]
+    positions = items.positions_of(removed)
+    assert positions == [(1, shapes[1]), (4, shapes[4]), (7, shapes[7])]
+    items.remove_many(removed)
+    assert list(items) == [shapes[i] for i in (0, 2, 3, 5, 6)]
+    items.insert_many(positions)
+    assert list(items) == shapes
+    assert [items[i] for i in range(len(items))] == shapes
+    assert items.in_z_order(list(reversed(shapes))) == shapes
+
+
+def test_insert_many_at_front_and_past_end():
+    shapes = make_lines(3)
+    items = ShapeList(shapes[1:2])
+    items.insert_many([(0, shapes[0]), (5, shapes[2])])
+    assert list(items) == shapes
+    # 插入后的新图形按 z-order 排在正确位置
+    assert items.in_z_order([shapes[2], shapes[0], shapes[1]]) == shapes
+
+
+def test_indexing_follows_mutations():
+    shapes = make_lines(5)
+    items = ShapeList(shapes)
+    assert items[2] is shapes[2] and items[-1] is shapes[4]
+    items.discard(shapes[0])
+    assert items[0] is shapes[1] and items.index(shapes[4]) == 3
+    extra = make_lines(1)[0]
+    items.append(extra)
+    assert items[-1] is extra and len(items) == 5
+    with pytest.raises(ValueError): items.index(shapes[0])
+    with pytest.raises(ValueError): items.remove(shapes[0])
+
+
+def test_iteration_does_not_copy_and_rejects_mutation():
+    shapes = make_lines(3)
+    items = ShapeList(shapes)
+    assert list(reversed(items)) == shapes[::-1]
+    with pytest.raises(RuntimeError):
+        for shape in items: items.discard(shape)
+    # 需要边遍历边修改时先取快照
+    for shape in list(items): items.discard(shape)
+    assert not items
+
+
+def test_duplicate_append_is_ignored():
+    shape = make_lines(1)[0]
+    items = ShapeList([shape, shape])
+    assert len(items) == 1 and shape in items
+
+
+def test_layer_keeps_index_and_z_order_in_sync():
+    layer = Layer("test")
+    shapes = make_lines(6)
+    layer.shapes = shapes
+    positions = layer.shapes.positions_of(shapes[2:4])
+    layer.shapes.remove_many(shapes[2:4])
+    assert layer.shapes_in(QRectF(0, 0, 10, 2)) == [shapes[i] for i in (0, 1, 4, 5)]
+    layer.shapes.insert_many(positions)
+    assert layer.shapes_in(QRectF(0, 0, 10, 2)) == shapes
+    assert all(shape.layer is layer for shape in shapes)
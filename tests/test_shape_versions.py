@@ -0,0 +1,71 @@
+import pytest
+from PyQt6.QtCore import QPointF
+from PyQt6.QtGui import QColor
+
+from commands import ChangePropertiesCommand
+from geometry import scaling_about
+from shapes import Circle, Polygon, ShapeGroup, GEOMETRY_CHANGED, STYLE_CHANGED
+
+
+def watch(shape):
+    events = []
+    shape.add_observer(lambda s, kind: events.append((s, kind)))
+    return events
+
+
+def versions(shape):
+    return shape.geometry_version, shape.style_version
+
+
+def test_reads_do_not_bump_versions_or_notify():
+    circle = Circle(QPointF(10, 10), 5)
+    events = watch(circle)
+    circle.get_bounding_box(); circle.get_transformed_bounding_box(); circle.get_world_extent()
+    assert versions(circle) == (0, 0) and events == []
+
+
+@pytest.mark.parametrize("mutate", [
+    lambda s: s.move(10, 0),
+    lambda s: s.apply_affine(scaling_about(2, 0, 0)),
+    lambda s: s.set_node_at(1, QPointF(300, 0)),
+    lambda s: ChangePropertiesCommand([s], {'points': [QPointF(0, 0), QPointF(20, 20), QPointF(0, 20)]}).redo(),
+    lambda s: setattr(s, 'angle', 30),
+])
+def test_geometry_changes_bump_geometry_version(mutate):
+    shape = Polygon([QPointF(0, 0), QPointF(100, 0), QPointF(100, 50)])
+    events = watch(shape)
+    geometry, style = versions(shape)
+    mutate(shape)
+    assert shape.geometry_version > geometry and shape.style_version == style
+    assert events and all(e == (shape, GEOMETRY_CHANGED) for e in events)
+
+
+def test_style_change_bumps_style_version_only():
+    circle = Circle(QPointF(10, 10), 5)
+    events = watch(circle)
+    command = ChangePropertiesCommand([circle], {'color': QColor("red"), 'width': 7})
+    command.redo()
+    assert versions(circle) == (0, 1) and events == [(circle, STYLE_CHANGED)]
+    command.undo()
+    assert versions(circle) == (0, 2) and circle.width == 2
+
+
+def test_member_changes_bubble_to_group():
+    a, b = Circle(QPointF(0, 0), 5), Circle(QPointF(100, 0), 5)
+    group = ShapeGroup([a, b])
+    events = watch(group)
+    a.move(0, 50)
+    b.color = QColor("red"); b.mark_style_changed()
+    assert [kind for _, kind in events] == [GEOMETRY_CHANGED, STYLE_CHANGED]
+    assert versions(group) == (1, 1)
+
+
+def test_removed_observer_is_not_called():
+    circle = Circle(QPointF(0, 0), 5)
+    events = []
+    callback = lambda s, kind: events.append(kind)
+    circle.add_observer(callback); circle.add_observer(callback) # 重复注册只算一次
+    circle.move(1, 1)
+    circle.remove_observer(callback)
+    circle.move(1, 1)
+    assert events == [GEOMETRY_CHANGED]
@@ -0,0 +1,73 @@
+from PyQt6.QtCore import QPointF, QRectF, QRect
+from PyQt6.QtGui import QColor
+
+from spatial_index import SpatialIndex
+from shapes import Layer, Line, Circle, Text
+
+
+def ids(shapes):
+    return {id(s) for s in shapes}
+
+
+def test_query_returns_only_nearby_shapes():
+    near = Circle(QPointF(10, 10), 5)
+    far = Circle(QPointF(5000, 5000), 5)
+    index = SpatialIndex([near, far])
+    assert ids(index.query(QRectF(0, 0, 50, 50))) == {id(near)}
+    assert ids(index.query_point(QPointF(5000, 5000))) == {id(far)}
+
+
+def test_moved_shape_is_found_at_new_position_only():
+    layer = Layer("L")
+    shape = Circle(QPointF(10, 10), 5)
+    layer.shapes.append(shape)
+    shape.move(3000, 0)
+    # 旧位置的登记在下一次查询前被替换
+    assert layer.index.query(QRectF(0, 0, 50, 50)) == []
+    assert ids(layer.index.query(QRectF(3000, 0, 50, 50))) == {id(shape)}
+    assert layer.index.extent_of(shape) == shape.get_world_extent()
+
+
+def test_repeated_changes_register_once():
+    layer = Layer("L")
+    shape = Line(QPointF(0, 0), QPointF(10, 0), QColor("black"))
+    layer.shapes.append(shape)
+    for _ in range(5): shape.move(1000, 0)
+    assert len(layer.index._stale) == 1
+    assert ids(layer.index.query(QRectF(5000, -10, 20, 20))) == {id(shape)}
+    assert not layer.index._stale and len(layer.index) == 1
+
+
+def test_removed_shape_leaves_no_cells():
+    layer = Layer("L")
+    shapes = [Circle(QPointF(i * 300, 0), 5) for i in range(4)]
+    layer.shapes.extend(shapes)
+    shapes[1].move(0, 10) # 删除前已经过期的登记也要一并清掉
+    layer.shapes.remove_many(shapes[:2])
+    assert ids(layer.index.query(QRectF(-100, -100, 2000, 200))) == ids(shapes[2:])
+    assert len(layer.index) == 2
+    layer.shapes.remove_many(shapes[2:])
+    assert not layer.index._cells and not layer.index._stale
+
+
+def test_unknown_and_oversized_extents_are_always_returned():
+    text = Text(QRect(0, 0, 40, 20), "abc", None)
+    huge = Line(QPointF(0, 0), QPointF(SpatialIndex.CELL_SIZE * 100, SpatialIndex.CELL_SIZE * 100), QColor("black"))
+    index = SpatialIndex([text, huge])
+    assert set(index._unbounded) == {id(text), id(huge)}
+    assert ids(index.query(QRectF(-9000, -9000, 1, 1))) == {id(text), id(huge)}
+    # 超大图形的范围仍然已知，只是不拆进格子
+    assert index.extent_of(huge) == huge.get_world_extent() and index.extent_of(text) is None
+    index.remove(huge)
+    assert ids(index.query(QRectF(0, 0, 1, 1))) == {id(text)}
+
+
+def test_shape_that_shrinks_moves_out_of_unbounded_list():
+    layer = Layer("L")
+    size = SpatialIndex.CELL_SIZE * 100
+    line = Line(QPointF(0, 0), QPointF(size, size), QColor("black"))
+    layer.shapes.append(line)
+    assert id(line) in layer.index._unbounded
+    line.scale(0.001, QPointF(0, 0))
+    assert layer.index.query(QRectF(5000, 5000, 10, 10)) == []
+    assert id(line) not in layer.index._unbounded
@@ -0,0 +1,70 @@
+import json
+
+from PyQt6.QtCore import Qt, QPointF
+from PyQt6.QtGui import QColor, QImage
+
+from canvas import CanvasWidget
+from file_handler import ProjectHandler
+from geometry import translation, compose, scaling_about
+from renderer import CanvasRenderer
+from shapes import Layer, Circle, Rectangle, ShapeGroup, Symbol, SymbolInstance
+
+
+def make_symbol():
+    return Symbol("badge", [Circle(QPointF(0, 0), 10, QColor("red"), 2, QColor("yellow")),
+                            Rectangle(QPointF(-5, -5), QPointF(5, 5), QColor("blue"), 1)])
+
+
+def test_save_and_load_share_one_symbol(tmp_path):
+    symbol = make_symbol()
+    layer = Layer("L")
+    layer.shapes.extend([SymbolInstance(symbol, translation(50, 50)), SymbolInstance(symbol, translation(150, 50)),
+                         ShapeGroup([SymbolInstance(symbol, translation(50, 150)), Circle(QPointF(0, 0), 3)])])
+    file_path = str(tmp_path / "project.json")
+    ProjectHandler.save([layer], file_path)
+    with open(file_path, encoding="utf-8") as f: data = json.load(f)
+    assert len(data["symbols"]) == 1 and len(data["symbols"][0]["shapes"]) == 2
+
+    loaded = ProjectHandler.load(file_path)[0]
+    first, second, group = loaded.shapes
+    nested = group.shapes[0]
+    assert isinstance(first, SymbolInstance) and first.symbol is second.symbol is nested.symbol
+    assert first.symbol.name == "badge" and len(first.symbol.shapes) == 2
+    assert first.matrix == translation(50, 50) and nested.matrix == translation(50, 150)
+    # 改动母版，所有实例的包围盒都随之更新
+    before = first.get_bounding_box()
+    first.symbol.shapes[0].radius = 20; first.symbol.shapes[0].invalidate_geometry()
+    assert first.get_bounding_box() != before
+    assert second.get_bounding_box().width() == first.get_bounding_box().width() == 40
+
+
+def draw(canvas, instance):
+    image = QImage(400, 400, QImage.Format.Format_ARGB32_Premultiplied)
+    image.fill(Qt.GlobalColor.transparent)
+    CanvasRenderer._draw_symbol_instance(image, instance, canvas)
+    return image
+
+
+def test_raster_cache_is_shared_within_a_bucket_and_cleared_on_invalidate():
+    canvas = CanvasWidget()
+    symbol = make_symbol()
+    image = draw(canvas, SymbolInstance(symbol, translation(100, 100)))
+    assert len(symbol.raster_cache) == 1
+    assert image.pixelColor(100, 100).alpha() > 0 and image.pixelColor(300, 300).alpha() == 0
+    cached = next(iter(symbol.raster_cache.values()))[0]
+    # 平移和很小的缩放落在同一个档位里，只重采样缓存的光栅
+    draw(canvas, SymbolInstance(symbol, translation(250, 30)))
+    draw(canvas, SymbolInstance(symbol, compose(scaling_about(1.02, 0, 0), translation(200, 200))))
+    assert len(symbol.raster_cache) == 1 and next(iter(symbol.raster_cache.values()))[0] is cached
+    rotated = SymbolInstance(symbol, translation(200, 200)); rotated.angle = 45
+    draw(canvas, rotated)
+    doubled = SymbolInstance(symbol, compose(scaling_about(2, 0, 0), translation(200, 200)))
+    draw(canvas, doubled)
+    assert len(symbol.raster_cache) == 3
+    symbol.invalidate()
+    assert not symbol.raster_cache
+    draw(canvas, doubled)
+    assert len(symbol.raster_cache) == 1
+    # 修改母版图形也会清空缓存
+    symbol.shapes[1].move(1, 0)
+    assert not symbol.raster_cache
@@ -0,0 +1,151 @@
+import pytest
+from PyQt6.QtCore import Qt, QPointF, QRectF
+from PyQt6.QtGui import QColor, QImage
+
+from canvas import CanvasWidget
+from renderer import CanvasRenderer
+from commands import AddShapeCommand, MoveShapesCommand, RemoveShapesCommand, ChangePropertiesCommand
+from shapes import Circle, Text, Polygon, Polyline, BezierSurface
+
+
+def make_canvas():
+    canvas = CanvasWidget()
+    canvas.resize(640, 480)
+    canvas.initialize_layers()
+    layer = canvas.get_current_layer()
+    for i in range(96):
+        layer.shapes.append(Circle(QPointF(20 + (i % 12) * 50, 20 + (i // 12) * 55), 12))
+    return canvas, layer
+
+
+def rebuilt(canvas, layer):
+    """整层重建后的画面，作为局部作废结果的对照。"""
+    layer.is_dirty = True
+    return canvas.grab().toImage()
+
+
+def tile_rect(key):
+    tile_ratio, tx, ty = key
+    size = CanvasRenderer.TILE_SIZE / tile_ratio
+    return QRectF(tx * size, ty * size, size, size)
+
+
+def test_move_repairs_visible_tiles_and_drops_other_levels():
+    canvas, layer = make_canvas()
+    canvas.zoom_at(2.0, QPointF(0, 0)); canvas.grab()
+    canvas.zoom_at(0.5, QPointF(0, 0)); canvas.grab() # 两个档位都有瓦片
+    before = {key: entry[0] for key, entry in layer.tiles.items()}
+    current_ratio = canvas.devicePixelRatioF() * canvas.ssaa_factor # 回到 1 倍缩放的档位
+    shape = layer.shapes[0]
+    old_extent = shape.get_world_extent()
+    canvas.execute_command(MoveShapesCommand([shape], 30, 20))
+    new_extent = shape.get_world_extent()
+    assert not layer.is_dirty and layer.has_changes()
+    image = canvas.grab().toImage()
+    touched = {key for key in before if tile_rect(key).intersects(old_extent) or tile_rect(key).intersects(new_extent)}
+    assert {key[0] for key in touched} == {current_ratio, current_ratio * 2}
+    for key, tile in before.items():
+        if key not in touched: assert layer.tiles[key][0] is tile
+        elif key[0] == current_ratio: assert key in layer.tiles # 可见瓦片就地修补
+        else: assert key not in layer.tiles
+    assert image == rebuilt(canvas, layer)
+
+
+def test_hidden_shapes_are_left_out_of_tiles():
+    canvas, layer = make_canvas()
+    reference = canvas.grab().toImage()
+    hidden = [layer.shapes[3], layer.shapes[50]]
+    for shape in hidden: layer.set_hidden(shape, True)
+    assert not layer.is_dirty
+    image = canvas.grab().toImage()
+    assert image != reference and image == rebuilt(canvas, layer)
+    layer.show_all()
+    assert canvas.grab().toImage() == reference
+
+
+def test_remove_and_style_change_match_full_rebuild():
+    canvas, layer = make_canvas()
+    canvas.grab()
+    canvas.execute_command(RemoveShapesCommand(layer, [layer.shapes[5], layer.shapes[40]]))
+    canvas.execute_command(ChangePropertiesCommand([layer.shapes[10]], {'width': 9}))
+    assert not layer.is_dirty
+    assert canvas.grab().toImage() == rebuilt(canvas, layer)
+
+
+def test_unknown_extent_rebuilds_whole_layer():
+    canvas, layer = make_canvas()
+    text = Text(layer.shapes[0].get_bounding_box().toRect(), "abc", canvas.current_font)
+    layer.shapes.append(text)
+    canvas.grab()
+    assert not layer.has_changes()
+    text.move(5, 5)
+    assert layer.take_damage() is None
+
+
+def test_bresenham_spans_are_built_once_per_shape_and_level(monkeypatch):
+    canvas = CanvasWidget()
+    canvas.resize(320, 240)
+    canvas.initialize_layers()
+    layer = canvas.get_current_layer()
+    layer.shapes.append(Polygon([QPointF(15, 20), QPointF(300, 45), QPointF(175, 225)], QColor("black"), 3,
+                                QColor("red"), Qt.BrushStyle.SolidPattern))
+    layer.shapes.append(BezierSurface(QRectF(50, 30, 210, 180), QColor("blue"), 2))
+    canvas.set_raster_algorithm("Bresenham")
+    calls = []
+    rasterize = CanvasRenderer._rasterize_custom
+    def counting(shape, *args):
+        calls.append(shape)
+        return rasterize(shape, *args)
+    monkeypatch.setattr(CanvasRenderer, "_rasterize_custom", staticmethod(counting))
+    canvas.grab()
+    assert len(layer.tiles) > 4 # 两个图形都跨了好几块瓦片
+    assert sorted(map(id, calls)) == sorted(map(id, layer.shapes))
+    # 每块瓦片与不共用扫描线、单独画这块瓦片的结果逐像素相同
+    for (tile_ratio, tx, ty), entry in layer.tiles.items():
+        tile = CanvasRenderer.TILE_SIZE
+        expected = QImage(tile, tile, QImage.Format.Format_ARGB32_Premultiplied)
+        expected.setDevicePixelRatio(tile_ratio)
+        expected.fill(Qt.GlobalColor.transparent)
+        for shape in layer.shapes:
+            CanvasRenderer._draw_shape_recursive(expected, shape, canvas, None, (tx * tile, ty * tile))
+        assert entry[0] == expected
+
+
+def test_bresenham_move_matches_full_rebuild():
+    canvas, layer = make_canvas()
+    canvas.set_raster_algorithm("Bresenham")
+    canvas.grab()
+    canvas.execute_command(MoveShapesCommand(layer.shapes[20:30], 37, 23))
+    assert not layer.is_dirty
+    assert canvas.grab().toImage() == rebuilt(canvas, layer)
+
+
+@pytest.mark.parametrize("algorithm", ["PyQt原生", "Bresenham"])
+def test_shape_added_on_top_is_stamped_into_existing_tiles(monkeypatch, algorithm):
+    canvas, layer = make_canvas()
+    canvas.set_raster_algorithm(algorithm)
+    canvas.zoom_at(2.0, QPointF(0, 0)); canvas.grab()
+    canvas.zoom_at(0.5, QPointF(0, 0)); canvas.grab() # 两个档位都有瓦片
+    before = {key: entry[0] for key, entry in layer.tiles.items()}
+    stroke = Polyline([QPointF(10, 400), QPointF(200, 150), QPointF(420, 300), QPointF(630, 20)], QColor("purple"), 4)
+    canvas.execute_command(AddShapeCommand(layer, stroke))
+    assert layer.pending_stamps == [stroke] and not layer.is_dirty and not layer.damage
+    rendered = []
+    render = CanvasRenderer._render_tiles
+    def recording(layer, canvas, tile_ratio, missing, frame):
+        rendered.append(list(missing))
+        render(layer, canvas, tile_ratio, missing, frame)
+    monkeypatch.setattr(CanvasRenderer, "_render_tiles", staticmethod(recording))
+    image = canvas.grab().toImage()
+    assert rendered == [] and layer.pending_stamps == []
+    stamped = {key for key in before if tile_rect(key).intersects(stroke.get_world_extent())}
+    assert {key[0] for key in stamped} == {key[0] for key in before} # 两个档位都叠画了
+    assert set(layer.tiles) == set(before)
+    for key, tile in before.items():
+        if tile is not None: assert layer.tiles[key][0] is tile # 就地叠画，没有重新光栅化
+        elif key not in stamped: assert layer.tiles[key][0] is None
+    monkeypatch.undo()
+    assert image == rebuilt(canvas, layer)
+    # 另一个档位上叠画的结果同样与重建一致
+    canvas.zoom_at(2.0, QPointF(0, 0))
+    assert canvas.grab().toImage() == rebuilt(canvas, layer)
@@ -0,0 +1,72 @@
+from undo_history import UndoHistory
+from commands import Command
+
+
+class Counter:
+    def __init__(self): self.value = 0
+
+
+class AddCommand(Command):
+    """给计数器加 amount；同一计数器上的连续加法可以合并。"""
+    def __init__(self, counter, amount, size=1024):
+        self.counter, self.amount, self.size = counter, amount, size
+    def redo(self): self.counter.value += self.amount
+    def undo(self): self.counter.value -= self.amount
+    def merge_with(self, other):
+        if not isinstance(other, AddCommand) or other.counter is not self.counter: return False
+        self.amount += other.amount; self.size += other.size
+        return True
+    def estimate_size(self): return self.size
+
+
+def execute(history, command, merge=False):
+    command.redo(); history.push(command, merge)
+
+
+def test_budget_evicts_oldest_and_keeps_latest():
+    history, counter = UndoHistory(memory_budget_mb=3 / 1024), Counter()  # 3 KB
+    for _ in range(5): execute(history, AddCommand(counter, 1))
+    assert len(history.undo_stack) == 3 and history.evicted_count == 2
+    assert history.total_bytes == 3 * 1024
+    # 超过预算的单条命令也保留，保证至少能撤销一步
+    execute(history, AddCommand(counter, 1, size=10 * 1024))
+    assert len(history.undo_stack) == 1 and history.total_bytes == 10 * 1024
+    history.undo(); assert counter.value == 5
+
+
+def test_budget_drops_redo_branch_before_undo_entries():
+    history, counter = UndoHistory(memory_budget_mb=4 / 1024), Counter()
+    for _ in range(4): execute(history, AddCommand(counter, 1))
+    history.undo(); history.undo()
+    history.set_memory_budget(3 / 1024)
+    assert len(history.redo_stack) == 1 and len(history.undo_stack) == 2
+    # 丢掉的是离当前位置最远的那条重做记录
+    history.redo(); assert counter.value == 3 and not history.can_redo()
+
+
+def test_saved_position_survives_eviction():
+    history, counter = UndoHistory(memory_budget_mb=2 / 1024), Counter()
+    execute(history, AddCommand(counter, 1)); history.mark_saved()
+    for _ in range(3): execute(history, AddCommand(counter, 1))
+    assert history.evicted_count == 2 and history.is_dirty
+    history.undo(); history.undo(); history.undo()  # 只剩两条可撤销
+    assert history.position == 2 and history.is_dirty
+
+
+def test_saved_position_on_discarded_redo_branch():
+    history, counter = UndoHistory(), Counter()
+    execute(history, AddCommand(counter, 1)); execute(history, AddCommand(counter, 1))
+    history.mark_saved()
+    history.undo(); assert history.is_dirty
+    execute(history, AddCommand(counter, 5))  # 丢弃重做分支，保存点随之失效
+    assert history._saved_position == -1 and history.is_dirty
+    history.undo(); history.redo(); assert history.is_dirty
+
+
+def test_saved_position_before_discarded_branch_is_kept():
+    history, counter = UndoHistory(), Counter()
+    execute(history, AddCommand(counter, 1)); history.mark_saved()
+    execute(history, AddCommand(counter, 1)); history.undo()
+    assert not history.is_dirty
+    execute(history, AddCommand(counter, 1))
+    history.undo(); assert not history.is_dirty
@@ -0,0 +1,75 @@
+import pytest
+
+import undo_history
+from undo_history import UndoHistory, MERGE_WINDOW_SECONDS
+from commands import CompositeCommand
+from test_undo_history import Counter, AddCommand, execute
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(undo_history.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_merge_within_window(clock):
+    history, counter = UndoHistory(), Counter()
+    execute(history, AddCommand(counter, 1))
+    clock[0] += MERGE_WINDOW_SECONDS / 2
+    execute(history, AddCommand(counter, 2), merge=True)
+    assert len(history.undo_stack) == 1 and history.total_bytes == 2048
+    history.undo(); assert counter.value == 0
+
+
+def test_merge_window_expires(clock):
+    history, counter = UndoHistory(), Counter()
+    execute(history, AddCommand(counter, 1))
+    clock[0] += MERGE_WINDOW_SECONDS * 2
+    execute(history, AddCommand(counter, 2), merge=True)
+    assert len(history.undo_stack) == 2
+
+
+def test_no_merge_into_saved_state(clock):
+    history, counter = UndoHistory(), Counter()
+    execute(history, AddCommand(counter, 1)); history.mark_saved()
+    execute(history, AddCommand(counter, 2), merge=True)
+    assert len(history.undo_stack) == 2
+    history.undo(); assert not history.is_dirty
+
+
+def test_no_merge_without_flag_or_after_undo(clock):
+    history, counter = UndoHistory(), Counter()
+    execute(history, AddCommand(counter, 1)); execute(history, AddCommand(counter, 1))
+    assert len(history.undo_stack) == 2
+    history.undo()
+    execute(history, AddCommand(counter, 1), merge=True)
+    assert len(history.undo_stack) == 2 and not history.can_redo()
+
+
+def test_transaction_commits_one_step():
+    history, counter, other = UndoHistory(), Counter(), Counter()
+    history.begin_transaction()
+    execute(history, AddCommand(counter, 1)); execute(history, AddCommand(counter, 1))
+    execute(history, AddCommand(other, 3))
+    assert not history.undo_stack and history.undo() is None
+    assert history.commit_transaction()
+    assert len(history.undo_stack) == 1
+    command = history.undo_stack[-1][0]
+    # 同一计数器上的两条在事务内已合并
+    assert isinstance(command, CompositeCommand) and len(command.commands) == 2
+    history.undo(); assert counter.value == 0 and other.value == 0
+    history.redo(); assert counter.value == 2 and other.value == 3
+
+
+def test_nested_and_empty_transactions():
+    history, counter = UndoHistory(), Counter()
+    history.begin_transaction(); history.begin_transaction()
+    execute(history, AddCommand(counter, 1))
+    assert not history.commit_transaction()  # 内层提交不入栈
+    assert history.in_transaction and not history.undo_stack
+    assert history.commit_transaction()
+    assert len(history.undo_stack) == 1 and isinstance(history.undo_stack[-1][0], AddCommand)
+    history.begin_transaction()
+    assert not history.commit_transaction() and len(history.undo_stack) == 1
+    assert not history.commit_transaction()